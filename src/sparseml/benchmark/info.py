@@ -102,6 +102,7 @@ from sparseml.benchmark.serialization import (
     BenchmarkConfig,
     BenchmarkInfo,
     BenchmarkResult,
+    BenchmarkResultTracker,
 )
 from sparseml.framework.info import FrameworkInferenceProviderInfo, FrameworkInfo
 from sparseml.utils import clean_path, create_parent_dirs
@@ -131,6 +132,8 @@ class BenchmarkRunner(ABC):
         load_data_kwargs: Dict[str, Any] = {},
         show_progress: bool = False,
         *args,
+        keep_results: bool = True,
+        detect_warmup: bool = False,
         **kwargs,
     ) -> BenchmarkResult:
         """
@@ -143,11 +146,18 @@ class BenchmarkRunner(ABC):
         :param load_data_kwargs: additional arguments to pass to the framework's
             load_data method
         :param args: additional arguments to pass to the framework
+        :param keep_results: True to keep the result for every batch in the
+            BenchmarkResult, False to only keep the distribution of the batch times
+            so memory use stays constant for long runs
+        :param detect_warmup: True to exclude batches run before the batch times
+            reach a steady state, in addition to the warmup iterations
         :param kwargs: additional arguments to pass to the framework
         :return: the results of the benchmark run
         :rtype: BenchmarkResult
         """
-        results = []
+        tracker = BenchmarkResultTracker(
+            keep_results=keep_results, detect_warmup=detect_warmup
+        )
         for batch_result in self.run_iter(
             data,
             desc=desc,
@@ -156,8 +166,8 @@ class BenchmarkRunner(ABC):
             *args,
             **kwargs,
         ):
-            results.append(batch_result)
-        return BenchmarkResult.from_results(results)
+            tracker.add(batch_result)
+        return tracker.to_result()
 
     def run_iter(
         self,
@@ -16,7 +16,8 @@
 Functionality related to serialization of the benchmarking run.
 """
 
-from typing import Any, Dict, List, Optional, Union
+import math
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 import numpy
 from pydantic import BaseModel, Field
@@ -26,13 +27,208 @@ from sparseml.framework import FrameworkInferenceProviderInfo
 
 
 __all__ = [
+    "DEFAULT_LATENCY_PERCENTILES",
+    "LatencyHistogram",
     "BatchBenchmarkResult",
     "BenchmarkResult",
+    "BenchmarkResultTracker",
     "BenchmarkConfig",
     "BenchmarkInfo",
 ]
 
 
+DEFAULT_LATENCY_PERCENTILES = (50.0, 90.0, 95.0, 99.0, 99.9)
+
+
+class LatencyHistogram(BaseModel):
+    """
+    Class for tracking the distribution of latencies in constant memory.
+    Values are counted in logarithmically sized buckets so any percentile
+    can be estimated within relative_accuracy of the true value. The number of
+    buckets only depends on the range of the values, not on how many are added.
+
+    Extends pydantic BaseModel class for serialization to and from json in addition
+    to proper type checking on construction.
+    """
+
+    relative_accuracy: float = Field(
+        default=0.01,
+        title="relative_accuracy",
+        description="The relative accuracy of the estimated percentiles",
+        gt=0.0,
+        lt=1.0,
+    )
+    min_value: float = Field(
+        default=1e-6,
+        title="min_value",
+        description=(
+            "The smallest value, in seconds, tracked accurately. "
+            "Smaller values are counted in the first bucket"
+        ),
+        gt=0.0,
+    )
+    counts: Dict[int, int] = Field(
+        default={},
+        title="counts",
+        description="The number of values counted in each logarithmic bucket",
+    )
+    count: int = Field(
+        default=0,
+        title="count",
+        description="The number of values added",
+        ge=0,
+    )
+    total: float = Field(
+        default=0.0,
+        title="total",
+        description="The sum of all of the values added",
+        ge=0.0,
+    )
+    minimum: Optional[float] = Field(
+        default=None,
+        title="minimum",
+        description="The smallest value added",
+    )
+    maximum: Optional[float] = Field(
+        default=None,
+        title="maximum",
+        description="The largest value added",
+    )
+
+    @property
+    def mean(self) -> float:
+        """
+        :return: the mean of the values added, 0.0 if none were added
+        """
+        return self.total / self.count if self.count > 0 else 0.0
+
+    def add(self, value: float, count: int = 1):
+        """
+        :param value: the value to add to the histogram
+        :param count: the number of times to add the value
+        """
+        index = self._bucket_index(value)
+        self.counts[index] = self.counts.get(index, 0) + count
+        self.count += count
+        self.total += value * count
+        self.minimum = value if self.minimum is None else min(self.minimum, value)
+        self.maximum = value if self.maximum is None else max(self.maximum, value)
+
+    def merge(self, other: "LatencyHistogram"):
+        """
+        :param other: the histogram to add the counts from into this one,
+            must have the same relative_accuracy and min_value
+        """
+        if (
+            other.relative_accuracy != self.relative_accuracy
+            or other.min_value != self.min_value
+        ):
+            raise ValueError(
+                "cannot merge histograms with different relative_accuracy or min_value"
+            )
+
+        for index, count in other.counts.items():
+            self.counts[index] = self.counts.get(index, 0) + count
+
+        self.count += other.count
+        self.total += other.total
+
+        for val in [other.minimum, other.maximum]:
+            if val is not None:
+                self.minimum = val if self.minimum is None else min(self.minimum, val)
+                self.maximum = val if self.maximum is None else max(self.maximum, val)
+
+    def percentile(self, percentile: float) -> float:
+        """
+        :param percentile: the percentile, from 0 to 100, to estimate
+        :return: the estimated value at the percentile, 0.0 if no values were added
+        """
+        if percentile < 0.0 or percentile > 100.0:
+            raise ValueError(
+                "percentile must be in the range [0, 100], given {}".format(percentile)
+            )
+
+        if self.count < 1:
+            return 0.0
+
+        # linearly interpolate between the closest ranks, matching numpy.percentile
+        rank = percentile / 100.0 * (self.count - 1)
+        lower_rank = int(math.floor(rank))
+        lower = self._rank_value(lower_rank)
+        upper = self._rank_value(min(lower_rank + 1, self.count - 1))
+
+        return lower + (upper - lower) * (rank - lower_rank)
+
+    def percentiles(
+        self, percentiles: Tuple[float, ...] = DEFAULT_LATENCY_PERCENTILES
+    ) -> Dict[str, float]:
+        """
+        :param percentiles: the percentiles, from 0 to 100, to estimate
+        :return: the estimated values keyed by the percentile, ex: p50, p99.9
+        """
+        return {
+            "p{:g}".format(percentile): self.percentile(percentile)
+            for percentile in percentiles
+        }
+
+    def trimmed_mean(self, iqr_scale: float = 1.5) -> Tuple[float, int]:
+        """
+        :param iqr_scale: values further than iqr_scale times the interquartile
+            range below the first quartile or above the third quartile are
+            treated as outliers
+        :return: a tuple containing the mean of the values that are not
+            outliers and the number of outliers excluded from it
+        """
+        if self.count < 1:
+            return 0.0, 0
+
+        first_quartile = self.percentile(25.0)
+        third_quartile = self.percentile(75.0)
+        spread = iqr_scale * (third_quartile - first_quartile)
+        lower_index = self._bucket_index(first_quartile - spread)
+        upper_index = self._bucket_index(third_quartile + spread)
+        kept_count = 0
+        kept_total = 0.0
+
+        for index, count in self.counts.items():
+            if lower_index <= index <= upper_index:
+                kept_count += count
+                kept_total += self._bucket_value(index) * count
+
+        if kept_count == self.count:
+            # nothing trimmed, use the exact mean rather than the bucket estimates
+            return self.mean, 0
+
+        return kept_total / kept_count, self.count - kept_count
+
+    def _rank_value(self, rank: int) -> float:
+        seen = 0
+
+        for index in sorted(self.counts.keys()):
+            seen += self.counts[index]
+
+            if seen > rank:
+                return min(max(self._bucket_value(index), self.minimum), self.maximum)
+
+        return self.maximum
+
+    @property
+    def _gamma(self) -> float:
+        return (1.0 + self.relative_accuracy) / (1.0 - self.relative_accuracy)
+
+    def _bucket_index(self, value: float) -> int:
+        if value <= self.min_value:
+            return 0
+
+        return int(math.ceil(math.log(value / self.min_value, self._gamma)))
+
+    def _bucket_value(self, index: int) -> float:
+        # midpoint of the bucket, within relative_accuracy of every value in it
+        gamma = self._gamma
+
+        return self.min_value * 2.0 * gamma ** index / (gamma + 1.0)
+
+
 class BatchBenchmarkResult(BaseModel):
     """
     Class for storing the result of one batch of a benchmark run.
@@ -176,11 +372,74 @@ class BenchmarkResult(BaseModel):
         ge=0,
     )
 
+    batch_times_percentiles: Dict[str, float] = Field(
+        default={},
+        title="batch_times_percentiles",
+        description=(
+            "The estimated time in seconds to complete a batch at each percentile, "
+            "keyed by the percentile, ex: p50, p99.9"
+        ),
+    )
+    batch_times_histogram: Optional[LatencyHistogram] = Field(
+        default=None,
+        title="batch_times_histogram",
+        description=(
+            "The distribution of the batch times in constant memory, "
+            "can be merged with other runs to compare tail latencies"
+        ),
+    )
+    batch_times_trimmed_mean: Optional[float] = Field(
+        default=None,
+        title="batch_times_trimmed_mean",
+        description="The mean time to complete a batch excluding outliers",
+        ge=0.0,
+    )
+    num_outliers: int = Field(
+        default=0,
+        title="num_outliers",
+        description="The number of batch times excluded from the trimmed mean",
+        ge=0,
+    )
+    num_warmup_batches: int = Field(
+        default=0,
+        title="num_warmup_batches",
+        description=(
+            "The number of batches detected as warm up before the batch times "
+            "reached a steady state, excluded from all results"
+        ),
+        ge=0,
+    )
+    num_streams: int = Field(
+        default=1,
+        title="num_streams",
+        description="The number of streams the batches were run through at once",
+        ge=1,
+    )
+    concurrent_items_per_second: Optional[float] = Field(
+        default=None,
+        title="concurrent_items_per_second",
+        description=(
+            "The wall clock number of items processed per second across all "
+            "streams, only set when run with more than one stream"
+        ),
+        ge=0.0,
+    )
+    concurrent_batches_per_second: Optional[float] = Field(
+        default=None,
+        title="concurrent_batches_per_second",
+        description=(
+            "The wall clock number of batches processed per second across all "
+            "streams, only set when run with more than one stream"
+        ),
+        ge=0.0,
+    )
+
     @classmethod
     def from_results(
         cls,
         results: List[Union[BatchBenchmarkResult, float]],
         batch_size: Optional[int] = None,
+        detect_warmup: bool = False,
     ) -> "BenchmarkResult":
         """
         Creates a serialized BenchmarkResult from a given list of benchmark results.
@@ -188,6 +447,8 @@ class BenchmarkResult(BaseModel):
 
         :param batch_time: Time to process a batch of data in seconds
         :param batch_size: Batch size of the result
+        :param detect_warmup: True to exclude the batches run before the batch
+            times reached a steady state, False to keep all of them
         :return: A serialized BatchBenchmarkResult
         """
         if not results:
@@ -196,56 +457,208 @@ class BenchmarkResult(BaseModel):
         for index, result in enumerate(results):
             if not isinstance(result, BatchBenchmarkResult):
                 results[index] = BatchBenchmarkResult.from_result(result, batch_size)
-        batch_times = [r.batch_time for r in results]
-        num_batches = len(batch_times)
-        num_items = sum(r.batch_size for r in results)
 
-        batch_times_mean = numpy.mean(batch_times).item()
-        batch_times_median = numpy.median(batch_times).item()
-        batch_times_std = numpy.std(batch_times).item()
+        tracker = BenchmarkResultTracker(batch_size, detect_warmup=detect_warmup)
+
+        for result in results:
+            tracker.add(result)
 
-        batches_per_second = num_batches / sum(batch_times)
-        items_per_second = num_items / sum(batch_times)
+        return tracker.to_result()
 
-        ms_per_batch = sum(batch_times) * 1e3 / num_batches
-        ms_per_item = sum(batch_times) * 1e3 / num_items
 
-        sorted_batch_times = sorted(batch_times)
-        top_90_index = int((num_batches) * 0.9)
-        top_95_index = int((num_batches) * 0.95)
-        top_99_index = int((num_batches) * 0.99)
+class BenchmarkResultTracker(object):
+    """
+    Builds a BenchmarkResult from batch results added one at a time.
+    Batch times are tracked in a LatencyHistogram, so with keep_results=False
+    memory use stays constant no matter how many batches are run.
+
+    :param batch_size: the batch size to use for results given as batch times
+    :param keep_results: True to keep every batch result to serialize in the
+        BenchmarkResult and calculate its stats exactly, False to estimate them
+        from the histogram
+    :param detect_warmup: True to exclude the batches run before the batch times
+        reach a steady state from the results
+    :param warmup_window: the number of batches in each of the two consecutive
+        windows whose mean batch times are compared to detect a steady state
+    :param warmup_tolerance: the relative difference between the mean batch times
+        of the windows below which the batch times are considered steady
+    :param max_warmup_batches: the most batches that can be treated as warm up.
+        If no steady state is found by then, no batches are treated as warm up
+    :param relative_accuracy: the relative accuracy of the percentile estimates
+    """
 
-        batch_times_median_90 = (
+    def __init__(
+        self,
+        batch_size: Optional[int] = None,
+        keep_results: bool = True,
+        detect_warmup: bool = False,
+        warmup_window: int = 10,
+        warmup_tolerance: float = 0.05,
+        max_warmup_batches: int = 100,
+        relative_accuracy: float = 0.01,
+    ):
+        if warmup_window < 1:
+            raise ValueError("warmup_window must be positive")
+
+        self._batch_size = batch_size
+        self._keep_results = keep_results
+        self._warmup_window = warmup_window
+        self._warmup_tolerance = warmup_tolerance
+        self._max_warmup_batches = max_warmup_batches
+        self._warmup_buffer = [] if detect_warmup else None
+        self._num_warmup_batches = 0
+        self._results = []
+        self._histogram = LatencyHistogram(relative_accuracy=relative_accuracy)
+        self._num_items = 0
+        self._mean = 0.0
+        self._sum_squares = 0.0
+
+    @property
+    def num_batches(self) -> int:
+        """
+        :return: the number of batches added so far, including any that may
+            still be detected as warm up
+        """
+        pending = len(self._warmup_buffer) if self._warmup_buffer else 0
+
+        return self._num_warmup_batches + self._histogram.count + pending
+
+    def add(self, result: Union[BatchBenchmarkResult, float]):
+        """
+        :param result: the result for a batch or the time in seconds to run it
+        """
+        if isinstance(result, BatchBenchmarkResult):
+            item = (result.batch_time, result.batch_size, result)
+        elif self._keep_results:
+            result = BatchBenchmarkResult.from_result(result, self._batch_size)
+            item = (result.batch_time, result.batch_size, result)
+        else:
+            # skip creating a BatchBenchmarkResult that would not be kept
+            if result <= 0:
+                raise ValueError("batch_time must be positive")
+            if self._batch_size is None or self._batch_size < 1:
+                raise ValueError("batch_size must be positive")
+            item = (result, self._batch_size, None)
+
+        if self._warmup_buffer is None:
+            self._record(*item)
+
+            return
+
+        self._warmup_buffer.append(item)
+        window = self._warmup_window
+
+        if len(self._warmup_buffer) >= 2 * window:
+            previous_mean = numpy.mean(
+                [val[0] for val in self._warmup_buffer[-2 * window : -window]]
+            )
+            current_mean = numpy.mean([val[0] for val in self._warmup_buffer[-window:]])
+
+            if abs(previous_mean - current_mean) <= (
+                self._warmup_tolerance * current_mean
+            ):
+                self._num_warmup_batches = len(self._warmup_buffer) - 2 * window
+                self._flush_warmup(self._num_warmup_batches)
+            elif len(self._warmup_buffer) >= self._max_warmup_batches + 2 * window:
+                self._flush_warmup(0)
+
+    def to_result(self) -> BenchmarkResult:
+        """
+        :return: the BenchmarkResult for all of the batches added, excluding
+            any detected warm up batches
+        """
+        if self._warmup_buffer:
+            # never reached a steady state, so none of the batches are warm up
+            self._flush_warmup(0)
+
+        num_batches = self._histogram.count
+
+        if num_batches < 1:
+            raise ValueError("results must be non-empty")
+
+        if self._keep_results:
+            stats = _batch_times_stats([res.batch_time for res in self._results])
+        else:
+            stats = dict(
+                batch_times_mean=self._mean,
+                batch_times_median=self._histogram.percentile(50.0),
+                batch_times_std=math.sqrt(self._sum_squares / num_batches),
+                batch_times_median_90=self._histogram.percentile(45.0),
+                batch_times_median_95=self._histogram.percentile(47.5),
+                batch_times_median_99=self._histogram.percentile(49.5),
+                total_time=self._histogram.total,
+            )
+
+        total_time = stats.pop("total_time")
+        trimmed_mean, num_outliers = self._histogram.trimmed_mean()
+
+        return BenchmarkResult(
+            results=list(self._results),
+            items_per_second=self._num_items / total_time,
+            batches_per_second=num_batches / total_time,
+            ms_per_batch=total_time * 1e3 / num_batches,
+            ms_per_item=total_time * 1e3 / self._num_items,
+            num_items=self._num_items,
+            num_batches=num_batches,
+            batch_times_percentiles=self._histogram.percentiles(),
+            batch_times_histogram=self._histogram.copy(deep=True),
+            batch_times_trimmed_mean=trimmed_mean,
+            num_outliers=num_outliers,
+            num_warmup_batches=self._num_warmup_batches,
+            **stats,
+        )
+
+    def _flush_warmup(self, num_warmup: int):
+        for item in self._warmup_buffer[num_warmup:]:
+            self._record(*item)
+
+        self._warmup_buffer = None
+
+    def _record(
+        self,
+        batch_time: float,
+        batch_size: int,
+        result: Optional[BatchBenchmarkResult],
+    ):
+        if self._keep_results:
+            self._results.append(result)
+
+        self._histogram.add(batch_time)
+        self._num_items += batch_size
+        # Welford's running mean and sum of squared differences
+        delta = batch_time - self._mean
+        self._mean += delta / self._histogram.count
+        self._sum_squares += delta * (batch_time - self._mean)
+
+
+def _batch_times_stats(batch_times: List[float]) -> Dict[str, float]:
+    num_batches = len(batch_times)
+    sorted_batch_times = sorted(batch_times)
+    top_90_index = int((num_batches) * 0.9)
+    top_95_index = int((num_batches) * 0.95)
+    top_99_index = int((num_batches) * 0.99)
+
+    return dict(
+        batch_times_mean=numpy.mean(batch_times).item(),
+        batch_times_median=numpy.median(batch_times).item(),
+        batch_times_std=numpy.std(batch_times).item(),
+        batch_times_median_90=(
             numpy.median(sorted_batch_times[:top_90_index]).item()
             if top_90_index > 1
             else sorted_batch_times[0]
-        )
-        batch_times_median_95 = (
+        ),
+        batch_times_median_95=(
             numpy.median(sorted_batch_times[:top_95_index]).item()
             if top_95_index > 1
             else sorted_batch_times[0]
-        )
-        batch_times_median_99 = (
+        ),
+        batch_times_median_99=(
             numpy.median(sorted_batch_times[:top_99_index]).item()
             if top_99_index > 1
             else sorted_batch_times[0]
-        )
-
-        return BenchmarkResult(
-            results=results,
-            batch_times_mean=batch_times_mean,
-            batch_times_median=batch_times_median,
-            batch_times_std=batch_times_std,
-            batch_times_median_90=batch_times_median_90,
-            batch_times_median_95=batch_times_median_95,
-            batch_times_median_99=batch_times_median_99,
-            items_per_second=items_per_second,
-            batches_per_second=batches_per_second,
-            ms_per_batch=ms_per_batch,
-            ms_per_item=ms_per_item,
-            num_items=num_items,
-            num_batches=num_batches,
-        )
+        ),
+        total_time=sum(batch_times),
+    )
 
 
 class BenchmarkConfig(BaseModel):
@@ -15,13 +15,19 @@
 import logging
 import os
 from collections import OrderedDict
-from typing import Any, Dict, Iterable, Optional, Tuple, Union
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple, Union
 
 import onnx
 from onnx import ModelProto
 
 from sparseml.base import Framework
-from sparseml.benchmark import BatchBenchmarkResult, BenchmarkInfo, BenchmarkRunner
+from sparseml.benchmark import (
+    BatchBenchmarkResult,
+    BenchmarkInfo,
+    BenchmarkResult,
+    BenchmarkResultTracker,
+    BenchmarkRunner,
+)
 from sparseml.framework import FrameworkInfo
 from sparseml.framework.info import FrameworkInferenceProviderInfo
 from sparseml.onnx.base import require_onnx, require_onnxruntime
@@ -54,6 +60,18 @@ GPU_ORT_PROVIDERS = [
 CPU_DEFAULT_ORT_PROVIDER = "CPUExecutionProvider"
 
 
+def _continue_iter(iterator: Iterator[Any]) -> Iterator[Any]:
+    # loaders such as DataLoader restart when iterated again, pull from the
+    # one iterator so the batches used for warmup are not run again
+    while True:
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+
+        yield item
+
+
 def _resolve_device_provider(
     framework_info: FrameworkInfo,
     device: Optional[str] = None,
@@ -99,6 +117,9 @@ class ORTBenchmarkRunner(BenchmarkRunner):
         FrameworkInfo
     :param device: device to use for benchmarking
     :param ort_provider: provider to use for ONNXruntime
+
+    framework_args are passed to the ORTModelRunner. Set num_streams in them to
+    benchmark throughput with that many sessions running batches at once
     """
 
     @require_onnx()
@@ -185,6 +206,82 @@ class ORTBenchmarkRunner(BenchmarkRunner):
         self._iterations = iterations
         self._warmup_iterations = warmup_iterations
 
+    def run(
+        self,
+        data: Any,
+        desc: str = "",
+        load_data_kwargs: Dict[str, Any] = {},
+        show_progress: bool = False,
+        *args,
+        keep_results: bool = True,
+        detect_warmup: bool = False,
+        **kwargs,
+    ) -> BenchmarkResult:
+        """
+        Runs a benchmark on the given data. Results are serialized together using
+        the BenchmarkResult class.
+        If the runner was created with more than one stream, the warmup
+        iterations run one at a time and the rest run through all of the streams
+        at once. All of the per batch stats, including items_per_second and
+        batches_per_second, are then derived from each batch's latency while
+        concurrent_items_per_second and concurrent_batches_per_second hold the
+        wall clock throughput across all of the streams.
+
+        :param data: data to use for benchmarking
+        :param desc: str to display if show_progress is True
+        :param show_progress: whether to show progress
+        :param load_data_kwargs: additional arguments to pass to the framework's
+            load_data method
+        :param args: additional arguments to pass to the framework
+        :param keep_results: True to keep the result for every batch in the
+            BenchmarkResult, False to only keep the distribution of the batch times
+            so memory use stays constant for long runs
+        :param detect_warmup: True to exclude batches run before the batch times
+            reach a steady state, in addition to the warmup iterations
+        :param kwargs: additional arguments to pass to the framework
+        :return: the results of the benchmark run
+        :rtype: BenchmarkResult
+        """
+        if self._framework_args.get("num_streams", 1) == 1:
+            return super().run(
+                data,
+                desc,
+                load_data_kwargs,
+                show_progress,
+                *args,
+                keep_results=keep_results,
+                detect_warmup=detect_warmup,
+                **kwargs,
+            )
+
+        loaded_data = _continue_iter(iter(self.load_data(data, **load_data_kwargs)))
+
+        # like the single stream run, fewer batches than warmup iterations
+        # leaves no results rather than failing mid warmup
+        for _, batch in zip(range(self.warmup_iterations), loaded_data):
+            self.run_batch(batch, *args, **kwargs)
+
+        concurrent_results = self._model_runner.run_concurrent(
+            loaded_data,
+            desc=desc,
+            show_progress=show_progress,
+            max_steps=self.iterations if self.iterations > 0 else -1,
+        )
+        _LOGGER.debug("ran concurrent benchmark {}".format(concurrent_results))
+        tracker = BenchmarkResultTracker(
+            self.batch_size, keep_results=keep_results, detect_warmup=detect_warmup
+        )
+
+        for batch_time in concurrent_results.batch_times:
+            tracker.add(batch_time)
+
+        results = tracker.to_result()
+        results.num_streams = concurrent_results.num_streams
+        results.concurrent_items_per_second = concurrent_results.items_per_second
+        results.concurrent_batches_per_second = concurrent_results.batches_per_second
+
+        return results
+
     def run_batch(
         self, batch: Union[Dict[str, Any], Tuple[Dict[str, Any], Any]], *args, **kwargs
     ) -> BatchBenchmarkResult:
@@ -333,7 +430,9 @@ def load_data(
     :param model: model to use for generating data
     :param batch_size: batch size
     :param total_iterations: total number of iterations
-    :param kwargs: additional arguments to pass to the DataLoader
+    :param kwargs: additional arguments to pass to the DataLoader,
+        ex: lazy_load=True and read_ahead to read numpy files from disk as they
+        are used rather than loading them all up front
     :return: an iterable of data and labels
     """
     # Creates random data from model input shapes if data is not provided
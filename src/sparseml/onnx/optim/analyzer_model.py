@@ -35,6 +35,7 @@ from sparseml.onnx.utils import (
     get_node_inputs,
     get_node_outputs,
     get_node_params,
+    indexed_graph_lookups,
     is_prunable_node,
 )
 from sparseml.utils import clean_path, create_parent_dirs
@@ -320,6 +321,8 @@ class ModelAnalyzer(object):
         can also be set to None if nodes are supplied
     :param nodes: the analyzed nodes to create the analyzer with,
         generally None and model should be passed to create a new one
+    :param node_shapes_cache_dir: optional directory to cache the extracted node
+        shapes in so they persist between runs for models with the same structure
     """
 
     @staticmethod
@@ -349,7 +352,10 @@ class ModelAnalyzer(object):
         return ModelAnalyzer(None, nodes)
 
     def __init__(
-        self, model: Union[ModelProto, str, None], nodes: List[NodeAnalyzer] = None
+        self,
+        model: Union[ModelProto, str, None],
+        nodes: List[NodeAnalyzer] = None,
+        node_shapes_cache_dir: Union[str, None] = None,
     ):
         if model is None and nodes is None:
             raise ValueError("model or nodes must not be None")
@@ -358,14 +364,16 @@ class ModelAnalyzer(object):
             raise ValueError("model or nodes must be None, both cannot be passed")
 
         if model is not None:
-            model = check_load_model(model)
-            node_shapes = extract_node_shapes(model)
-            self._nodes = [
-                NodeAnalyzer(
-                    model, node, node_shape=node_shapes.get(extract_node_id(node))
-                )
-                for node in model.graph.node
-            ]
+            model = check_load_model(model, load_external_data=False)
+            node_shapes = extract_node_shapes(model, cache_dir=node_shapes_cache_dir)
+
+            with indexed_graph_lookups(model):
+                self._nodes = [
+                    NodeAnalyzer(
+                        model, node, node_shape=node_shapes.get(extract_node_id(node))
+                    )
+                    for node in model.graph.node
+                ]
         else:
             self._nodes = nodes
 
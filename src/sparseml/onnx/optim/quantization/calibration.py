@@ -16,7 +16,7 @@
 Provides a class for performing quantization calibration on an Onnx model.
 """
 
-
+import math
 import os
 import tempfile
 from typing import Dict, Generator, Iterable, List, Tuple, Union
@@ -27,7 +27,293 @@ import onnx
 from sparseml.onnx.utils import ORTModelRunner, fold_conv_bns, get_node_output_nodes
 
 
-__all__ = ["CalibrationSession"]
+__all__ = ["CALIBRATION_MODES", "CalibrationStatistics", "CalibrationSession"]
+
+
+CALIBRATION_MODES = ["minmax", "moving_average", "percentile", "entropy"]
+_HISTOGRAM_CALIBRATION_MODES = ["percentile", "entropy"]
+_CALIB_TENSOR_SUFFIX = "_CalibTensor"
+
+
+class CalibrationStatistics(object):
+    """
+    Running statistics for a single tensor collected over calibration batches.
+    Memory use is constant in the number of batches seen: only the running
+    min and max, their moving averages, and a fixed size histogram of the
+    absolute values of the tensor are stored.
+
+    The histogram covers [0, histogram_max) with num_bins equal width bins.
+    When a batch contains a value outside of the current range, the range is
+    doubled by merging neighboring bins until the value fits.
+
+    :param num_bins: the number of bins to use for the histogram,
+        must be a positive even number. Default is 2048
+    :param averaging_constant: the weight given to a new batch's min and max
+        when updating the moving averages. Default is 0.01
+    """
+
+    def __init__(self, num_bins: int = 2048, averaging_constant: float = 0.01):
+        if num_bins <= 0 or num_bins % 2 != 0:
+            raise ValueError(
+                "num_bins must be a positive even number, given {}".format(num_bins)
+            )
+
+        if not 0.0 < averaging_constant <= 1.0:
+            raise ValueError(
+                "averaging_constant must be in (0, 1], given {}".format(
+                    averaging_constant
+                )
+            )
+
+        self._num_bins = num_bins
+        self._averaging_constant = averaging_constant
+        self._num_batches = 0
+        self._min = None
+        self._max = None
+        self._moving_average_min = None
+        self._moving_average_max = None
+        self._histogram = None
+        self._histogram_max = 0.0
+
+    @property
+    def num_bins(self) -> int:
+        """
+        :return: the number of bins used for the histogram
+        """
+        return self._num_bins
+
+    @property
+    def num_batches(self) -> int:
+        """
+        :return: the number of batches the statistics were updated with
+        """
+        return self._num_batches
+
+    @property
+    def min(self) -> Union[float, None]:
+        """
+        :return: the smallest value seen across all batches
+        """
+        return self._min
+
+    @property
+    def max(self) -> Union[float, None]:
+        """
+        :return: the largest value seen across all batches
+        """
+        return self._max
+
+    @property
+    def moving_average_min(self) -> Union[float, None]:
+        """
+        :return: the exponential moving average of the batch min values
+        """
+        return self._moving_average_min
+
+    @property
+    def moving_average_max(self) -> Union[float, None]:
+        """
+        :return: the exponential moving average of the batch max values
+        """
+        return self._moving_average_max
+
+    @property
+    def histogram(self) -> Union[np.ndarray, None]:
+        """
+        :return: the counts for the histogram of absolute values,
+            None if no values have been added
+        """
+        return self._histogram
+
+    @property
+    def histogram_max(self) -> float:
+        """
+        :return: the upper edge of the last bin in the histogram
+        """
+        return self._histogram_max
+
+    def update(
+        self, min_val: float, max_val: float, values: Union[np.ndarray, None] = None
+    ):
+        """
+        :param min_val: the min value of the tensor for the current batch
+        :param max_val: the max value of the tensor for the current batch
+        :param values: the values of the tensor for the current batch to add
+            to the histogram, if None the histogram is not updated
+        """
+        min_val = float(min_val)
+        max_val = float(max_val)
+
+        if self._num_batches == 0:
+            self._min = min_val
+            self._max = max_val
+            self._moving_average_min = min_val
+            self._moving_average_max = max_val
+        else:
+            self._min = min(self._min, min_val)
+            self._max = max(self._max, max_val)
+            self._moving_average_min += self._averaging_constant * (
+                min_val - self._moving_average_min
+            )
+            self._moving_average_max += self._averaging_constant * (
+                max_val - self._moving_average_max
+            )
+
+        self._num_batches += 1
+
+        if values is not None:
+            self._update_histogram(values)
+
+    def percentile_range(self, percentile: float = 99.999) -> Tuple[float, float]:
+        """
+        :param percentile: the percentile of absolute values to cover, in [0, 100]
+        :return: the min and max range that covers the given percentile of
+            absolute values, clipped to the min and max seen
+        """
+        self._validate_histogram()
+        cdf = np.cumsum(self._histogram, dtype=np.float64)
+        cdf /= cdf[-1]
+        bin_idx = int(np.searchsorted(cdf, percentile / 100.0))
+        bin_idx = min(bin_idx, self._num_bins - 1)
+
+        return self._threshold_range((bin_idx + 1) * self._bin_width())
+
+    def entropy_range(self, num_quantized_bins: int = 128) -> Tuple[float, float]:
+        """
+        Selects the threshold on absolute values that minimizes the KL divergence
+        between the histogram and its quantized version with num_quantized_bins
+        levels, values above the threshold are clipped into the last bin.
+
+        :param num_quantized_bins: the number of quantization levels to
+            compare the histogram against. Default is 128
+        :return: the min and max range for the selected threshold,
+            clipped to the min and max seen
+        """
+        self._validate_histogram()
+        histogram = self._histogram.astype(np.float64)
+        num_bins = self._num_bins
+
+        if num_quantized_bins >= num_bins or not histogram[num_quantized_bins:].any():
+            return self._threshold_range(self._histogram_max)
+
+        nonzero = histogram != 0
+        nonzero_counts = nonzero.astype(np.int64)
+        tail_sums = np.cumsum(histogram[::-1])[::-1]
+        best_divergence = math.inf
+        best_idx = num_bins
+
+        for idx in range(num_quantized_bins, num_bins + 1):
+            reference = histogram[:idx].copy()
+            if idx < num_bins:
+                reference[-1] += tail_sums[idx]
+
+            starts = (np.arange(num_quantized_bins) * idx) // num_quantized_bins
+            lengths = np.diff(np.append(starts, idx))
+            sums = np.add.reduceat(histogram[:idx], starts)
+            counts = np.add.reduceat(nonzero_counts[:idx], starts)
+            expanded = np.repeat(sums / np.maximum(counts, 1), lengths)
+            expanded[~nonzero[:idx]] = 0.0
+
+            divergence = _kl_divergence(reference, expanded)
+
+            if divergence < best_divergence:
+                best_divergence = divergence
+                best_idx = idx
+
+        return self._threshold_range(best_idx * self._bin_width())
+
+    def range(
+        self,
+        calibration_mode: str = "minmax",
+        percentile: float = 99.999,
+    ) -> Tuple[float, float]:
+        """
+        :param calibration_mode: the method to select the range with,
+            one of CALIBRATION_MODES
+        :param percentile: the percentile to cover for the percentile mode
+        :return: the min and max range selected for the tensor
+        """
+        if self._num_batches == 0:
+            raise ValueError("no batches have been added to the calibration stats")
+
+        if calibration_mode == "minmax":
+            return self._min, self._max
+
+        if calibration_mode == "moving_average":
+            return self._moving_average_min, self._moving_average_max
+
+        if calibration_mode == "percentile":
+            return self.percentile_range(percentile)
+
+        if calibration_mode == "entropy":
+            return self.entropy_range()
+
+        raise ValueError(
+            "unknown calibration_mode {}, expected one of {}".format(
+                calibration_mode, CALIBRATION_MODES
+            )
+        )
+
+    def _update_histogram(self, values: np.ndarray):
+        values = np.abs(np.asarray(values, dtype=np.float32).reshape(-1))
+
+        if values.size == 0:
+            return
+
+        if self._histogram is None:
+            self._histogram = np.zeros(self._num_bins, dtype=np.int64)
+
+        max_abs = float(values.max())
+
+        if self._histogram_max == 0.0:
+            # all previous values were zero and so fall in the first bin
+            # regardless of the range selected now
+            self._histogram_max = max_abs
+
+        while max_abs > self._histogram_max:
+            merged = self._histogram.reshape(-1, 2).sum(axis=1)
+            self._histogram = np.concatenate(
+                [merged, np.zeros(self._num_bins - merged.size, dtype=np.int64)]
+            )
+            self._histogram_max *= 2.0
+
+        if self._histogram_max == 0.0:
+            self._histogram[0] += values.size
+
+            return
+
+        indices = (values * (self._num_bins / self._histogram_max)).astype(np.int64)
+        np.minimum(indices, self._num_bins - 1, out=indices)
+        self._histogram += np.bincount(indices, minlength=self._num_bins)
+
+    def _validate_histogram(self):
+        if self._histogram is None:
+            raise ValueError(
+                "no values have been added to the calibration histogram, "
+                "values must be passed to update for percentile or entropy ranges"
+            )
+
+    def _bin_width(self) -> float:
+        return self._histogram_max / self._num_bins
+
+    def _threshold_range(self, threshold: float) -> Tuple[float, float]:
+        return max(self._min, -threshold), min(self._max, threshold)
+
+
+def _kl_divergence(reference: np.ndarray, quantized: np.ndarray) -> float:
+    reference = reference / reference.sum()
+    quantized_total = quantized.sum()
+
+    if quantized_total == 0:
+        return math.inf
+
+    quantized = quantized / quantized_total
+    mask = reference > 0
+    # reference bins with no quantized mass only occur for the clipped outliers,
+    # smooth them rather than returning an infinite divergence
+    quantized = np.maximum(quantized[mask], 1e-10)
+
+    return float(np.sum(reference[mask] * np.log(reference[mask] / quantized)))
 
 
 class CalibrationSession:
@@ -41,6 +327,17 @@ class CalibrationSession:
     :param include_nodes: List of operator names to force to be quantized
     :param augmented_model_path: file path to save augmented model to for verification
     :param static: True to use static quantization. Default is True
+    :param calibration_mode: the method used to select the quantization range of
+        each tensor, one of CALIBRATION_MODES. 'minmax' uses the min and max seen
+        across all batches, 'moving_average' uses a moving average of the batch
+        min and max values, 'percentile' and 'entropy' select a range from a
+        running histogram of each tensor. Default is 'minmax'
+    :param num_bins: the number of histogram bins to track per tensor for the
+        'percentile' and 'entropy' modes. Default is 2048
+    :param percentile: the percentile of absolute values to cover in the
+        'percentile' mode. Default is 99.999
+    :param averaging_constant: the weight given to each batch in the
+        'moving_average' mode. Default is 0.01
     """
 
     def __init__(
@@ -51,13 +348,28 @@ class CalibrationSession:
         include_nodes: List[str] = None,
         augmented_model_path: str = None,
         static: bool = True,
+        calibration_mode: str = "minmax",
+        num_bins: int = 2048,
+        percentile: float = 99.999,
+        averaging_constant: float = 0.01,
     ):
+        if calibration_mode not in CALIBRATION_MODES:
+            raise ValueError(
+                "unknown calibration_mode {}, expected one of {}".format(
+                    calibration_mode, CALIBRATION_MODES
+                )
+            )
+
         self._onnx_file = onnx_file
         self._calibrate_op_types = list(calibrate_op_types)
         self._exclude_nodes = exclude_nodes or []
         self._include_nodes = include_nodes or []
         self._augmented_model_path = augmented_model_path
         self._static = static
+        self._calibration_mode = calibration_mode
+        self._num_bins = num_bins
+        self._percentile = percentile
+        self._averaging_constant = averaging_constant
 
         self._model = onnx.load(self._onnx_file)
         self._optimized_model_path = self._optimize_model()
@@ -71,7 +383,7 @@ class CalibrationSession:
         onnx.save(self._model_augmented, self._augmented_model_path)
 
         self._sessions = {}  # batch_size -> session
-        self._quantization_thresholds = {}  # Dict[node.name, Tuple(min_val, max_val)]
+        self._calibration_stats = {}  # Dict[edge name, CalibrationStatistics]
 
     @property
     def model(self):
@@ -89,6 +401,21 @@ class CalibrationSession:
         """
         return self._model_augmented
 
+    @property
+    def calibration_mode(self) -> str:
+        """
+        :return: the method used to select the quantization range of each tensor
+        """
+        return self._calibration_mode
+
+    @property
+    def calibration_stats(self) -> Dict[str, CalibrationStatistics]:
+        """
+        :return: the running calibration statistics for each calibrated
+            graph edge name
+        """
+        return self._calibration_stats
+
     def _optimize_model(self) -> Union[str, None]:
         """
         Perform batch norm folding in model if possible.
@@ -153,6 +480,42 @@ class CalibrationSession:
         )
         return reduce_node, reduce_node_output
 
+    def add_identity_to_node_output(
+        self, output_edge: str, edge_info: Union[onnx.ValueInfoProto, None] = None
+    ) -> Tuple[onnx.NodeProto, onnx.ValueInfoProto]:
+        """
+        :param output_edge: the graph edge to expose as a model output
+        :param edge_info: optional value info for the edge to copy the
+            shape of the output from
+        :return: a tuple of an identity node for the edge and its output
+        """
+        output_name = output_edge + _CALIB_TENSOR_SUFFIX
+        identity_node = onnx.helper.make_node(
+            "Identity", [output_edge], [output_name], output_name
+        )
+        identity_node_output = onnx.helper.make_tensor_value_info(
+            output_name, onnx.TensorProto.FLOAT, None
+        )
+        if edge_info is not None:
+            identity_node_output.type.CopyFrom(edge_info.type)
+        return identity_node, identity_node_output
+
+    def _get_edge_value_infos(self) -> Dict[str, onnx.ValueInfoProto]:
+        """
+        :return: the value info of every graph edge with a known type
+            after running shape inference on the model
+        """
+        try:
+            inferred_model = onnx.shape_inference.infer_shapes(self._model)
+        except Exception:
+            inferred_model = self._model
+        graph = inferred_model.graph
+        return {
+            info.name: info
+            for info in list(graph.input) + list(graph.value_info) + list(graph.output)
+            if info.type.HasField("tensor_type")
+        }
+
     def _get_input_node_for_edge(self, input_edge: str) -> onnx.NodeProto:
         """
         :param input_edge: name of graph edge to get input node for
@@ -168,12 +531,18 @@ class CalibrationSession:
         """
         return: A new Onnx model with ReduceMin and ReduceMax nodes added to all
             quantizable nodes in the original model and ensures their outputs are
-            stored as part of the graph output.
+            stored as part of the graph output. For the histogram based calibration
+            modes, the full calibrated activations are also added as outputs
+            after the reduce outputs.
         """
 
         added_nodes = []
         added_outputs = []
+        tensor_outputs = []
         edges_already_calibrated = []
+        track_tensors = self._calibration_mode in _HISTOGRAM_CALIBRATION_MODES
+        initializer_names = {init.name for init in self._model.graph.initializer}
+        edge_infos = self._get_edge_value_infos() if track_tensors else {}
 
         for node in self._model.graph.node:
             should_calibrate = (
@@ -209,6 +578,20 @@ class CalibrationSession:
                     added_nodes.append(reduce_node)
                     added_outputs.append(reduce_node_output)
 
+                    # initializer ranges are not used for activation quantization
+                    # so only their min and max are tracked
+                    if track_tensors and output_edge not in initializer_names:
+                        (
+                            identity_node,
+                            identity_node_output,
+                        ) = self.add_identity_to_node_output(
+                            output_edge, edge_infos.get(output_edge)
+                        )
+                        added_nodes.append(identity_node)
+                        tensor_outputs.append(identity_node_output)
+
+        added_outputs.extend(tensor_outputs)
+
         # use optimized model if available
         base_model_path = self._optimized_model_path or self._onnx_file
         augmented_model = onnx.load(base_model_path)
@@ -232,8 +615,14 @@ class CalibrationSession:
             output_obj.name for output_obj in self._model_augmented.graph.output
         ]
 
-        calib_output_names = output_names[num_orig_outputs:]
-        calib_outputs = outputs[num_orig_outputs:]
+        calib_output_names = []
+        calib_outputs = []
+        for output_name, output in zip(
+            output_names[num_orig_outputs:], outputs[num_orig_outputs:]
+        ):
+            if not output_name.endswith(_CALIB_TENSOR_SUFFIX):
+                calib_output_names.append(output_name)
+                calib_outputs.append(output)
 
         # Iterate through outputs in pairs of min, max
         assert len(calib_output_names) % 2 == 0
@@ -256,7 +645,10 @@ class CalibrationSession:
 
     def process_batch(self, input_batch: Dict[str, np.ndarray]) -> None:
         """
-        Updates the model's calibration thresholds based on a run of the input batch
+        Updates the model's calibration statistics based on a run of the input batch
+
+        Only the running statistics of each tensor are kept, the batch
+        activations are released once they have been added.
 
         :param input_batch: Dictionary of pre-processed model input batch to use, with
             input names mapped to a numpy array of the batch
@@ -266,20 +658,37 @@ class CalibrationSession:
             self._sessions[batch_size] = ORTModelRunner(
                 self._augmented_model_path, batch_size=batch_size
             )
-        outputs, _ = self._sessions[batch_size].batch_forward(input_batch)
+        outputs_dict, _ = self._sessions[batch_size].batch_forward(input_batch)
         # extract just output values from ordered dict
-        outputs = list(outputs.values())
+        outputs = list(outputs_dict.values())
 
         for op_name, min_val, max_val in self._iter_calib_ops_output(outputs):
-            if op_name not in self._quantization_thresholds:
-                self._quantization_thresholds[op_name] = (min_val, max_val)
-            else:
-                op_prev_min, op_prev_max = self._quantization_thresholds[op_name]
-                self._quantization_thresholds[op_name] = (
-                    min(op_prev_min, min_val),
-                    max(op_prev_max, max_val),
+            if op_name not in self._calibration_stats:
+                self._calibration_stats[op_name] = CalibrationStatistics(
+                    self._num_bins, self._averaging_constant
                 )
 
+            self._calibration_stats[op_name].update(
+                min_val, max_val, outputs_dict.get(op_name + _CALIB_TENSOR_SUFFIX)
+            )
+
+    def get_quantization_thresholds(self) -> Dict[str, Tuple[float, float]]:
+        """
+        :return: A dictionary of the calibrated graph edge names mapped to
+            the (min, max) range selected by the calibration mode. Initializers
+            have no histogram tracked and always use their min and max
+        """
+        thresholds = {}
+        for name, stats in self._calibration_stats.items():
+            calibration_mode = self._calibration_mode
+            if stats.histogram is None and calibration_mode in (
+                _HISTOGRAM_CALIBRATION_MODES
+            ):
+                calibration_mode = "minmax"
+            thresholds[name] = stats.range(calibration_mode, self._percentile)
+
+        return thresholds
+
     def get_quantization_params_dict(self) -> Dict[str, List[Union[int, float]]]:
         """
         :return: A dictionary of quantization parameters based on the original
@@ -287,11 +696,12 @@ class CalibrationSession:
             process_batch function.  The format of the dictionary will be:
             {"param_name": [zero_point, scale]}
         """
+        quantization_thresholds = self.get_quantization_thresholds()
         quantization_params = {}
         for idx, node in enumerate(self._model.graph.node):
             node_output_name = node.output[0]
-            if node_output_name in self._quantization_thresholds:
-                range_min, range_max = self._quantization_thresholds[node_output_name]
+            if node_output_name in quantization_thresholds:
+                range_min, range_max = quantization_thresholds[node_output_name]
                 next_nodes = get_node_output_nodes(self._model, node)
                 # only pass next_node for optimization if there is 1
                 next_node = next_nodes[0] if len(next_nodes) == 1 else None
@@ -302,10 +712,10 @@ class CalibrationSession:
         # Add model inputs to quantization_params
         for input_name in self.get_model_input_names():
             if (
-                input_name in self._quantization_thresholds
+                input_name in quantization_thresholds
                 and input_name not in quantization_params
             ):
-                range_min, range_max = self._quantization_thresholds[input_name]
+                range_min, range_max = quantization_thresholds[input_name]
                 inp_params = CalibrationSession._calculate_scale_zeropoint(
                     range_min, range_max, None
                 )
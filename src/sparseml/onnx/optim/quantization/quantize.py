@@ -4,11 +4,14 @@
 # https://github.com/microsoft/onnxruntime/tree/master/onnxruntime/python/tools/quantization
 # Latest Commit: fc5e65a
 # Modifications: quantize_data function modified for compatibility with NMIE
+#                weight quantization vectorized and run ahead of time on a thread pool
 # --------------------------------------------------------------------------
 
 # neuralmagic: no copyright
 # flake8: noqa
 
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import onnx
 import onnx.numpy_helper
@@ -136,24 +139,35 @@ def quantize_data(data, quantize_range, qType):
         S: scale
         z: zero point
     """
-    rmin = min(min(data), 0)
-    rmax = max(max(data), 0)
+    rmins, rmaxs, zero_points, scales, quantized_data = _quantize_data_rows(
+        np.reshape(np.asarray(data, dtype=np.float64), (1, -1)), quantize_range, qType
+    )
+
+    return rmins[0], rmaxs[0], zero_points[0], scales[0], quantized_data[0]
+
+
+def _quantize_data_rows(data, quantize_range, qType):
+    """
+    Vectorized quantize_data, quantizes each row of a 2D float64 array independently
+    :return: lists of the minimum, maximum, zero point, and scale for each row
+        and the quantized rows
+    """
+    rmins = np.minimum(data.min(axis=1), 0)
+    rmaxs = np.maximum(data.max(axis=1), 0)
+    max_ranges = np.maximum(np.abs(rmins), np.abs(rmaxs))
+    scales = (max_ranges * 2) / quantize_range
 
     if qType == onnx_proto.TensorProto.INT8:
-        max_range = max(abs(rmin), abs(rmax))
-        scale = (float(max_range) * 2) / quantize_range
         zero_point = 0
         # signed byte type
-        quantized_data = (np.asarray(data) / scale).round().astype("b")
+        quantized_data = (data / scales[:, None]).round().astype("b")
     elif qType == onnx_proto.TensorProto.UINT8:
         # Original ORT Code:
         # scale = (float(rmax) - rmin) / quantize_range if rmin != rmax else 1
         # zero_point = round((0 - rmin) / scale)  # round to nearest integer
         # Modifications for compatibility with NMIE
-        max_range = max(abs(rmin), abs(rmax))
-        scale = (float(max_range) * 2) / quantize_range
         zero_point = 128
-        quantized_data = ((np.asarray(data) / scale).round() + zero_point).astype(
+        quantized_data = ((data / scales[:, None]).round() + zero_point).astype(
             "B"
         )  # unsigned byte type
     else:
@@ -163,7 +177,32 @@ def quantize_data(data, quantize_range, qType):
             )
         )
 
-    return rmin, rmax, zero_point, scale, quantized_data
+    return (
+        rmins.tolist(),
+        rmaxs.tolist(),
+        [zero_point] * len(scales),
+        scales.tolist(),
+        quantized_data,
+    )
+
+
+def _quantize_weight_data(weights, qType, per_channel):
+    """
+    :param weights: the float weights of an initializer
+    :param qType: type to quantize to
+    :param per_channel: True to quantize each output channel (first dimension)
+        separately, False to quantize the whole tensor together
+    :return: lists of the minimum, maximum, zero point, and scale for the tensor
+        or each channel and the quantized weights in the shape of the original
+    """
+    rows = weights.shape[0] if per_channel else 1
+    # float64 matches the precision of the original list based computation
+    data = np.reshape(weights.astype(np.float64), (rows, -1))
+    rmins, rmaxs, zero_points, scales, quantized_data = _quantize_data_rows(
+        data, _get_qrange_for_qType(qType), qType
+    )
+
+    return rmins, rmaxs, zero_points, scales, quantized_data.reshape(weights.shape)
 
 
 def _attribute_to_kwarg(attribute):
@@ -302,9 +341,14 @@ class ONNXQuantizer:
         quantization_params,
         nodes_to_quantize,
         nodes_to_exclude,
+        num_threads=None,
     ):
         self.model = shape_inference.infer_shapes(model)
         self.value_infos = {vi.name: vi for vi in self.model.graph.value_info}
+        # original initializers are only removed after all nodes are quantized
+        self._initializers_by_name = {
+            init.name: init for init in self.model.graph.initializer
+        }
         self.per_channel = per_channel  # weight-pack per channel
         self.mode = mode  # QuantizationMode.Value
         self.static = static  # use static quantization for inputs.
@@ -314,6 +358,8 @@ class ONNXQuantizer:
         self.quantization_params = quantization_params
         self.nodes_to_quantize = nodes_to_quantize  # specific nodes to quantize
         self.nodes_to_exclude = nodes_to_exclude  # specific nodes to exclude
+        # threads to quantize weights with, None for the ThreadPoolExecutor default
+        self.num_threads = num_threads
 
         if not self.mode in quantization_modes:
             raise ValueError("unsupported quantization mode {}".format(self.mode))
@@ -329,22 +375,93 @@ class ONNXQuantizer:
 
         # List of quantized weights
         self._quantized_weights = []
+        # Map of (initializer name, qType, per_channel) to weight quantization futures
+        self._weight_futures = {}
         # Map of all original value names to quantized value names
         self.quantized_value_map = {}
 
     def quantize_model(self):
+        with ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            self._submit_weight_quantization(executor)
+
+            try:
+                return self._quantize_model()
+            finally:
+                for future in self._weight_futures.values():
+                    future.cancel()
+                self._weight_futures = {}
+
+    def _is_node_quantized(self, node):
+        if (
+            self.nodes_to_quantize is not None
+            and node.name not in self.nodes_to_quantize
+        ):
+            return False
+
+        return self.nodes_to_exclude is None or node.name not in self.nodes_to_exclude
+
+    def _submit_weight_quantization(self, executor):
+        """
+        Quantize the weights of the nodes that always quantize their initializer
+        inputs on the executor before the graph is walked, so the numpy work runs
+        in parallel instead of one weight at a time as each node is reached
+        """
+        for node in self.model.graph.node:
+            if not self._is_node_quantized(node):
+                continue
+
+            if node.op_type in ["Conv", "MatMul", "Attention"]:
+                indices = [0, 1]
+            elif node.op_type == "Gather" and self._is_valid_quantize_value(
+                node.input[0]
+            ):
+                indices = [0]
+            else:
+                continue
+
+            per_channel = self.per_channel and node.op_type == "Conv"
+
+            for input_index in indices:
+                if input_index >= len(node.input):
+                    continue
+
+                initializer = self._initializers_by_name.get(node.input[input_index])
+                key = (node.input[input_index], self.weight_qType, per_channel)
+
+                if (
+                    initializer is None
+                    or initializer.data_type != onnx_proto.TensorProto.FLOAT
+                    or key in self._weight_futures
+                ):
+                    continue
+
+                self._weight_futures[key] = executor.submit(
+                    self._quantize_initializer_data, initializer, *key[1:]
+                )
+
+    def _quantize_initializer_data(self, initializer, qType, per_channel):
+        weights = self.find_weight_data(initializer)
+
+        return (weights,) + _quantize_weight_data(weights, qType, per_channel)
+
+    def _quantized_weight_data(self, initializer, qType, per_channel):
+        """
+        :return: the original weights and their quantization, taken from the weights
+            quantized ahead of time if available, otherwise quantized now
+        """
+        future = self._weight_futures.pop((initializer.name, qType, per_channel), None)
+
+        if future is not None:
+            return future.result()
+
+        return self._quantize_initializer_data(initializer, qType, per_channel)
+
+    def _quantize_model(self):
         # Create a new topologically sorted list for quantizing a model
         new_list = []
         for node in self.model.graph.node:
             # if a list of ops to be quantized is provided then only quantize those ops
-            if (
-                self.nodes_to_quantize is not None
-                and node.name not in self.nodes_to_quantize
-            ):
-                new_list += self._handle_other_ops(node, new_list)
-            elif (
-                self.nodes_to_exclude is not None and node.name in self.nodes_to_exclude
-            ):
+            if not self._is_node_quantized(node):
                 new_list += self._handle_other_ops(node, new_list)
             else:
                 if node.op_type == "Conv":
@@ -414,7 +531,7 @@ class ONNXQuantizer:
                 and value_info.type.tensor_type.elem_type
                 == onnx_proto.TensorProto.FLOAT
             )
-        weight = _find_by_name(value_name, self.model.graph.initializer)
+        weight = self._initializers_by_name.get(value_name)
         return weight is not None and weight.data_type == onnx_proto.TensorProto.FLOAT
 
     def _remove_quantized_weights(self):
@@ -423,18 +540,25 @@ class ONNXQuantizer:
             - use output from DequantizeLinear as input if they do not support quantization.
             - use quantized weight if they support quantization.
         """
-        for weight in self._quantized_weights:
-            # Remove existing weight initializer
-            self.model.graph.initializer.remove(weight.initializer)
-
-            # Removing input weight to a convolution
-            try:
-                weight_input = next(
-                    val for val in self.model.graph.input if val.name == weight.name
-                )
-                self.model.graph.input.remove(weight_input)
-            except StopIteration:
-                if self.model.ir_version < 4:
+        weight_names = set(weight.name for weight in self._quantized_weights)
+
+        # Remove existing weight initializers, by index to avoid comparing tensors
+        initializers = self.model.graph.initializer
+        for index in reversed(range(len(initializers))):
+            if initializers[index].name in weight_names:
+                del initializers[index]
+
+        # Removing input weight to a convolution
+        inputs = self.model.graph.input
+        input_names = set()
+        for index in reversed(range(len(inputs))):
+            if inputs[index].name in weight_names:
+                input_names.add(inputs[index].name)
+                del inputs[index]
+
+        if self.model.ir_version < 4:
+            for weight in self._quantized_weights:
+                if weight.name not in input_names:
                     print(
                         "Warning: invalid weight name {} found in the graph (not a graph input)".format(
                             weight.name
@@ -487,17 +611,21 @@ class ONNXQuantizer:
         :param qType: type to quantize to
         :return: Weight class with quantization information
         """
-        weights_data = self.find_weight_data(initializer)
-        rmin, rmax, zero_point, scale, quantized_weights_data = quantize_data(
-            weights_data.flatten().tolist(), _get_qrange_for_qType(qType), qType
-        )
+        (
+            weights_data,
+            rmins,
+            rmaxs,
+            zero_points,
+            scales,
+            quantized_weights_data,
+        ) = self._quantized_weight_data(initializer, qType, per_channel=False)
         weight = QuantizedInitializer(
             initializer.name,
             initializer,
-            [rmin],
-            [rmax],
-            [zero_point],
-            [scale],
+            rmins,
+            rmaxs,
+            zero_points,
+            scales,
             weights_data,
             quantized_weights_data,
             axis=None,
@@ -528,41 +656,17 @@ class ONNXQuantizer:
         if not self.per_channel:
             return self._get_quantized_weight(initializer, qType)
 
-        weights = self.find_weight_data(initializer)
         # Quantize per output channel
         # Assuming (M x C/group x kH x kW) format where M is number of output channels.
-        channel_count = initializer.dims[0]
-        np_data = np.reshape(weights, initializer.dims)
-        rmin_list = []
-        rmax_list = []
-        zero_point_list = []
-        scale_list = []
-        quantized_per_channel_data_list = []
-        for i in range(channel_count):
-            # for each channel, compute quantization data. Assuming (M x C/group x kH x kW)
-            per_channel_data = np_data[i, :, :, :].flatten()
-            rmin, rmax, zero_point, scale, quantized_per_channel_data = quantize_data(
-                per_channel_data.flatten().tolist(), _get_qrange_for_qType(qType), qType
-            )
-            rmin_list.append(rmin)
-            rmax_list.append(rmax)
-            zero_point_list.append(zero_point)
-            scale_list.append(scale)
-            quantized_per_channel_data_list.append(quantized_per_channel_data)
+        (
+            weights,
+            rmin_list,
+            rmax_list,
+            zero_point_list,
+            scale_list,
+            quantized_weights,
+        ) = self._quantized_weight_data(initializer, qType, per_channel=True)
         channel_index = 0  # (M x C/group x kH x kW)
-        # combine per_channel_data into one
-        reshape_dims = list(initializer.dims)  # deep copy
-        reshape_dims[channel_index] = 1  # only one per channel for reshape
-        quantized_weights = np.asarray(quantized_per_channel_data_list[0]).reshape(
-            reshape_dims
-        )
-        for i in range(1, len(quantized_per_channel_data_list)):
-            channel_weights = np.asarray(quantized_per_channel_data_list[i]).reshape(
-                reshape_dims
-            )
-            quantized_weights = np.concatenate(
-                (quantized_weights, channel_weights), axis=0
-            )
 
         weight = QuantizedInitializer(
             initializer.name,
@@ -572,7 +676,7 @@ class ONNXQuantizer:
             zero_point_list,
             scale_list,
             weights,
-            quantized_weights.flatten().tolist(),
+            quantized_weights,
             channel_index,
             qType,
         )
@@ -1211,7 +1315,7 @@ class ONNXQuantizer:
                 continue
 
             # Quantize the input
-            initializer = _find_by_name(node_input, self.model.graph.initializer)
+            initializer = self._initializers_by_name.get(node_input)
             if initializer is not None:
                 if node.op_type == "Conv":
                     weight = self._get_quantized_weight_convolution(
@@ -1870,6 +1974,7 @@ def quantize(
     quantization_params=None,
     nodes_to_quantize=None,
     nodes_to_exclude=None,
+    num_threads=None,
 ):
     """
         Given an onnx model, create a quantized onnx model and save it into a file
@@ -1921,6 +2026,9 @@ def quantize(
     :param nodes_to_exclude:
         List of nodes names to exclude. The nodes in this list will be excluded from quantization
         when it is not None.
+    :param num_threads:
+        Number of threads to quantize the weights with ahead of quantizing the graph.
+        None to use the ThreadPoolExecutor default for the machine.
     """
     if nbits == 8:
         input_qType = (
@@ -1948,6 +2056,7 @@ def quantize(
             quantization_params,
             nodes_to_quantize,
             nodes_to_exclude,
+            num_threads,
         )
         quantizer.quantize_model()
         quantizer.model.producer_name = __producer__
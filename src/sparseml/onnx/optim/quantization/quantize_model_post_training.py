@@ -42,6 +42,8 @@ def quantize_model_post_training(
     force_fusions: bool = False,
     show_progress: bool = True,
     run_extra_opt: bool = True,
+    calibration_mode: str = "minmax",
+    percentile: float = 99.999,
 ) -> Union[None, onnx.ModelProto]:
     """
     Wrapper function for calibrating and quantizing an Onnx model
@@ -69,6 +71,10 @@ def quantize_model_post_training(
     :param run_extra_opt: If true, will run additional optimizations on the quantized
         model. Currently the only optimization is quantizing identity relu outputs in
         ResNet blocks
+    :param calibration_mode: the method used to select the quantization range of
+        each activation, one of CALIBRATION_MODES. Default is 'minmax'
+    :param percentile: the percentile of absolute activation values to cover
+        when calibration_mode is 'percentile'. Default is 99.999
     :return: None or quantized onnx model object if output_model_path is not provided
     """
     calibrator = CalibrationSession(
@@ -78,6 +84,8 @@ def quantize_model_post_training(
         include_nodes,
         augmented_model_path,
         static,
+        calibration_mode=calibration_mode,
+        percentile=percentile,
     )
 
     # data_loader must have a finite number of examples
@@ -16,13 +16,20 @@
 Sensitivity analysis implementations for kernel sparsity on Models against loss funcs.
 """
 
+import itertools
 import logging
 import numbers
+import os
+import shutil
+import tempfile
 import time
-from typing import Any, Generator, List, NamedTuple, Tuple, Union
+import weakref
+from collections import OrderedDict
+from copy import deepcopy
+from typing import Any, Dict, Generator, List, NamedTuple, Optional, Tuple, Union
 
 import numpy
-from onnx import ModelProto
+from onnx import AttributeProto, ModelProto, NodeProto, ValueInfoProto, helper, mapping
 from tqdm import auto
 
 from sparseml.onnx.utils import (
@@ -32,9 +39,11 @@ from sparseml.onnx.utils import (
     ORTModelRunner,
     check_load_model,
     extract_node_id,
+    get_init_by_name,
     get_node_params,
     get_prunable_nodes,
     kl_divergence,
+    model_inputs,
     prune_model_one_shot,
     update_model_param,
 )
@@ -44,6 +53,7 @@ from sparseml.optim import (
     PruningSensitivityResult,
     default_pruning_sparsities_loss,
     default_pruning_sparsities_perf,
+    magnitude_pruning_averages_iter,
 )
 from sparseml.utils import flatten_iterable
 
@@ -127,6 +137,7 @@ def pruning_loss_sens_magnitude_iter(
     sparsity_levels: Union[
         List[float], Tuple[float, ...]
     ] = default_pruning_sparsities_loss(True),
+    num_threads: int = 1,
 ) -> Generator[
     Tuple[PruningLossSensitivityAnalysis, KSSensitivityProgress], None, None
 ]:
@@ -139,13 +150,21 @@ def pruning_loss_sens_magnitude_iter(
     :param model: the loaded model or a file path to the onnx model
         to calculate the sparse sensitivity analysis for
     :param sparsity_levels: the sparsity levels to calculate the loss for for each param
+    :param num_threads: the number of threads to run the layers in parallel with.
+        Default is 1 to run them sequentially
     :return: the analysis results for the model with an additional layer at each
         iteration along with a float representing the iteration progress
     """
-    model = check_load_model(model)
+    model = check_load_model(model, load_external_data=False)
     prunable = get_prunable_nodes(model)
     analysis = PruningLossSensitivityAnalysis()
     num_layers = len(prunable)
+    weights, params = itertools.tee(
+        get_node_params(model, node)[0] for node in prunable
+    )
+    averages_iter = magnitude_pruning_averages_iter(
+        (weight.val for weight in params), sparsity_levels, num_threads
+    )
 
     for index, node in enumerate(prunable):
         node_id = extract_node_id(node)
@@ -154,30 +173,9 @@ def pruning_loss_sens_magnitude_iter(
             index, node_id, num_layers, float(index) / float(num_layers)
         )
 
-        weight, bias = get_node_params(model, node)
-        values = numpy.sort(numpy.abs(weight.val.flatten()))
-        prev_index = 0
-
-        for sparsity in sparsity_levels:
-            val_index = round(sparsity * values.size)
-
-            if val_index >= len(values):
-                val_index = len(values) - 1
-
-            if sparsity <= 1e-9:
-                baseline = True
-                sparsity = 0.0
-                sparse_avg = 0.0
-            else:
-                baseline = False
-
-                if val_index > prev_index:
-                    sparse_avg = values[prev_index:val_index].mean().item()
-                    prev_index = val_index
-                else:
-                    sparse_avg = values[val_index].item()
-                    prev_index = val_index + 1
+        weight = next(weights)
 
+        for sparsity, sparse_avg, baseline in next(averages_iter):
             analysis.add_result(
                 node_id, weight.name, index, sparsity, sparse_avg, baseline
             )
@@ -191,6 +189,7 @@ def pruning_loss_sens_magnitude(
         List[float], Tuple[float, ...]
     ] = default_pruning_sparsities_loss(True),
     show_progress: bool = True,
+    num_threads: int = 1,
 ) -> PruningLossSensitivityAnalysis:
     """
     Approximated kernel sparsity (pruning) loss analysis for a given model.
@@ -200,13 +199,15 @@ def pruning_loss_sens_magnitude(
         to calculate the sparse sensitivity analysis for
     :param sparsity_levels: the sparsity levels to calculate the loss for for each param
     :param show_progress: True to log the progress with a tqdm bar, False otherwise
+    :param num_threads: the number of threads to run the layers in parallel with.
+        Default is 1 to run them sequentially
     :return: the analysis results for the model
     """
     analysis = None
     bar = None
 
     for (analysis, progress) in pruning_loss_sens_magnitude_iter(
-        model, sparsity_levels
+        model, sparsity_levels, num_threads
     ):
         if bar is None and show_progress:
             bar = auto.tqdm(total=progress.total, desc="KS Loss Sensitivity Analysis")
@@ -227,6 +228,8 @@ def pruning_loss_sens_one_shot_iter(
     steps_per_measurement: int,
     sparsity_levels: List[float] = default_pruning_sparsities_loss(False),
     use_deepsparse_inference: bool = False,
+    cache_activations: bool = False,
+    activation_cache_dir: Optional[str] = None,
 ) -> Generator[
     Tuple[PruningLossSensitivityAnalysis, KSSensitivityProgress], None, None
 ]:
@@ -238,6 +241,9 @@ def pruning_loss_sens_one_shot_iter(
     Updates and yeilds the KSLossSensitivityAnalysis at each layer.
     The loss is calculated by taking the kl_divergence of
     pruned values from the baseline.
+    If cache_activations is True, the baseline run records the tensors feeding
+    the part of the graph that depends on each prunable node and each measurement
+    only runs that part of the graph with onnxruntime.
 
     :param model: the loaded model or a file path to the onnx model
         to calculate the sparse sensitivity analysis for
@@ -248,10 +254,24 @@ def pruning_loss_sens_one_shot_iter(
     :param sparsity_levels: the sparsity levels to calculate the loss for for each param
     :param use_deepsparse_inference: True to use the DeepSparse inference engine
         to run the analysis, False to use onnxruntime
+    :param cache_activations: True to cache the baseline activations feeding each
+        prunable node and only run the model from that node onwards for each
+        measurement, False to run the full model for every measurement.
+        Not supported with use_deepsparse_inference
+    :param activation_cache_dir: optional directory to spill the cached activations
+        to instead of keeping them in memory. Only used if cache_activations is True
     :return: the sensitivity results for every node that is prunable,
         yields update at each layer along with iteration progress
     """
-    model = check_load_model(model)
+    if cache_activations and use_deepsparse_inference:
+        raise ValueError(
+            "cache_activations is only supported with onnxruntime, "
+            "set use_deepsparse_inference to False"
+        )
+
+    # deepsparse compiles from a serialized copy, so only keep external data
+    # on disk when running through onnxruntime
+    model = check_load_model(model, load_external_data=use_deepsparse_inference)
     prunable_nodes = get_prunable_nodes(model)
     analysis = PruningLossSensitivityAnalysis()
     num_updates = len(prunable_nodes) * len(sparsity_levels) + 1
@@ -259,24 +279,36 @@ def pruning_loss_sens_one_shot_iter(
 
     yield analysis, KSSensitivityProgress(update_num, None, num_updates, 0.0)
 
-    runner = (
-        ORTModelRunner(model)
-        if not use_deepsparse_inference
-        else DeepSparseModelRunner(model, batch_size)
-    )
-    _LOGGER.debug("created runner for one shot analysis {}".format(runner))
-    base_outputs, _ = runner.run(
-        data,
-        desc="",
-        show_progress=False,
-        max_steps=steps_per_measurement,
+    cache = (
+        _ActivationCache.create(model, prunable_nodes, activation_cache_dir)
+        if cache_activations
+        else None
     )
+
+    if cache is not None:
+        base_outputs = cache.record(data, steps_per_measurement)
+    else:
+        runner = (
+            ORTModelRunner(model)
+            if not use_deepsparse_inference
+            else DeepSparseModelRunner(model, batch_size)
+        )
+        _LOGGER.debug("created runner for one shot analysis {}".format(runner))
+        base_outputs, _ = runner.run(
+            data,
+            desc="",
+            show_progress=False,
+            max_steps=steps_per_measurement,
+        )
+        del runner
+
     _LOGGER.debug("recorded base outputs")
-    del runner
 
     for index, node in enumerate(prunable_nodes):
         node_id = extract_node_id(node)
         weight, bias = get_node_params(model, node)
+        # copy of the proto only, keeps external data on disk when restoring
+        weight_init = deepcopy(get_init_by_name(model, weight.name))
         _LOGGER.debug("running one shot for node {}".format(node_id))
 
         for sparsity in sparsity_levels:
@@ -292,19 +324,24 @@ def pruning_loss_sens_one_shot_iter(
             _LOGGER.debug(
                 "created one shot pruned model for sparsity {}".format(sparsity)
             )
-            runner = (
-                ORTModelRunner(model)
-                if not use_deepsparse_inference
-                else DeepSparseModelRunner(model, batch_size)
-            )
-            _LOGGER.debug("created runner for one shot analysis {}".format(runner))
-            pruned_outputs, _ = runner.run(
-                data,
-                desc="",
-                show_progress=False,
-                max_steps=steps_per_measurement,
-            )
-            del runner
+
+            if cache is not None:
+                pruned_outputs = cache.run(index)
+            else:
+                runner = (
+                    ORTModelRunner(model)
+                    if not use_deepsparse_inference
+                    else DeepSparseModelRunner(model, batch_size)
+                )
+                _LOGGER.debug("created runner for one shot analysis {}".format(runner))
+                pruned_outputs, _ = runner.run(
+                    data,
+                    desc="",
+                    show_progress=False,
+                    max_steps=steps_per_measurement,
+                )
+                del runner
+
             _LOGGER.debug("recorded outputs")
 
             for base, pruned in zip(base_outputs, pruned_outputs):
@@ -328,7 +365,10 @@ def pruning_loss_sens_one_shot_iter(
                     baseline=sparsity < 1e-9,
                 )
         # reset node to its baseline density
-        update_model_param(model, weight.name, weight.val)
+        update_model_param(model, weight.name, weight_init)
+
+    if cache is not None:
+        cache.clear()
 
     yield analysis, KSSensitivityProgress(num_updates, None, num_updates, 1.0)
 
@@ -341,6 +381,8 @@ def pruning_loss_sens_one_shot(
     sparsity_levels: List[float] = default_pruning_sparsities_loss(False),
     show_progress: bool = True,
     use_deepsparse_inference: bool = False,
+    cache_activations: bool = False,
+    activation_cache_dir: Optional[str] = None,
 ) -> PruningLossSensitivityAnalysis:
     """
     Run a one shot sensitivity analysis for kernel sparsity.
@@ -360,6 +402,12 @@ def pruning_loss_sens_one_shot(
     :param show_progress: True to log the progress with a tqdm bar, False otherwise
     :param use_deepsparse_inference: True to use the DeepSparse inference engine
         to run the analysis, False to use onnxruntime
+    :param cache_activations: True to cache the baseline activations feeding each
+        prunable node and only run the model from that node onwards for each
+        measurement, False to run the full model for every measurement.
+        Not supported with use_deepsparse_inference
+    :param activation_cache_dir: optional directory to spill the cached activations
+        to instead of keeping them in memory. Only used if cache_activations is True
     :return: the sensitivity results for every node that is prunable
     """
     analysis = None
@@ -372,6 +420,8 @@ def pruning_loss_sens_one_shot(
         steps_per_measurement,
         sparsity_levels,
         use_deepsparse_inference,
+        cache_activations,
+        activation_cache_dir,
     ):
         if bar is None and show_progress:
             bar = auto.tqdm(total=progress.total, desc="KS Loss Sensitivity Analysis")
@@ -534,3 +584,217 @@ def pruning_perf_sens_one_shot(
         bar.close()
 
     return analysis
+
+
+class _ActivationCache(object):
+    """
+    Records the baseline values of the tensors feeding the part of a model's graph
+    that depends on each prunable node so each one shot measurement can run only
+    that part of the graph through onnxruntime.
+
+    :param model: the model to cache activations for, prunable node weights
+        are read from it each time a measurement is run
+    :param nodes: the prunable nodes in the model
+    :param cache_dir: optional directory to save the cached values to,
+        if not supplied they are kept in memory
+    """
+
+    @staticmethod
+    def create(
+        model: ModelProto, nodes: List[NodeProto], cache_dir: Optional[str] = None
+    ) -> Optional["_ActivationCache"]:
+        """
+        :param model: the model to cache activations for
+        :param nodes: the prunable nodes in the model
+        :param cache_dir: optional directory to save the cached values to
+        :return: the created cache or None if the model's graph can't be split
+        """
+        for node in model.graph.node:
+            for attr in node.attribute:
+                if attr.type in [AttributeProto.GRAPH, AttributeProto.GRAPHS]:
+                    _LOGGER.warning(
+                        "unable to cache activations for models with subgraphs, "
+                        "running the full model for sensitivity analysis"
+                    )
+                    return None
+
+        return _ActivationCache(model, nodes, cache_dir)
+
+    def __init__(
+        self,
+        model: ModelProto,
+        nodes: List[NodeProto],
+        cache_dir: Optional[str] = None,
+    ):
+        self._model = model
+        self._cache_dir = tempfile.mkdtemp(dir=cache_dir) if cache_dir else None
+        # removes the saved values if the cache is dropped without being cleared
+        self._cache_dir_finalizer = (
+            weakref.finalize(self, shutil.rmtree, self._cache_dir, True)
+            if self._cache_dir
+            else None
+        )
+        self._cache = []  # type: List[Dict[str, numpy.ndarray]]
+        self._node_graphs = [self._downstream_graph(node) for node in nodes]
+        self._names = sorted(
+            {name for _, frontier, _ in self._node_graphs for name in frontier}
+        )
+        self._dtypes = {}  # type: Dict[str, numpy.dtype]
+        self._num_batches = 0
+
+    def record(
+        self, data: DataLoader, max_steps: int
+    ) -> List[Dict[str, numpy.ndarray]]:
+        """
+        Run the full model over the data and record the activations
+        every measurement starts from
+
+        :param data: the data to run through the model
+        :param max_steps: maximum number of steps to take for the data
+        :return: the outputs of the model for each batch
+        """
+        record_model = ModelProto()
+        record_model.CopyFrom(self._model)
+        input_names = [inp.name for inp in model_inputs(self._model)]
+        output_names = [out.name for out in self._model.graph.output]
+        record_model.graph.output.extend(
+            [
+                ValueInfoProto(name=name)
+                for name in self._names
+                if name not in input_names and name not in output_names
+            ]
+        )
+        runner = ORTModelRunner(record_model, overwrite_input_names=False)
+        outputs = []
+
+        for batch, (batch_data, _) in enumerate(data):
+            if all(name in batch_data for name in input_names):
+                inputs = {name: batch_data[name] for name in input_names}
+            else:
+                # data keyed by other names is matched to the model inputs
+                # by position, the same as the default ORTModelRunner remapping
+                inputs = dict(zip(input_names, batch_data.values()))
+
+            pred, _ = runner.batch_forward(inputs)
+            pred.update(inputs)
+            outputs.append(OrderedDict((name, pred[name]) for name in output_names))
+            self._save(batch, {name: pred[name] for name in self._names})
+
+            if batch >= max_steps - 1 and max_steps > -1:
+                break
+
+        del runner
+
+        return outputs
+
+    def run(self, node_index: int) -> List[Dict[str, numpy.ndarray]]:
+        """
+        :param node_index: the index of the prunable node to run the model from
+        :return: the outputs of the model for each recorded batch with the
+            current weights of the model
+        """
+        nodes, frontier, outputs = self._node_graphs[node_index]
+        used = {inp for node in nodes for inp in node.input}
+        inputs = [name for name in frontier if name in used]
+        graph = helper.make_graph(
+            nodes,
+            self._model.graph.name,
+            [
+                helper.make_tensor_value_info(
+                    name, mapping.NP_TYPE_TO_TENSOR_TYPE[self._dtypes[name]], None
+                )
+                for name in inputs
+            ],
+            [out for out in self._model.graph.output if out.name in outputs],
+            [init for init in self._model.graph.initializer if init.name in used],
+        )
+        sub_model = ModelProto()
+        sub_model.ir_version = self._model.ir_version
+        sub_model.opset_import.extend(self._model.opset_import)
+        sub_model.graph.CopyFrom(graph)
+        runner = ORTModelRunner(sub_model, overwrite_input_names=False)
+        results = []
+
+        for batch in range(self._num_batches):
+            cached = self._load(batch, frontier)
+            pred, _ = runner.batch_forward({name: cached[name] for name in inputs})
+            results.append(
+                OrderedDict(
+                    (out.name, pred[out.name] if out.name in pred else cached[out.name])
+                    for out in self._model.graph.output
+                )
+            )
+
+        del runner
+
+        return results
+
+    def clear(self):
+        """
+        Remove all of the cached activations
+        """
+        self._cache = []
+
+        if self._cache_dir_finalizer is not None:
+            self._cache_dir_finalizer()
+
+    def _downstream_graph(self, node: NodeProto) -> Tuple[List, List[str], set]:
+        produced = set(node.output)
+        nodes = []
+
+        # nodes are topologically sorted so one pass finds everything
+        # the prunable node feeds into
+        for other in self._model.graph.node:
+            if other.output == node.output or any(
+                inp in produced for inp in other.input
+            ):
+                nodes.append(other)
+                produced.update(other.output)
+
+        init_names = {init.name for init in self._model.graph.initializer}
+        frontier = []
+
+        for other in nodes:
+            for inp in other.input:
+                if (
+                    inp
+                    and inp not in produced
+                    and inp not in init_names
+                    and inp not in frontier
+                ):
+                    frontier.append(inp)
+
+        # outputs that don't depend on the node are returned from the cache
+        for out in self._model.graph.output:
+            if out.name not in produced and out.name not in frontier:
+                frontier.append(out.name)
+
+        return nodes, frontier, produced
+
+    def _save(self, batch: int, values: Dict[str, numpy.ndarray]):
+        self._num_batches = batch + 1
+        self._dtypes.update((name, val.dtype) for name, val in values.items())
+
+        if not self._cache_dir:
+            self._cache.append(values)
+            return
+
+        for index, name in enumerate(self._names):
+            numpy.save(
+                os.path.join(self._cache_dir, "{}-{}.npy".format(batch, index)),
+                values[name],
+            )
+
+    def _load(self, batch: int, names: List[str]) -> Dict[str, numpy.ndarray]:
+        if not self._cache_dir:
+            return self._cache[batch]
+
+        return {
+            name: numpy.load(
+                os.path.join(
+                    self._cache_dir,
+                    "{}-{}.npy".format(batch, self._names.index(name)),
+                )
+            )
+            for name in names
+        }
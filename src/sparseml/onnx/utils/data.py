@@ -18,8 +18,14 @@ Utilities for data loading into numpy for use in ONNX supported systems
 
 import logging
 import math
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import weakref
 from collections import OrderedDict
-from typing import Dict, List, Tuple, Union
+from typing import Any, Dict, List, Tuple, Union
 
 import numpy
 from onnx import ModelProto
@@ -31,7 +37,12 @@ from sparseml.onnx.utils.helpers import (
     model_inputs,
     model_outputs,
 )
-from sparseml.utils import NumpyArrayBatcher, load_labeled_data
+from sparseml.utils import (
+    NDARRAY_KEY,
+    LazyLabeledData,
+    NumpyArrayBatcher,
+    load_labeled_data,
+)
 
 
 __all__ = ["DataLoader"]
@@ -48,6 +59,11 @@ class DataLoader(object):
     Iterator returns a tuple containing (data, label).
     label is only returned if label data was passed in.
 
+    When all items share the same keys, shapes, and types they are stored as
+    one contiguous array per key so batches are slices of those arrays
+    (or a single gather when a batch wraps around the data) rather than stacked
+    per item. These batches may be read only views of the loaded data.
+
     :param data: a file glob pointing to numpy files, path to a tar ball of numpy
         files, or loaded numpy data
     :param labels: a file glob pointing to numpy files path to a tar ball of numpy
@@ -56,6 +72,17 @@ class DataLoader(object):
     :param iter_steps: the number of steps (batches) to create.
         Set to -1 for infinite, 0 for running through the loaded data once,
         or a positive integer for the desired number of steps
+    :param prefetch_batches: the number of batches to create ahead of time
+        in a background thread while iterating, ex: 2 to double buffer.
+        Default is 0 to create the batches in the calling thread
+    :param data_cache_dir: optional directory to write the contiguous data to as
+        .npy files that are then memory mapped instead of kept in memory.
+        The files are removed when the DataLoader is deleted. Not used if lazy_load
+    :param lazy_load: True to only index the data and label files up front and
+        read the items from disk as the batches are created so memory does not grow
+        with the size of the dataset, False to load all of them. Default is False
+    :param read_ahead: if lazy_load, the number of items to read ahead of time
+        in background threads
     """
 
     @staticmethod
@@ -171,7 +198,7 @@ class DataLoader(object):
             and outputs, typically the batch dimension
         :return: the created DataLoader instance with the random data
         """
-        model = check_load_model(model)
+        model = check_load_model(model, load_external_data=False)
         inputs = model_inputs(model)
         outputs = model_outputs(model)
         data_shapes = OrderedDict(
@@ -218,10 +245,22 @@ class DataLoader(object):
         labels: Union[None, str, List[Union[numpy.ndarray, Dict[str, numpy.ndarray]]]],
         batch_size: int,
         iter_steps: int = 0,
+        prefetch_batches: int = 0,
+        data_cache_dir: Union[str, None] = None,
+        lazy_load: bool = False,
+        read_ahead: int = 0,
     ):
         self._batch_size = batch_size
         self._iter_steps = iter_steps
-        self._labeled_data = load_labeled_data(data, labels, raise_on_error=False)
+        self._prefetch_batches = prefetch_batches
+        self._labeled_data = load_labeled_data(
+            data,
+            labels,
+            raise_on_error=False,
+            lazy=lazy_load,
+            cache_size=2 * (batch_size + read_ahead),
+            read_ahead=read_ahead,
+        )
 
         if len(self._labeled_data) < 1:
             raise ValueError(
@@ -230,8 +269,58 @@ class DataLoader(object):
                 )
             )
 
+        # lazily loaded items are batched one by one as they are read
+        self._data_arrays = (
+            _stack_items([dat for dat, _ in self._labeled_data])
+            if not lazy_load
+            else None
+        )
+        self._label_arrays = (
+            _stack_items([lab for _, lab in self._labeled_data])
+            if self._data_arrays is not None and self._labeled_data[0][1] is not None
+            else None
+        )
+
+        if self._data_arrays is not None and (
+            self._label_arrays is not None
+            or all(lab is None for _, lab in self._labeled_data)
+        ):
+            if data_cache_dir:
+                cache_dir = tempfile.mkdtemp(dir=data_cache_dir)
+                weakref.finalize(self, shutil.rmtree, cache_dir, True)
+                self._data_arrays = _memmap_arrays(self._data_arrays, cache_dir, "data")
+                self._label_arrays = (
+                    _memmap_arrays(self._label_arrays, cache_dir, "labels")
+                    if self._label_arrays is not None
+                    else None
+                )
+
+            # point the items to the contiguous arrays so the data isn't held twice
+            self._labeled_data = [
+                (
+                    _item_view(self._data_arrays, dat, index),
+                    _item_view(self._label_arrays, lab, index),
+                )
+                for index, (dat, lab) in enumerate(self._labeled_data)
+            ]
+            _LOGGER.debug(
+                "stored data contiguously for keys {}".format(
+                    list(self._data_arrays.keys())
+                )
+            )
+        elif not lazy_load:
+            self._data_arrays = None
+            self._label_arrays = None
+            _LOGGER.debug(
+                "data items do not match in keys, shapes, or types, "
+                "batching item by item"
+            )
+
         self._index = 0
         self._step_count = 0
+        self._prefetch_queue = None  # type: Union[queue.Queue, None]
+        self._prefetch_stop = None  # type: Union[threading.Event, None]
+        self._prefetch_finalizer = None  # type: Union[weakref.finalize, None]
 
         if self.infinite:
             # __len__ cannot return math.inf as a value and must be non-negative integer
@@ -262,14 +351,17 @@ class DataLoader(object):
     @property
     def labeled_data(
         self,
-    ) -> List[
-        Tuple[
-            Union[numpy.ndarray, Dict[str, numpy.ndarray]],
-            Union[None, numpy.ndarray, Dict[str, numpy.ndarray]],
-        ]
+    ) -> Union[
+        List[
+            Tuple[
+                Union[numpy.ndarray, Dict[str, numpy.ndarray]],
+                Union[None, numpy.ndarray, Dict[str, numpy.ndarray]],
+            ]
+        ],
+        LazyLabeledData,
     ]:
         """
-        :return: the loaded data and labels
+        :return: the loaded data and labels, a LazyLabeledData if lazy_load
         """
         return self._labeled_data
 
@@ -284,9 +376,35 @@ class DataLoader(object):
     def __len__(self):
         return self._max_steps
 
+    @property
+    def prefetch_batches(self) -> int:
+        """
+        :return: the number of batches to create ahead of time in a background
+            thread while iterating, 0 if created in the calling thread
+        """
+        return self._prefetch_batches
+
     def __iter__(self):
         self._index = 0
         self._step_count = 0
+        self._stop_prefetch()
+
+        if self._prefetch_batches > 0:
+            self._prefetch_queue = queue.Queue(maxsize=self._prefetch_batches)
+            self._prefetch_stop = threading.Event()
+            # the thread must not reference self so the loader can still be deleted
+            thread = threading.Thread(
+                target=_prefetch_worker,
+                args=(
+                    self._batch_creator(),
+                    self._max_steps if not self.infinite else -1,
+                    self._prefetch_queue,
+                    self._prefetch_stop,
+                ),
+                daemon=True,
+            )
+            thread.start()
+            self._prefetch_finalizer = weakref.finalize(self, self._prefetch_stop.set)
 
         return self
 
@@ -298,20 +416,181 @@ class DataLoader(object):
             raise StopIteration()
 
         self._step_count += 1
+
+        if self._prefetch_queue is not None:
+            batch = self._prefetch_queue.get()
+
+            if isinstance(batch, BaseException):
+                self._stop_prefetch()
+                raise batch
+
+            return batch
+
+        batch_data, batch_label, self._index = self._batch_creator()(self._index)
+
+        return batch_data, batch_label
+
+    def _batch_creator(self):
+        if self._data_arrays is not None:
+            return _ContiguousBatchCreator(
+                self._data_arrays, self._label_arrays, self._batch_size
+            )
+
+        return _ItemBatchCreator(self._labeled_data, self._batch_size)
+
+    def _stop_prefetch(self):
+        if self._prefetch_finalizer is not None:
+            # stops the thread and unregisters from the loader's deletion
+            self._prefetch_finalizer()
+
+        self._prefetch_queue = None
+        self._prefetch_stop = None
+        self._prefetch_finalizer = None
+
+
+def _stack_items(
+    items: List[Union[None, numpy.ndarray, Dict[str, numpy.ndarray]]]
+) -> Union[None, Dict[str, numpy.ndarray]]:
+    # stack the items into one array per key if they all match, None otherwise
+    first = items[0]
+
+    if isinstance(first, numpy.ndarray):
+        first = {NDARRAY_KEY: first}
+
+    if not isinstance(first, dict):
+        return None
+
+    keys = list(first.keys())
+    signatures = [(first[key].shape, first[key].dtype) for key in keys]
+
+    for item in items:
+        if isinstance(item, numpy.ndarray):
+            item = {NDARRAY_KEY: item}
+
+        if (
+            not isinstance(item, dict)
+            or list(item.keys()) != keys
+            or any(
+                not isinstance(item[key], numpy.ndarray)
+                or (item[key].shape, item[key].dtype) != signature
+                for key, signature in zip(keys, signatures)
+            )
+        ):
+            return None
+
+    arrays = OrderedDict()
+
+    for key in keys:
+        arrays[key] = numpy.stack(
+            [
+                item[key] if not isinstance(item, numpy.ndarray) else item
+                for item in items
+            ]
+        )
+
+    return arrays
+
+
+def _memmap_arrays(
+    arrays: Dict[str, numpy.ndarray], cache_dir: str, prefix: str
+) -> Dict[str, numpy.ndarray]:
+    memmapped = OrderedDict()
+
+    for index, (key, array) in enumerate(arrays.items()):
+        path = os.path.join(cache_dir, "{}_{}.npy".format(prefix, index))
+        numpy.save(path, array)
+        memmapped[key] = numpy.load(path, mmap_mode="r")
+
+    return memmapped
+
+
+def _item_view(
+    arrays: Union[None, Dict[str, numpy.ndarray]],
+    item: Union[None, numpy.ndarray, Dict[str, numpy.ndarray]],
+    index: int,
+) -> Union[None, numpy.ndarray, Dict[str, numpy.ndarray]]:
+    if arrays is None:
+        return item
+
+    if isinstance(item, numpy.ndarray):
+        return arrays[NDARRAY_KEY][index]
+
+    return OrderedDict([(key, array[index]) for key, array in arrays.items()])
+
+
+class _ContiguousBatchCreator(object):
+    def __init__(
+        self,
+        data_arrays: Dict[str, numpy.ndarray],
+        label_arrays: Union[None, Dict[str, numpy.ndarray]],
+        batch_size: int,
+    ):
+        self._data_arrays = data_arrays
+        self._label_arrays = label_arrays
+        self._batch_size = batch_size
+        self._num_items = len(next(iter(data_arrays.values())))
+
+    def __call__(self, index: int) -> Tuple[Any, Any, int]:
+        end = index + self._batch_size
+
+        if end <= self._num_items:
+            # zero copy slice of the contiguous data
+            batch_data = OrderedDict(
+                [(key, array[index:end]) for key, array in self._data_arrays.items()]
+            )
+            batch_label = (
+                OrderedDict(
+                    [
+                        (key, array[index:end])
+                        for key, array in self._label_arrays.items()
+                    ]
+                )
+                if self._label_arrays is not None
+                else None
+            )
+        else:
+            # batch wraps around the data, gather it in one go
+            indices = numpy.arange(index, end) % self._num_items
+            batch_data = OrderedDict(
+                [
+                    (key, numpy.take(array, indices, axis=0))
+                    for key, array in self._data_arrays.items()
+                ]
+            )
+            batch_label = (
+                OrderedDict(
+                    [
+                        (key, numpy.take(array, indices, axis=0))
+                        for key, array in self._label_arrays.items()
+                    ]
+                )
+                if self._label_arrays is not None
+                else None
+            )
+
+        return batch_data, batch_label, end % self._num_items
+
+
+class _ItemBatchCreator(object):
+    def __init__(self, labeled_data: List[Tuple[Any, Any]], batch_size: int):
+        self._labeled_data = labeled_data
+        self._batch_size = batch_size
+
+    def __call__(self, index: int) -> Tuple[Any, Any, int]:
         data_batcher = NumpyArrayBatcher()
         label_batcher = NumpyArrayBatcher()
         num_resets = 0
 
         while len(data_batcher) < self._batch_size:
             try:
-                _LOGGER.debug("including data in batch at index {}".format(self._index))
-                dat, lab = self._labeled_data[self._index]
+                _LOGGER.debug("including data in batch at index {}".format(index))
+                dat, lab = self._labeled_data[index]
 
                 if lab is None and len(label_batcher) > 0:
                     raise ValueError(
                         (
                             "data has no label at index {}, but other data had labels"
-                        ).format(self._index)
+                        ).format(index)
                     )
                 elif (
                     lab is not None
@@ -322,7 +601,7 @@ class DataLoader(object):
                         (
                             "data has label at index {}, "
                             "but other data did not have labels"
-                        ).format(self._index)
+                        ).format(index)
                     )
                 elif lab is not None:
                     label_batcher.append(lab)
@@ -333,12 +612,12 @@ class DataLoader(object):
                     (
                         "DataLoader: Error while adding file "
                         "to batch for index {}: {}"
-                    ).format(self._index, err)
+                    ).format(index, err)
                 )
 
-            if self._index >= len(self._labeled_data) - 1:
+            if index >= len(self._labeled_data) - 1:
                 _LOGGER.debug("resetting index to loop data again")
-                self._index = 0
+                index = 0
                 num_resets += 1
 
                 if num_resets > self._batch_size // len(self._labeled_data) + 2:
@@ -349,7 +628,7 @@ class DataLoader(object):
                         "not enough were loadable to fill the batch size"
                     )
             else:
-                self._index += 1
+                index += 1
 
         batch_data = data_batcher.stack()
         _LOGGER.debug("created batch data of size {}".format(len(batch_data)))
@@ -358,4 +637,33 @@ class DataLoader(object):
         if batch_label:
             _LOGGER.debug("created batch labels of size {}".format(len(batch_label)))
 
-        return batch_data, batch_label
+        return batch_data, batch_label, index
+
+
+def _prefetch_worker(
+    batch_creator: Any,
+    max_steps: int,
+    batch_queue: queue.Queue,
+    stop: threading.Event,
+):
+    index = 0
+    step = 0
+
+    while not stop.is_set() and (max_steps < 0 or step < max_steps):
+        try:
+            batch_data, batch_label, index = batch_creator(index)
+            item = (batch_data, batch_label)
+        except Exception as err:
+            item = err
+
+        while not stop.is_set():
+            try:
+                batch_queue.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+
+        if isinstance(item, BaseException):
+            return
+
+        step += 1
@@ -24,7 +24,11 @@ import onnx
 from onnx import ModelProto, NodeProto, TensorProto, numpy_helper
 from toposort import toposort_flatten
 
-from sparseml.onnx.utils.helpers import get_node_params
+from sparseml.onnx.utils.helpers import (
+    extract_node_id,
+    get_indexed_graph,
+    get_node_params,
+)
 
 
 __all__ = [
@@ -43,6 +47,8 @@ class ONNXGraph(object):
     """
     Class for quick look-up of ONNX graph nodes and initializers. If graph state
     changes outside of ONNXGraph class functions, update() should be called.
+    Can be used to index the lookups of the helpers in sparseml.onnx.utils.helpers
+    through indexed_graph_lookups.
 
     :param model: the ONNX graph to represent
     """
@@ -106,6 +112,49 @@ class ONNXGraph(object):
         """
         return self._output_id_to_node.get(id)
 
+    def get_node_by_id(self, node_id: str) -> Optional[NodeProto]:
+        """
+        :param node_id: id of the node as generated by extract_node_id
+        :return: the node with the given id if it is present in the graph,
+            None otherwise
+        """
+        node = self._output_id_to_node.get(node_id)
+
+        return node if node is not None and extract_node_id(node) == node_id else None
+
+    def get_nodes_by_input_id(self, input_id: str) -> List[NodeProto]:
+        """
+        :param input_id: id of the input to get nodes by
+        :return: the nodes that take the given id as an input,
+            empty if the id is an initializer
+        """
+        if input_id in self._name_to_initializer:
+            return []
+
+        nodes = []
+        seen = set()
+
+        for node in self._input_id_to_nodes.get(input_id, []):
+            # a node is stored once for every time it uses the input
+            if id(node) not in seen:
+                seen.add(id(node))
+                nodes.append(node)
+
+        return nodes
+
+    def get_nodes_by_output_id(self, output_id: str) -> List[NodeProto]:
+        """
+        :param output_id: id of the output to get nodes by
+        :return: the nodes that create the given id as an output,
+            empty if the id is an initializer
+        """
+        if output_id in self._name_to_initializer:
+            return []
+
+        node = self._output_id_to_node.get(output_id)
+
+        return [node] if node is not None else []
+
     def get_node_parents(
         self, node: NodeProto
     ) -> List[Union[NodeProto, TensorProto, None]]:
@@ -290,7 +339,7 @@ class ONNXGraph(object):
 def update_model_param(
     model: ModelProto,
     param_name: str,
-    val: numpy.ndarray,
+    val: Union[numpy.ndarray, TensorProto],
 ) -> None:
     """
     Removes the parameter with name param_name from the model
@@ -299,16 +348,26 @@ def update_model_param(
 
     :param model: The model to update
     :param param_name: The parameter name in the model to update
-    :param val: The new value of the parameter
+    :param val: The new value of the parameter, can also be an initializer
+        to copy from, ex: to restore a parameter stored as external data
     """
     param_matches = [
         param for param in model.graph.initializer if param.name == param_name
     ]
     if param_matches:
         model.graph.initializer.remove(param_matches[0])
-    new_param = numpy_helper.from_array(val, param_name)
+    if isinstance(val, TensorProto):
+        new_param = TensorProto()
+        new_param.CopyFrom(val)
+        new_param.name = param_name
+    else:
+        new_param = numpy_helper.from_array(val, param_name)
     model.graph.initializer.append(new_param)
 
+    graph = get_indexed_graph(model)
+    if graph is not None:
+        graph.update()
+
 
 def swap_node_output(node: onnx.NodeProto, output: str) -> None:
     """
@@ -341,6 +400,10 @@ def remove_node_and_params_from_graph(
             model.graph.initializer.remove(param)
     model.graph.node.remove(node)
 
+    graph = get_indexed_graph(model)
+    if graph is not None:
+        graph.update()
+
 
 def _override_tensor_batch_dim(model, tensor, batch_size):
     for init in model.graph.initializer:
@@ -350,8 +413,8 @@ def _override_tensor_batch_dim(model, tensor, batch_size):
 
     shape = tensor.type.tensor_type.shape
 
-    # skip tensors with variable batch sizes
-    if not shape.dim[0].dim_param and shape.dim[0].dim_value > 0:
+    # skip tensors with unknown shapes or variable batch sizes
+    if shape.dim and not shape.dim[0].dim_param and shape.dim[0].dim_value > 0:
         shape.dim[0].dim_value = batch_size
 
 
@@ -16,19 +16,38 @@
 Utility / helper functions
 """
 
+import hashlib
+import json
 import logging
+import os
+import tempfile
+import threading
 from collections import OrderedDict
+from contextlib import contextmanager
 from copy import deepcopy
 from functools import reduce
-from typing import Any, Dict, List, NamedTuple, Tuple, Union
+from typing import Any, Dict, Generator, List, NamedTuple, Tuple, Union
 
 import numpy
 import onnx
 import onnxruntime
-from onnx import ModelProto, NodeProto, TensorProto, numpy_helper
+from onnx import (
+    GraphProto,
+    ModelProto,
+    NodeProto,
+    TensorProto,
+    ValueInfoProto,
+    mapping,
+    numpy_helper,
+)
+from onnx.external_data_helper import (
+    ExternalDataInfo,
+    load_external_data_for_tensor,
+    uses_external_data,
+)
 from onnx.helper import get_attribute_value, make_empty_tensor_value_info
 
-from sparseml.utils import clean_path
+from sparseml.utils import clean_path, create_dirs
 
 
 _LOGGER = logging.getLogger(__name__)
@@ -36,6 +55,10 @@ _LOGGER = logging.getLogger(__name__)
 __all__ = [
     "validate_onnx_file",
     "check_load_model",
+    "get_init_array",
+    "create_ort_session",
+    "indexed_graph_lookups",
+    "get_indexed_graph",
     "extract_node_id",
     "get_node_by_id",
     "get_nodes_by_input_id",
@@ -45,6 +68,7 @@ __all__ = [
     "NodeShape",
     "extract_nodes_shapes_ort",
     "extract_nodes_shapes_shape_inference",
+    "get_model_structure_hash",
     "extract_node_shapes",
     "get_init_by_name",
     "get_attr_float_val_for_node",
@@ -85,7 +109,7 @@ def validate_onnx_file(path: str):
     :raise ValueError: if not a valid ONNX model
     """
     try:
-        onnx_model = check_load_model(path)
+        onnx_model = check_load_model(path, load_external_data=False)
 
         if not onnx_model.opset_import:
             raise ValueError("could not parse opset_import")
@@ -93,23 +117,211 @@ def validate_onnx_file(path: str):
         raise ValueError("file at {} is not a valid onnx model: {}".format(path, err))
 
 
-def check_load_model(model: Union[str, ModelProto]) -> ModelProto:
+def check_load_model(
+    model: Union[str, ModelProto], load_external_data: bool = True
+) -> ModelProto:
     """
     Load an ONNX model from a given file path if supplied.
     If already a model proto, then returns.
 
     :param model: the model proto or path to the model ONNX file to check for loading
+    :param load_external_data: True to load the external data of the initializers
+        into memory, False to keep them on disk and only reference them by absolute
+        path so they can be read lazily with get_init_array.
+        Only applies when loading from a file path. Default is True
     :return: the loaded ONNX ModelProto
     """
     if isinstance(model, ModelProto):
         return model
 
     if isinstance(model, str):
-        return onnx.load(clean_path(model))
+        path = clean_path(model)
+
+        if load_external_data:
+            return onnx.load(path)
+
+        model = onnx.load(path, load_external_data=False)
+        _set_external_data_base_dir(model, os.path.dirname(path))
+
+        return model
 
     raise ValueError("unknown type given for model: {}".format(model))
 
 
+def _set_external_data_base_dir(model: ModelProto, base_dir: str):
+    for init in model.graph.initializer:
+        if not uses_external_data(init):
+            continue
+
+        for entry in init.external_data:
+            if entry.key == "location":
+                entry.value = os.path.join(base_dir, entry.value)
+
+    # tensors outside of the initializers are small, load them to keep them simple
+    for node in model.graph.node:
+        for attr in node.attribute:
+            for tensor in [attr.t] + list(attr.tensors):
+                if uses_external_data(tensor):
+                    load_external_data_for_tensor(tensor, base_dir)
+
+
+def get_init_array(init: TensorProto) -> numpy.ndarray:
+    """
+    Get the values of an initializer as a numpy array.
+    Initializers stored as external data are memory mapped read only from disk
+    rather than loaded into memory. Relative external data locations are resolved
+    from the current working directory, check_load_model with
+    load_external_data=False sets them to absolute paths.
+
+    :param init: the initializer to get the values of
+    :return: the values of the initializer, read only
+    """
+    if not uses_external_data(init):
+        return numpy_helper.to_array(init)
+
+    info = ExternalDataInfo(init)
+    dtype = numpy.dtype(mapping.TENSOR_TYPE_TO_NP_TYPE[init.data_type])
+    shape = tuple(init.dims)
+
+    # external data is always stored little endian
+    return numpy.memmap(
+        info.location,
+        dtype=dtype.newbyteorder("<"),
+        mode="r",
+        offset=info.offset or 0,
+        shape=(int(numpy.prod(shape)),),
+    ).reshape(shape)
+
+
+def create_ort_session(
+    model: ModelProto,
+    sess_options: Union[Any, None] = None,
+    providers: Union[List[str], None] = None,
+    extra_outputs: Union[List[ValueInfoProto], None] = None,
+) -> Any:
+    """
+    Create an onnxruntime InferenceSession for a loaded model.
+    Models with initializers stored as external data are handed to onnxruntime
+    through a temporary file holding only the graph so the external data is read
+    by onnxruntime directly rather than serialized with the model.
+
+    :param model: the loaded model to create the session for
+    :param sess_options: the onnxruntime.SessionOptions to create the session with,
+        creates a default one if not given
+    :param providers: list of ORT provider names to create the session with,
+        defaults to the onnxruntime defaults
+    :param extra_outputs: additional graph outputs to expose in the session,
+        added to the serialized model only so the given model is not modified
+    :return: the created onnxruntime.InferenceSession
+    """
+    sess_options = sess_options or onnxruntime.SessionOptions()
+    locations = [
+        entry
+        for init in model.graph.initializer
+        if uses_external_data(init)
+        for entry in init.external_data
+        if entry.key == "location"
+    ]
+
+    if not locations:
+        return onnxruntime.InferenceSession(
+            _serialize_with_outputs(model, extra_outputs),
+            sess_options,
+            providers=providers,
+        )
+
+    # onnxruntime only resolves external data relative to the model file,
+    # so point the locations to the data from the temporary file
+    tmp_file = tempfile.NamedTemporaryFile(suffix=".onnx", delete=False)
+    tmp_dir = os.path.dirname(tmp_file.name)
+    original_values = [entry.value for entry in locations]
+
+    try:
+        for entry in locations:
+            entry.value = os.path.relpath(os.path.abspath(entry.value), tmp_dir)
+
+        try:
+            tmp_file.write(_serialize_with_outputs(model, extra_outputs))
+        finally:
+            for entry, value in zip(locations, original_values):
+                entry.value = value
+
+        tmp_file.close()
+
+        return onnxruntime.InferenceSession(
+            tmp_file.name, sess_options, providers=providers
+        )
+    finally:
+        tmp_file.close()
+        os.remove(tmp_file.name)
+
+
+def _serialize_with_outputs(
+    model: ModelProto, outputs: Union[List[ValueInfoProto], None]
+) -> bytes:
+    # parsing concatenated messages appends repeated fields, so the outputs are
+    # added to the serialized model without copying or editing the given one
+    serialized = model.SerializeToString()
+
+    if outputs:
+        serialized += ModelProto(graph=GraphProto(output=outputs)).SerializeToString()
+
+    return serialized
+
+
+# per thread so concurrent uses for the same model never share or remove
+# each other's index, holds a graphs dict of id(model) -> ONNXGraph
+_INDEXED_GRAPHS = threading.local()
+
+
+@contextmanager
+def indexed_graph_lookups(model: ModelProto) -> Generator[Any, None, None]:
+    """
+    Context manager that indexes the nodes and initializers of a model in an
+    ONNXGraph so the node and initializer lookup helpers in this module use
+    dictionary lookups for the model rather than scanning the graph on each call.
+    While active, the model should only be edited through the yielded ONNXGraph
+    or the graph_editor helpers so the index stays in sync.
+    Nested uses for the same model reuse the existing index.
+    The index is only used by lookups from the thread that created it.
+
+    :param model: the loaded model to index
+    :return: the ONNXGraph indexing the model
+    """
+    # imported here as graph_editor depends on this module
+    from sparseml.onnx.utils.graph_editor import ONNXGraph
+
+    key = id(model)
+
+    if not hasattr(_INDEXED_GRAPHS, "graphs"):
+        _INDEXED_GRAPHS.graphs = {}
+
+    graphs = _INDEXED_GRAPHS.graphs
+
+    if key in graphs:
+        yield graphs[key]
+        return
+
+    graph = ONNXGraph(model)
+    graphs[key] = graph
+
+    try:
+        yield graph
+    finally:
+        del graphs[key]
+
+
+def get_indexed_graph(model: ModelProto) -> Union[Any, None]:
+    """
+    :param model: the model to get the active index for
+    :return: the ONNXGraph indexing the model if it is inside of an
+        indexed_graph_lookups context in the current thread, None otherwise
+    """
+    graphs = getattr(_INDEXED_GRAPHS, "graphs", None)
+
+    return graphs.get(id(model)) if graphs else None
+
+
 def extract_node_id(node: NodeProto) -> str:
     """
     Get the node id for a given node from an ONNX model.
@@ -132,6 +344,11 @@ def get_node_by_id(model: ModelProto, node_id: str) -> Union[NodeProto, None]:
     :param node_id: id of the node to get from the model
     :return: the retrieved node or None if no node found
     """
+    graph = get_indexed_graph(model)
+
+    if graph is not None:
+        return graph.get_node_by_id(node_id)
+
     for node in model.graph.node:
         if extract_node_id(node) == node_id:
             return node
@@ -147,15 +364,15 @@ def get_nodes_by_input_id(model: ModelProto, input_id: str) -> List[NodeProto]:
     :param input_id: id of the input to get nodes by
     :return: the retrieved nodes
     """
-    nodes = []
+    graph = get_indexed_graph(model)
 
-    for node in model.graph.node:
-        inputs = get_node_inputs(model, node)
+    if graph is not None:
+        return graph.get_nodes_by_input_id(input_id)
 
-        if input_id in inputs:
-            nodes.append(node)
+    if get_init_by_name(model, input_id) is not None:
+        return []
 
-    return nodes
+    return [node for node in model.graph.node if input_id in node.input]
 
 
 def get_nodes_by_output_id(model: ModelProto, output_id: str) -> List[NodeProto]:
@@ -166,15 +383,15 @@ def get_nodes_by_output_id(model: ModelProto, output_id: str) -> List[NodeProto]
     :param output_id: id of the output to get nodes by
     :return: the retrieved nodes
     """
-    nodes = []
+    graph = get_indexed_graph(model)
 
-    for node in model.graph.node:
-        outputs = get_node_outputs(model, node)
+    if graph is not None:
+        return graph.get_nodes_by_output_id(output_id)
 
-        if output_id in outputs:
-            nodes.append(node)
+    if get_init_by_name(model, output_id) is not None:
+        return []
 
-    return nodes
+    return [node for node in model.graph.node if output_id in node.output]
 
 
 def extract_shape(proto: Any) -> Union[None, Tuple[Union[int, None], ...]]:
@@ -242,17 +459,12 @@ def extract_nodes_shapes_ort(model: ModelProto) -> Dict[str, List[List[int]]]:
     :param model: an ONNX model
     :return: a list of NodeArg with their shape exposed
     """
-    model_copy = deepcopy(model)
-
-    for node in model_copy.graph.node:
-        intermediate_layer_value_info = make_empty_tensor_value_info(
-            extract_node_id(node)
-        )
-        model_copy.graph.output.append(intermediate_layer_value_info)
-
+    intermediate_outputs = [
+        make_empty_tensor_value_info(extract_node_id(node)) for node in model.graph.node
+    ]
     sess_options = onnxruntime.SessionOptions()
     sess_options.log_severity_level = 3
-    sess = onnxruntime.InferenceSession(model_copy.SerializeToString(), sess_options)
+    sess = create_ort_session(model, sess_options, extra_outputs=intermediate_outputs)
 
     output_shapes = {}
     for node in sess.get_outputs() + sess.get_inputs():
@@ -279,26 +491,21 @@ def extract_nodes_shapes_shape_inference(
     :param model: an ONNX model
     :return: a list of NodeProto with their shape exposed
     """
-    model_copy = deepcopy(model)
-
-    for node in model_copy.graph.node:
-        model_copy.graph.output.extend(
-            [
-                onnx.helper.make_tensor_value_info(
-                    output, onnx.TensorProto.UNDEFINED, None
-                )
-                for output in node.output
-            ]
-        )
-
-    if hasattr(onnx, "shape_inference"):
-        model_copy = onnx.shape_inference.infer_shapes(model_copy)
-    else:
+    if not hasattr(onnx, "shape_inference"):
         raise ModuleNotFoundError(
             "onnx.shape_inference not available for current version, "
             "please upgrade to use this functionality"
         )
 
+    intermediate_outputs = [
+        onnx.helper.make_tensor_value_info(output, onnx.TensorProto.UNDEFINED, None)
+        for node in model.graph.node
+        for output in node.output
+    ]
+    model_copy = onnx.shape_inference.infer_shapes(
+        _serialize_with_outputs(model, intermediate_outputs)
+    )
+
     output_shapes = {}
     for node in model_copy.graph.output:
         node_shape = extract_shape(node)
@@ -309,13 +516,128 @@ def extract_nodes_shapes_shape_inference(
     return output_shapes
 
 
-def extract_node_shapes(model: ModelProto) -> Dict[str, NodeShape]:
+def get_model_structure_hash(model: ModelProto) -> str:
+    """
+    Hash the structure of a model: its nodes, inputs, outputs, opsets and the
+    names, types, and shapes of its initializers.
+    The values of the initializers are not included so models that differ only
+    in their weights give the same hash, except for small integer initializers
+    that can determine shapes such as the shape, axes, pads, starts, or ends
+    inputs of a node.
+
+    :param model: the loaded model to hash
+    :return: the hex digest of the structure of the model
+    """
+    hasher = hashlib.sha256()
+    hasher.update(str(model.ir_version).encode())
+
+    for opset in model.opset_import:
+        hasher.update(opset.SerializeToString())
+
+    for proto in [
+        *model.graph.node,
+        *model.graph.input,
+        *model.graph.output,
+        *model.graph.value_info,
+    ]:
+        hasher.update(proto.SerializeToString())
+
+    # initializer order changes when params are updated, it is not structural
+    for init in sorted(model.graph.initializer, key=lambda init: init.name):
+        hasher.update(
+            "{}:{}:{}".format(init.name, init.data_type, list(init.dims)).encode()
+        )
+
+        if (
+            init.data_type in _SHAPE_INITIALIZER_TYPES
+            and numpy.prod(init.dims) <= _SHAPE_INITIALIZER_MAX_SIZE
+        ):
+            hasher.update(numpy_helper.to_array(init).tobytes())
+
+    return hasher.hexdigest()
+
+
+_SHAPE_INITIALIZER_TYPES = {
+    TensorProto.INT8,
+    TensorProto.INT16,
+    TensorProto.INT32,
+    TensorProto.INT64,
+    TensorProto.UINT8,
+    TensorProto.UINT16,
+    TensorProto.UINT32,
+    TensorProto.UINT64,
+}
+_SHAPE_INITIALIZER_MAX_SIZE = 64
+
+
+_NODE_SHAPES_CACHE = OrderedDict()  # type: Dict[str, Dict[str, NodeShape]]
+_NODE_SHAPES_CACHE_SIZE = 16
+
+
+def extract_node_shapes(
+    model: ModelProto, use_cache: bool = True, cache_dir: Union[str, None] = None
+) -> Dict[str, NodeShape]:
     """
     Extracts the shape information for each node as a NodeShape object.
+    Results are cached in process, and optionally on disk, by the structure
+    hash of the model so repeated calls for the same model, or one that only
+    differs in its weights, do not create a new ONNX Runtime session.
 
     :param model: the loaded onnx.ModelProto to extract node shape information from
+    :param use_cache: True to look up and store the node shapes in the cache,
+        False to always extract them from the model. Default is True
+    :param cache_dir: optional directory to additionally cache the node shapes
+        in as json files so they persist between processes
     :return: a mapping of node id to a NodeShape object
     """
+    if not use_cache:
+        return _extract_node_shapes(model)
+
+    model_hash = get_model_structure_hash(model)
+    cache_path = (
+        os.path.join(clean_path(cache_dir), "node_shapes_{}.json".format(model_hash))
+        if cache_dir
+        else None
+    )
+    node_shapes = _NODE_SHAPES_CACHE.get(model_hash)
+
+    if node_shapes is None and cache_path and os.path.exists(cache_path):
+        with open(cache_path, "r") as file:
+            node_shapes = {
+                node_id: NodeShape(**shape)
+                for node_id, shape in json.load(file).items()
+            }
+
+    if node_shapes is None:
+        node_shapes = _extract_node_shapes(model)
+
+        if not node_shapes:
+            # extraction failed, don't cache so it can be retried
+            return node_shapes
+
+    if cache_path and not os.path.exists(cache_path):
+        create_dirs(os.path.dirname(cache_path))
+        tmp_path = "{}.{}.tmp".format(cache_path, os.getpid())
+
+        with open(tmp_path, "w") as file:
+            json.dump(
+                {node_id: shape._asdict() for node_id, shape in node_shapes.items()},
+                file,
+            )
+
+        os.replace(tmp_path, cache_path)
+
+    _NODE_SHAPES_CACHE[model_hash] = node_shapes
+    _NODE_SHAPES_CACHE.move_to_end(model_hash)
+
+    while len(_NODE_SHAPES_CACHE) > _NODE_SHAPES_CACHE_SIZE:
+        _NODE_SHAPES_CACHE.popitem(last=False)
+
+    # the shapes hold mutable lists, never hand out the cached objects
+    return deepcopy(node_shapes)
+
+
+def _extract_node_shapes(model: ModelProto) -> Dict[str, NodeShape]:
 
     # Maps NodeArg to its inputs
     node_to_inputs = {}
@@ -402,6 +724,11 @@ def get_init_by_name(model: ModelProto, init_name: str) -> Union[Any, None]:
     :param init_name: the name of the initializer to retrieve
     :return: the initializer retrieved by name from the model
     """
+    graph = get_indexed_graph(model)
+
+    if graph is not None:
+        return graph.get_init_by_name(init_name)
+
     matching_inits = [
         init for init in model.graph.initializer if init.name == init_name
     ]
@@ -425,7 +752,7 @@ def _get_node_param_init_by_idx(
     if idx < len(node.input):
         initializer = get_init_by_name(model, node.input[idx])
         if initializer is not None:
-            return numpy_helper.to_array(initializer)
+            return get_init_array(initializer)
     return None
 
 
@@ -499,12 +826,12 @@ def conv_node_params(
 
     weight_name, weight_init = _get_init_by_name_nested(model, node.input[1])
     weight = NodeParam(
-        weight_name, numpy_helper.to_array(weight_init) if include_values else None
+        weight_name, get_init_array(weight_init) if include_values else None
     )
     if len(node.input) > 2:
         bias_name, bias_init = _get_init_by_name_nested(model, node.input[2])
         bias = NodeParam(
-            bias_name, numpy_helper.to_array(bias_init) if include_values else None
+            bias_name, get_init_array(bias_init) if include_values else None
         )
     else:
         bias = None
@@ -547,12 +874,12 @@ def _get_matmul_gemm_weight(
     elif weight_inits[0][1] is not None:
         weight = NodeParam(
             weight_inits[0][0],
-            numpy_helper.to_array(weight_inits[0][1]) if include_values else None,
+            get_init_array(weight_inits[0][1]) if include_values else None,
         )
     else:
         weight = NodeParam(
             weight_inits[1][0],
-            numpy_helper.to_array(weight_inits[1][1]) if include_values else None,
+            get_init_array(weight_inits[1][1]) if include_values else None,
         )
 
     return weight
@@ -581,7 +908,7 @@ def gemm_node_params(
     if len(node.input) > 2:
         bias_name, bias_init = _get_init_by_name_nested(model, node.input[2])
         bias = NodeParam(
-            bias_name, numpy_helper.to_array(bias_init) if include_values else None
+            bias_name, get_init_array(bias_init) if include_values else None
         )
     else:
         bias = None
@@ -756,12 +1083,11 @@ def get_node_input_nodes(model: ModelProto, node: NodeProto) -> List[NodeProto]:
         for the inputs to the given node
     """
     nodes = []
-    inputs = [node.name for node in model.graph.input] + [
-        node.name for node in model.graph.initializer
-    ]
+    # get_node_inputs already filters out initializers
+    model_input_names = {inp.name for inp in model.graph.input}
 
     for input_id in get_node_inputs(model, node):
-        if input_id in inputs:
+        if input_id in model_input_names:
             continue
 
         nodes.extend(get_nodes_by_output_id(model, input_id))
@@ -891,12 +1217,13 @@ def get_prunable_nodes(model: Union[str, ModelProto]) -> List[Any]:
     :param model: the model proto loaded from the ONNX file
     :return: a list of nodes from the model proto
     """
-    model = check_load_model(model)
+    model = check_load_model(model, load_external_data=False)
     prunable_nodes = []
 
-    for node in model.graph.node:
-        if is_prunable_node(model, node):
-            prunable_nodes.append(node)
+    with indexed_graph_lookups(model):
+        for node in model.graph.node:
+            if is_prunable_node(model, node):
+                prunable_nodes.append(node)
 
     return prunable_nodes
 
@@ -927,25 +1254,26 @@ def onnx_nodes_sparsities(
     :return: a tuple containing the overall sparsity measurement for the model,
         each conv or gemm node found in the model
     """
-    model = check_load_model(model)
+    model = check_load_model(model, load_external_data=False)
     node_inp_sparsities = OrderedDict()  # type: Dict[str, SparsityMeasurement]
     params_count = 0
     params_zero_count = 0
 
-    for node in get_prunable_nodes(model):
-        node_id = extract_node_id(node)
-        node_key = "{}(id={})".format(node.op_type, node_id)
-        weight, bias = get_node_params(model, node)
+    with indexed_graph_lookups(model):
+        for node in get_prunable_nodes(model):
+            node_id = extract_node_id(node)
+            node_key = "{}(id={})".format(node.op_type, node_id)
+            weight, bias = get_node_params(model, node)
 
-        zeros = weight.val.size - numpy.count_nonzero(weight.val)
-        sparsity = float(zeros) / float(weight.val.size)
-        density = 1.0 - sparsity
-        node_inp_sparsities[
-            "{}_inp={}".format(node_key, weight.name)
-        ] = SparsityMeasurement(node_id, weight.val.size, zeros, sparsity, density)
+            zeros = weight.val.size - numpy.count_nonzero(weight.val)
+            sparsity = float(zeros) / float(weight.val.size)
+            density = 1.0 - sparsity
+            node_inp_sparsities[
+                "{}_inp={}".format(node_key, weight.name)
+            ] = SparsityMeasurement(node_id, weight.val.size, zeros, sparsity, density)
 
-        params_count += weight.val.size
-        params_zero_count += zeros
+            params_count += weight.val.size
+            params_zero_count += zeros
 
     return (
         SparsityMeasurement(
@@ -967,7 +1295,7 @@ def model_inputs(model: Union[str, ModelProto]) -> List:
         to get the model inputs for
     :return: the input to the model
     """
-    model = check_load_model(model)
+    model = check_load_model(model, load_external_data=False)
     inputs_all = [node.name for node in model.graph.input]
     inputs_init = [node.name for node in model.graph.initializer]
     input_names = list(set(inputs_all) - set(inputs_init))
@@ -985,7 +1313,7 @@ def model_outputs(model: Union[str, ModelProto]) -> List:
         to get the model outputs for
     :return: the output from the model
     """
-    model = check_load_model(model)
+    model = check_load_model(model, load_external_data=False)
     outputs = [node for node in model.graph.output]
 
     return outputs
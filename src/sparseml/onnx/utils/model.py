@@ -17,13 +17,15 @@ Utilities for ONNX models and running inference with them
 """
 import logging
 import os
+import queue
 import re
 import tempfile
+import threading
 import time
 from abc import ABC, abstractmethod
 from collections import OrderedDict
 from copy import deepcopy
-from typing import Any, Callable, Dict, List, Tuple, Union
+from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
 
 import numpy
 import onnxruntime
@@ -36,6 +38,7 @@ from sparseml.onnx.utils.data import DataLoader
 from sparseml.onnx.utils.graph_editor import override_model_batch_size
 from sparseml.onnx.utils.helpers import (
     check_load_model,
+    create_ort_session,
     extract_node_id,
     get_node_by_id,
     get_prunable_node_from_foldable,
@@ -64,6 +67,7 @@ except Exception:
 __all__ = [
     "max_available_cores",
     "ModelRunner",
+    "ConcurrentRunResults",
     "ORTModelRunner",
     "DeepSparseModelRunner",
     "OpenVINOModelRunner",
@@ -110,11 +114,88 @@ def max_available_cores() -> int:
     return physical_cores if physical_cores else -1
 
 
+_PIPELINE_END = object()
+
+
+def _pipeline_put(item_queue: queue.Queue, item: Any, stop: threading.Event) -> bool:
+    while not stop.is_set():
+        try:
+            item_queue.put(item, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+
+    return False
+
+
+def _pipeline_data_worker(
+    data_iter: Any,
+    max_steps: int,
+    data_queue: queue.Queue,
+    stop: threading.Event,
+):
+    try:
+        while not stop.is_set():
+            data_time = time.time()
+            batch, (data, label) = next(data_iter)
+            data_time = time.time() - data_time
+
+            if not _pipeline_put(data_queue, (data, label, data_time), stop):
+                return
+
+            if batch >= max_steps - 1 and max_steps > -1:
+                break
+    except StopIteration:
+        pass
+    except Exception as err:
+        _pipeline_put(data_queue, err, stop)
+        return
+
+    _pipeline_put(data_queue, _PIPELINE_END, stop)
+
+
+def _pipeline_post_worker(
+    loss: Union[Callable[[Any, Any], Any], None],
+    post_queue: queue.Queue,
+    result_queue: queue.Queue,
+    stop: threading.Event,
+):
+    while not stop.is_set():
+        try:
+            item = post_queue.get(timeout=0.1)
+        except queue.Empty:
+            continue
+
+        if item is _PIPELINE_END:
+            break
+
+        pred, label, pred_time = item
+
+        try:
+            post_time = time.time()
+            output = loss(pred, label) if loss is not None else pred
+            post_time = time.time() - post_time
+        except Exception as err:
+            # stop the other stages, run_iter raises the error from the results
+            result_queue.put(err)
+            stop.set()
+            return
+
+        result_queue.put((output, pred_time, post_time))
+
+    result_queue.put(_PIPELINE_END)
+
+
 class ModelRunner(ABC):
     """
     Abstract class for handling running inference for a model
 
     :param loss: the loss function, if any, to run for evaluation of the model
+    :param pipeline_depth: the number of batches allowed in flight between the
+        stages of run_iter. 0 (the default) runs data loading, inference and the
+        loss one after another on the calling thread. Greater than 0 loads batches
+        on a producer thread and runs the loss on a consumer thread, with queues
+        of up to pipeline_depth batches between them and inference
     """
 
     def __init__(
@@ -122,8 +203,29 @@ class ModelRunner(ABC):
         loss: Union[
             Callable[[Dict[str, numpy.ndarray], Dict[str, numpy.ndarray]], Any], None
         ] = None,
+        pipeline_depth: int = 0,
     ):
         self._loss = loss
+        self._pipeline_depth = pipeline_depth
+        self._stage_times = {"data": [], "pred": [], "post": []}
+
+    @property
+    def pipeline_depth(self) -> int:
+        """
+        :return: the number of batches allowed in flight between the stages of
+            run_iter, 0 if the stages run one after another
+        """
+        return self._pipeline_depth
+
+    @property
+    def stage_times(self) -> Dict[str, List[float]]:
+        """
+        :return: the per batch times in seconds for each stage of the most
+            recent run; data loading under "data", inference under "pred"
+            (the times returned from run) and the loss or post-processing
+            under "post"
+        """
+        return self._stage_times
 
     def run(
         self,
@@ -196,15 +298,120 @@ class ModelRunner(ABC):
             else auto.tqdm(enumerate(data_loader), desc=desc, total=progress_steps)
         )
 
-        for batch, (data, label) in data_iter:
+        self._stage_times = {"data": [], "pred": [], "post": []}
+
+        if self._pipeline_depth > 0:
+            yield from self._run_iter_pipelined(
+                iter(data_iter), max_steps, *args, **kwargs
+            )
+
+            return
+
+        data_iter = iter(data_iter)
+
+        while True:
+            data_time = time.time()
+
+            try:
+                batch, (data, label) = next(data_iter)
+            except StopIteration:
+                break
+
+            data_time = time.time() - data_time
             _LOGGER.debug("calling batch_forward for batch {}".format(batch))
             pred, pred_time = self.batch_forward(data, *args, **kwargs)
             _LOGGER.debug("prediction completed in {}".format(pred_time))
+            post_time = time.time()
             output = self._loss(pred, label) if self._loss is not None else pred
+            post_time = time.time() - post_time
+            self._record_stage_times(data_time, pred_time, post_time)
             yield output, pred_time
             if batch >= max_steps - 1 and max_steps > -1:
                 break
 
+    def _run_iter_pipelined(self, data_iter: Any, max_steps: int, *args, **kwargs):
+        data_queue = queue.Queue(maxsize=self._pipeline_depth)
+        post_queue = queue.Queue(maxsize=self._pipeline_depth)
+        # bounded by the post queue plus the outputs drained after every batch
+        result_queue = queue.Queue()
+        stop = threading.Event()
+        workers = [
+            threading.Thread(
+                target=_pipeline_data_worker,
+                args=(data_iter, max_steps, data_queue, stop),
+                daemon=True,
+            ),
+            threading.Thread(
+                target=_pipeline_post_worker,
+                args=(self._loss, post_queue, result_queue, stop),
+                daemon=True,
+            ),
+        ]
+        data_times = []
+
+        for worker in workers:
+            worker.start()
+
+        def _handle_result(result):
+            if isinstance(result, BaseException):
+                raise result
+
+            output, pred_time, post_time = result
+            self._record_stage_times(data_times.pop(0), pred_time, post_time)
+
+            return output, pred_time
+
+        try:
+            batch = 0
+
+            while not stop.is_set():
+                try:
+                    item = data_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                if item is _PIPELINE_END:
+                    break
+
+                if isinstance(item, BaseException):
+                    raise item
+
+                data, label, data_time = item
+                data_times.append(data_time)
+                _LOGGER.debug("calling batch_forward for batch {}".format(batch))
+                pred, pred_time = self.batch_forward(data, *args, **kwargs)
+                _LOGGER.debug("prediction completed in {}".format(pred_time))
+                _pipeline_put(post_queue, (pred, label, pred_time), stop)
+                batch += 1
+
+                while True:
+                    try:
+                        result = result_queue.get_nowait()
+                    except queue.Empty:
+                        break
+
+                    yield _handle_result(result)
+
+            _pipeline_put(post_queue, _PIPELINE_END, stop)
+
+            while True:
+                result = result_queue.get()
+
+                if result is _PIPELINE_END:
+                    break
+
+                yield _handle_result(result)
+        finally:
+            stop.set()
+
+            for worker in workers:
+                worker.join()
+
+    def _record_stage_times(self, data_time: float, pred_time: float, post_time: float):
+        self._stage_times["data"].append(data_time)
+        self._stage_times["pred"].append(pred_time)
+        self._stage_times["post"].append(post_time)
+
     @abstractmethod
     def batch_forward(
         self, batch: Dict[str, numpy.ndarray], *args, **kwargs
@@ -232,6 +439,8 @@ class OpenVINOModelRunner(ModelRunner):
     :param shape: shape to be set for the input(s).
         For example, "input1[1,3,224,224],input2[1,4]"
         or "[1,3,224,224]" in case of one input size.
+    :param pipeline_depth: the number of batches allowed in flight between data
+        loading, inference and the loss in run; 0 to run them one after another
     """
 
     @staticmethod
@@ -247,8 +456,9 @@ class OpenVINOModelRunner(ModelRunner):
         nthreads: int = 1,
         batch_size: int = 0,
         shape: str = "",
+        pipeline_depth: int = 0,
     ):
-        super().__init__(loss)
+        super().__init__(loss, pipeline_depth)
         self._loss = loss
 
         self._nthreads = nthreads
@@ -433,6 +643,161 @@ class OpenVINOModelRunner(ModelRunner):
             inputs[k].buffer[:] = v
 
 
+class ConcurrentRunResults(object):
+    """
+    Results from running batches through several inference streams at once
+
+    :param outputs: the outputs for each batch, in the order of the data
+    :param batch_times: the time in seconds each batch spent in inference,
+        in the order of the data
+    :param batch_streams: the index of the stream each batch was run on,
+        in the order of the data
+    :param batch_sizes: the number of items in each batch, in the order of the data
+    :param num_streams: the number of streams the batches were run on
+    :param total_time: the wall clock time in seconds to run all of the batches
+    """
+
+    def __init__(
+        self,
+        outputs: List[Any],
+        batch_times: List[float],
+        batch_streams: List[int],
+        batch_sizes: List[int],
+        num_streams: int,
+        total_time: float,
+    ):
+        self._outputs = outputs
+        self._batch_times = batch_times
+        self._batch_streams = batch_streams
+        self._batch_sizes = batch_sizes
+        self._num_streams = num_streams
+        self._total_time = total_time
+
+    def __repr__(self):
+        return "{}(num_streams={}, num_batches={}, items_per_second={})".format(
+            self.__class__.__name__,
+            self._num_streams,
+            len(self._batch_times),
+            self.items_per_second,
+        )
+
+    @property
+    def outputs(self) -> List[Any]:
+        """
+        :return: the outputs for each batch, in the order of the data
+        """
+        return self._outputs
+
+    @property
+    def batch_times(self) -> List[float]:
+        """
+        :return: the time in seconds each batch spent in inference,
+            in the order of the data
+        """
+        return self._batch_times
+
+    @property
+    def batch_streams(self) -> List[int]:
+        """
+        :return: the index of the stream each batch was run on,
+            in the order of the data
+        """
+        return self._batch_streams
+
+    @property
+    def num_streams(self) -> int:
+        """
+        :return: the number of streams the batches were run on
+        """
+        return self._num_streams
+
+    @property
+    def total_time(self) -> float:
+        """
+        :return: the wall clock time in seconds to run all of the batches
+        """
+        return self._total_time
+
+    @property
+    def num_items(self) -> int:
+        """
+        :return: the number of items run across all of the streams
+        """
+        return sum(self._batch_sizes)
+
+    @property
+    def items_per_second(self) -> float:
+        """
+        :return: the number of items run per second of wall clock time
+            across all of the streams
+        """
+        return self.num_items / self._total_time if self._total_time > 0 else 0.0
+
+    @property
+    def batches_per_second(self) -> float:
+        """
+        :return: the number of batches run per second of wall clock time
+            across all of the streams
+        """
+        return (
+            len(self._batch_times) / self._total_time if self._total_time > 0 else 0.0
+        )
+
+    def stream_times(self, stream: int) -> List[float]:
+        """
+        :param stream: the index of the stream to get the batch times for
+        :return: the time in seconds each batch run on the stream spent in inference
+        """
+        return [
+            batch_time
+            for batch_time, batch_stream in zip(self._batch_times, self._batch_streams)
+            if batch_stream == stream
+        ]
+
+    def stream_latency_percentiles(
+        self, percentiles: Tuple[float, ...] = (50.0, 90.0, 95.0, 99.0)
+    ) -> List[Dict[float, float]]:
+        """
+        :param percentiles: the percentiles, from 0 to 100, to calculate
+        :return: for each stream, a mapping of each percentile to the batch
+            latency in seconds at that percentile. Streams that ran no batches
+            have an empty mapping
+        """
+        stream_percentiles = []
+
+        for stream in range(self._num_streams):
+            times = self.stream_times(stream)
+            values = numpy.percentile(times, percentiles) if times else []
+            stream_percentiles.append(
+                {perc: float(val) for perc, val in zip(percentiles, values)}
+            )
+
+        return stream_percentiles
+
+
+def _concurrent_data_worker(
+    data_iter: Any,
+    max_steps: int,
+    data_queue: queue.Queue,
+    num_streams: int,
+    stop: threading.Event,
+):
+    try:
+        for batch, (data, label) in enumerate(data_iter):
+            if not _pipeline_put(data_queue, (batch, data, label), stop):
+                return
+
+            if batch >= max_steps - 1 and max_steps > -1:
+                break
+    except Exception as err:
+        _pipeline_put(data_queue, err, stop)
+        return
+
+    # one end marker for each stream so they all exit once the data runs out
+    for _ in range(num_streams):
+        _pipeline_put(data_queue, _PIPELINE_END, stop)
+
+
 class ORTModelRunner(ModelRunner):
     """
     Class for handling running inference for an ONNX model through onnxruntime
@@ -447,6 +812,13 @@ class ORTModelRunner(ModelRunner):
         rewrite the model proto so that the model batch size matches batch_size
     :param providers: list of ORT provider names. will default to
         ort.get_available_providers()
+    :param pipeline_depth: the number of batches allowed in flight between data
+        loading, inference and the loss in run; 0 to run them one after another
+    :param num_streams: the number of inference sessions to create and run
+        batches through at once from a shared input queue in run and
+        run_concurrent. nthreads, or all available cores if it is 0, is split
+        evenly between the sessions. Each session holds its own copy of the
+        weights. Default 1 runs one batch at a time through a single session
     """
 
     @require_onnxruntime()
@@ -460,10 +832,17 @@ class ORTModelRunner(ModelRunner):
         nthreads: int = 0,
         batch_size: int = None,
         providers: List[str] = None,
+        pipeline_depth: int = 0,
+        num_streams: int = 1,
         **kwargs,
     ):
-        super().__init__(loss)
-        self._model = check_load_model(model)
+        if num_streams < 1:
+            raise ValueError(
+                "num_streams must be at least 1, given {}".format(num_streams)
+            )
+
+        super().__init__(loss, pipeline_depth)
+        self._model = check_load_model(model, load_external_data=False)
 
         if batch_size is not None:
             override_model_batch_size(self._model, batch_size)
@@ -475,6 +854,13 @@ class ORTModelRunner(ModelRunner):
         # Note: If ORT was built with OpenMP, use OpenMP env variable such as
         # OMP_NUM_THREADS to control the number of threads.
         # See: https://github.com/microsoft/onnxruntime/blob/master/docs/ONNX_Runtime_Perf_Tuning.md  # noqa
+        if num_streams > 1:
+            total_threads = nthreads if nthreads > 0 else max_available_cores()
+            nthreads = max(1, total_threads // num_streams)
+            _LOGGER.debug(
+                "running {} streams with {} threads each".format(num_streams, nthreads)
+            )
+
         sess_options.intra_op_num_threads = nthreads
 
         sess_options.log_severity_level = 3
@@ -482,25 +868,31 @@ class ORTModelRunner(ModelRunner):
             onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
         )
 
-        self._session = onnxruntime.InferenceSession(
-            self._model.SerializeToString()
-            if not isinstance(self._model, str)
-            else self._model,
-            sess_options,
-            providers=providers,
-        )
+        self._sessions = [
+            create_ort_session(self._model, sess_options, providers)
+            for _ in range(num_streams)
+        ]
+        self._session = self._sessions[0]
         self._overwrite_input_names = overwrite_input_names
         _LOGGER.debug("created model in onnxruntime {}".format(self._session))
 
     def __del__(self):
         try:
             del self._session
+            del self._sessions
         except Exception:
             pass
 
     def __repr__(self):
         return str(self._session)
 
+    @property
+    def num_streams(self) -> int:
+        """
+        :return: the number of inference sessions batches are run through at once
+        """
+        return len(self._sessions)
+
     def run(
         self,
         data_loader: DataLoader,
@@ -525,8 +917,128 @@ class ORTModelRunner(ModelRunner):
         """
         _check_args(args, kwargs)
 
+        if self.num_streams > 1:
+            results = self.run_concurrent(data_loader, desc, show_progress, max_steps)
+
+            return results.outputs, results.batch_times
+
         return super().run(data_loader, desc, show_progress, max_steps)
 
+    def run_concurrent(
+        self,
+        data_loader: Iterable[Tuple[Dict[str, numpy.ndarray], Any]],
+        desc: str = "",
+        show_progress: bool = True,
+        max_steps: int = -1,
+    ) -> ConcurrentRunResults:
+        """
+        Run inference for the data given in the data_loader iterator through
+        all of the runner's inference sessions at once. A producer thread fills
+        a shared input queue that one thread per session pulls batches from.
+
+        :param data_loader: the data_loader, or any iterable of (data, label)
+            tuples, used to load batches of data to run through the model
+        :param desc: str to display if show_progress is True
+        :param show_progress: True to show a tqdm bar when running, False otherwise
+        :param max_steps: maximum number of steps to take for the data_loader
+            instead of running over all the data
+        :return: the outputs, per batch latencies and aggregate throughput
+            across all of the streams
+        """
+        num_streams = self.num_streams
+        data_queue = queue.Queue(maxsize=2 * num_streams)
+        stop = threading.Event()
+        results = {}
+        errors = []
+        counter_len = (
+            len(data_loader)
+            if hasattr(data_loader, "__len__")
+            and not getattr(data_loader, "infinite", False)
+            else None
+        )
+        progress_steps = (
+            min(max_steps, counter_len)
+            if max_steps > 0 and counter_len
+            else (max_steps if max_steps > 0 else counter_len)
+        )
+        progress = auto.tqdm(desc=desc, total=progress_steps) if show_progress else None
+        progress_lock = threading.Lock()
+
+        def _stream_worker(stream: int):
+            session = self._sessions[stream]
+
+            while not stop.is_set():
+                try:
+                    item = data_queue.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+
+                if item is _PIPELINE_END:
+                    return
+
+                try:
+                    if isinstance(item, BaseException):
+                        raise item
+
+                    batch, data, label = item
+                    pred, pred_time = self._session_forward(session, data)
+                    output = self._loss(pred, label) if self._loss is not None else pred
+                    batch_size = len(next(iter(data.values()))) if data else 0
+                except Exception as err:
+                    errors.append(err)
+                    stop.set()
+
+                    return
+
+                results[batch] = (output, pred_time, stream, batch_size)
+
+                if progress is not None:
+                    with progress_lock:
+                        progress.update(1)
+
+        workers = [
+            threading.Thread(
+                target=_concurrent_data_worker,
+                args=(data_loader, max_steps, data_queue, num_streams, stop),
+                daemon=True,
+            )
+        ] + [
+            threading.Thread(target=_stream_worker, args=(stream,), daemon=True)
+            for stream in range(num_streams)
+        ]
+        total_time = time.time()
+
+        try:
+            for worker in workers:
+                worker.start()
+
+            for worker in workers[1:]:
+                worker.join()
+        finally:
+            stop.set()
+
+            for worker in workers:
+                worker.join()
+
+            if progress is not None:
+                progress.close()
+
+        total_time = time.time() - total_time
+
+        if errors:
+            raise errors[0]
+
+        ordered = [results[batch] for batch in sorted(results.keys())]
+
+        return ConcurrentRunResults(
+            outputs=[res[0] for res in ordered],
+            batch_times=[res[1] for res in ordered],
+            batch_streams=[res[2] for res in ordered],
+            batch_sizes=[res[3] for res in ordered],
+            num_streams=num_streams,
+            total_time=total_time,
+        )
+
     def batch_forward(
         self, batch: Dict[str, numpy.ndarray], *args, **kwargs
     ) -> Tuple[Dict[str, numpy.ndarray], float]:
@@ -538,6 +1050,11 @@ class ORTModelRunner(ModelRunner):
         """
         _check_args(args, kwargs)
 
+        return self._session_forward(self._session, batch)
+
+    def _session_forward(
+        self, session: onnxruntime.InferenceSession, batch: Dict[str, numpy.ndarray]
+    ) -> Tuple[Dict[str, numpy.ndarray], float]:
         if not self._overwrite_input_names:
             sess_batch = batch
         else:
@@ -545,17 +1062,17 @@ class ORTModelRunner(ModelRunner):
             batch_keys = list(batch.keys())
             _LOGGER.debug(
                 "remapping input dict from {} to {}".format(
-                    batch_keys, [inp.name for inp in self._session.get_inputs()]
+                    batch_keys, [inp.name for inp in session.get_inputs()]
                 )
             )
 
-            for inp_index, inp in enumerate(self._session.get_inputs()):
+            for inp_index, inp in enumerate(session.get_inputs()):
                 sess_batch[inp.name] = batch[batch_keys[inp_index]]
 
-        sess_outputs = [out.name for out in self._session.get_outputs()]
+        sess_outputs = [out.name for out in session.get_outputs()]
 
         pred_time = time.time()
-        pred = self._session.run(sess_outputs, sess_batch)
+        pred = session.run(sess_outputs, sess_batch)
         pred_time = time.time() - pred_time
 
         pred_dict = OrderedDict((key, val) for key, val in zip(sess_outputs, pred))
@@ -579,6 +1096,7 @@ class _DeepSparseBaseModelRunner(ModelRunner):
         loss: Union[
             Callable[[Dict[str, numpy.ndarray], Dict[str, numpy.ndarray]], Any], None
         ],
+        pipeline_depth: int = 0,
     ):
         if not _DeepSparseBaseModelRunner.available():
             raise ModuleNotFoundError(
@@ -586,7 +1104,7 @@ class _DeepSparseBaseModelRunner(ModelRunner):
                 "must be installed before using any ModelRunner for deepsparse"
             )
 
-        super().__init__(loss)
+        super().__init__(loss, pipeline_depth)
         self._model = model
 
         self._batch_size = batch_size
@@ -628,6 +1146,8 @@ class DeepSparseModelRunner(_DeepSparseBaseModelRunner):
     :param num_cores: the number of physical cores to run the model on. Defaults
         to run on all available cores
     :param loss: the loss function, if any, to run for evaluation of the model
+    :param pipeline_depth: the number of batches allowed in flight between data
+        loading, inference and the loss in run; 0 to run them one after another
     """
 
     def __init__(
@@ -638,8 +1158,9 @@ class DeepSparseModelRunner(_DeepSparseBaseModelRunner):
         loss: Union[
             Callable[[Dict[str, numpy.ndarray], Dict[str, numpy.ndarray]], Any], None
         ] = None,
+        pipeline_depth: int = 0,
     ):
-        super().__init__(model, batch_size, num_cores, loss)
+        super().__init__(model, batch_size, num_cores, loss, pipeline_depth)
         self._engine = compile_model(
             self._model, batch_size=batch_size, num_cores=num_cores
         )
@@ -711,7 +1232,7 @@ def correct_nm_analyze_model_node_ids(nm_result: Dict, model: Union[str, ModelPr
     :param model: the onnx model proto or path to the onnx file that the
         nm_result was for
     """
-    model = check_load_model(model)
+    model = check_load_model(model, load_external_data=False)
 
     for layer in nm_result["layer_info"]:
         node_id = (
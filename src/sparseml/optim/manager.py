@@ -58,34 +58,8 @@ class BaseManager(BaseObject):
         if self._metadata is not None:
             self._info_log_metadata()
 
-        if isinstance(modifiers, List):
-            # sort modifiers by when they start and end so that later modifiers
-            # can overwrite in a deterministic order such as when initializing
-            self._modifiers = _sort_modifiers_list(modifiers)
-        elif isinstance(modifiers, Dict):
-            # staged recipe
-            # sort modifiers of each stage by start/end as above then sort stages
-            # by their modifiers
-            modifiers = {
-                stage: _sort_modifiers_list(stage_modifiers)
-                for stage, stage_modifiers in modifiers.items()
-            }
-            self._modifiers = OrderedDict(
-                sorted(
-                    modifiers.items(),
-                    key=cmp_to_key(
-                        lambda item_1, item_2: BaseModifier.comparator_lists(
-                            item_1[1], item_2[1]
-                        )
-                    ),
-                )
-            )
-
-        else:
-            raise ValueError(
-                "modifiers type must be List[BaseModifier] or "
-                f"Dict[str, List[BaseModifier]] found {type(modifiers)}"
-            )
+        self._modifiers_version = 0
+        self.modifiers = modifiers
 
     def __del__(self):
         for mod in self.iter_modifiers():
@@ -262,7 +236,7 @@ class BaseManager(BaseObject):
 
         return combined_manager
 
-    @ModifierProp(serializable=False)
+    @ModifierProp(serializable=False, restrict_initialized=False)
     def modifiers(self) -> Union[List[BaseModifier], Dict[str, List[BaseModifier]]]:
         """
         :return: list of all SparseML modifiers in the managed recipe or dictionary
@@ -270,6 +244,55 @@ class BaseManager(BaseObject):
         """
         return self._modifiers
 
+    @modifiers.setter
+    def modifiers(
+        self, modifiers: Union[List[BaseModifier], Dict[str, List[BaseModifier]]]
+    ):
+        """
+        :param modifiers: list of SparseML modifiers or dictionary of modifier
+            stages to list of those modifiers to replace the managed ones with.
+            Assign a new value rather than editing the returned modifiers in place
+            so anything tracking modifiers_version sees the change
+        """
+        if isinstance(modifiers, List):
+            # sort modifiers by when they start and end so that later modifiers
+            # can overwrite in a deterministic order such as when initializing
+            self._modifiers = _sort_modifiers_list(modifiers)
+        elif isinstance(modifiers, Dict):
+            # staged recipe
+            # sort modifiers of each stage by start/end as above then sort stages
+            # by their modifiers
+            modifiers = {
+                stage: _sort_modifiers_list(stage_modifiers)
+                for stage, stage_modifiers in modifiers.items()
+            }
+            self._modifiers = OrderedDict(
+                sorted(
+                    modifiers.items(),
+                    key=cmp_to_key(
+                        lambda item_1, item_2: BaseModifier.comparator_lists(
+                            item_1[1], item_2[1]
+                        )
+                    ),
+                )
+            )
+
+        else:
+            raise ValueError(
+                "modifiers type must be List[BaseModifier] or "
+                f"Dict[str, List[BaseModifier]] found {type(modifiers)}"
+            )
+
+        self._modifiers_version += 1
+
+    @property
+    def modifiers_version(self) -> int:
+        """
+        :return: a counter incremented every time the modifiers are replaced,
+            used to cheaply check if the modifiers changed
+        """
+        return self._modifiers_version
+
     @ModifierProp(serializable=False)
     def epoch_modifiers(self) -> List[BaseModifier]:
         """
@@ -16,9 +16,11 @@
 Generic code related to sensitivity analysis.
 """
 
+import itertools
 import json
-from collections import OrderedDict
-from typing import Any, Dict, List, Tuple, Union
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Tuple, Union
 
 import numpy
 import pandas
@@ -30,6 +32,8 @@ from sparseml.utils.helpers import clean_path, create_parent_dirs, interpolated_
 __all__ = [
     "default_pruning_sparsities_loss",
     "default_pruning_sparsities_perf",
+    "magnitude_pruning_averages",
+    "magnitude_pruning_averages_iter",
     "PruningSensitivityResult",
     "PruningLossSensitivityAnalysis",
     "PruningPerfSensitivityAnalysis",
@@ -60,6 +64,108 @@ def default_pruning_sparsities_perf() -> Tuple[float, ...]:
     return 0.0, 0.4, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.975, 0.99
 
 
+def magnitude_pruning_averages(
+    values: numpy.ndarray, sparsity_levels: Iterable[float]
+) -> List[Tuple[float, float, bool]]:
+    """
+    Approximate the pruning loss of a param at each of the given sparsity levels
+    as the average magnitude of the weights removed when moving from the
+    previous sparsity level to the current one.
+    All levels are computed from a single partition of the magnitudes at the
+    sparsity boundaries and one cumulative sum rather than sorting the values
+    and averaging a slice per level.
+
+    :param values: the param values to calculate the approximate loss for
+    :param sparsity_levels: the sparsity levels to calculate the loss for,
+        expected to be in ascending order
+    :return: a list of tuples containing the sparsity level, the average magnitude
+        of the values pruned for it, and True if it is the baseline (zero sparsity)
+    """
+    values = numpy.abs(numpy.asarray(values).reshape(-1))
+    num_values = values.size
+    segments = []  # type: List[Union[None, Tuple[int, int]]]
+    prev_index = 0
+
+    for sparsity in sparsity_levels:
+        val_index = min(round(sparsity * num_values), num_values - 1)
+
+        if sparsity <= 1e-9:
+            segments.append(None)
+        elif val_index > prev_index:
+            segments.append((prev_index, val_index))
+            prev_index = val_index
+        else:
+            segments.append((val_index, val_index + 1))
+            prev_index = val_index + 1
+
+    # partitioning at every segment boundary puts the values of each segment
+    # in place without a full sort, sums over a segment are order independent
+    kth = sorted(
+        {index for seg in segments if seg for index in seg if index < num_values}
+    )
+    partitioned = numpy.partition(values, kth) if kth else values
+    sums = numpy.zeros(num_values + 1, dtype=numpy.float64)
+    numpy.cumsum(partitioned, dtype=numpy.float64, out=sums[1:])
+    averages = []
+
+    for sparsity, seg in zip(sparsity_levels, segments):
+        if seg is None:
+            averages.append((0.0, 0.0, True))
+        else:
+            start, end = seg
+            averages.append(
+                (sparsity, float((sums[end] - sums[start]) / (end - start)), False)
+            )
+
+    return averages
+
+
+def magnitude_pruning_averages_iter(
+    params: Iterable[numpy.ndarray],
+    sparsity_levels: Iterable[float],
+    num_threads: int = 1,
+) -> Iterator[List[Tuple[float, float, bool]]]:
+    """
+    Run magnitude_pruning_averages for each of the given params,
+    optionally across a pool of threads.
+
+    :param params: the param values to calculate the approximate loss for
+    :param sparsity_levels: the sparsity levels to calculate the loss for,
+        expected to be in ascending order
+    :param num_threads: the number of threads to run params in parallel with,
+        numpy releases the GIL for the partition and sum.
+        At most 2 * num_threads params are read ahead of the consumer.
+        Default is 1 to run in the calling thread
+    :return: an iterator over the results of magnitude_pruning_averages for
+        each param in the order they were given
+    """
+    sparsity_levels = list(sparsity_levels)
+
+    def _averages(values: numpy.ndarray) -> List[Tuple[float, float, bool]]:
+        return magnitude_pruning_averages(values, sparsity_levels)
+
+    if num_threads <= 1:
+        yield from map(_averages, params)
+        return
+
+    # submit a bounded window of params rather than executor.map which consumes
+    # the whole iterable up front and holds every param in memory at once
+    params = iter(params)
+    pending = deque()
+
+    with ThreadPoolExecutor(num_threads) as executor:
+        for values in itertools.islice(params, 2 * num_threads):
+            pending.append(executor.submit(_averages, values))
+
+        while pending:
+            result = pending.popleft().result()
+
+            for values in itertools.islice(params, 1):
+                pending.append(executor.submit(_averages, values))
+
+            yield result
+
+
 class PruningSensitivityResult(object):
     """
     A sensitivity result for a given node/param in a model.
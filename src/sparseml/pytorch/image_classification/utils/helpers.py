@@ -381,7 +381,7 @@ def save_model_training(
     )
 
     if val_res is not None:
-        has_top1 = "top1acc" in val_res.results
+        has_top1 = "top1acc" in val_res.result_keys
         metric_name = "top-1 accuracy" if has_top1 else "val_loss"
         metric = val_res.result_mean("top1acc" if has_top1 else DEFAULT_LOSS_KEY).item()
         print(
@@ -405,7 +405,7 @@ def save_model_training(
         ]
 
         if val_res is not None:
-            for loss in val_res.results.keys():
+            for loss in val_res.result_keys:
                 info_lines.append(f"{loss}: {val_res.result_mean(loss).item()}")
 
         info_file.write("\n".join(info_lines))
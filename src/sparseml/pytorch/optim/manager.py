@@ -18,7 +18,9 @@ grouping modifiers and running them together.
 Also handles loading modifiers from yaml files
 """
 
+import heapq
 import logging
+import math
 from typing import Any, Dict, List, Optional, Union
 
 import torch
@@ -33,7 +35,11 @@ from sparseml.optim import (
     parse_recipe_variables,
     validate_metadata,
 )
-from sparseml.pytorch.sparsification.modifier import Modifier, ScheduledModifier
+from sparseml.pytorch.sparsification.modifier import (
+    Modifier,
+    ScheduledModifier,
+    ScheduledUpdateModifier,
+)
 from sparseml.pytorch.utils import BaseLogger, LoggerManager, is_parallel_model
 from sparsezoo.objects import Recipe
 
@@ -89,6 +95,11 @@ class RecipeManagerStepWrapper(object):
         self._wrapped_steps_per_epoch = steps_per_epoch
         self._wrapped_epoch = epoch
         self._wrapped_steps = round(epoch * steps_per_epoch)
+        self._wrapped_timeline = (
+            _ModifierTimeline(manager, steps_per_epoch, self._wrapped_steps)
+            if _ModifierTimeline.supported(manager)
+            else None
+        )
 
     def __del__(self):
         try:
@@ -204,15 +215,33 @@ class RecipeManagerStepWrapper(object):
             kwargs["skip_orig_step"] if "skip_orig_step" in kwargs else False
         )
         ret = None
+        # the timeline skips the modifiers that have nothing to do at this step
+        runner = (
+            self._wrapped_manager
+            if self._wrapped_timeline is None
+            else self._wrapped_timeline
+        )
+
+        if self._wrapped_timeline is not None:
+            if self._wrapped_timeline.stale():
+                # the manager's modifiers were replaced since it was built
+                self._wrapped_timeline = _ModifierTimeline(
+                    self._wrapped_manager,
+                    self._wrapped_steps_per_epoch,
+                    self._wrapped_steps,
+                )
+                runner = self._wrapped_timeline
+
+            self._wrapped_timeline.step = self._wrapped_steps
 
         if self._wrapped_manager.enabled:
-            self._wrapped_manager.update(
+            runner.update(
                 self._wrapped_module,
                 self._wrapped_optimizer,
                 self._wrapped_epoch,
                 self._wrapped_steps_per_epoch,
             )
-            self._wrapped_manager.optimizer_pre_step(
+            runner.optimizer_pre_step(
                 self._wrapped_module,
                 self._wrapped_optimizer,
                 self._wrapped_epoch,
@@ -223,7 +252,7 @@ class RecipeManagerStepWrapper(object):
             ret = self._wrapped.step(*args, **kwargs)
 
         if self._wrapped_manager.enabled:
-            self._wrapped_manager.optimizer_post_step(
+            runner.optimizer_post_step(
                 self._wrapped_module,
                 self._wrapped_optimizer,
                 self._wrapped_epoch,
@@ -232,15 +261,262 @@ class RecipeManagerStepWrapper(object):
 
         # update tracking metrics for epoch and steps
         self._wrapped_steps += 1
-        epoch_num = self._wrapped_steps // self._wrapped_steps_per_epoch
-        epoch_steps = self._wrapped_steps % self._wrapped_steps_per_epoch
-        self._wrapped_epoch = float(epoch_num) + (
-            float(epoch_steps) / float(self._wrapped_steps_per_epoch)
+        self._wrapped_epoch = _step_epoch(
+            self._wrapped_steps, self._wrapped_steps_per_epoch
         )
 
         return ret
 
 
+def _step_epoch(step: int, steps_per_epoch: int) -> float:
+    epoch_num = step // steps_per_epoch
+    epoch_steps = step % steps_per_epoch
+
+    return float(epoch_num) + (float(epoch_steps) / float(steps_per_epoch))
+
+
+def _overrides(obj: Any, base: type, name: str) -> bool:
+    return getattr(type(obj), name) is not getattr(base, name) or name in vars(obj)
+
+
+class _ModifierTimeline(object):
+    """
+    Precomputed schedule of the optimizer steps the modifiers of a manager need
+    to act at, used by RecipeManagerStepWrapper in place of the manager's
+    update, optimizer_pre_step, and optimizer_post_step to avoid checking every
+    modifier at every step.
+
+    Modifiers using the default ScheduledModifier or ScheduledUpdateModifier
+    scheduling are kept in a heap keyed by the next step their update_ready could
+    return True at, computed from their start, end, frequency, and last update.
+    They are only checked once that step is reached and then rescheduled from
+    their new state, so disabled modifiers or modifiers that were not ready are
+    checked again at the following step.
+    Modifiers that override the scheduling checks are checked at every step.
+    Only modifiers that override optimizer_pre_step or optimizer_post_step
+    are called for those.
+    The timeline must be rebuilt once the manager's modifiers_version changes.
+
+    :param manager: the manager to precompute the schedule for
+    :param steps_per_epoch: the number of optimizer steps (batches) in each epoch
+    :param step: the optimizer step the schedule starts at
+    """
+
+    @staticmethod
+    def supported(manager: Any) -> bool:
+        """
+        :param manager: the manager to check
+        :return: True if the manager uses the default update and optimizer step
+            implementations that the timeline can replace, False otherwise
+        """
+        return not any(
+            _overrides(manager, ScheduledModifierManager, name)
+            for name in ["update", "optimizer_pre_step", "optimizer_post_step"]
+        )
+
+    def __init__(self, manager: Any, steps_per_epoch: int, step: int):
+        self._manager = manager
+        self._steps_per_epoch = steps_per_epoch
+        self.step = step
+        self._modifiers_version = manager.modifiers_version
+        self._modifiers = list(manager.iter_modifiers())
+        self._scheduled = [self._schedulable(mod) for mod in self._modifiers]
+        self._polled = [
+            index for index, scheduled in enumerate(self._scheduled) if not scheduled
+        ]
+        self._events = [
+            # check everything at the first step since the starting epoch
+            # may not line up with the step
+            (step, index)
+            for index, scheduled in enumerate(self._scheduled)
+            if scheduled
+        ]
+        self._pre_step = [
+            mod
+            for mod in self._modifiers
+            if _overrides(mod, Modifier, "optimizer_pre_step")
+        ]
+        self._post_step = [
+            mod
+            for mod in self._modifiers
+            if _overrides(mod, Modifier, "optimizer_post_step")
+        ]
+
+        heapq.heapify(self._events)
+
+    def stale(self) -> bool:
+        """
+        :return: True if the modifiers of the manager were replaced since the
+            timeline was built and it must be rebuilt, False otherwise
+        """
+        return self._manager.modifiers_version != self._modifiers_version
+
+    def update(
+        self,
+        module: Module,
+        optimizer: Optimizer,
+        epoch: float,
+        steps_per_epoch: int,
+        log_updates: bool = True,
+    ):
+        """
+        Equivalent of ScheduledModifierManager.update for the current step that
+        only checks the modifiers with a pending event and the polled modifiers
+
+        :param module: module to modify
+        :param optimizer: optimizer to modify
+        :param epoch: current epoch and progress within the current epoch
+        :param steps_per_epoch: number of steps taken within each epoch
+            (calculate batch number using this and epoch)
+        :param log_updates: True to log the updates for each modifier to the loggers,
+            False to skip logging
+        """
+        # run the manager's own checks that ScheduledModifierManager.update runs
+        super(ScheduledModifierManager, self._manager).update(
+            module, optimizer, epoch, steps_per_epoch
+        )
+
+        if not self._polled and (not self._events or self._events[0][0] > self.step):
+            return
+
+        due = []
+
+        while self._events and self._events[0][0] <= self.step:
+            due.append(heapq.heappop(self._events)[1])
+
+        if self._polled:
+            due.extend(self._polled)
+            # run in the manager's order so later modifiers can overwrite
+            due.sort()
+
+        for index in due:
+            mod = self._modifiers[index]
+
+            if mod.enabled and mod.update_ready(epoch, steps_per_epoch):
+                mod.scheduled_update(module, optimizer, epoch, steps_per_epoch)
+
+                if log_updates:
+                    mod.scheduled_log_update(module, optimizer, epoch, steps_per_epoch)
+
+            if self._scheduled[index]:
+                next_step = self._next_step(mod, self.step + 1)
+
+                if next_step is not None:
+                    heapq.heappush(self._events, (next_step, index))
+
+    def optimizer_pre_step(
+        self, module: Module, optimizer: Optimizer, epoch: float, steps_per_epoch: int
+    ):
+        """
+        Calls optimizer_pre_step for the enabled modifiers that implement it
+
+        :param module: module to modify
+        :param optimizer: optimizer to modify
+        :param epoch: current epoch and progress within the current epoch
+        :param steps_per_epoch: number of steps taken within each epoch
+            (calculate batch number using this and epoch)
+        """
+        super(ScheduledModifierManager, self._manager).optimizer_pre_step(
+            module, optimizer, epoch, steps_per_epoch
+        )
+
+        for mod in self._pre_step:
+            if mod.enabled:
+                mod.optimizer_pre_step(module, optimizer, epoch, steps_per_epoch)
+
+    def optimizer_post_step(
+        self, module: Module, optimizer: Optimizer, epoch: float, steps_per_epoch: int
+    ):
+        """
+        Calls optimizer_post_step for the enabled modifiers that implement it
+
+        :param module: module to modify
+        :param optimizer: optimizer to modify
+        :param epoch: current epoch and progress within the current epoch
+        :param steps_per_epoch: number of steps taken within each epoch
+            (calculate batch number using this and epoch)
+        """
+        super(ScheduledModifierManager, self._manager).optimizer_post_step(
+            module, optimizer, epoch, steps_per_epoch
+        )
+
+        for mod in self._post_step:
+            if mod.enabled:
+                mod.optimizer_post_step(module, optimizer, epoch, steps_per_epoch)
+
+    @staticmethod
+    def _schedulable(mod: Any) -> bool:
+        if not isinstance(mod, ScheduledModifier):
+            return False
+
+        if _overrides(mod, ScheduledModifier, "start_pending") or _overrides(
+            mod, ScheduledModifier, "end_pending"
+        ):
+            return False
+
+        base = (
+            ScheduledUpdateModifier
+            if isinstance(mod, ScheduledUpdateModifier)
+            else ScheduledModifier
+        )
+
+        return not _overrides(mod, base, "update_ready")
+
+    def _next_step(self, mod: ScheduledModifier, step: int) -> Optional[int]:
+        # earliest step >= step that the default update_ready can be True at
+        if mod.ended:
+            return None
+
+        if not mod.started:
+            if mod.start_epoch == -1.0:
+                return step
+
+            return (
+                self._first_step(step, mod.start_epoch)
+                if mod.start_epoch >= 0.0
+                else None
+            )
+
+        next_step = (
+            self._first_step(step, mod.end_epoch) if mod.end_epoch >= 0.0 else None
+        )
+
+        if not isinstance(mod, ScheduledUpdateModifier):
+            return next_step
+
+        update_step = None
+
+        if mod.update_frequency == -1.0:
+            update_step = self._first_step(step, mod.start_epoch, inclusive=False)
+        elif mod.last_update_epoch >= 0.0:
+            update_step = max(
+                self._first_step(step, mod.start_epoch, inclusive=False),
+                self._first_step(step, mod.last_update_epoch + mod.update_frequency),
+            )
+
+        if update_step is None:
+            return next_step
+
+        return update_step if next_step is None else min(next_step, update_step)
+
+    def _first_step(self, step: int, epoch: float, inclusive: bool = True) -> int:
+        # first step >= step whose epoch is >= (or > if not inclusive) the given one
+        def _reached(check_step: int) -> bool:
+            check_epoch = _step_epoch(check_step, self._steps_per_epoch)
+
+            return check_epoch >= epoch if inclusive else check_epoch > epoch
+
+        first = max(step, int(math.floor(epoch * self._steps_per_epoch)) - 1)
+
+        while first > step and _reached(first - 1):
+            first -= 1
+
+        while not _reached(first):
+            first += 1
+
+        return first
+
+
 class ScheduledModifierManager(BaseManager, Modifier):
     """
     The base modifier manager, handles managing multiple ScheduledModifers.
@@ -243,6 +243,8 @@ class ModuleASOneShootBooster(object):
     :param loss: the loss function to use for calculations
     :param data_loader_kwargs: any keyword arguments to supply to a the
         DataLoader constructor
+    :param prefetch: True to place the next batch on the device while the current
+        batch is run, False to place each batch on the device synchronously
     """
 
     def __init__(
@@ -253,6 +255,7 @@ class ModuleASOneShootBooster(object):
         batch_size: int,
         loss: LossWrapper,
         data_loader_kwargs: Dict,
+        prefetch: bool = False,
     ):
         self._module = module
         self._device = device
@@ -260,6 +263,7 @@ class ModuleASOneShootBooster(object):
         self._batch_size = batch_size
         self._loss = loss
         self._dataloader_kwargs = data_loader_kwargs if data_loader_kwargs else {}
+        self._prefetch = prefetch
 
     def run_layers(
         self,
@@ -437,7 +441,7 @@ class ModuleASOneShootBooster(object):
             as_analyzer = ModuleASAnalyzer(layer, dim=None, track_outputs_sparsity=True)
             as_analyzer.enable()
 
-        tester = ModuleTester(module, device, self._loss)
+        tester = ModuleTester(module, device, self._loss, prefetch=self._prefetch)
         data_loader = DataLoader(
             self._dataset, self._batch_size, **self._dataloader_kwargs
         )
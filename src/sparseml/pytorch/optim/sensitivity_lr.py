@@ -84,7 +84,7 @@ def _sensitivity_callback(
 
         measurement_steps = 0
         check_index += 1
-        lr_results = ModuleRunResults()
+        lr_results = ModuleRunResults(keep_results=True)
 
         if check_index < len(check_lrs):
             set_optim_learning_rate(optim, check_lrs[check_index])
@@ -125,6 +125,7 @@ def lr_loss_sensitivity(
     trainer_run_funcs: ModuleRunFuncs = None,
     trainer_loggers: List[BaseLogger] = None,
     show_progress: bool = True,
+    prefetch: bool = False,
 ) -> LRLossSensitivityAnalysis:
     """
     Implementation for handling running sensitivity analysis for
@@ -147,6 +148,8 @@ def lr_loss_sensitivity(
     :param trainer_run_funcs: override functions for ModuleTrainer class
     :param trainer_loggers: loggers to log data to while running the analysis
     :param show_progress: track progress of the runs if True
+    :param prefetch: True to place the next batch on the device while the current
+        batch is run, False to place each batch on the device synchronously
     :return: a list of tuples containing the analyzed learning rate at 0
         and the ModuleRunResults in 1, ModuleRunResults being a collection
         of all the batch results run through the module at that LR
@@ -160,6 +163,7 @@ def lr_loss_sensitivity(
         loggers=trainer_loggers,
         log_summary=False,
         log_steps=max(1, round(steps_per_measurement / 10)),
+        prefetch=prefetch,
     )
     batch_end, completed = _sensitivity_callback(
         check_lrs, steps_per_measurement, optim, analysis, loss_key
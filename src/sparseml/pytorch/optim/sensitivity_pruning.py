@@ -16,16 +16,33 @@
 Sensitivity analysis implementations for kernel sparsity on Modules against loss funcs.
 """
 
-from typing import Any, Callable, List, Tuple, Union
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+from copy import deepcopy
+from functools import partial
+from itertools import islice
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import torch
 from torch import Tensor
 from torch.nn import Module
 from torch.utils.data import DataLoader
+from tqdm import auto
+
+
+try:
+    from torch.fx import Interpreter, symbolic_trace
+except ImportError:
+    Interpreter = object
+    symbolic_trace = None
 
 from sparseml.optim import (
     PruningLossSensitivityAnalysis,
     default_pruning_sparsities_loss,
+    magnitude_pruning_averages_iter,
 )
 from sparseml.pytorch.optim.mask_creator_pruning import UnstructuredPruningMaskCreator
 from sparseml.pytorch.optim.mask_pruning import ModuleParamPruningMask
@@ -46,6 +63,8 @@ __all__ = [
     "pruning_loss_sens_one_shot",
 ]
 
+_LOGGER = logging.getLogger(__name__)
+
 
 def model_prunability_magnitude(module: Module):
     """
@@ -75,6 +94,7 @@ def pruning_loss_sens_magnitude(
     sparsity_levels: Union[
         List[float], Tuple[float, ...]
     ] = default_pruning_sparsities_loss(True),
+    num_threads: int = 1,
 ) -> PruningLossSensitivityAnalysis:
     """
     Approximated kernel sparsity (pruning) loss analysis for a given model.
@@ -82,37 +102,23 @@ def pruning_loss_sens_magnitude(
 
     :param module: the model to calculate the sparse sensitivity analysis for
     :param sparsity_levels: the sparsity levels to calculate the loss for for each param
+    :param num_threads: the number of threads to run the layers in parallel with.
+        Default is 1 to run them sequentially
     :return: the analysis results for the model
     """
     prunable = get_prunable_layers(module)
     analysis = PruningLossSensitivityAnalysis()
+    params = (
+        layer.weight.detach().cpu().float().numpy().reshape(-1) for _, layer in prunable
+    )
+    averages_iter = magnitude_pruning_averages_iter(
+        params, sparsity_levels, num_threads
+    )
 
-    for index, (name, layer) in enumerate(prunable):
-        weight = getattr(layer, "weight")
+    for index, ((name, _), averages) in enumerate(zip(prunable, averages_iter)):
         name = "{}.weight".format(name)
-        values, _ = weight.view(-1).abs().sort()
-        prev_index = 0
-
-        for sparsity in sparsity_levels:
-            val_index = round(sparsity * len(values))
-
-            if val_index >= len(values):
-                val_index = len(values) - 1
-
-            if sparsity <= 1e-9:
-                baseline = True
-                sparsity = 0.0
-                sparse_avg = 0.0
-            else:
-                baseline = False
-
-                if val_index > prev_index:
-                    sparse_avg = values[prev_index:val_index].mean().item()
-                    prev_index = val_index
-                else:
-                    sparse_avg = values[val_index].item()
-                    prev_index = val_index + 1
 
+        for sparsity, sparse_avg, baseline in averages:
             analysis.add_result(None, name, index, sparsity, sparse_avg, baseline)
 
     return analysis
@@ -195,7 +201,7 @@ def _sensitivity_callback(
             analysis.add_result(
                 None,
                 "{}.weight".format(prunable_layers[layer_index][0]),
-                sparsity_index,
+                layer_index,
                 sparsity_levels[sparsity_index],
                 losses[loss_key].item(),
                 baseline=sparsity_levels[sparsity_index] < 1e-9,
@@ -218,6 +224,11 @@ def pruning_loss_sens_one_shot(
     tester_run_funcs: ModuleRunFuncs = None,
     tester_loggers: List[BaseLogger] = None,
     show_progress: bool = True,
+    num_workers: int = 1,
+    checkpoint_path: Optional[str] = None,
+    cache_activations: bool = False,
+    activation_cache_dir: Optional[str] = None,
+    prefetch: bool = False,
 ) -> PruningLossSensitivityAnalysis:
     """
     Run a one shot sensitivity analysis for kernel sparsity.
@@ -228,6 +239,19 @@ def pruning_loss_sens_one_shot(
     This means it is not parallel for data loading and the first run can take longer.
     Subsequent sparsity checks for layers and levels will be much faster.
 
+    If num_workers > 1, each (layer, sparsity) measurement is run independently
+    in a pool of worker processes, each holding its own copy of the module.
+    The module, loss, cached data batches, and tester_run_funcs must be picklable
+    for this and tester_loggers are not used by the workers.
+    Results are added to the analysis in layer then sparsity order
+    regardless of which worker finishes first.
+
+    If cache_activations is True, the module is traced with torch.fx and a
+    baseline pass records the values feeding the part of the graph that depends
+    on each prunable layer. Every measurement for a layer then resumes from those
+    cached values instead of rerunning the layers before it.
+    Modules that cannot be traced fall back to full forward passes.
+
     :param module: the module to run the kernel sparsity sensitivity analysis over
         will extract all prunable layers out
     :param data: the data to run through the module for calculating the sensitivity
@@ -242,8 +266,40 @@ def pruning_loss_sens_one_shot(
     :param tester_run_funcs: override functions to use in the ModuleTester that runs
     :param tester_loggers: loggers to log data to while running the analysis
     :param show_progress: track progress of the runs if True
+    :param num_workers: number of worker processes to run measurements in.
+        Default is 1 to run all measurements in this process
+    :param checkpoint_path: optional path to a json file to save the partial analysis
+        to after each measurement completes. If the file already exists, the
+        measurements it contains are loaded and skipped so an interrupted run
+        can be resumed
+    :param cache_activations: True to cache the baseline activations feeding each
+        prunable layer and only rerun the module from that layer onwards for each
+        measurement, False to run the full module for every measurement
+    :param activation_cache_dir: optional directory to spill the cached activations
+        to instead of keeping them in memory. Only used if cache_activations is True
+    :param prefetch: True to place the next batch on the device while the current
+        batch is run, False to place each batch on the device synchronously
     :return: the sensitivity results for every layer that is prunable
     """
+    if num_workers > 1 or checkpoint_path or cache_activations:
+        return _pruning_loss_sens_one_shot_measurements(
+            module,
+            data,
+            loss,
+            device,
+            steps_per_measurement,
+            sparsity_levels,
+            loss_key,
+            tester_run_funcs,
+            tester_loggers if num_workers <= 1 else None,
+            show_progress,
+            num_workers,
+            checkpoint_path,
+            cache_activations,
+            activation_cache_dir,
+            prefetch,
+        )
+
     analysis = PruningLossSensitivityAnalysis()
     tester = ModuleTester(
         module,
@@ -252,6 +308,7 @@ def pruning_loss_sens_one_shot(
         loggers=tester_loggers,
         log_summary=False,
         log_steps=max(1, round(steps_per_measurement / 10)),
+        prefetch=prefetch,
     )
     layers = get_prunable_layers(module)
     batch_end = _sensitivity_callback(
@@ -274,3 +331,399 @@ def pruning_loss_sens_one_shot(
     batch_end_hook.remove()
 
     return analysis
+
+
+def _pruning_loss_sens_one_shot_measurements(
+    module: Module,
+    data: DataLoader,
+    loss: Union[LossWrapper, Callable[[Any, Any], Tensor]],
+    device: str,
+    steps_per_measurement: int,
+    sparsity_levels: List[int],
+    loss_key: str,
+    tester_run_funcs: Optional[ModuleRunFuncs],
+    tester_loggers: Optional[List[BaseLogger]],
+    show_progress: bool,
+    num_workers: int,
+    checkpoint_path: Optional[str],
+    cache_activations: bool,
+    activation_cache_dir: Optional[str],
+    prefetch: bool,
+) -> PruningLossSensitivityAnalysis:
+    layers = get_prunable_layers(module)
+    analysis = (
+        PruningLossSensitivityAnalysis.load_json(checkpoint_path)
+        if checkpoint_path and os.path.exists(checkpoint_path)
+        else PruningLossSensitivityAnalysis()
+    )
+    completed = {
+        (res.name, sparsity)
+        for res in analysis.results
+        for sparsity in res.sparse_measurements
+    }
+    measurements = [
+        (layer_index, sparsity)
+        for layer_index, (name, _) in enumerate(layers)
+        for sparsity in sparsity_levels
+        if ("{}.weight".format(name), sparsity) not in completed
+    ]
+
+    if checkpoint_path and completed:
+        _LOGGER.info(
+            "resuming sensitivity analysis from {} with {} of {} measurements "
+            "remaining".format(
+                checkpoint_path,
+                len(measurements),
+                len(layers) * len(sparsity_levels),
+            )
+        )
+
+    if not measurements:
+        return analysis
+
+    # every measurement is run over the same cached batches
+    batches = list(
+        islice(
+            infinite_data_loader(
+                data, early_stop_steps=steps_per_measurement, cache=True
+            ),
+            steps_per_measurement,
+        )
+    )
+    bar = (
+        auto.tqdm(total=len(measurements), desc="KS Analysis")
+        if show_progress
+        else None
+    )
+    pending = {}  # type: Dict[int, List[float]]
+    next_index = 0
+
+    def _add_measurement_losses(index: int, losses: List[float]):
+        # add results in measurement order so they are deterministic
+        nonlocal next_index
+        pending[index] = losses
+
+        while next_index in pending:
+            layer_index, sparsity = measurements[next_index]
+
+            for measurement_loss in pending.pop(next_index):
+                analysis.add_result(
+                    None,
+                    "{}.weight".format(layers[layer_index][0]),
+                    layer_index,
+                    sparsity,
+                    measurement_loss,
+                    baseline=sparsity < 1e-9,
+                )
+
+            next_index += 1
+
+            if checkpoint_path:
+                analysis.save_json(checkpoint_path)
+
+        if bar is not None:
+            bar.update(1)
+
+    cache_dir = (
+        tempfile.mkdtemp(dir=activation_cache_dir)
+        if cache_activations and activation_cache_dir
+        else None
+    )
+    worker_args = (
+        module,
+        batches,
+        loss,
+        device,
+        loss_key,
+        tester_run_funcs,
+        cache_activations,
+        cache_dir,
+        prefetch,
+    )
+
+    try:
+        if num_workers <= 1:
+            _sensitivity_worker_init(*worker_args, loggers=tester_loggers)
+
+            for index, measurement in enumerate(measurements):
+                _add_measurement_losses(
+                    *_sensitivity_worker_measure((index, measurement))
+                )
+
+            _SENSITIVITY_WORKER_STATE.clear()
+        else:
+            num_workers = min(num_workers, len(measurements))
+            # split the available threads between workers to avoid oversubscription
+            num_threads = max(1, torch.get_num_threads() // num_workers)
+            context = multiprocessing.get_context("spawn")
+
+            with context.Pool(
+                num_workers,
+                initializer=_sensitivity_worker_init,
+                initargs=(*worker_args, None, num_threads),
+            ) as pool:
+                for index, losses in pool.imap_unordered(
+                    _sensitivity_worker_measure, enumerate(measurements)
+                ):
+                    _add_measurement_losses(index, losses)
+    finally:
+        if cache_dir:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    if bar is not None:
+        bar.close()
+
+    return analysis
+
+
+_SENSITIVITY_WORKER_STATE = {}  # type: Dict[str, Any]
+
+
+def _sensitivity_worker_init(
+    module: Module,
+    batches: List[Any],
+    loss: Union[LossWrapper, Callable[[Any, Any], Tensor]],
+    device: str,
+    loss_key: str,
+    tester_run_funcs: Optional[ModuleRunFuncs],
+    cache_activations: bool,
+    cache_dir: Optional[str],
+    prefetch: bool,
+    loggers: Optional[List[BaseLogger]] = None,
+    num_threads: Optional[int] = None,
+):
+    if num_threads:
+        # running in a spawned worker, torch moves pickled tensors into shared
+        # memory so copy the module to keep the pruned weights process local
+        torch.set_num_threads(num_threads)
+        module = deepcopy(module)
+
+    layers = get_prunable_layers(module)
+    cache_module = (
+        _ActivationCacheModule.create(
+            module,
+            [name for name, _ in layers],
+            tempfile.mkdtemp(dir=cache_dir) if cache_dir else None,
+        )
+        if cache_activations
+        else None
+    )
+    tester = ModuleTester(
+        cache_module if cache_module is not None else module,
+        device,
+        loss,
+        loggers=loggers,
+        log_summary=False,
+        log_steps=max(1, round(len(batches) / 10)),
+        prefetch=prefetch,
+    )
+
+    if tester_run_funcs is not None:
+        tester.run_funcs.copy(tester_run_funcs)
+
+    if cache_module is not None:
+        # baseline pass to record the activations every measurement resumes from
+        tester.run(batches, desc="", show_progress=False, track_results=False)
+
+    _SENSITIVITY_WORKER_STATE.update(
+        tester=tester,
+        cache_module=cache_module,
+        layers=layers,
+        batches=batches,
+        loss_key=loss_key,
+    )
+
+
+def _sensitivity_worker_measure(
+    measurement: Tuple[int, Tuple[int, float]]
+) -> Tuple[int, List[float]]:
+    index, (layer_index, sparsity) = measurement
+    tester = _SENSITIVITY_WORKER_STATE["tester"]
+    loss_key = _SENSITIVITY_WORKER_STATE["loss_key"]
+    mask = ModuleParamPruningMask(
+        [_SENSITIVITY_WORKER_STATE["layers"][layer_index][1]],
+        store_init=True,
+        mask_creator=UnstructuredPruningMaskCreator(),
+    )
+    mask.enabled = True
+
+    if sparsity > 0.0:
+        mask.set_param_masks_from_sparsity(sparsity)
+
+    losses = []
+
+    def _batch_end(epoch, step, batch_size, data, pred, batch_losses):
+        losses.append(batch_losses[loss_key].item())
+
+    if _SENSITIVITY_WORKER_STATE["cache_module"] is not None:
+        _SENSITIVITY_WORKER_STATE["cache_module"].resume_from(layer_index)
+
+    batch_end_hook = tester.run_hooks.register_batch_end_hook(_batch_end)
+    tester.run(
+        _SENSITIVITY_WORKER_STATE["batches"],
+        desc="KS Analysis",
+        show_progress=False,
+        track_results=False,
+    )
+    batch_end_hook.remove()
+    mask.enabled = False
+    mask.reset()
+
+    return index, losses
+
+
+class _ActivationRecorder(Interpreter):
+    def __init__(self, module: Module, nodes: Any, save: Callable[[Any, Any], None]):
+        super().__init__(module)
+        self._nodes = nodes
+        self._save = save
+
+    def run_node(self, node: Any) -> Any:
+        value = super().run_node(node)
+
+        if node in self._nodes:
+            self._save(node, value)
+
+        return value
+
+
+class _ActivationCacheModule(Module):
+    """
+    Runs a module traced with torch.fx and caches the baseline values of the
+    nodes feeding the part of the graph that depends on each prunable layer.
+    After the first (recording) pass over the batches, resume_from selects a layer
+    and each following forward pass only recomputes the nodes downstream of it,
+    starting from the cached values for the matching batch.
+
+    :param graph_module: the traced module to run
+    :param layer_names: the names of the prunable layers in the traced module
+    :param cache_dir: optional directory to save the cached values to,
+        if not supplied they are kept in memory
+    """
+
+    @staticmethod
+    def create(
+        module: Module, layer_names: List[str], cache_dir: Optional[str] = None
+    ) -> Optional["_ActivationCacheModule"]:
+        """
+        :param module: the module to trace
+        :param layer_names: the names of the prunable layers in the module
+        :param cache_dir: optional directory to save the cached values to
+        :return: the created cache module or None if the module can't be traced
+        """
+        if symbolic_trace is None:
+            _LOGGER.warning(
+                "torch.fx is not available, running full forward passes "
+                "for sensitivity analysis"
+            )
+            return None
+
+        try:
+            graph_module = symbolic_trace(module)
+        except Exception as err:
+            _LOGGER.warning(
+                "unable to trace module to cache activations, running full "
+                "forward passes for sensitivity analysis: {}".format(err)
+            )
+            return None
+
+        return _ActivationCacheModule(graph_module, layer_names, cache_dir)
+
+    def __init__(
+        self,
+        graph_module: Module,
+        layer_names: List[str],
+        cache_dir: Optional[str] = None,
+    ):
+        super().__init__()
+        self.graph_module = graph_module
+        self._cache_dir = cache_dir
+        self._cache = {}  # type: Dict[Tuple[int, str], Any]
+        self._layer_nodes = [self._downstream_nodes(name) for name in layer_names]
+        self._record_nodes = set()
+
+        for nodes in self._layer_nodes:
+            if nodes is not None:
+                self._record_nodes.update(nodes[0])
+
+        self._layer_index = None
+        self._batch = 0
+
+    def resume_from(self, layer_index: Optional[int]):
+        """
+        :param layer_index: the index of the layer to resume forward passes from,
+            None to run and record full forward passes
+        """
+        self._layer_index = layer_index
+        self._batch = 0
+
+    def forward(self, *args):
+        batch = self._batch
+        self._batch += 1
+
+        if self._layer_index is None:
+            return _ActivationRecorder(
+                self.graph_module, self._record_nodes, partial(self._save, batch)
+            ).run(*args)
+
+        nodes = self._layer_nodes[self._layer_index]
+
+        if nodes is None:
+            return self.graph_module(*args)
+
+        frontier, skipped = nodes
+        initial_env = {
+            node: self._load(batch, node) if node in frontier else None
+            for node in skipped
+        }
+
+        return Interpreter(self.graph_module).run(*args, initial_env=initial_env)
+
+    def _downstream_nodes(self, layer_name: str) -> Optional[Tuple[set, List]]:
+        nodes = list(self.graph_module.graph.nodes)
+        downstream = {
+            node
+            for node in nodes
+            if node.op == "call_module" and node.target == layer_name
+        }
+
+        if not downstream:
+            return None
+
+        # nodes are topologically sorted so one pass finds everything the layer
+        # feeds into, the output is always rerun to gather the final values
+        for node in nodes:
+            if node.op == "output" or any(
+                inp in downstream for inp in node.all_input_nodes
+            ):
+                downstream.add(node)
+
+        # inputs and attributes are cheap and must always be rerun so the
+        # interpreter consumes the positional args and picks up masked params
+        rerun = downstream.union(
+            node for node in nodes if node.op in ["placeholder", "get_attr"]
+        )
+        frontier = {
+            inp
+            for node in downstream
+            for inp in node.all_input_nodes
+            if inp not in rerun
+        }
+        skipped = [node for node in nodes if node not in rerun]
+
+        return frontier, skipped
+
+    def _cache_path(self, batch: int, node: Any) -> str:
+        return os.path.join(self._cache_dir, "{}-{}.pt".format(batch, node.name))
+
+    def _save(self, batch: int, node: Any, value: Any):
+        if self._cache_dir:
+            torch.save(value, self._cache_path(batch, node))
+        else:
+            self._cache[(batch, node.name)] = value
+
+    def _load(self, batch: int, node: Any) -> Any:
+        if self._cache_dir:
+            return torch.load(self._cache_path(batch, node))
+
+        return self._cache[(batch, node.name)]
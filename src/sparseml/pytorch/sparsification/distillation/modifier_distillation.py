@@ -18,7 +18,7 @@ Modifier for performing model distillation
 
 
 import logging
-from collections import Mapping
+from collections.abc import Mapping
 from copy import deepcopy
 from typing import Any, Dict, Iterable, List, Optional, Union
 
@@ -29,6 +29,9 @@ from torch.nn import Module
 from torch.optim import Optimizer
 
 from sparseml.optim import BaseModifier, ModifierProp
+from sparseml.pytorch.sparsification.distillation.teacher_cache import (
+    TeacherOutputsCache,
+)
 from sparseml.pytorch.sparsification.modifier import (
     PyTorchModifierYAML,
     ScheduledModifier,
@@ -54,7 +57,8 @@ class DistillationModifier(ScheduledUpdateModifier):
     module may be provided as a kwarg to the Manager initialization and
     loss_update(loss) must be called before any backwards pass in the integrated
     training flow. If no teacher model is provided, then self distillation
-    will be used
+    will be used. A TeacherOutputsCache may be given as the distillation_teacher
+    to read precomputed teacher outputs instead of running the teacher
 
     | Sample yaml:
     |   !DistillationModifier
@@ -98,6 +102,7 @@ class DistillationModifier(ScheduledUpdateModifier):
         self._teacher_input_keys = teacher_input_keys
 
         self._teacher = None
+        self._teacher_device = None
         self._distillation_enabled = False
 
         self._logged_loss_terms = {}
@@ -196,7 +201,9 @@ class DistillationModifier(ScheduledUpdateModifier):
             with. If not provided, self distillation will be used with a teacher
              from a copy of the given module at the start epoch. If given string
              "disable" this modifier will not apply distillation of any kind,
-             even in the active epoch range
+             even in the active epoch range. If given a TeacherOutputsCache,
+             the cached teacher outputs are used instead of a teacher forward pass
+             and the distillation loss is skipped while the module is in eval mode
         :param kwargs: Optional kwargs to support specific arguments
             for individual modifiers.
         """
@@ -208,13 +215,22 @@ class DistillationModifier(ScheduledUpdateModifier):
             )
             self._distillation_enabled = False
         elif distillation_teacher == "self":
+            self._teacher = "self"
             self._distillation_enabled = True
             _LOGGER.info(
                 "distillation_teacher set to self attention, "
                 "instantiating self distillation at start_epoch"
             )
+        elif isinstance(distillation_teacher, TeacherOutputsCache):
+            self._teacher = distillation_teacher
+            self._distillation_enabled = True
+            _LOGGER.info(
+                "distillation modifier using teacher outputs cache at "
+                f"{distillation_teacher.path}"
+            )
         elif callable(distillation_teacher):
             self._teacher = distillation_teacher
+            self._teacher_device = _module_device(distillation_teacher)
             self._distillation_enabled = True
             _LOGGER.info("distillation modifier using distillation_teacher object")
         else:
@@ -252,6 +268,8 @@ class DistillationModifier(ScheduledUpdateModifier):
         student_outputs: Union[Tensor, Dict, Iterable] = None,
         student_inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]] = None,
         teacher_inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]] = None,
+        teacher_outputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]] = None,
+        sample_indices: Union[Tensor, Iterable[int]] = None,
         **kwargs,
     ) -> Tensor:
         """
@@ -263,6 +281,10 @@ class DistillationModifier(ScheduledUpdateModifier):
         :param epoch: current epoch and progress within the current epoch
         :param steps_per_epoch: number of steps taken within each epoch
             (calculate batch number using this and epoch)
+        :param teacher_outputs: optional precomputed teacher outputs for the batch,
+            if given the teacher is not run
+        :param sample_indices: the dataset indices of the samples in the batch,
+            used to look up an index keyed TeacherOutputsCache
         :return: loss tensor with knowledge distillation loss added
         """
         loss = super().loss_update(
@@ -279,43 +301,23 @@ class DistillationModifier(ScheduledUpdateModifier):
                 "distillation loss update"
             )
 
-        if teacher_inputs is None:
-            teacher_inputs = (
-                student_inputs
-                if not self._teacher_input_keys
-                else {key: student_inputs[key] for key in self._teacher_input_keys}
-            )
-
-        # copy to keep from updating student's inputs
-        teacher_inputs = deepcopy(teacher_inputs)
-
-        if self._teacher == "self":
-            _LOGGER.info("Copying current models state for self distillation")
-            self._teacher = deepcopy(module)
-
-        # ensure that teacher model is in eval mode and on correct device
-        self._teacher.eval()
-        teacher_device = next(self._teacher.parameters()).device
-        inputs_device = device_of(teacher_inputs)
-
-        if teacher_device != inputs_device:
-            _LOGGER.info(
-                f"Teacher device {teacher_device} does not match "
-                f"inputs device {inputs_device}, moving teacher to correct device"
-            )
-            self._teacher.to(inputs_device)
+        if teacher_outputs is None and isinstance(self._teacher, TeacherOutputsCache):
+            if not module.training:
+                # the cache only holds the outputs for the training samples
+                return loss
 
-        with torch.no_grad():
-            teacher_outputs = tensors_module_forward(
-                teacher_inputs, self._teacher, check_feat_lab_inp=False
+            teacher_outputs = self._teacher.lookup(
+                inputs=self._resolve_teacher_inputs(student_inputs, teacher_inputs),
+                indices=sample_indices,
+                device=device_of(student_inputs),
             )
 
-        if type(student_outputs) != type(teacher_outputs):
-            raise ValueError(
-                f"Student output type of {type(student_outputs)} must match "
-                f"teacher output type of {type(teacher_outputs)}"
+        if teacher_outputs is None:
+            teacher_outputs = self.teacher_forward(
+                module, student_inputs, teacher_inputs
             )
 
+        student_outputs = self._align_student_outputs(student_outputs, teacher_outputs)
         teacher_loss = self._kldiv_output_loss(student_outputs, teacher_outputs)
         total_loss = ((1.0 - self._hardness) * loss) + (self._hardness * teacher_loss)
         self._logged_loss_terms.update(
@@ -364,8 +366,79 @@ class DistillationModifier(ScheduledUpdateModifier):
         """
         super().finalize(module, reset_loggers, **kwargs)
         self._teacher = None
+        self._teacher_device = None
         self._distillation_enabled = False
 
+    def prepare_teacher(self, module: Module, device: Any):
+        """
+        Make the teacher ready to run: copy the student for self distillation if
+        not done yet, put the teacher in eval mode, and move it to the device.
+        Called by teacher_forward, call ahead of running teacher_forward
+        concurrently with the student so the copy is not taken while the
+        student is running
+
+        :param module: the student module, copied as the teacher for
+            self distillation
+        :param device: the device the teacher inputs are on
+        """
+        if isinstance(self._teacher, str) and self._teacher == "self":
+            _LOGGER.info("Copying current models state for self distillation")
+            self._teacher = deepcopy(module)
+            self._teacher_device = _module_device(self._teacher)
+
+        # ensure that teacher model is in eval mode and on correct device
+        if isinstance(self._teacher, Module) and self._teacher.training:
+            self._teacher.eval()
+
+        if self._teacher_device is not None and self._teacher_device != device:
+            _LOGGER.info(
+                f"Teacher device {self._teacher_device} does not match "
+                f"inputs device {device}, moving teacher to correct device"
+            )
+            self._teacher.to(device)
+            self._teacher_device = device
+
+    def teacher_forward(
+        self,
+        module: Module,
+        student_inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]],
+        teacher_inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]] = None,
+    ) -> Any:
+        """
+        Run the teacher on the inputs for a batch without tracking gradients.
+        The input tensors are shared with the student rather than copied and must
+        not be modified in place by the teacher. May be called ahead of
+        loss_update, e.g. concurrently with the student forward pass,
+        and the result passed to loss_update as teacher_outputs
+
+        :param module: the student module, copied as the teacher for
+            self distillation
+        :param student_inputs: the inputs for the student for the batch
+        :param teacher_inputs: optional inputs for the teacher, if not given
+            student_inputs filtered by teacher_input_keys are used
+        :return: the outputs of the teacher for the batch
+        """
+        teacher_inputs = self._resolve_teacher_inputs(student_inputs, teacher_inputs)
+        self.prepare_teacher(module, device_of(teacher_inputs))
+
+        with torch.no_grad():
+            return tensors_module_forward(
+                teacher_inputs, self._teacher, check_feat_lab_inp=False
+            )
+
+    def _resolve_teacher_inputs(
+        self,
+        student_inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]],
+        teacher_inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor], None],
+    ) -> Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]]:
+        if teacher_inputs is not None:
+            return teacher_inputs
+
+        if not self._teacher_input_keys:
+            return student_inputs
+
+        return {key: student_inputs[key] for key in self._teacher_input_keys}
+
     def _calc_distill_head_output_loss(
         self, student_val: Tensor, teacher_val: Tensor
     ) -> Tensor:
@@ -381,6 +454,29 @@ class DistillationModifier(ScheduledUpdateModifier):
         )
         return v
 
+    def _align_student_outputs(self, student_outputs, teacher_outputs):
+        if not isinstance(self._teacher, TeacherOutputsCache):
+            if type(student_outputs) != type(teacher_outputs):
+                raise ValueError(
+                    f"Student output type of {type(student_outputs)} must match "
+                    f"teacher output type of {type(teacher_outputs)}"
+                )
+
+            return student_outputs
+
+        # cached outputs are stored as plain tensors or dicts of the cached keys
+        if isinstance(student_outputs, Mapping) != isinstance(teacher_outputs, Mapping):
+            raise ValueError(
+                f"Student output type of {type(student_outputs)} must match "
+                f"cached teacher output type of {type(teacher_outputs)}"
+            )
+
+        if isinstance(student_outputs, Mapping) and not self._distill_output_keys:
+            # the cache may only hold a subset of the student outputs
+            student_outputs = {key: student_outputs[key] for key in teacher_outputs}
+
+        return student_outputs
+
     def _kldiv_output_loss(self, student_outputs, teacher_outputs):
         # Distillation loss from the head outputs
         distill_head_output_losses = []
@@ -408,3 +504,10 @@ class DistillationModifier(ScheduledUpdateModifier):
             else 0.0
         )
         return kldiv_output_loss
+
+
+def _module_device(module: Module) -> Optional[torch.device]:
+    for param in module.parameters():
+        return param.device
+
+    return None
@@ -0,0 +1,565 @@
+# Copyright (c) 2021 - present / Neuralmagic, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Offline cache of teacher outputs for distillation so the teacher forward pass
+does not need to be run on every training step
+"""
+
+
+import hashlib
+import json
+import logging
+import os
+from collections.abc import Mapping
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union
+
+import numpy
+import torch
+from torch import Tensor
+from torch.nn import Module
+
+from sparseml.pytorch.utils import tensors_module_forward, tensors_to_device
+
+
+__all__ = [
+    "TEACHER_CACHE_KEY_BY_HASH",
+    "TEACHER_CACHE_KEY_BY_INDEX",
+    "TeacherOutputsCache",
+]
+
+
+_LOGGER = logging.getLogger(__name__)
+
+TEACHER_CACHE_KEY_BY_HASH = "hash"
+TEACHER_CACHE_KEY_BY_INDEX = "index"
+
+_METADATA_FILE = "teacher_cache.json"
+_HASHES_FILE = "hashes.bin"
+_HASH_SIZE = hashlib.sha1().digest_size
+_CACHE_VERSION = 1
+
+
+class TeacherOutputsCache(object):
+    """
+    Memory mapped, on disk cache of teacher outputs for distillation.
+    Create with TeacherOutputsCache.create, which runs the teacher once over
+    a dataset, and load in training with TeacherOutputsCache(path).
+
+    Each cached output is stored as a flat binary file with one row per sample,
+    optionally in fp16 and optionally truncated to the top k values of the last
+    dimension. Truncated outputs are restored with the remaining values set to
+    the smallest value of the original row so the teacher softmax stays close
+    to the original. Samples are looked up either by their index in the
+    dataset or by a hash of their teacher inputs.
+
+    :param path: the directory the cache was created in
+    """
+
+    @staticmethod
+    def create(
+        path: str,
+        teacher: Module,
+        data: Iterable[Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]]],
+        output_keys: Optional[List[Any]] = None,
+        input_keys: Optional[List[str]] = None,
+        key_by: str = TEACHER_CACHE_KEY_BY_HASH,
+        top_k: Optional[int] = None,
+        half_precision: bool = True,
+        device: Optional[str] = None,
+    ) -> "TeacherOutputsCache":
+        """
+        Run the teacher over all batches in data and write its outputs to disk.
+        Only one batch of outputs is held in memory at a time.
+
+        :param path: the directory to write the cache to, created if needed
+        :param teacher: the teacher module to run
+        :param data: iterable of teacher input batches, must not be shuffled
+            when keying by index
+        :param output_keys: the keys or indices of the teacher outputs to cache
+            for dict or sequence outputs. None caches every tensor output with
+            a batch dimension
+        :param input_keys: the keys of dict inputs to pass to the teacher and
+            to hash. None uses all keys of each batch
+        :param key_by: how samples are looked up, one of
+            TEACHER_CACHE_KEY_BY_HASH or TEACHER_CACHE_KEY_BY_INDEX.
+            Default is hash
+        :param top_k: if set, only the largest top_k values along the last
+            dimension of each output are stored
+        :param half_precision: True to store values in fp16, False for fp32.
+            Default is True
+        :param device: the device to run the teacher on, defaults to the device
+            the teacher is currently on
+        :return: the created cache loaded for reading
+        """
+        if key_by not in (TEACHER_CACHE_KEY_BY_HASH, TEACHER_CACHE_KEY_BY_INDEX):
+            raise ValueError(
+                "key_by must be one of {}, given {}".format(
+                    [TEACHER_CACHE_KEY_BY_HASH, TEACHER_CACHE_KEY_BY_INDEX], key_by
+                )
+            )
+
+        if top_k is not None and top_k < 1:
+            raise ValueError("top_k must be a positive int, given {}".format(top_k))
+
+        os.makedirs(path, exist_ok=True)
+        teacher.eval()
+
+        if device is None:
+            param = next(teacher.parameters(), None)
+            device = str(param.device) if param is not None else "cpu"
+
+        value_dtype = numpy.float16 if half_precision else numpy.float32
+        metadata = None
+        files = {}
+        num_samples = 0
+
+        try:
+            for batch in data:
+                if input_keys is not None and isinstance(batch, Mapping):
+                    batch = {key: batch[key] for key in input_keys}
+
+                batch_size = _batch_size(batch)
+                hashes = (
+                    _hash_inputs(batch, input_keys, batch_size)
+                    if key_by == TEACHER_CACHE_KEY_BY_HASH
+                    else None
+                )
+
+                with torch.no_grad():
+                    outputs = tensors_module_forward(
+                        tensors_to_device(batch, device),
+                        teacher,
+                        check_feat_lab_inp=False,
+                    )
+
+                if metadata is None:
+                    metadata = _create_metadata(
+                        batch,
+                        outputs,
+                        batch_size,
+                        output_keys,
+                        key_by,
+                        top_k,
+                        value_dtype,
+                    )
+                    files = _open_files(path, metadata)
+
+                for out_meta in metadata["outputs"]:
+                    _write_output(
+                        files,
+                        out_meta,
+                        _get_output(outputs, out_meta["key"]),
+                        batch_size,
+                        top_k,
+                        value_dtype,
+                    )
+
+                if hashes is not None:
+                    files[_HASHES_FILE].write(b"".join(hashes))
+
+                num_samples += batch_size
+        finally:
+            for file in files.values():
+                file.close()
+
+        if metadata is None:
+            raise ValueError("no batches given to create the teacher outputs cache")
+
+        metadata["num_samples"] = num_samples
+
+        with open(os.path.join(path, _METADATA_FILE), "w") as meta_file:
+            json.dump(metadata, meta_file, indent=2)
+
+        _LOGGER.info(f"created teacher outputs cache for {num_samples} samples")
+
+        return TeacherOutputsCache(path)
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, _METADATA_FILE)) as meta_file:
+            metadata = json.load(meta_file)
+
+        if metadata["version"] != _CACHE_VERSION:
+            raise ValueError(
+                "unsupported teacher cache version {}, expected {}".format(
+                    metadata["version"], _CACHE_VERSION
+                )
+            )
+
+        self._path = path
+        self._metadata = metadata
+        self._arrays = {}  # output name -> Dict[array name, numpy.memmap]
+        self._hash_rows = None
+
+        num_samples = metadata["num_samples"]
+        value_dtype = numpy.dtype(metadata["dtype"])
+
+        for out_meta in metadata["outputs"]:
+            shape = tuple(out_meta["shape"])
+            arrays = {}
+
+            if out_meta["top_k"]:
+                top_k = out_meta["top_k"]
+                arrays["values"] = _load_array(
+                    path,
+                    out_meta,
+                    "values",
+                    value_dtype,
+                    (num_samples,) + shape[:-1] + (top_k,),
+                )
+                arrays["indices"] = _load_array(
+                    path,
+                    out_meta,
+                    "indices",
+                    numpy.dtype(out_meta["indices_dtype"]),
+                    (num_samples,) + shape[:-1] + (top_k,),
+                )
+                arrays["fill"] = _load_array(
+                    path, out_meta, "fill", value_dtype, (num_samples,) + shape[:-1]
+                )
+            else:
+                arrays["values"] = _load_array(
+                    path, out_meta, "values", value_dtype, (num_samples,) + shape
+                )
+
+            self._arrays[out_meta["name"]] = arrays
+
+        if metadata["key_by"] == TEACHER_CACHE_KEY_BY_HASH:
+            hashes = numpy.fromfile(
+                os.path.join(path, _HASHES_FILE), dtype="S{}".format(_HASH_SIZE)
+            )
+            if hashes.shape[0] != num_samples:
+                raise ValueError(
+                    "teacher cache hashes do not match the number of samples"
+                )
+            self._hash_rows = {digest: row for row, digest in enumerate(hashes)}
+
+    @property
+    def path(self) -> str:
+        """
+        :return: the directory the cache is stored in
+        """
+        return self._path
+
+    @property
+    def num_samples(self) -> int:
+        """
+        :return: the number of samples stored in the cache
+        """
+        return self._metadata["num_samples"]
+
+    @property
+    def key_by(self) -> str:
+        """
+        :return: how samples are looked up, by hash of their inputs or by index
+        """
+        return self._metadata["key_by"]
+
+    @property
+    def input_keys(self) -> Optional[List[str]]:
+        """
+        :return: the keys of the dict inputs the teacher was run with,
+            None if the inputs were not a dict
+        """
+        return self._metadata["input_keys"]
+
+    @property
+    def output_keys(self) -> List[Any]:
+        """
+        :return: the keys or indices of the cached teacher outputs
+        """
+        return [out_meta["key"] for out_meta in self._metadata["outputs"]]
+
+    def lookup(
+        self,
+        inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor], None] = None,
+        indices: Union[Tensor, Iterable[int], None] = None,
+        device: Union[str, torch.device, None] = None,
+    ) -> Union[Tensor, List[Tensor], Dict[Any, Tensor]]:
+        """
+        :param inputs: the teacher inputs for the batch, required when
+            the cache is keyed by hash
+        :param indices: the dataset indices of the samples in the batch,
+            required when the cache is keyed by index
+        :param device: the device to place the returned outputs on
+        :return: the cached teacher outputs for the batch in fp32,
+            structured as the original outputs: a tensor, or a dict or list
+            containing only the cached outputs
+        """
+        rows = self._rows(inputs, indices)
+        outputs = {}
+
+        for out_meta in self._metadata["outputs"]:
+            arrays = self._arrays[out_meta["name"]]
+
+            if out_meta["top_k"]:
+                fill = arrays["fill"][rows].astype(numpy.float32)
+                values = numpy.empty(
+                    fill.shape + (out_meta["shape"][-1],), dtype=numpy.float32
+                )
+                values[...] = fill[..., None]
+                numpy.put_along_axis(
+                    values,
+                    arrays["indices"][rows].astype(numpy.int64),
+                    arrays["values"][rows].astype(numpy.float32),
+                    axis=-1,
+                )
+            else:
+                values = arrays["values"][rows].astype(numpy.float32)
+
+            tensor = torch.from_numpy(values)
+            outputs[out_meta["key"]] = (
+                tensor.to(device) if device is not None else tensor
+            )
+
+        output_type = self._metadata["output_type"]
+
+        if output_type == "tensor":
+            return outputs[None]
+
+        if output_type == "sequence":
+            return [outputs[key] for key in self.output_keys]
+
+        return outputs
+
+    def _rows(
+        self,
+        inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor], None],
+        indices: Union[Tensor, Iterable[int], None],
+    ) -> numpy.ndarray:
+        if self.key_by == TEACHER_CACHE_KEY_BY_INDEX:
+            if indices is None:
+                raise ValueError("indices are required for an index keyed cache")
+
+            if isinstance(indices, Tensor):
+                indices = indices.cpu().numpy()
+
+            rows = numpy.asarray(indices, dtype=numpy.int64).reshape(-1)
+
+            if rows.size and (rows.min() < 0 or rows.max() >= self.num_samples):
+                raise IndexError(
+                    "sample indices out of range for a teacher cache of {} "
+                    "samples".format(self.num_samples)
+                )
+
+            return rows
+
+        if inputs is None:
+            raise ValueError("inputs are required for a hash keyed cache")
+
+        if self.input_keys is not None:
+            inputs = {key: inputs[key] for key in self.input_keys}
+
+        rows = []
+
+        for digest in _hash_inputs(inputs, self.input_keys, _batch_size(inputs)):
+            if digest not in self._hash_rows:
+                raise KeyError(
+                    "teacher inputs not found in the teacher outputs cache at "
+                    "{}, the inputs must be padded and tokenized the same as when "
+                    "the cache was created".format(self._path)
+                )
+            rows.append(self._hash_rows[digest])
+
+        return numpy.asarray(rows, dtype=numpy.int64)
+
+
+def _batch_size(inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]]) -> int:
+    for _, tensor in _flatten_tensors(inputs):
+        return tensor.shape[0]
+
+    raise ValueError("could not find a tensor in the teacher inputs")
+
+
+def _flatten_tensors(
+    tensors: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]],
+    keys: Optional[List[str]] = None,
+) -> List[Tuple[Any, Tensor]]:
+    if isinstance(tensors, Tensor):
+        return [(None, tensors)]
+
+    if isinstance(tensors, Mapping):
+        return [(key, tensors[key]) for key in sorted(keys or tensors)]
+
+    return [(idx, tens) for idx, tens in enumerate(tensors)]
+
+
+def _hash_inputs(
+    inputs: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]],
+    keys: Optional[List[str]],
+    batch_size: int,
+) -> List[bytes]:
+    arrays = [
+        (str(key).encode(), tensor.detach().cpu().numpy())
+        for key, tensor in _flatten_tensors(inputs, keys)
+    ]
+    digests = []
+
+    for row in range(batch_size):
+        hasher = hashlib.sha1()
+        for key, array in arrays:
+            hasher.update(key)
+            hasher.update(numpy.ascontiguousarray(array[row]).tobytes())
+        digests.append(hasher.digest())
+
+    return digests
+
+
+def _get_output(outputs: Any, key: Any) -> Tensor:
+    return outputs if key is None else outputs[key]
+
+
+def _create_metadata(
+    inputs: Any,
+    outputs: Any,
+    batch_size: int,
+    output_keys: Optional[List[Any]],
+    key_by: str,
+    top_k: Optional[int],
+    value_dtype: numpy.dtype,
+) -> Dict[str, Any]:
+    if isinstance(outputs, Tensor):
+        output_type = "tensor"
+        candidate_keys = [None]
+    elif isinstance(outputs, Mapping):
+        output_type = "mapping"
+        candidate_keys = output_keys or list(outputs.keys())
+    elif isinstance(outputs, Iterable):
+        output_type = "sequence"
+        candidate_keys = output_keys or list(range(len(outputs)))
+    else:
+        raise ValueError(
+            "unsupported teacher output type {} for caching".format(type(outputs))
+        )
+
+    outputs_meta = []
+
+    for key in candidate_keys:
+        output = _get_output(outputs, key)
+
+        if not isinstance(output, Tensor) or output.dim() < 1:
+            if output_keys:
+                raise ValueError(
+                    "teacher output {} is not a batched tensor".format(key)
+                )
+            continue
+
+        if output.shape[0] != batch_size:
+            if output_keys:
+                raise ValueError(
+                    "teacher output {} does not have a batch dimension".format(key)
+                )
+            continue
+
+        shape = list(output.shape[1:])
+        out_top_k = top_k if top_k is not None and shape and top_k < shape[-1] else 0
+        out_meta = {
+            "key": key,
+            "name": "output_{}".format(len(outputs_meta)),
+            "shape": shape,
+            "top_k": out_top_k,
+        }
+        if out_top_k:
+            out_meta["indices_dtype"] = (
+                "int16" if shape[-1] <= numpy.iinfo(numpy.int16).max else "int32"
+            )
+        outputs_meta.append(out_meta)
+
+    if not outputs_meta:
+        raise ValueError("no batched tensor outputs found in the teacher outputs")
+
+    return {
+        "version": _CACHE_VERSION,
+        "key_by": key_by,
+        "dtype": numpy.dtype(value_dtype).name,
+        "output_type": output_type,
+        "input_keys": sorted(inputs.keys()) if isinstance(inputs, Mapping) else None,
+        "outputs": outputs_meta,
+        "num_samples": 0,
+    }
+
+
+def _array_file(path: str, out_meta: Dict[str, Any], array_name: str) -> str:
+    return os.path.join(path, "{}.{}.bin".format(out_meta["name"], array_name))
+
+
+def _open_files(path: str, metadata: Dict[str, Any]) -> Dict[str, Any]:
+    files = {}
+
+    for out_meta in metadata["outputs"]:
+        array_names = ["values", "indices", "fill"] if out_meta["top_k"] else ["values"]
+        for array_name in array_names:
+            files[(out_meta["name"], array_name)] = open(
+                _array_file(path, out_meta, array_name), "wb"
+            )
+
+    if metadata["key_by"] == TEACHER_CACHE_KEY_BY_HASH:
+        files[_HASHES_FILE] = open(os.path.join(path, _HASHES_FILE), "wb")
+
+    return files
+
+
+def _write_output(
+    files: Dict[str, Any],
+    out_meta: Dict[str, Any],
+    output: Tensor,
+    batch_size: int,
+    top_k: Optional[int],
+    value_dtype: numpy.dtype,
+):
+    if list(output.shape) != [batch_size] + out_meta["shape"]:
+        raise ValueError(
+            "teacher output {} changed shape from {} to {}, all samples must have "
+            "the same output shape to be cached (e.g. pad inputs to a max "
+            "length)".format(out_meta["key"], out_meta["shape"], list(output.shape[1:]))
+        )
+
+    output = output.detach().float()
+    name = out_meta["name"]
+
+    if out_meta["top_k"]:
+        values, indices = torch.topk(output, top_k, dim=-1)
+        fill = output.min(dim=-1).values
+        files[(name, "values")].write(_to_bytes(values, value_dtype))
+        files[(name, "indices")].write(_to_bytes(indices, out_meta["indices_dtype"]))
+        files[(name, "fill")].write(_to_bytes(fill, value_dtype))
+    else:
+        files[(name, "values")].write(_to_bytes(output, value_dtype))
+
+
+def _to_bytes(tensor: Tensor, dtype: Union[str, numpy.dtype]) -> bytes:
+    return numpy.ascontiguousarray(tensor.cpu().numpy().astype(dtype)).tobytes()
+
+
+def _load_array(
+    path: str,
+    out_meta: Dict[str, Any],
+    array_name: str,
+    dtype: numpy.dtype,
+    shape: Tuple[int, ...],
+) -> numpy.ndarray:
+    file_path = _array_file(path, out_meta, array_name)
+    expected_size = int(numpy.prod(shape)) * dtype.itemsize
+
+    if os.path.getsize(file_path) != expected_size:
+        raise ValueError(
+            "teacher cache file {} does not match the expected shape {}".format(
+                file_path, shape
+            )
+        )
+
+    if expected_size == 0:
+        return numpy.zeros(shape, dtype=dtype)
+
+    return numpy.memmap(file_path, dtype=dtype, mode="r", shape=shape)
@@ -809,6 +809,13 @@ class ScheduledUpdateModifier(ScheduledModifier, BaseUpdate):
         )
         self._last_update_epoch = -1.0
 
+    @ModifierProp(serializable=False)
+    def last_update_epoch(self) -> float:
+        """
+        :return: the epoch the last update was made at, -1 if no update has been made
+        """
+        return self._last_update_epoch
+
     def update_ready(self, epoch: float, steps_per_epoch: int) -> bool:
         """
         Calls base implementation to check if start_pending() or end_pending().
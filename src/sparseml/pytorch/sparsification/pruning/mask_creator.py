@@ -75,8 +75,47 @@ class UnstructuredPruningMaskCreator(PruningMaskCreator):
     Class for creating unstructured sparsity masks.
     Masks will be created using unstructured sparsity by pruning weights ranked
     by their value.  Each mask will correspond to the given tensor.
+
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. 'kthvalue' selects the exact order statistic without sorting,
+        'sort' fully sorts the scores (original implementation), and 'sampled'
+        estimates the threshold from a fixed size random sample of the scores.
+        With n samples, the realized sparsity is within sqrt(ln(2 / d) / (2n)) of
+        the target with probability 1 - d (~0.002 for the default sample size and
+        d = 0.001). Default is 'kthvalue'
+    :param threshold_num_samples: number of scores to sample when threshold_method
+        is 'sampled'. Tensors with fewer elements use the exact 'kthvalue' path.
+        Default is 2 ** 20
     """
 
+    _VALID_THRESHOLD_METHODS = ["kthvalue", "sort", "sampled"]
+
+    def __init__(
+        self,
+        threshold_method: str = "kthvalue",
+        threshold_num_samples: int = 2 ** 20,
+    ):
+        if threshold_method not in self._VALID_THRESHOLD_METHODS:
+            raise ValueError(
+                f"Invalid threshold_method {threshold_method}, valid threshold "
+                f"methods: {self._VALID_THRESHOLD_METHODS}"
+            )
+        if threshold_num_samples < 1:
+            raise ValueError(
+                "threshold_num_samples must be a positive integer, given "
+                f"{threshold_num_samples}"
+            )
+
+        self._threshold_method = threshold_method
+        self._threshold_num_samples = threshold_num_samples
+
+    @property
+    def threshold_method(self) -> str:
+        """
+        :return: method used to find the score threshold for a target sparsity
+        """
+        return self._threshold_method
+
     def create_sparsity_masks(
         self,
         tensors: List[Tensor],
@@ -186,17 +225,42 @@ class UnstructuredPruningMaskCreator(PruningMaskCreator):
         if tensor.numel() < 1 or sparsity <= 0.0 or sparsity > 1.0:
             return tensor.new_tensor([])
 
-        sorted_vals, _ = torch.sort(tensor.view(-1))
-        lookup_index = round(sparsity * tensor.numel()) - 1
+        values = tensor.view(-1)
+
+        if (
+            self._threshold_method == "sampled"
+            and values.numel() > self._threshold_num_samples
+        ):
+            # estimate the threshold as the same quantile of a random sample
+            generator = torch.Generator().manual_seed(42)
+            sample_indices = torch.randint(
+                values.numel(), (self._threshold_num_samples,), generator=generator
+            )
+            values = values[sample_indices.to(values.device)]
+
+        lookup_index = round(sparsity * values.numel()) - 1
 
         if lookup_index < 0:
             lookup_index = 0
-        elif lookup_index > tensor.numel():
-            lookup_index = tensor.numel()
+        elif lookup_index > values.numel() - 1:
+            lookup_index = values.numel() - 1
+
+        if self._threshold_method == "sort":
+            sorted_vals, _ = torch.sort(values)
+
+            return sorted_vals[lookup_index]
 
-        return sorted_vals[lookup_index]
+        # kthvalue is 1-indexed and selects without a full sort
+        threshold, _ = torch.kthvalue(values, lookup_index + 1)
+
+        return threshold
 
     def _flatten_and_stack_tensors(self, tensors: List[Tensor]) -> Tensor:
+        stacked_view = _stacked_tensors_view(tensors)
+        if stacked_view is not None:
+            # tensors already laid out back to back in one buffer, no copy needed
+            return stacked_view
+
         total_elements = sum(tensor.numel() for tensor in tensors)
 
         global_tensor = (
@@ -218,14 +282,18 @@ class UnstructuredPruningMaskCreator(PruningMaskCreator):
         unstacked_tensors = []
         global_idx = 0
         for tensor in original_tensors:
-            # unpack global tensor into masks matching original tensor shapes
-            unstacked_tensor = (
-                tensor.new_empty(tensor.numel()).detach().requires_grad_(False)
-            )
-            unstacked_tensor.copy_(
-                stacked_tensor[global_idx : global_idx + tensor.numel()]
-            ).type(tensor.type())
-            unstacked_tensor = unstacked_tensor.reshape(tensor.shape)
+            # unpack global tensor into views matching original tensor shapes
+            unstacked_tensor = stacked_tensor[
+                global_idx : global_idx + tensor.numel()
+            ].view(tensor.shape)
+
+            if (
+                unstacked_tensor.device != tensor.device
+                or unstacked_tensor.dtype != tensor.dtype
+            ):
+                unstacked_tensor = unstacked_tensor.to(
+                    device=tensor.device, dtype=tensor.dtype
+                )
 
             unstacked_tensors.append(unstacked_tensor)
             global_idx += tensor.numel()
@@ -377,12 +445,16 @@ class FourBlockMaskCreator(GroupedPruningMaskCreator):
 
     :param grouping_fn_name: The name of the torch grouping function to reduce
         dimensions by
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. One of 'kthvalue', 'sort', 'sampled'. Default is 'kthvalue'
     """
 
     def __init__(
         self,
         grouping_fn_name: str = "mean",
+        threshold_method: str = "kthvalue",
     ):
+        super().__init__(threshold_method=threshold_method)
         self._grouping_fn_name = grouping_fn_name
 
     def group_tensor(self, tensor: Tensor) -> Tensor:
@@ -479,13 +551,18 @@ class BlockMaskCreator(GroupedPruningMaskCreator):
         channel dimensions.  -1 for a dimension blocks across the entire dimension
     :param grouping_fn_name: The name of the torch grouping function to reduce
         dimensions by
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. One of 'kthvalue', 'sort', 'sampled'. Default is 'kthvalue'
     """
 
     def __init__(
         self,
         block_shape: List[int],
         grouping_fn_name: str = "mean",
+        threshold_method: str = "kthvalue",
     ):
+        super().__init__(threshold_method=threshold_method)
+
         if len(block_shape) < 2:
             raise ValueError(
                 (
@@ -674,18 +751,59 @@ class NMPruningMaskCreator(PruningMaskCreator):
         return masks
 
 
-def get_mask_creator_default(mask_type: Union[str, List[int]]) -> PruningMaskCreator:
+def _stacked_tensors_view(tensors: List[Tensor]) -> Optional[Tensor]:
+    """
+    :param tensors: list of tensors to check
+    :return: a flat view over all of the given tensors if they are contiguous and
+        laid out back to back in the same storage (i.e. views into a single flat
+        buffer), otherwise None
+    """
+    base = tensors[0]
+    base_ptr = _storage_data_ptr(base)
+    offset = base.storage_offset()
+
+    for tensor in tensors:
+        if (
+            not tensor.is_contiguous()
+            or tensor.dtype != base.dtype
+            or tensor.device != base.device
+            or _storage_data_ptr(tensor) != base_ptr
+            or tensor.storage_offset() != offset
+        ):
+            return None
+        offset += tensor.numel()
+
+    return base.detach().as_strided(
+        (offset - base.storage_offset(),), (1,), base.storage_offset()
+    )
+
+
+def _storage_data_ptr(tensor: Tensor) -> int:
+    # Tensor.storage() is deprecated and warns on every call in newer torch versions
+    if hasattr(tensor, "untyped_storage"):
+        return tensor.untyped_storage().data_ptr()
+
+    return tensor.storage().data_ptr()
+
+
+def get_mask_creator_default(
+    mask_type: Union[str, List[int]],
+    threshold_method: str = "kthvalue",
+) -> PruningMaskCreator:
     """
     :param mask_type: type of mask creator to use, can be 'unstructured', for
         unstructured mask creator, 'block4' for 1x4 block pruning, 'N:M' where N and M
         are integers for N:M pruning, or a list of two integers for custom block
         pruning (does not support padding)
+    :param threshold_method: method used by threshold based mask creators to find
+        the score threshold for a target sparsity. One of 'kthvalue', 'sort',
+        'sampled'. Not used for N:M pruning. Default is 'kthvalue'
     :return: mask creator object created from the mask type
     """
     if mask_type == "unstructured":
-        return UnstructuredPruningMaskCreator()
+        return UnstructuredPruningMaskCreator(threshold_method=threshold_method)
     elif mask_type == "block4":
-        return FourBlockMaskCreator()
+        return FourBlockMaskCreator(threshold_method=threshold_method)
     elif ":" in mask_type:
         nm = mask_type.split(":")
         if len(nm) != 2:
@@ -707,7 +825,7 @@ def get_mask_creator_default(mask_type: Union[str, List[int]]) -> PruningMaskCre
                 "expected list of length 2 for specification of BlockMaskCreator, "
                 f"got list with length {len(mask_type)}, mask_type={mask_type}"
             )
-        return BlockMaskCreator(mask_type)
+        return BlockMaskCreator(mask_type, threshold_method=threshold_method)
     else:
         raise ValueError(
             f"Unknown mask_type {mask_type}. Supported mask types include "
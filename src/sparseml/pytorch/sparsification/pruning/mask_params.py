@@ -23,10 +23,16 @@ from typing import Iterable, List, Optional, Tuple, Union
 import torch
 from torch import Tensor
 from torch.nn import Module, Parameter
+from torch.optim import SGD, Adam, AdamW, Optimizer
 
 from sparseml.pytorch.sparsification.pruning.mask_creator import PruningMaskCreator
 from sparseml.pytorch.sparsification.pruning.scorer import PruningParamsScorer
-from sparseml.pytorch.utils import mask_difference, tensor_list_sparsity
+from sparseml.pytorch.utils import (
+    mask_difference,
+    pack_mask,
+    tensor_list_sparsity,
+    unpack_mask,
+)
 
 
 __all__ = [
@@ -34,6 +40,18 @@ __all__ = [
 ]
 
 
+# torch._foreach_* ops were added in torch 1.7
+_FOREACH_MUL_AVAILABLE = hasattr(torch, "_foreach_mul_")
+
+# optimizers whose step leaves a zeroed param at zero once its gradient and
+# first moment state are zeroed, mapped to the state keys holding that moment
+_MASKABLE_OPTIMIZER_STATE_KEYS = {
+    SGD: ["momentum_buffer"],
+    Adam: ["exp_avg"],
+    AdamW: ["exp_avg"],
+}
+
+
 class ModuleParamPruningMask(object):
     """
     Mask to apply kernel sparsity (model pruning) to a specific parameter in a layer
@@ -56,9 +74,14 @@ class ModuleParamPruningMask(object):
         sparsity masks for a target sparsity sparsity masks will be created such that
         the average sparsity across all given layers is the target sparsity with the
         lowest global values masked. If False, each layer will be masked to the target
-        sparsity ranking values within each individual tensor. Default is False
+        sparsity ranking values within each individual tensor. Scores for global
+        pruning are written into a single preallocated flat buffer so the mask creator
+        can rank them without stacking copies. Default is False
     :param allow_reintroduction: set True to not mask weights and gradients between
         forward passes (forward mask hooks will remain). Default is False
+    :param pack_masks: set True to store each mask bit-packed into a uint8 tensor
+        (1 bit per param value) instead of a dense tensor of the param's dtype.
+        Masks are unpacked on demand when applied. Default is False
     """
 
     def __init__(
@@ -73,6 +96,7 @@ class ModuleParamPruningMask(object):
         layer_names: Optional[List[str]] = None,
         global_sparsity: bool = False,
         allow_reintroduction: bool = False,
+        pack_masks: bool = False,
     ):
         self._layers = layers
         self._param_names = (
@@ -88,6 +112,7 @@ class ModuleParamPruningMask(object):
         self._store_unmasked = store_unmasked
         self._track_grad_mom = track_grad_mom
         self._global_sparsity = global_sparsity
+        self._pack_masks = pack_masks
 
         self._enabled = False
         self._forward_hooks = [None] * len(self._layers)
@@ -108,12 +133,16 @@ class ModuleParamPruningMask(object):
                 )
 
         # initialize masks to all ones
-        self._param_masks = [torch.ones(param.shape) for param in self._params]
+        self._param_masks = [None] * len(self._layers)  # type: List[Tensor]
+        self._param_mask_numels = [0] * len(self._layers)  # type: List[int]
+        for idx, param in enumerate(self._params):
+            self._set_mask(idx, torch.ones(param.shape))
         self._params_init = [None] * len(self._layers)  # type: List[Tensor]
         self._params_unmasked = [None] * len(self._layers)  # type: List[Tensor]
         self._params_grad = [None] * len(self._layers)  # type: List[Tensor]
         self._params_movement = [None] * len(self._layers)  # type: List[Tensor]
         self._params_applied_thinning = [0.0] * len(self._layers)  # type: List[float]
+        self._global_scores = None  # type: Optional[Tensor]
 
         # movement pruning requires weight reintroduction
         self._allow_reintroduction = allow_reintroduction
@@ -204,6 +233,13 @@ class ModuleParamPruningMask(object):
         """
         return self._global_sparsity
 
+    @property
+    def pack_masks(self) -> bool:
+        """
+        :return: True if masks are stored bit-packed, False if stored densely
+        """
+        return self._pack_masks
+
     @property
     def enabled(self) -> bool:
         """
@@ -244,7 +280,21 @@ class ModuleParamPruningMask(object):
         """
         :return: the current masks applied to each of the parameters
         """
-        return self._param_masks
+        if not self._pack_masks:
+            return self._param_masks
+
+        return [self._get_mask(idx) for idx in range(len(self._params))]
+
+    @property
+    def packed_param_masks(self) -> List[Tensor]:
+        """
+        :return: the current masks applied to each of the parameters, bit-packed
+            as uint8 tensors by pack_mask
+        """
+        if self._pack_masks:
+            return self._param_masks
+
+        return [pack_mask(mask) for mask in self._param_masks]
 
     @property
     def params_init(self) -> List[Optional[Tensor]]:
@@ -266,7 +316,7 @@ class ModuleParamPruningMask(object):
             else:
                 params_unmasked.append(
                     self._params[idx].data
-                    + (self._param_masks == 0.0).type(self._params[idx].data.type())
+                    + (self._get_mask(idx) == 0.0).type(self._params[idx].data.type())
                     * self._params_unmasked[idx]
                 )
         return params_unmasked
@@ -305,13 +355,18 @@ class ModuleParamPruningMask(object):
     def set_param_masks(self, masks: List[Tensor]):
         """
         :param masks: the masks to set and apply as the current param tensors,
-            if enabled mask is applied immediately
+            if enabled mask is applied immediately. Masks may also be given in the
+            bit-packed form returned by pack_mask
         """
         mask_diffs = []
+        masks = list(masks)
         for idx, value in enumerate(masks):
             if value is None:
                 raise ValueError("mask cannot be set to None")
 
+            if self._is_packed_mask(value, idx):
+                value = masks[idx] = unpack_mask(value, self._params[idx].shape)
+
             if value.shape != self._params[idx].shape:
                 raise ValueError(
                     "mask shape of {} does not match layer.param shape of {}".format(
@@ -321,9 +376,9 @@ class ModuleParamPruningMask(object):
 
             value = self._check_regen_value(value, idx)
             self._check_regen_param_vals(idx)
-            mask_diff = mask_difference(self._param_masks[idx], value)
+            mask_diff = mask_difference(self._get_mask(idx), value)
 
-            self._param_masks[idx] = value
+            self._set_mask(idx, value)
 
             mask_diffs.append(mask_diff)
 
@@ -347,11 +402,7 @@ class ModuleParamPruningMask(object):
             target for a tensor in the same position in the tensor list. If global
             sparsity is enabled, all values of the target list must be the same
         """
-        if self._scorer:
-            param_scores = self._scorer.score_parameters()
-        else:
-            # if scorer is not set, use param data
-            param_scores = self.params_data
+        param_scores = self._score_params()
 
         if not isinstance(target, Iterable):
             target = [target] * len(self._params)
@@ -387,17 +438,70 @@ class ModuleParamPruningMask(object):
         if not self._enabled:
             return
 
+        if param_idx is None and _FOREACH_MUL_AVAILABLE and not self._store_unmasked:
+            # mask all params in a single fused call
+            self._check_regen_param_vals()
+
+            with torch.no_grad():
+                torch._foreach_mul_(
+                    [param.data for param in self._params],
+                    [self._get_mask(idx) for idx in range(len(self._params))],
+                )
+
+            return
+
         indices = range(len(self._params)) if param_idx is None else [param_idx]
 
         for idx in indices:
             self._check_regen_param_vals(idx)
+            mask = self._get_mask(idx)
 
             with torch.no_grad():
                 if self._store_unmasked:
                     self._params_unmasked[idx] = self._params[idx].data.mul(
-                        1 - self._param_masks[idx]  # inverted mask
+                        1 - mask  # inverted mask
                     )
-                self._params[idx].data.mul_(self._param_masks[idx])
+                self._params[idx].data.mul_(mask)
+
+    def mask_optimizer_state(self, optimizer: Optimizer) -> bool:
+        """
+        Zero the first moment state the optimizer holds for masked values so that,
+        combined with the masked gradients, optimizer steps never write to the masked
+        values of the params. Must be called again whenever the masks change.
+        Supported optimizers are SGD, Adam, and AdamW
+
+        :param optimizer: the optimizer updating the masked params
+        :return: True if the optimizer is supported and its state was masked,
+            False otherwise
+        """
+        state_keys = _MASKABLE_OPTIMIZER_STATE_KEYS.get(type(optimizer))
+
+        if (
+            state_keys is None
+            or self._allow_reintroduction
+            or not self._enabled
+            or not _FOREACH_MUL_AVAILABLE
+        ):
+            return False
+
+        buffers = []
+        masks = []
+
+        for idx, param in enumerate(self._params):
+            param_state = optimizer.state.get(param, {})
+
+            for key in state_keys:
+                buffer = param_state.get(key)
+
+                if buffer is not None and buffer.shape == param.shape:
+                    buffers.append(buffer)
+                    masks.append(self._get_mask(idx))
+
+        if buffers:
+            with torch.no_grad():
+                torch._foreach_mul_(buffers, masks)
+
+        return True
 
     def reset(self):
         """
@@ -414,7 +518,7 @@ class ModuleParamPruningMask(object):
         before Optimizer.step() to grab the latest gradients
         """
         if self._scorer:
-            self._scorer.pre_optim_step_update(self._param_masks)
+            self._scorer.pre_optim_step_update(self.param_masks)
 
     def pruning_end(self, leave_enabled: bool):
         """
@@ -427,6 +531,7 @@ class ModuleParamPruningMask(object):
         if not leave_enabled:
             self.enabled = False
         self._allow_reintroduction = False
+        self._global_scores = None  # no further mask updates, free score buffer
         self.apply()  # ensure that weights are pruned to final level
         if self._scorer:
             self._scorer.on_pruning_end()
@@ -438,6 +543,79 @@ class ModuleParamPruningMask(object):
         """
         self._allow_reintroduction = False
 
+    def _score_params(self) -> List[Tensor]:
+        global_score_views = (
+            self._get_global_score_views() if self._global_sparsity else None
+        )
+
+        if global_score_views is None:
+            # if scorer is not set, use param data
+            return self._scorer.score_parameters() if self._scorer else self.params_data
+
+        if self._scorer:
+            return self._scorer.score_parameters_into(global_score_views)
+
+        for param, score_view in zip(self._params, global_score_views):
+            score_view.copy_(param.data)
+
+        return global_score_views
+
+    def _get_global_score_views(self) -> Optional[List[Tensor]]:
+        # returns views into a persistent flat buffer, one per param, or None if
+        # the params cannot share a single buffer
+        params_data = self.params_data
+        device = params_data[0].device
+        dtype = params_data[0].dtype
+
+        if any(data.device != device or data.dtype != dtype for data in params_data):
+            return None
+
+        num_elements = sum(data.numel() for data in params_data)
+
+        if (
+            self._global_scores is None
+            or self._global_scores.numel() != num_elements
+            or self._global_scores.device != device
+            or self._global_scores.dtype != dtype
+        ):
+            # (re)allocate on first use, thinning, or device change
+            self._global_scores = None
+            self._global_scores = ModuleParamPruningMask._detach_tens(
+                torch.empty(num_elements, device=device, dtype=dtype)
+            )
+
+        score_views = []
+        offset = 0
+        for data in params_data:
+            score_views.append(
+                self._global_scores[offset : offset + data.numel()].view(data.shape)
+            )
+            offset += data.numel()
+
+        return score_views
+
+    def _set_mask(self, param_idx: int, mask: Tensor):
+        self._param_masks[param_idx] = pack_mask(mask) if self._pack_masks else mask
+        self._param_mask_numels[param_idx] = mask.numel()
+
+    def _get_mask(self, param_idx: int) -> Tensor:
+        if not self._pack_masks:
+            return self._param_masks[param_idx]
+
+        data = self._params[param_idx].data
+
+        return unpack_mask(self._param_masks[param_idx], data.shape, data.dtype)
+
+    def _is_packed_mask(self, mask: Tensor, param_idx: int) -> bool:
+        param = self._params[param_idx]
+
+        return (
+            mask.dtype == torch.uint8
+            and mask.dim() == 1
+            and mask.shape != param.shape
+            and mask.numel() == (param.numel() + 7) // 8
+        )
+
     def _check_regen_value(self, val: Tensor, param_idx: int) -> Tensor:
         if self._params[param_idx].data.device != val.device:
             val = ModuleParamPruningMask._detach_tens(
@@ -450,16 +628,21 @@ class ModuleParamPruningMask(object):
         indices = range(len(self._params)) if param_idx is None else [param_idx]
 
         for idx in indices:
-            if self._params[idx].data.numel() < self._param_masks[idx].numel():
+            if self._params[idx].data.numel() < self._param_mask_numels[idx]:
                 self._params_applied_thinning[idx] = 1 - (
                     self._params[idx].data.numel() / self._param_orig_sizes[idx]
                 )
-                self._param_masks[idx] = ModuleParamPruningMask._detach_tens(
-                    torch.ones_like(self._params[idx].data)
+                self._set_mask(
+                    idx,
+                    ModuleParamPruningMask._detach_tens(
+                        torch.ones_like(self._params[idx].data)
+                    ),
                 )
             if self._params[idx].data.device != self._param_masks[idx].device:
                 self._param_masks[idx] = ModuleParamPruningMask._detach_tens(
-                    torch.empty_like(self._params[idx].data).copy_(
+                    self._param_masks[idx].to(self._params[idx].data.device)
+                    if self._pack_masks
+                    else torch.empty_like(self._params[idx].data).copy_(
                         self._param_masks[idx]
                     )
                 )
@@ -548,7 +731,7 @@ class ModuleParamPruningMask(object):
             )
 
         return (
-            grad.mul_(self._param_masks[param_idx])
+            grad.mul_(self._get_mask(param_idx))
             if not self._allow_reintroduction
             else grad  # do not mask gradient for movement pruning
         )
@@ -113,6 +113,12 @@ class BasePruningModifier(ABC, ScheduledUpdateModifier):
     :param leave_enabled: True to continue masking the weights after end_epoch,
         False to stop masking. Should be set to False if exporting the result
         immediately after or doing some other prune. Default is False
+    :param pack_masks: set True to store masks bit-packed (1 bit per param value)
+        in memory and in this modifier's state dict. Default is False
+    :param fold_mask_into_optimizer: set True to also mask the momentum state of
+        SGD, Adam, and AdamW optimizers so optimizer steps never write to masked
+        values and the mask is only reapplied after steps that change it.
+        Other optimizers fall back to reapplying the mask every step. Default is False
     """
 
     def __init__(
@@ -128,6 +134,8 @@ class BasePruningModifier(ABC, ScheduledUpdateModifier):
         global_sparsity: bool = False,
         allow_reintroduction: bool = False,
         leave_enabled: bool = False,
+        pack_masks: bool = False,
+        fold_mask_into_optimizer: bool = False,
         parent_class_kwarg_names: Optional[List[str]] = None,
         **kwargs,
     ):
@@ -159,10 +167,13 @@ class BasePruningModifier(ABC, ScheduledUpdateModifier):
         self._global_sparsity = global_sparsity
         self._allow_reintroduction = allow_reintroduction
         self._leave_enabled = leave_enabled
+        self._pack_masks = pack_masks
+        self._fold_mask_into_optimizer = fold_mask_into_optimizer
 
         self._applied_sparsity = None
         self._pre_step_completed = False
         self._sparsity_applied = False
+        self._optimizer_state_masked = False
 
     @BaseModifier.sparsification_types.getter
     def sparsification_types(self) -> List[SparsificationTypes]:
@@ -222,6 +233,22 @@ class BasePruningModifier(ABC, ScheduledUpdateModifier):
         """
         return self._leave_enabled
 
+    @ModifierProp(no_serialize_val=False)
+    def pack_masks(self) -> bool:
+        """
+        :return: True to store masks bit-packed in memory and in this modifier's
+            state dict, False to store them densely
+        """
+        return self._pack_masks
+
+    @ModifierProp(no_serialize_val=False)
+    def fold_mask_into_optimizer(self) -> bool:
+        """
+        :return: True to mask the optimizer's momentum state so that optimizer steps
+            never write to masked values, False to reapply the mask after every step
+        """
+        return self._fold_mask_into_optimizer
+
     @property
     def module_masks(self) -> Optional[ModuleParamPruningMask]:
         """
@@ -445,11 +472,20 @@ class BasePruningModifier(ABC, ScheduledUpdateModifier):
         """
         super().optimizer_post_step(module, optimizer, epoch, steps_per_epoch)
 
-        if not self._allow_reintroduction:
+        if not self._allow_reintroduction and (
+            self._sparsity_applied or not self._optimizer_state_masked
+        ):
             # be sure to apply mask again after optimizer update because
             # weights may have changed (optimizer with momentum, not masking gradient)
             self._module_masks.apply()
 
+            if self._fold_mask_into_optimizer:
+                # with masked grads and momentum, following steps leave the masked
+                # weights at zero until the masks change again
+                self._optimizer_state_masked = self._module_masks.mask_optimizer_state(
+                    optimizer
+                )
+
         self._sparsity_applied = False
 
     def finalize(
@@ -475,10 +511,16 @@ class BasePruningModifier(ABC, ScheduledUpdateModifier):
     def state_dict(self) -> Dict[str, Tensor]:
         """
         :return: PyTorch state dictionary to store any variables from this modifier.
-            The mapping is param_name -> mask
+            The mapping is param_name -> mask. If pack_masks is set, masks are stored
+            bit-packed as returned by pack_mask
         """
         return OrderedDict(
-            zip(self._module_masks.names, self._module_masks.param_masks)
+            zip(
+                self._module_masks.names,
+                self._module_masks.packed_param_masks
+                if self._pack_masks
+                else self._module_masks.param_masks,
+            )
         )
 
     def load_state_dict(self, state_dict: Dict[str, Tensor], strict: bool = True):
@@ -506,6 +548,7 @@ class BasePruningModifier(ABC, ScheduledUpdateModifier):
         self._module_masks.set_param_masks(
             [state_dict[name] for name in self._module_masks.names]
         )
+        self._optimizer_state_masked = False
 
     def _check_params_match(self, token: Union[str, List[str]]):
         if isinstance(token, str):
@@ -543,6 +586,7 @@ class BasePruningModifier(ABC, ScheduledUpdateModifier):
             layer_names=layer_names,
             global_sparsity=self._global_sparsity,
             allow_reintroduction=self._allow_reintroduction,
+            pack_masks=self._pack_masks,
         )
 
     def _create_analyzers(
@@ -592,6 +636,12 @@ class BaseGradualPruningModifier(BasePruningModifier):
         creator methods. Default is False
     :param allow_reintroduction: if True, gradients and params will not be masked
         between forward passes. Default is False
+    :param pack_masks: set True to store masks bit-packed (1 bit per param value)
+        in memory and in this modifier's state dict. Default is False
+    :param fold_mask_into_optimizer: set True to also mask the momentum state of
+        SGD, Adam, and AdamW optimizers so optimizer steps never write to masked
+        values and the mask is only reapplied after steps that change it.
+        Other optimizers fall back to reapplying the mask every step. Default is False
     :param parent_class_kwarg_names: a list of args which indicates the subset of kwargs
         to pass to super.__init__. Resulting kwargs will be the set intersect of
         parent_class_kwarg_names and the initial kwargs. A value of None will preserve
@@ -616,6 +666,8 @@ class BaseGradualPruningModifier(BasePruningModifier):
         min_frequency: float = -1.0,
         global_sparsity: bool = False,
         allow_reintroduction: bool = False,
+        pack_masks: bool = False,
+        fold_mask_into_optimizer: bool = False,
         parent_class_kwarg_names: Optional[List[str]] = None,
         **kwargs,
     ):
@@ -639,6 +691,8 @@ class BaseGradualPruningModifier(BasePruningModifier):
             min_frequency=min_frequency,
             global_sparsity=global_sparsity,
             allow_reintroduction=allow_reintroduction,
+            pack_masks=pack_masks,
+            fold_mask_into_optimizer=fold_mask_into_optimizer,
             init_sparsity=self._init_sparsity,
             final_sparsity=self._final_sparsity,
             inter_func=inter_func,
@@ -60,6 +60,17 @@ class MagnitudePruningParamsScorer(PruningParamsScorer):
         """
         return [torch.abs(param.data) for param in self._params]
 
+    def score_parameters_into(self, out: List[Tensor]) -> List[Tensor]:
+        """
+        :param out: list of Tensors the same shapes as the given Parameters to write
+            the scores to
+        :return: the given out Tensors filled with the magnitude of each Parameter
+        """
+        for param, out_score in zip(self._params, out):
+            torch.abs(param.data, out=out_score)
+
+        return out
+
 
 @PyTorchModifierYAML()
 class GMPruningModifier(BaseGradualPruningModifier, BaseGMPruningModifier):
@@ -106,6 +117,16 @@ class GMPruningModifier(BaseGradualPruningModifier, BaseGMPruningModifier):
     :param mask_type: String to define type of sparsity to apply. May be 'unstructred'
         for unstructured pruning or 'block4' for four block pruning or a list of two
         integers for a custom block shape. Default is 'unstructured'
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. 'kthvalue' for exact selection, 'sort' for a full sort of the scores,
+        or 'sampled' to estimate the threshold from a random sample of the scores.
+        Default is 'kthvalue'
+    :param pack_masks: set True to store masks bit-packed (1 bit per param value)
+        in memory and in this modifier's state dict. Default is False
+    :param fold_mask_into_optimizer: set True to also mask the momentum state of
+        SGD, Adam, and AdamW optimizers so optimizer steps never write to masked
+        values and the mask is only reapplied after steps that change it.
+        Other optimizers fall back to reapplying the mask every step. Default is False
     :param global_sparsity: set True to use global magnitude pruning, False for
         layer-wise. Default is False. [DEPRECATED] - use GlobalMagnitudePruningModifier
         for global magnitude pruning and MagnitudePruningModifier for layer-wise
@@ -130,6 +151,9 @@ class GMPruningModifier(BaseGradualPruningModifier, BaseGMPruningModifier):
         global_sparsity: bool = False,
         phased: bool = False,
         score_type: str = "magnitude",
+        threshold_method: str = "kthvalue",
+        pack_masks: bool = False,
+        fold_mask_into_optimizer: bool = False,
     ):
         self._check_deprecated_params(global_sparsity, phased, score_type)
 
@@ -146,6 +170,8 @@ class GMPruningModifier(BaseGradualPruningModifier, BaseGMPruningModifier):
             global_sparsity=global_sparsity,
             end_comparator=-1,
             allow_reintroduction=False,
+            pack_masks=pack_masks,
+            fold_mask_into_optimizer=fold_mask_into_optimizer,
             parent_class_kwarg_names=[
                 "init_sparsity",
                 "final_sparsity",
@@ -154,6 +180,7 @@ class GMPruningModifier(BaseGradualPruningModifier, BaseGMPruningModifier):
                 "mask_type",
             ],
         )
+        self._threshold_method = threshold_method
 
     def _get_mask_creator(
         self, param_names: List[str], params: List[Parameter]
@@ -163,7 +190,9 @@ class GMPruningModifier(BaseGradualPruningModifier, BaseGMPruningModifier):
         :param params: list of parameters to be masked
         :return: mask creator object to be used by this pruning algorithm
         """
-        return get_mask_creator_default(self.mask_type)
+        return get_mask_creator_default(
+            self.mask_type, threshold_method=self._threshold_method
+        )
 
     def _get_scorer(self, params: List[Parameter]) -> PruningParamsScorer:
         """
@@ -172,6 +201,13 @@ class GMPruningModifier(BaseGradualPruningModifier, BaseGMPruningModifier):
         """
         return MagnitudePruningParamsScorer(params)
 
+    @ModifierProp(no_serialize_val="kthvalue")
+    def threshold_method(self) -> str:
+        """
+        :return: method used to find the score threshold for a target sparsity
+        """
+        return self._threshold_method
+
     @ModifierProp()
     def global_sparsity(self) -> bool:
         """
@@ -251,6 +287,16 @@ class MagnitudePruningModifier(GMPruningModifier):
     :param mask_type: String to define type of sparsity to apply. May be 'unstructred'
         for unstructured pruning or 'block4' for four block pruning or a list of two
         integers for a custom block shape. Default is 'unstructured'
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. 'kthvalue' for exact selection, 'sort' for a full sort of the scores,
+        or 'sampled' to estimate the threshold from a random sample of the scores.
+        Default is 'kthvalue'
+    :param pack_masks: set True to store masks bit-packed (1 bit per param value)
+        in memory and in this modifier's state dict. Default is False
+    :param fold_mask_into_optimizer: set True to also mask the momentum state of
+        SGD, Adam, and AdamW optimizers so optimizer steps never write to masked
+        values and the mask is only reapplied after steps that change it.
+        Other optimizers fall back to reapplying the mask every step. Default is False
     """
 
     def __init__(
@@ -264,6 +310,9 @@ class MagnitudePruningModifier(GMPruningModifier):
         leave_enabled: bool = True,
         inter_func: str = "cubic",
         mask_type: str = "unstructured",
+        threshold_method: str = "kthvalue",
+        pack_masks: bool = False,
+        fold_mask_into_optimizer: bool = False,
     ):
         super(MagnitudePruningModifier, self).__init__(
             params=params,
@@ -276,6 +325,9 @@ class MagnitudePruningModifier(GMPruningModifier):
             mask_type=mask_type,
             leave_enabled=leave_enabled,
             global_sparsity=False,
+            threshold_method=threshold_method,
+            pack_masks=pack_masks,
+            fold_mask_into_optimizer=fold_mask_into_optimizer,
         )
 
     @ModifierProp(serializable=False)
@@ -333,6 +385,16 @@ class GlobalMagnitudePruningModifier(GMPruningModifier):
     :param mask_type: String to define type of sparsity to apply. May be 'unstructred'
         for unstructured pruning or 'block4' for four block pruning or a list of two
         integers for a custom block shape. Default is 'unstructured'
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. 'kthvalue' for exact selection, 'sort' for a full sort of the scores,
+        or 'sampled' to estimate the threshold from a random sample of the scores.
+        Default is 'kthvalue'
+    :param pack_masks: set True to store masks bit-packed (1 bit per param value)
+        in memory and in this modifier's state dict. Default is False
+    :param fold_mask_into_optimizer: set True to also mask the momentum state of
+        SGD, Adam, and AdamW optimizers so optimizer steps never write to masked
+        values and the mask is only reapplied after steps that change it.
+        Other optimizers fall back to reapplying the mask every step. Default is False
     """
 
     def __init__(
@@ -346,6 +408,9 @@ class GlobalMagnitudePruningModifier(GMPruningModifier):
         leave_enabled: bool = True,
         inter_func: str = "cubic",
         mask_type: str = "unstructured",
+        threshold_method: str = "kthvalue",
+        pack_masks: bool = False,
+        fold_mask_into_optimizer: bool = False,
     ):
         super(GlobalMagnitudePruningModifier, self).__init__(
             params=params,
@@ -358,6 +423,9 @@ class GlobalMagnitudePruningModifier(GMPruningModifier):
             mask_type=mask_type,
             leave_enabled=leave_enabled,
             global_sparsity=True,
+            threshold_method=threshold_method,
+            pack_masks=pack_masks,
+            fold_mask_into_optimizer=fold_mask_into_optimizer,
         )
 
     @ModifierProp(serializable=False)
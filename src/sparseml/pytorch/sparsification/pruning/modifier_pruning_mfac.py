@@ -19,10 +19,12 @@ https://arxiv.org/pdf/2107.03356.pdf
 import logging
 import math
 import os
+import tempfile
 from abc import ABC, abstractmethod
 from functools import wraps
-from typing import Dict, List, Optional, Union
+from typing import Dict, List, Optional, Tuple, Union
 
+import numpy
 import torch
 import torch.distributed as dist
 from torch import Tensor
@@ -55,6 +57,7 @@ __all__ = [
 
 _LOGGER = logging.getLogger(__name__)
 BYTES_IN_MIB = 1024 ** 2
+MMAP_GRADS_DEVICE = "mmap"
 
 
 @PyTorchModifierYAML()
@@ -118,7 +121,11 @@ class MFACPruningModifier(BaseGradualPruningModifier):
         dictionary, then 0.0 must be included as a key for the base number of gradients
         to store (i.e. {0: 64, 0.5: 128, 0.75: 256}). Default is 64
     :param damp: dampening factor, default is 1e-5
-    :param grads_device: device to store the gradient buffer on. Default is "cpu"
+    :param grads_device: device to store the gradient buffer on. Set to "mmap" to
+        store it in a memory-mapped temporary file (created under TMPDIR) so that
+        buffers larger than RAM can be used on cpu, requires fisher_block_size to
+        be None so the Fisher inverse is computed in pages of num_grads / num_pages
+        samples. Default is "cpu"
     :param fisher_block_size: optional value to enable blocked computation of the
         Fisher matrix. Blocks will be formed consecutively along the diagonal. If
         None, blocked computation is not used. Default is 2000
@@ -130,6 +137,16 @@ class MFACPruningModifier(BaseGradualPruningModifier):
     :param mask_type: String to define type of sparsity to apply. May be 'unstructred'
         for unstructured pruning or 'block4' for four block pruning or a list of two
         integers for a custom block shape. Default is 'unstructured'
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. 'kthvalue' for exact selection, 'sort' for a full sort of the scores,
+        or 'sampled' to estimate the threshold from a random sample of the scores.
+        Default is 'kthvalue'
+    :param pack_masks: set True to store masks bit-packed (1 bit per param value)
+        in memory and in this modifier's state dict. Default is False
+    :param fold_mask_into_optimizer: set True to also mask the momentum state of
+        SGD, Adam, and AdamW optimizers so optimizer steps never write to masked
+        values and the mask is only reapplied after steps that change it.
+        Other optimizers fall back to reapplying the mask every step. Default is False
     """
 
     def __init__(
@@ -151,6 +168,9 @@ class MFACPruningModifier(BaseGradualPruningModifier):
         num_pages: int = 1,  # break computation into pages when block size is None
         available_devices: Optional[List[str]] = None,
         mask_type: str = "unstructured",
+        threshold_method: str = "kthvalue",
+        pack_masks: bool = False,
+        fold_mask_into_optimizer: bool = False,
     ):
         super().__init__(
             params=params,
@@ -162,8 +182,16 @@ class MFACPruningModifier(BaseGradualPruningModifier):
             update_frequency=update_frequency,
             global_sparsity=global_sparsity,
             leave_enabled=leave_enabled,
+            pack_masks=pack_masks,
+            fold_mask_into_optimizer=fold_mask_into_optimizer,
             parent_class_kwarg_names=[],
         )
+        if grads_device == MMAP_GRADS_DEVICE and fisher_block_size:
+            raise ValueError(
+                f"fisher_block_size must be None when grads_device is "
+                f"{MMAP_GRADS_DEVICE}, given {fisher_block_size}"
+            )
+
         self._grad_sampler = None
         self._use_gradient_buffering = use_gradient_buffering
         self._num_grads = num_grads
@@ -172,6 +200,7 @@ class MFACPruningModifier(BaseGradualPruningModifier):
         self._fisher_block_size = fisher_block_size
         self._num_pages = num_pages
         self._mask_type = mask_type
+        self._threshold_method = threshold_method
         if available_devices is None:
             if torch.cuda.device_count() > 0:
                 self._available_devices = ["cuda:0"]
@@ -208,8 +237,8 @@ class MFACPruningModifier(BaseGradualPruningModifier):
         """
         return self._grads_device
 
-    @ModifierProp(serializable=True)
-    def fisher_block_size(self) -> int:
+    @ModifierProp(serializable=True, no_serialize_val=2000)
+    def fisher_block_size(self) -> Optional[int]:
         """
         Return block size B for blockwise Fisher Inverse approximation
         """
@@ -236,6 +265,13 @@ class MFACPruningModifier(BaseGradualPruningModifier):
         """
         return self._mask_type
 
+    @ModifierProp(no_serialize_val="kthvalue")
+    def threshold_method(self) -> str:
+        """
+        :return: method used to find the score threshold for a target sparsity
+        """
+        return self._threshold_method
+
     def initialize(
         self,
         module: Module,
@@ -287,7 +323,9 @@ class MFACPruningModifier(BaseGradualPruningModifier):
         :param params: list of Parameters to be masked
         :return: mask creator object to be used by this pruning algorithm
         """
-        return get_mask_creator_default(self.mask_type)
+        return get_mask_creator_default(
+            self.mask_type, threshold_method=self._threshold_method
+        )
 
     def _get_scorer(self, params: List[Parameter]) -> PruningParamsGradScorer:
         """
@@ -301,6 +339,7 @@ class MFACPruningModifier(BaseGradualPruningModifier):
             fisher_block_size=self._fisher_block_size,
             num_pages=self._num_pages,
             available_devices=self._available_devices,
+            grads_device=self._grads_device,
         )
 
     def check_mask_update(
@@ -373,6 +412,8 @@ class MFACPruningParamsScorer(PruningParamsGradScorer):
         Default is 1
     :param available_devices: list of device names to perform computation on. Default
         is empty
+    :param grads_device: device to store the gradient buffer on or "mmap" to store
+        it in a memory-mapped temporary file. Default is "cpu"
     """
 
     def __init__(
@@ -383,6 +424,7 @@ class MFACPruningParamsScorer(PruningParamsGradScorer):
         fisher_block_size: int,
         num_pages: int,
         available_devices: Optional[List[str]],
+        grads_device: Union[str, int] = "cpu",
     ):
         super().__init__(params)
         self._num_grads = num_grads
@@ -390,6 +432,7 @@ class MFACPruningParamsScorer(PruningParamsGradScorer):
         self._fisher_block_size = fisher_block_size
         self._num_pages = num_pages
         self._available_devices = available_devices
+        self._grads_device = grads_device
 
         # control when to do live gradient buffering, enabled by default
         self.buffer_grads = True
@@ -443,7 +486,7 @@ class MFACPruningParamsScorer(PruningParamsGradScorer):
             if self._is_main_proc:
                 # initialize grads tensor to fit grad buffers from all processes
                 num_grads = self._grad_buffer.size(0)
-                self._grads = self._grad_buffer.new_zeros(
+                self._grads = self._zeros_on_grads_device(
                     (
                         num_grads * dist.get_world_size(),
                         self._grad_buffer.size(1),
@@ -626,13 +669,25 @@ class MFACPruningParamsScorer(PruningParamsGradScorer):
         num_grads = _get_num_grads_for_sparsity(
             self._num_grads, self._last_applied_sparsity
         )
-        self._grad_buffer = torch.zeros(
-            (num_grads, total_nonzero),
-            device="cpu",
-        )
+        self._grad_buffer = None  # release any previous buffer before allocating
+        self._grad_buffer = self._zeros_on_grads_device((num_grads, total_nonzero))
         self._buffer_idx = 0
         self._grads_collected = 0
 
+    def _zeros_on_grads_device(self, shape: Tuple[int, int]) -> Tensor:
+        if self._grads_device != MMAP_GRADS_DEVICE:
+            return torch.zeros(shape, device=self._grads_device)
+
+        if shape[0] * shape[1] == 0:
+            return torch.zeros(shape)
+
+        # the temporary file is unlinked on creation, its disk space is
+        # released once the tensor using the mapping is freed
+        with tempfile.TemporaryFile() as file:
+            grads = numpy.memmap(file, dtype=numpy.float32, mode="w+", shape=shape)
+
+        return torch.from_numpy(grads)
+
 
 """
 Classes and methods for computing H^-1
@@ -702,7 +757,9 @@ class FisherInverseFast(FisherInverse):
             self._num_params, device=self._device, dtype=self._dtype
         )
         for i in range(self._num_samples):
-            res -= (self._hinv_g[i, :] ** 2) / self._denom[i]
+            res.addcmul_(
+                self._hinv_g[i, :], self._hinv_g[i, :], value=-1.0 / self._denom[i]
+            )
         return res
 
     def mul(self, x):
@@ -783,12 +840,16 @@ class FisherInverseFastBlock(FisherInverse):
         x = x.to("cpu")
         res = []
         for idx, fisher_inv_block in enumerate(self._fisher_inv_blocks):
+            x_block = x[(self._block_size * idx) : (self._block_size * (idx + 1))]
+
+            if not x_block.any():
+                # product is zero, skip moving the block to the device
+                res.append(torch.zeros_like(x_block))
+                continue
+
             device = self._devices[idx % len(self._devices)]
             fisher_inv_block = fisher_inv_block.to(device)
-            x_block = x[(self._block_size * idx) : (self._block_size * (idx + 1))].to(
-                device
-            )
-            res.append(fisher_inv_block.mul(x_block).to("cpu"))
+            res.append(fisher_inv_block.mul(x_block.to(device)).to("cpu"))
 
             # free GPU mem
             fisher_inv_block.to("cpu")
@@ -800,22 +861,24 @@ class FisherInverseFastPageSwap(FisherInverse):
     """
     Implementation of computing the inverse Fisher matrix values based on the
     M-FAC paper using a given page size to break up computation across samples.
-    Pages of gradients must fit into GPU memory.
+    Pages of gradients must fit into GPU memory. When computing on cpu, grads
+    may be a memory-mapped tensor so only the pages in use are held in memory
 
     :param grads: tensor of gradient samples to compute the inverse Fisher product
         with. Dimension should be (num_samples, num_parameters)
     :param damp: the dampening factor. Default is 1e-5
     :param num_pages: number of pages to break gradient samples into. the number of
         gradients must be divisible by num_pages
-    :param devices: list of GPU device ids to use for computation. Default is to use cpu
+    :param devices: list of device ids to use for computation. Default is cuda:0
     """
 
     def __init__(self, grads, damp=1e-5, num_pages=1, devices=None):
-        assert torch.cuda.is_available(), (
+        self._devices = devices or ["cuda:0"]
+        self._cpu = all(torch.device(device).type == "cpu" for device in self._devices)
+        assert self._cpu or torch.cuda.is_available(), (
             "CUDA enabled device not available, "
-            "but is required for using FisherInverseFastPageSwap"
+            "but is required for using FisherInverseFastPageSwap on GPU devices"
         )
-        self._devices = devices or ["cuda:0"]
         self._gpu0 = self._devices[0]  # for computations that fit on single GPU
 
         self._dtype = grads.dtype
@@ -898,7 +961,7 @@ class FisherInverseFastPageSwap(FisherInverse):
                 params_idx : (params_idx + self._params_per_device),
             ].to(device)
 
-        first_page_hinv_g_dist = parallel_apply(
+        first_page_hinv_g_dist = self._parallel_apply(
             [_get_first_page_on_device] * len(self._devices),
             list(
                 zip(range(0, self._num_params, self._params_per_device), self._devices)
@@ -911,7 +974,7 @@ class FisherInverseFastPageSwap(FisherInverse):
             first_page_hinv_g[0, :] = self._damp * first_grad
             self._denom[0] += first_grad.dot(first_page_hinv_g[0, :]).to("cpu")
 
-        parallel_apply(
+        self._parallel_apply(
             [_process_first_sample] * len(self._devices),
             first_page_hinv_g_dist,
         )
@@ -935,7 +998,7 @@ class FisherInverseFastPageSwap(FisherInverse):
                     .to("cpu")
                 )
 
-            parallel_apply(
+            self._parallel_apply(
                 [_calc_mul_update_dist] * len(self._devices),
                 list(enumerate(first_page_hinv_g_dist)),
             )
@@ -951,7 +1014,7 @@ class FisherInverseFastPageSwap(FisherInverse):
                     .to("cpu")
                 )
 
-            parallel_apply(
+            self._parallel_apply(
                 [_apply_mul_update_dist] * len(self._devices),
                 list(enumerate(first_page_hinv_g_dist)),
             )
@@ -965,7 +1028,7 @@ class FisherInverseFastPageSwap(FisherInverse):
                 shard_param_idx : (shard_param_idx + self._params_per_device),
             ] = hinv_g_shard.to("cpu")
 
-        parallel_apply(
+        self._parallel_apply(
             [_update_main_hinv_g] * len(first_page_hinv_g_dist),
             list(
                 zip(
@@ -1029,6 +1092,16 @@ class FisherInverseFastPageSwap(FisherInverse):
         ] = fisher_inv_buf_gpu.to("cpu")
         del fisher_inv_buf_gpu
 
+    def _parallel_apply(self, funcs, inputs):
+        if not self._cpu:
+            return parallel_apply(funcs, inputs)
+
+        # parallel_apply requires CUDA, run sequentially when computing on cpu
+        return [
+            func(*(args if isinstance(args, (list, tuple)) else (args,)))
+            for func, args in zip(funcs, inputs)
+        ]
+
 
 class FisherInverseFastSmallBlocks(FisherInverse):
     """
@@ -1278,12 +1351,23 @@ class FisherInverseFastSmallBlocks(FisherInverse):
                 t_hinv.append(tensor[block_start - cont_start_idx :])
                 block_start = cont_end_idx
 
-        mul_slice = (
-            torch.bmm(torch.cat(t_hinv).to(device), x_slice)
-            .reshape(-1)
-            .to("cpu")  # move all to same device after computation
+        # only blocks holding nonzero values of x contribute to the product,
+        # for OBS updates these are the blocks with newly pruned weights
+        active_blocks = x_slice.reshape(x_slice.size(0), -1).any(dim=1)
+        active_blocks_idx = active_blocks.nonzero(as_tuple=False).reshape(-1)
+        hinv_active = (
+            t_hinv[0][active_blocks_idx.to(t_hinv[0].device)]
+            if len(t_hinv) == 1
+            else torch.cat(t_hinv)[active_blocks_idx.to(t_hinv[0].device)]
+        )
+
+        mul_slice = torch.zeros_like(x_slice)
+        mul_slice[active_blocks_idx] = torch.bmm(
+            hinv_active.to(device), x_slice[active_blocks_idx]
+        )
+        self._mul_slices.append(
+            mul_slice.reshape(-1).to("cpu")  # move all to same device after computation
         )
-        self._mul_slices.append(mul_slice)
 
     def _init_hinv(
         self,
@@ -1331,13 +1415,12 @@ class FisherInverseFastSmallBlocks(FisherInverse):
             + torch.bmm(grads_blocked_device.unsqueeze(1), hinv_g_slice)
         ).squeeze(2)
 
-        hinv_g_slice = hinv_g_slice.reshape(-1, self._block_size)
-
-        for idx_block in range(self._block_size):
-            # update h_inv calculation across block dims
-            self._hinvs[call_idx][:, idx_block, :] -= hinv_g_slice * (
-                hinv_g_slice[:, idx_block].unsqueeze(1) / denom
-            )
+        # rank one update of every block: H^-1 -= (H^-1 g)(H^-1 g)^T / denom
+        self._hinvs[call_idx].baddbmm_(
+            hinv_g_slice,
+            (hinv_g_slice / denom.unsqueeze(2)).transpose(1, 2),
+            alpha=-1.0,
+        )
 
     def _pad(self, x: Tensor):
         # pad 1-d tensor to num_blocks * block_size
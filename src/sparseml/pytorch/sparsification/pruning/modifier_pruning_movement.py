@@ -83,6 +83,16 @@ class MovementPruningModifier(GMPruningModifier):
     :param mask_type: String to define type of sparsity (options: ['unstructured',
         'block']), List to define block shape of a parameters in and out
         channels, or a SparsityMaskCreator object. default is 'unstructured'
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. 'kthvalue' for exact selection, 'sort' for a full sort of the scores,
+        or 'sampled' to estimate the threshold from a random sample of the scores.
+        Default is 'kthvalue'
+    :param pack_masks: set True to store masks bit-packed (1 bit per param value)
+        in memory and in this modifier's state dict. Default is False
+    :param fold_mask_into_optimizer: set True to also mask the momentum state of
+        SGD, Adam, and AdamW optimizers so optimizer steps never write to masked
+        values and the mask is only reapplied after steps that change it.
+        Other optimizers fall back to reapplying the mask every step. Default is False
     """
 
     def __init__(
@@ -96,6 +106,9 @@ class MovementPruningModifier(GMPruningModifier):
         leave_enabled: bool = True,
         inter_func: str = "cubic",
         mask_type: str = "unstructured",
+        threshold_method: str = "kthvalue",
+        pack_masks: bool = False,
+        fold_mask_into_optimizer: bool = False,
     ):
         super(MovementPruningModifier, self).__init__(
             init_sparsity=init_sparsity,
@@ -107,6 +120,9 @@ class MovementPruningModifier(GMPruningModifier):
             leave_enabled=leave_enabled,
             inter_func=inter_func,
             mask_type=mask_type,
+            threshold_method=threshold_method,
+            pack_masks=pack_masks,
+            fold_mask_into_optimizer=fold_mask_into_optimizer,
         )
 
     def _get_scorer(self, params: List[Parameter]) -> PruningParamsGradScorer:
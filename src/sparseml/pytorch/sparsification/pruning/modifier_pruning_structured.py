@@ -54,6 +54,8 @@ class StructuredPruningMaskCreator(GroupedPruningMaskCreator):
         should be scored together. If set, all idxs in the range of provided tensors
         must be included in exactly one group (tensors in their own group should be a
         list of length 1).  If None, no tensor groups will be used
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. One of 'kthvalue', 'sort', 'sampled'. Default is 'kthvalue'
     """
 
     def __init__(
@@ -61,6 +63,7 @@ class StructuredPruningMaskCreator(GroupedPruningMaskCreator):
         structure_type: str,
         grouping_fn_name: str = "l2",
         tensor_group_idxs: Optional[List[List[int]]] = None,
+        threshold_method: str = "kthvalue",
     ):
         valid_structure_types = ["channel", "filter"]
         if structure_type not in valid_structure_types:
@@ -69,6 +72,7 @@ class StructuredPruningMaskCreator(GroupedPruningMaskCreator):
                 f"valid values: {valid_structure_types}"
             )
 
+        super().__init__(threshold_method=threshold_method)
         self._structure_type = structure_type
         self._grouping_fn_name = grouping_fn_name
         self._tensor_group_idxs = tensor_group_idxs
@@ -334,6 +338,16 @@ class StructuredPruningModifier(GMPruningModifier):
     :param mask_type: String to define type of structured sparsity (options: [
         'channel', 'filter']), or a DimensionSparsityMaskCreator object.
         default is 'filter'
+    :param threshold_method: method used to find the score threshold for a target
+        sparsity. 'kthvalue' for exact selection, 'sort' for a full sort of the scores,
+        or 'sampled' to estimate the threshold from a random sample of the scores.
+        Default is 'kthvalue'
+    :param pack_masks: set True to store masks bit-packed (1 bit per param value)
+        in memory and in this modifier's state dict. Default is False
+    :param fold_mask_into_optimizer: set True to also mask the momentum state of
+        SGD, Adam, and AdamW optimizers so optimizer steps never write to masked
+        values and the mask is only reapplied after steps that change it.
+        Other optimizers fall back to reapplying the mask every step. Default is False
     """
 
     def __init__(
@@ -348,6 +362,9 @@ class StructuredPruningModifier(GMPruningModifier):
         leave_enabled: bool = True,
         inter_func: str = "cubic",
         mask_type: str = "filter",
+        threshold_method: str = "kthvalue",
+        pack_masks: bool = False,
+        fold_mask_into_optimizer: bool = False,
     ):
         if mask_type not in ["filter", "channel"]:
             raise ValueError(
@@ -364,6 +381,9 @@ class StructuredPruningModifier(GMPruningModifier):
             leave_enabled=leave_enabled,
             inter_func=inter_func,
             mask_type=mask_type,
+            threshold_method=threshold_method,
+            pack_masks=pack_masks,
+            fold_mask_into_optimizer=fold_mask_into_optimizer,
         )
 
         self._param_groups = param_groups or []
@@ -403,7 +423,9 @@ class StructuredPruningModifier(GMPruningModifier):
                 param_group_idxs.append([idx])
 
         return StructuredPruningMaskCreator(
-            structure_type=self._mask_type, tensor_group_idxs=param_group_idxs
+            structure_type=self._mask_type,
+            tensor_group_idxs=param_group_idxs,
+            threshold_method=self._threshold_method,
         )
 
     @BaseGMPruningModifier.sparsification_types.getter
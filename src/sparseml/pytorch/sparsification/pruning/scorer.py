@@ -50,6 +50,21 @@ class PruningParamsScorer(ABC):
         """
         raise NotImplementedError()
 
+    def score_parameters_into(self, out: List[Tensor]) -> List[Tensor]:
+        """
+        Score the parameters into preallocated tensors. Used to write scores
+        directly into a shared buffer, ex for global pruning. Subclasses may override
+        to avoid allocating intermediate score tensors
+
+        :param out: list of Tensors the same shapes as the given Parameters to write
+            the scores to
+        :return: the given out Tensors filled with the Parameter scores
+        """
+        for score, out_score in zip(self.score_parameters(), out):
+            out_score.copy_(score)
+
+        return out
+
     def pre_optim_step_update(self, masks: List[Tensor]):
         """
         Perform any required logic for tracking Parameter data and gradients before
@@ -17,13 +17,16 @@ Benchmarking PyTorch models on a given device for given batch sizes
 """
 
 import time
-from typing import Any, List, Tuple
+from typing import Any, Dict, List, Tuple
 
-import numpy
 import torch
 from torch.nn import Module
 from tqdm import auto
 
+from sparseml.benchmark.serialization import (
+    DEFAULT_LATENCY_PERCENTILES,
+    LatencyHistogram,
+)
 from sparseml.pytorch.utils.helpers import (
     tensors_batch_size,
     tensors_module_forward,
@@ -43,12 +46,18 @@ class BatchBenchmarkResults(object):
     to run each batch and the items.
 
     :param batch_size: the batch size the results are for
+    :param keep_timings: True to keep every batch timing in model_batch_timings
+        and e2e_batch_timings, False to only keep their distributions so memory
+        use stays constant for long runs
     """
 
-    def __init__(self, batch_size: int):
+    def __init__(self, batch_size: int, keep_timings: bool = True):
         self._batch_size = batch_size
+        self._keep_timings = keep_timings
         self._batch_model_times = []
         self._batch_e2e_times = []
+        self._model_histogram = LatencyHistogram()
+        self._e2e_histogram = LatencyHistogram()
 
     def __repr__(self):
         return "{}(batch_size={}, batch_model_times={}, batch_e2e_times={})".format(
@@ -87,7 +96,8 @@ class BatchBenchmarkResults(object):
     def model_batch_timings(self) -> List[float]:
         """
         :return: the overall timings in seconds for each batch to run through the model.
-            Does not include time for transferring data to and from device (if any)
+            Does not include time for transferring data to and from device (if any).
+            Empty if the results were created with keep_timings=False
         """
         return self._batch_model_times
 
@@ -98,6 +108,7 @@ class BatchBenchmarkResults(object):
             and the system.
             Includes model execution time as well as time to transfer the data to and
             from a device.
+            Empty if the results were created with keep_timings=False
         """
         return self._batch_e2e_times
 
@@ -105,9 +116,10 @@ class BatchBenchmarkResults(object):
     def model_batch_seconds(self):
         """
         :return: the average time it took to execute the batches through the model.
-            Does not include time for transferring data to and from device (if any)
+            Does not include time for transferring data to and from device (if any).
+            NaN if no results have been added
         """
-        return float(numpy.mean(self.model_batch_timings))
+        return _histogram_mean(self._model_histogram)
 
     @property
     def model_batches_per_second(self):
@@ -139,8 +151,9 @@ class BatchBenchmarkResults(object):
             and the system.
             Includes model execution time as well as time to transfer the data to
             and from a device.
+            NaN if no results have been added
         """
-        return float(numpy.mean(self.e2e_batch_timings))
+        return _histogram_mean(self._e2e_histogram)
 
     @property
     def e2e_batches_per_second(self):
@@ -166,6 +179,42 @@ class BatchBenchmarkResults(object):
         """
         return 1.0 / self.e2e_item_seconds
 
+    @property
+    def model_batch_histogram(self) -> LatencyHistogram:
+        """
+        :return: the distribution of the times to execute the batches through
+            the model
+        """
+        return self._model_histogram
+
+    @property
+    def e2e_batch_histogram(self) -> LatencyHistogram:
+        """
+        :return: the distribution of the overall times to execute the batches
+            through the model and the system
+        """
+        return self._e2e_histogram
+
+    def model_batch_percentiles(
+        self, percentiles: Tuple[float, ...] = DEFAULT_LATENCY_PERCENTILES
+    ) -> Dict[str, float]:
+        """
+        :param percentiles: the percentiles, from 0 to 100, to estimate
+        :return: the estimated seconds to execute a batch through the model at each
+            percentile keyed by the percentile, ex: p50, p99.9
+        """
+        return self._model_histogram.percentiles(percentiles)
+
+    def e2e_batch_percentiles(
+        self, percentiles: Tuple[float, ...] = DEFAULT_LATENCY_PERCENTILES
+    ) -> Dict[str, float]:
+        """
+        :param percentiles: the percentiles, from 0 to 100, to estimate
+        :return: the estimated overall seconds to execute a batch through the model
+            and the system at each percentile keyed by the percentile, ex: p50, p99.9
+        """
+        return self._e2e_histogram.percentiles(percentiles)
+
     def add(self, model_sec: float, e2e_sec: float, batch_size: int):
         """
         Add a new batch result
@@ -182,8 +231,18 @@ class BatchBenchmarkResults(object):
                 )
             )
 
-        self._batch_model_times.append(model_sec)
-        self._batch_e2e_times.append(e2e_sec)
+        self._model_histogram.add(model_sec)
+        self._e2e_histogram.add(e2e_sec)
+
+        if self._keep_timings:
+            self._batch_model_times.append(model_sec)
+            self._batch_e2e_times.append(e2e_sec)
+
+
+def _histogram_mean(histogram: LatencyHistogram) -> float:
+    # NaN rather than the histogram's 0.0 for no values so the per second
+    # properties don't divide by zero before any results are added
+    return histogram.mean if histogram.count > 0 else float("nan")
 
 
 class ModuleBenchmarker(object):
@@ -73,6 +73,8 @@ __all__ = [
     "tensor_list_sparsity",
     "tensor_sample",
     "mask_difference",
+    "pack_mask",
+    "unpack_mask",
     "get_layer",
     "replace_layer",
     "get_terminal_layers",
@@ -285,7 +287,9 @@ def tensors_batch_size(tensors: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor
 
 
 def tensors_to_device(
-    tensors: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]], device: str
+    tensors: Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]],
+    device: str,
+    non_blocking: bool = False,
 ) -> Union[Tensor, Iterable[Tensor], Dict[Any, Tensor]]:
     """
     Default function for putting a tensor or collection of tensors to the proper device.
@@ -303,24 +307,41 @@ def tensors_to_device(
     :param tensors: the tensors or collection of tensors to put onto a device
     :param device: the string representing the device to put the tensors on,
         ex: 'cpu', 'cuda', 'cuda:1'
+    :param non_blocking: True to pin cpu tensors in memory and copy them
+        asynchronously with respect to the host when moving to a cuda device,
+        False to copy synchronously
     :return: the tensors or collection of tensors after being placed on the device
     """
     if isinstance(tensors, Tensor):
-        return tensors.to(device)
+        if (
+            non_blocking
+            and tensors.device.type == "cpu"
+            and torch.device(device).type == "cuda"
+            and not tensors.is_pinned()
+        ):
+            tensors = tensors.pin_memory()
+
+        return tensors.to(device, non_blocking=non_blocking)
 
     if isinstance(tensors, OrderedDict):
         return OrderedDict(
-            [(key, tensors_to_device(tens, device)) for key, tens in tensors.items()]
+            [
+                (key, tensors_to_device(tens, device, non_blocking))
+                for key, tens in tensors.items()
+            ]
         )
 
     if isinstance(tensors, Dict):
-        return {key: tensors_to_device(tens, device) for key, tens in tensors.items()}
+        return {
+            key: tensors_to_device(tens, device, non_blocking)
+            for key, tens in tensors.items()
+        }
 
     if isinstance(tensors, tuple):
-        return tuple(tensors_to_device(tens, device) for tens in tensors)
+        return tuple(tensors_to_device(tens, device, non_blocking) for tens in tensors)
 
     if isinstance(tensors, Iterable):
-        return [tensors_to_device(tens, device) for tens in tensors]
+        return [tensors_to_device(tens, device, non_blocking) for tens in tensors]
 
     raise ValueError(
         "unrecognized type for tensors given of {}".format(tensors.__class__.__name__)
@@ -681,6 +702,49 @@ def mask_difference(old_mask: Tensor, new_mask: Tensor) -> Tensor:
     return -1.0 * newly_masked + newly_unmasked
 
 
+_MASK_BIT_VALUES = [128, 64, 32, 16, 8, 4, 2, 1]
+
+
+def pack_mask(mask: Tensor) -> Tensor:
+    """
+    :param mask: the mask to pack, values that are 0.0 are treated as masked and all
+        other values as unmasked
+    :return: flat uint8 tensor on the same device as mask with each element holding
+        8 consecutive mask values as bits (most significant bit first). The last
+        element is zero padded if mask.numel() is not a multiple of 8
+    """
+    bits = (mask.reshape(-1) != 0).type(torch.uint8)
+    remainder = bits.numel() % 8
+
+    if remainder != 0:
+        bits = torch.cat([bits, bits.new_zeros(8 - remainder)])
+
+    bit_values = torch.tensor(_MASK_BIT_VALUES, dtype=torch.uint8, device=mask.device)
+
+    return torch.sum(bits.view(-1, 8) * bit_values, dim=1, dtype=torch.uint8)
+
+
+def unpack_mask(
+    packed_mask: Tensor,
+    shape: Union[torch.Size, List[int], Tuple[int, ...]],
+    dtype: torch.dtype = torch.float32,
+) -> Tensor:
+    """
+    :param packed_mask: packed mask as returned by pack_mask
+    :param shape: the shape of the original mask
+    :param dtype: the dtype to create the unpacked mask as. Default is float32
+    :return: the unpacked mask on the same device as packed_mask with 1.0 for values
+        that are unmasked and 0.0 for values that are masked
+    """
+    bit_values = torch.tensor(
+        _MASK_BIT_VALUES, dtype=torch.uint8, device=packed_mask.device
+    )
+    bits = torch.bitwise_and(packed_mask.view(-1, 1), bit_values) != 0
+    num_elements = int(numpy.prod(shape)) if len(shape) > 0 else 1
+
+    return bits.view(-1)[:num_elements].view(shape).type(dtype)
+
+
 ##############################
 #
 # pytorch module helper functions
@@ -16,14 +16,22 @@
 Contains code for loggers that help visualize the information from each modifier
 """
 
+import atexit
 import logging
 import os
+import queue
+import threading
 import time
+import weakref
 from abc import ABC
 from datetime import datetime
+from functools import partial
 from logging import CRITICAL, DEBUG, ERROR, INFO, WARN, Logger
 from types import ModuleType
-from typing import Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+import torch
+from torch import Tensor
 
 
 try:
@@ -67,6 +75,8 @@ LOGGING_LEVELS = {
     "critical": CRITICAL,
 }
 
+_LOGGER = logging.getLogger(__name__)
+
 
 class BaseLogger(ABC):
     """
@@ -752,9 +762,27 @@ class LoggerManager(ABC):
     Wrapper around loggers that handles log scheduling and handing off logs to intended
     loggers.
 
+    If async_logging is enabled, logs are buffered for each step on the calling
+    thread and handed off in a single batch to a background thread that writes
+    them to the loggers once a log for a new step comes in.
+    Tensor values in a batch are gathered into one tensor per device so only a
+    single device to host copy is made per step, and that copy happens on the
+    background thread instead of forcing a sync on the calling thread.
+    Batches are queued on a bounded queue, when it is full the calling thread
+    either blocks until there is space or drops the batch, tracked by
+    num_blocked_logs and num_dropped_logs respectively.
+    Pending logs are written out on flush(), save(), close(), and at exit.
+
     :param loggers: list of loggers assigned to this manager
     :param log_frequency: number of epochs or fraction of epochs to wait between logs
-
+    :param log_python: True to add a PythonLogger if one isn't given in loggers
+    :param name: name given to the logger manager, used for identification
+    :param async_logging: True to write logs to the loggers on a background
+        thread, False to write them on the calling thread. Default is False
+    :param async_queue_size: the maximum number of batched steps of logs waiting
+        to be written by the background thread. Default is 128
+    :param async_drop_when_full: True to drop logs when the queue is full,
+        False to block the calling thread until there is space. Default is False
     """
 
     def __init__(
@@ -763,6 +791,9 @@ class LoggerManager(ABC):
         log_frequency: Union[float, None] = 0.1,
         log_python: bool = True,
         name: str = "manager",
+        async_logging: bool = False,
+        async_queue_size: int = 128,
+        async_drop_when_full: bool = False,
     ):
         self._loggers = loggers or []
         self._log_frequency = log_frequency
@@ -772,6 +803,34 @@ class LoggerManager(ABC):
         ):
             self._loggers.append(PythonLogger())
 
+        self._async_drop_when_full = async_drop_when_full
+        self._async_queue = None  # type: Optional[queue.Queue]
+        self._async_thread = None  # type: Optional[threading.Thread]
+        self._async_buffer = []  # type: List[Tuple[str, Tuple, Dict[str, Any]]]
+        self._async_buffer_step = None
+        self._num_blocked_logs = 0
+        self._num_dropped_logs = 0
+
+        if async_logging:
+            self._async_queue = queue.Queue(maxsize=async_queue_size)
+            # the worker and exit hook don't reference the manager so it can be
+            # garbage collected, closing it from __del__
+            self._async_thread = threading.Thread(
+                target=_async_log_worker,
+                args=(self._async_queue,),
+                name="LoggerManager",
+                daemon=True,
+            )
+            self._async_thread.start()
+            self._async_exit_hook = partial(_close_logger_manager, weakref.ref(self))
+            atexit.register(self._async_exit_hook)
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception:
+            pass
+
     def __len__(self):
         return len(self.loggers)
 
@@ -845,6 +904,29 @@ class LoggerManager(ABC):
                 return log.wandb
         return None
 
+    @property
+    def async_logging(self) -> bool:
+        """
+        :return: True if logs are written to the loggers on a background thread
+        """
+        return self._async_queue is not None
+
+    @property
+    def num_blocked_logs(self) -> int:
+        """
+        :return: the number of logs that blocked the calling thread because the
+            async logging queue was full
+        """
+        return self._num_blocked_logs
+
+    @property
+    def num_dropped_logs(self) -> int:
+        """
+        :return: the number of logs that were dropped because the
+            async logging queue was full
+        """
+        return self._num_dropped_logs
+
     def log_scalar(
         self,
         tag: str,
@@ -862,15 +944,16 @@ class LoggerManager(ABC):
         :param kwargs: additional logging arguments to support Python and custom loggers
         :return: True if logged, False otherwise.
         """
-        for log in self.loggers:
-            if log.enabled and (log_types == ALL_TOKEN or log.name in log_types):
-                log.log_scalar(
-                    tag=tag,
-                    value=value,
-                    step=step,
-                    wall_time=wall_time,
-                    level=level,
-                )
+        self._log(
+            "log_scalar",
+            log_types,
+            step,
+            tag=tag,
+            value=value,
+            step=step,
+            wall_time=wall_time,
+            level=level,
+        )
 
     def log_scalars(
         self,
@@ -889,15 +972,16 @@ class LoggerManager(ABC):
         :param kwargs: additional logging arguments to support Python and custom loggers
         :return: True if logged, False otherwise.
         """
-        for log in self.loggers:
-            if log.enabled and (log_types == ALL_TOKEN or log.name in log_types):
-                log.log_scalars(
-                    tag=tag,
-                    values=values,
-                    step=step,
-                    wall_time=wall_time,
-                    level=level,
-                )
+        self._log(
+            "log_scalars",
+            log_types,
+            step,
+            tag=tag,
+            values=values,
+            step=step,
+            wall_time=wall_time,
+            level=level,
+        )
 
     def log_string(
         self,
@@ -916,15 +1000,16 @@ class LoggerManager(ABC):
         :param kwargs: additional logging arguments to support Python and custom loggers
         :return: True if logged, False otherwise.
         """
-        for log in self.loggers:
-            if log.enabled and (log_types == ALL_TOKEN or log.name in log_types):
-                log.log_string(
-                    tag=tag,
-                    string=string,
-                    step=step,
-                    wall_time=wall_time,
-                    level=level,
-                )
+        self._log(
+            "log_string",
+            log_types,
+            step,
+            tag=tag,
+            string=string,
+            step=step,
+            wall_time=wall_time,
+            level=level,
+        )
 
     def log_hyperparams(
         self,
@@ -936,9 +1021,7 @@ class LoggerManager(ABC):
         :param params: Each key-value pair in the dictionary is the name of the
             hyper parameter and it's corresponding value.
         """
-        for log in self._loggers:
-            if log.enabled and (log_types == ALL_TOKEN or log.name in log_types):
-                log.log_hyperparams(params, level)
+        self._log("log_hyperparams", log_types, self._async_buffer_step, params, level)
 
     def save(
         self,
@@ -949,6 +1032,186 @@ class LoggerManager(ABC):
         :param file_path: path to a file to be saved
         :param kwargs: additional arguments that a specific logger might use
         """
+        self.flush()
+
         for log in self._loggers:
             if log.enabled:
                 log.save(file_path, **kwargs)
+
+    def flush(self):
+        """
+        Wait until all pending logs have been written to the loggers
+        when async_logging is enabled
+        """
+        if self._async_queue is None:
+            return
+
+        self._enqueue_async_buffer(block=True)
+        self._async_queue.join()
+
+    def close(self):
+        """
+        Write out all pending logs and stop the background thread
+        when async_logging is enabled. Following logs are written on the
+        calling thread
+        """
+        if self._async_queue is None:
+            return
+
+        self.flush()
+        self._async_queue.put(None)
+        self._async_thread.join()
+        self._async_queue = None
+        self._async_thread = None
+        atexit.unregister(self._async_exit_hook)
+
+    def _log(
+        self,
+        func: str,
+        log_types: Union[str, List[str]],
+        log_step: Optional[int],
+        *args,
+        **kwargs,
+    ):
+        if self._async_queue is None:
+            self._write_log(func, log_types, args, kwargs)
+            return
+
+        if self._async_buffer and log_step != self._async_buffer_step:
+            self._enqueue_async_buffer()
+
+        # copy tensors so later in place updates don't change the logged values,
+        # the copy is async for cuda tensors
+        if isinstance(kwargs.get("value"), Tensor):
+            kwargs["value"] = kwargs["value"].detach().clone()
+
+        if isinstance(kwargs.get("values"), dict):
+            kwargs["values"] = {
+                key: val.detach().clone() if isinstance(val, Tensor) else val
+                for key, val in kwargs["values"].items()
+            }
+
+        if "wall_time" in kwargs and not kwargs["wall_time"]:
+            # record when the log happened rather than when it is written
+            kwargs["wall_time"] = time.time()
+
+        self._async_buffer_step = log_step
+        self._async_buffer.append((func, log_types, args, kwargs))
+
+        if log_step is None or len(self._async_buffer) >= _ASYNC_BUFFER_MAX_SIZE:
+            # logs without a step never trigger a step change, send them now
+            self._enqueue_async_buffer()
+
+    def _write_log(
+        self,
+        func: str,
+        log_types: Union[str, List[str]],
+        args: Tuple,
+        kwargs: Dict[str, Any],
+    ):
+        _write_log(self._loggers, func, log_types, args, kwargs)
+
+    def _enqueue_async_buffer(self, block: bool = False):
+        if not self._async_buffer:
+            return
+
+        batch = (self._loggers, *_gather_log_tensors(self._async_buffer))
+        self._async_buffer = []
+
+        if self._async_drop_when_full and not block:
+            try:
+                self._async_queue.put_nowait(batch)
+            except queue.Full:
+                self._num_dropped_logs += len(batch[1])
+        else:
+            if self._async_queue.full():
+                self._num_blocked_logs += len(batch[1])
+
+            self._async_queue.put(batch)
+
+
+_ASYNC_BUFFER_MAX_SIZE = 1024
+
+
+def _write_log(
+    loggers: List[BaseLogger],
+    func: str,
+    log_types: Union[str, List[str]],
+    args: Tuple,
+    kwargs: Dict[str, Any],
+):
+    for log in loggers:
+        if log.enabled and (log_types == ALL_TOKEN or log.name in log_types):
+            getattr(log, func)(*args, **kwargs)
+
+
+def _async_log_worker(async_queue: queue.Queue):
+    while True:
+        batch = async_queue.get()
+
+        if batch is None:
+            async_queue.task_done()
+            break
+
+        loggers, logs, gathered = batch
+
+        try:
+            for func, log_types, args, kwargs in _scatter_log_tensors(logs, gathered):
+                _write_log(loggers, func, log_types, args, kwargs)
+        except Exception as err:
+            _LOGGER.warning("error writing logs: {}".format(err))
+        finally:
+            async_queue.task_done()
+
+
+def _close_logger_manager(manager_ref: "weakref.ref"):
+    manager = manager_ref()
+
+    if manager is not None:
+        manager.close()
+
+
+def _gather_log_tensors(
+    logs: List[Tuple[str, Any, Tuple, Dict[str, Any]]]
+) -> Tuple[List, Dict[Tuple, Tuple[List, Tensor]]]:
+    # stack the single value tensors on each device so they can be moved
+    # to the host with one copy, stacking is async for cuda tensors
+    slots = {}  # type: Dict[Tuple, Tuple[List, List[Tensor]]]
+
+    for index, (_, _, _, kwargs) in enumerate(logs):
+        values = kwargs.get("values")
+        candidates = [(index, "value", None, kwargs.get("value"))]
+
+        if isinstance(values, dict):
+            candidates.extend(
+                (index, "values", key, val) for key, val in values.items()
+            )
+
+        for index_, name, key, val in candidates:
+            if isinstance(val, Tensor) and val.numel() == 1:
+                device_slots, tensors = slots.setdefault(
+                    (val.device, val.dtype), ([], [])
+                )
+                device_slots.append((index_, name, key))
+                tensors.append(val.reshape(()))
+
+    return logs, {
+        device: (device_slots, torch.stack(tensors))
+        for device, (device_slots, tensors) in slots.items()
+    }
+
+
+def _scatter_log_tensors(
+    logs: List[Tuple[str, Any, Tuple, Dict[str, Any]]],
+    gathered: Dict[Tuple, Tuple[List, Tensor]],
+) -> List[Tuple[str, Any, Tuple, Dict[str, Any]]]:
+    for device_slots, stacked in gathered.values():
+        for (index, name, key), val in zip(device_slots, stacked.cpu().tolist()):
+            kwargs = logs[index][3]
+
+            if key is None:
+                kwargs[name] = val
+            else:
+                kwargs[name] = {**kwargs[name], key: val}
+
+    return logs
@@ -17,11 +17,13 @@ Code related to running a module through training and testing over a dataset.
 Allows reporting of progress and override functions and hooks.
 """
 
+import queue
+import threading
 import time
 from abc import ABC, abstractmethod
 from collections import OrderedDict
 from contextlib import ExitStack
-from typing import Any, Callable, Dict, List, Optional, Union
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Union
 
 import torch
 from torch import Tensor
@@ -57,6 +59,7 @@ __all__ = [
     "ModuleRunHooks",
     "ModuleRunResults",
     "ModuleDeviceContext",
+    "ModuleRunPrefetcher",
     "ModuleTester",
     "ModuleTrainer",
 ]
@@ -391,20 +394,55 @@ class ModuleRunFuncs(object):
 
 class ModuleRunResults(object):
     """
-    Class containing the results / losses from a model run for training or testing
-    Keeps all result values as a dictionary and Tensor containing all values
+    Class containing the results / losses from a model run for training or testing.
+    Keeps running accumulators for each result (count, mean, sum of squared
+    differences, min and max) on the device the results were created on so that
+    appending does not force a device sync and memory stays constant in the
+    number of batches. Each appended value is weighted by the batch size it was
+    computed for. Appended values are buffered and folded into the accumulators
+    in groups of fold_size to keep the per batch overhead low.
+
+    :param keep_results: True to additionally keep every appended result on the
+        cpu, required for result, results, and result_list_tensor.
+        Default is False
+    :param fold_size: the max number of appended values to buffer per result
+        before folding them into the running accumulators. Default is 128
     """
 
-    def __init__(self):
+    def __init__(self, keep_results: bool = False, fold_size: int = 128):
+        self._keep_results = keep_results
+        self._fold_size = fold_size
         self._results = {}
+        self._pending = {}  # key -> (List[Tensor], List[int] weights)
+        self._dtypes = {}
+        self._counts = {}
+        self._means = {}
+        self._sq_diffs = {}
+        self._mins = {}
+        self._maxs = {}
 
     def __repr__(self):
         results = [
-            "{}={}".format(key, self.result_mean(key).item()) for key in self._results
+            "{}={}".format(key, self.result_mean(key).item()) for key in self._dtypes
         ]
 
         return "ModuleRunResults({})".format(", ".join(results))
 
+    @property
+    def keep_results(self) -> bool:
+        """
+        :return: True if every appended result is kept, False if only the
+            running accumulators are kept
+        """
+        return self._keep_results
+
+    @property
+    def result_keys(self) -> List[str]:
+        """
+        :return: the names of all results that have been appended
+        """
+        return list(self._dtypes.keys())
+
     @property
     def results(self) -> Dict[str, List[Tensor]]:
         """
@@ -413,6 +451,8 @@ class ModuleRunResults(object):
         :return: a dictionary containing a mapping of name (str) to a list of tensors
             that were recorded for that loss
         """
+        self._validate_keep_results()
+
         return self._results
 
     def result(self, key: str) -> List[Tensor]:
@@ -422,6 +462,8 @@ class ModuleRunResults(object):
         :param key: the name of the loss function to get the results for
         :return: a list of tensors containing all of the results for that loss
         """
+        self._validate_keep_results()
+
         return self._results[key]
 
     def result_list_tensor(self, key: str) -> Tensor:
@@ -436,6 +478,16 @@ class ModuleRunResults(object):
 
         return torch.cat(res)
 
+    def result_count(self, key: str) -> int:
+        """
+        :param key: the name of the loss function to get the count for
+        :return: the number of values recorded for that loss,
+            each result counts once per item in its batch
+        """
+        self._fold(key)
+
+        return self._counts[key]
+
     def result_mean(self, key: str) -> Tensor:
         """
         The mean result of a single loss function
@@ -443,9 +495,9 @@ class ModuleRunResults(object):
         :param key: the name of the loss function to get the mean result for
         :return: a single tensor containing the average of all the results for that loss
         """
-        res = self.result_list_tensor(key)
+        self._fold(key)
 
-        return torch.mean(res)
+        return self._finalize(self._means[key], key)
 
     def result_std(self, key: str) -> Tensor:
         """
@@ -456,9 +508,33 @@ class ModuleRunResults(object):
         :return: a single tensor containing the standard deviation of all
             the results for that loss
         """
-        res = self.result_list_tensor(key)
+        self._fold(key)
+        count = self._counts[key]
+        variance = (
+            self._sq_diffs[key] / (count - 1)
+            if count > 1
+            else torch.full_like(self._sq_diffs[key], float("nan"))
+        )
+
+        return self._finalize(torch.sqrt(variance), key)
+
+    def result_min(self, key: str) -> Tensor:
+        """
+        :param key: the name of the loss function to get the min result for
+        :return: a single tensor containing the smallest result for that loss
+        """
+        self._fold(key)
+
+        return self._finalize(self._mins[key], key)
+
+    def result_max(self, key: str) -> Tensor:
+        """
+        :param key: the name of the loss function to get the max result for
+        :return: a single tensor containing the largest result for that loss
+        """
+        self._fold(key)
 
-        return torch.std(res)
+        return self._finalize(self._maxs[key], key)
 
     def append(self, losses: Dict[str, Tensor], batch_size: int):
         """
@@ -468,12 +544,90 @@ class ModuleRunResults(object):
         :param batch_size: the batch size the losses were run for
         """
         for key, val in losses.items():
-            if key not in self._results:
-                self._results[key] = []
+            val = val.detach()
+
+            if key not in self._dtypes:
+                self._dtypes[key] = val.dtype
+                self._pending[key] = ([], [])
+                # NaN until values are folded in, matching the mean of no values
+                empty = torch.tensor(float("nan"), dtype=torch.float64).to(val.device)
+                self._counts[key] = 0
+                self._means[key] = empty
+                self._sq_diffs[key] = empty
+                self._mins[key] = empty
+                self._maxs[key] = empty
+
+            if val.numel() > 0:
+                pending_vals, pending_weights = self._pending[key]
+                pending_vals.append(val.reshape(-1))
+                pending_weights.extend([batch_size] * val.numel())
+
+                if len(pending_vals) >= self._fold_size:
+                    self._fold(key)
+
+            if self._keep_results:
+                if key not in self._results:
+                    self._results[key] = []
+
+                result = val.cpu()
+                result = result.repeat(batch_size)
+                self._results[key].append(result)
+
+    def _fold(self, key: str):
+        pending_vals, pending_weights = self._pending[key]
+
+        if not pending_vals:
+            return
+
+        vals = torch.cat(pending_vals).to(torch.float64)
+        weights = torch.tensor(pending_weights, dtype=torch.float64).to(vals.device)
+        batch_count = sum(pending_weights)
+        batch_mean = (vals * weights).sum() / batch_count
+        batch_sq_diff = (weights * (vals - batch_mean) ** 2).sum()
+        batch_min = vals.min()
+        batch_max = vals.max()
+        pending_vals.clear()
+        pending_weights.clear()
+
+        if self._counts[key] == 0:
+            self._counts[key] = batch_count
+            self._means[key] = batch_mean
+            self._sq_diffs[key] = batch_sq_diff
+            self._mins[key] = batch_min
+            self._maxs[key] = batch_max
+
+            return
+
+        # Chan et al. parallel update of the running mean and
+        # sum of squared differences with the folded batch statistics
+        count = self._counts[key]
+        total = count + batch_count
+        delta = batch_mean - self._means[key]
+        self._counts[key] = total
+        self._means[key] = self._means[key] + delta * (batch_count / total)
+        self._sq_diffs[key] = (
+            self._sq_diffs[key]
+            + batch_sq_diff
+            + delta * delta * (count * batch_count / total)
+        )
+        self._mins[key] = torch.min(self._mins[key], batch_min)
+        self._maxs[key] = torch.max(self._maxs[key], batch_max)
+
+    def _finalize(self, val: Tensor, key: str) -> Tensor:
+        dtype = self._dtypes[key]
+
+        if not dtype.is_floating_point:
+            dtype = torch.get_default_dtype()
 
-            result = val.detach_().cpu()
-            result = result.repeat(batch_size)
-            self._results[key].append(result)
+        return val.to(dtype).cpu()
+
+    def _validate_keep_results(self):
+        if not self._keep_results:
+            raise ValueError(
+                "per batch results are only stored when the ModuleRunResults is "
+                "created with keep_results=True, use result_keys, result_mean, "
+                "and result_std for the running results"
+            )
 
 
 class ModuleDeviceContext(object):
@@ -544,6 +698,159 @@ class ModuleDeviceContext(object):
         ), "world_size must be a positive int"
 
 
+class ModuleRunPrefetcher(object):
+    """
+    Iterator that wraps a data loader and places the next batch on the device
+    while the current batch is run through the module.
+    For cuda devices, batches are pinned and copied with non blocking transfers
+    on a side stream that the current stream waits on before returning the batch.
+    For other devices, a background thread loads and places the next batches.
+
+    :param data: the data loader or iterable of batches to prefetch from
+    :param device: the device to place the batches on, ex: 'cpu', 'cuda:0'
+    :param to_device: the function used to place a batch on the device,
+        if it is the default tensors_to_device then non blocking copies are used
+    :param num_prefetch: the number of batches to load ahead of the current one
+        when prefetching with a background thread
+    """
+
+    def __init__(
+        self,
+        data: Iterable[Any],
+        device: str,
+        to_device: Callable[[Any, str], Any] = tensors_to_device,
+        num_prefetch: int = 1,
+    ):
+        if num_prefetch < 1:
+            raise ValueError(
+                "num_prefetch must be at least 1, given {}".format(num_prefetch)
+            )
+
+        self._data = data
+        self._device = device
+        self._to_device = to_device
+        self._num_prefetch = num_prefetch
+        self._stream = None
+
+        try:
+            torch_device = torch.device(device)
+        except Exception:
+            # multi device strings such as cuda:0,1 for DataParallel
+            torch_device = torch.device(device.split(",")[0])
+
+        if torch_device.type == "cuda" and torch.cuda.is_available():
+            self._stream = torch.cuda.Stream(device=torch_device)
+
+    @property
+    def uses_stream(self) -> bool:
+        """
+        :return: True if batches are copied on a cuda side stream,
+            False if a background thread is used
+        """
+        return self._stream is not None
+
+    def __iter__(self) -> Iterator[Any]:
+        if self._stream is not None:
+            return self._iter_stream()
+
+        return self._iter_thread()
+
+    def _iter_stream(self) -> Iterator[Any]:
+        data_iter = iter(self._data)
+        current_stream = torch.cuda.current_stream(self._stream.device)
+        next_data = self._load_stream(data_iter)
+
+        while next_data is not _PREFETCH_END:
+            current_stream.wait_stream(self._stream)
+            data = next_data
+            _record_stream(data, current_stream)
+            # issue the copies for the next batch before the current one is run
+            next_data = self._load_stream(data_iter)
+
+            yield data
+
+    def _load_stream(self, data_iter: Iterator[Any]) -> Any:
+        try:
+            data = next(data_iter)
+        except StopIteration:
+            return _PREFETCH_END
+
+        with torch.cuda.stream(self._stream):
+            if self._to_device is tensors_to_device:
+                return tensors_to_device(data, self._device, non_blocking=True)
+
+            return self._to_device(data, self._device)
+
+    def _iter_thread(self) -> Iterator[Any]:
+        batches = queue.Queue(maxsize=self._num_prefetch)
+        stop = threading.Event()
+        thread = threading.Thread(
+            target=self._load_thread, args=(batches, stop), daemon=True
+        )
+        thread.start()
+
+        try:
+            while True:
+                data, error = batches.get()
+
+                if error is not None:
+                    raise error
+
+                if data is _PREFETCH_END:
+                    break
+
+                yield data
+        finally:
+            # unblock the loader thread if the consumer stopped early
+            stop.set()
+
+            while thread.is_alive():
+                try:
+                    batches.get_nowait()
+                except queue.Empty:
+                    pass
+
+                thread.join(timeout=0.01)
+
+    def _load_thread(self, batches: queue.Queue, stop: threading.Event):
+        def _put(item: Any) -> bool:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+
+                    return True
+                except queue.Full:
+                    pass
+
+            return False
+
+        try:
+            for data in self._data:
+                if not _put((self._to_device(data, self._device), None)):
+                    return
+
+            _put((_PREFETCH_END, None))
+        except Exception as err:
+            _put((None, err))
+
+
+_PREFETCH_END = object()
+
+
+def _record_stream(data: Any, stream: Any):
+    # mark tensors copied on the side stream as used by the given stream so
+    # their memory isn't reused by the caching allocator while still in use
+    if isinstance(data, Tensor):
+        if data.is_cuda:
+            data.record_stream(stream)
+    elif isinstance(data, Dict):
+        for val in data.values():
+            _record_stream(val, stream)
+    elif isinstance(data, (list, tuple)):
+        for val in data:
+            _record_stream(val, stream)
+
+
 class ModuleRunner(ABC):
     """
     Abstract class for running data through a module and recording the results
@@ -561,6 +868,9 @@ class ModuleRunner(ABC):
     :param device_context: ModuleDeviceContext with settings to enable mixed precision
         using torch.cuda.amp or adjust losses when using DistributedDataParallel.
         Default settings do not use mixed precision or account for DDP.
+    :param prefetch: True to place the next batch on the device while the current
+        batch is run using a ModuleRunPrefetcher, False to place each batch
+        on the device synchronously before running it
     """
 
     def __init__(
@@ -573,6 +883,7 @@ class ModuleRunner(ABC):
         log_steps: int,
         log_summary: bool,
         device_context: ModuleDeviceContext = ModuleDeviceContext.default_context(),
+        prefetch: bool = False,
     ):
         self._module = module
         self._device = device
@@ -586,6 +897,7 @@ class ModuleRunner(ABC):
         self._log_steps = log_steps
         self._log_summary = log_summary
         self._device_context = device_context
+        self._prefetch = prefetch
 
         self._run_funcs = ModuleRunFuncs()
         self._run_hooks = ModuleRunHooks()
@@ -636,6 +948,14 @@ class ModuleRunner(ABC):
         """
         return self._device_context
 
+    @property
+    def prefetch(self) -> bool:
+        """
+        :return: True to place the next batch on the device while the current
+            batch is run, False to place each batch on the device synchronously
+        """
+        return self._prefetch
+
     def run(
         self,
         data_loader: DataLoader,
@@ -644,6 +964,7 @@ class ModuleRunner(ABC):
         show_progress: bool = True,
         track_results: bool = True,
         max_steps: int = -1,
+        keep_results: bool = False,
     ) -> Union[None, ModuleRunResults]:
         """
         Run evaluation over all the data in the given data loader
@@ -658,6 +979,8 @@ class ModuleRunner(ABC):
             False to return None
         :param max_steps: maximum number of steps/batches to run through,
             will stop after reaching this. if <= 0 then no restriction is placed
+        :param keep_results: True to keep every batch result in the returned
+            results in addition to the running mean and std, False otherwise
         :return: the results of evaluation if track_results else None
         """
         if self._log_summary and not track_results:
@@ -682,18 +1005,25 @@ class ModuleRunner(ABC):
         else:
             progress_steps = None
 
+        if self._prefetch:
+            data_loader = ModuleRunPrefetcher(
+                data_loader, self._device, self._run_funcs.to_device
+            )
+
         data_iter = (
             enumerate(data_loader)
             if not show_progress
             else enumerate(auto.tqdm(data_loader, desc=desc, total=progress_steps))
         )
-        results = ModuleRunResults() if track_results else None
+        results = ModuleRunResults(keep_results) if track_results else None
         previous_steps = (counter if counter > -1 else 0) * counter_len
         first_batch_size = None
         epoch_timer = time.time()
+        data_timer = epoch_timer
 
         for batch, data in data_iter:
             step_timer = time.time()
+            data_wait = step_timer - data_timer
             batch_size = self._run_funcs.batch_size(data)  # type: int
 
             if first_batch_size is None:
@@ -739,6 +1069,11 @@ class ModuleRunner(ABC):
                     1.0 / step_time,
                     log_step,
                 )
+                self._log_scalar(
+                    "{}/Data wait seconds per step".format(self._log_name),
+                    data_wait,
+                    log_step,
+                )
 
                 if progress_steps:
                     remaining_steps = progress_steps - batch - 1
@@ -754,11 +1089,13 @@ class ModuleRunner(ABC):
             if 0 < max_steps <= batch:
                 break
 
+            data_timer = time.time()
+
         should_log = self._loggers and self._log_summary and results
         log_step = counter  # log under the counter step for the summaries
 
         if should_log:
-            for loss in results.results.keys():
+            for loss in results.result_keys:
                 val = results.result_mean(loss)
                 self._log_scalar(
                     "{}/{} Summary".format(self._log_name, loss),
@@ -789,6 +1126,7 @@ class ModuleRunner(ABC):
         show_progress: bool = True,
         track_results: bool = True,
         max_steps: int = -1,
+        keep_results: bool = False,
     ):
         """
         Convenience function for evaluation over all the data in the given data loader
@@ -802,6 +1140,8 @@ class ModuleRunner(ABC):
             False to return None
         :param max_steps: maximum number of steps/batches to run through,
             will stop after reaching this. if <= 0 then no restriction is placed
+        :param keep_results: True to keep every batch result in the returned
+            results in addition to the running mean and std, False otherwise
         :return: the results of evaluation if track_results else None
         """
         return self.run(
@@ -811,6 +1151,7 @@ class ModuleRunner(ABC):
             show_progress,
             track_results,
             max_steps,
+            keep_results,
         )
 
     def _log_scalar(self, key: str, item: Any, step: int):
@@ -875,6 +1216,9 @@ class ModuleTrainer(ModuleRunner):
         using torch.cuda.amp or adjust losses when using DistributedDataParallel.
         Default settings do not use mixed precision or account for DDP.
         Will raise an exception if torch version does not support amp.
+    :param prefetch: True to place the next batch on the device while the current
+        batch is run using a ModuleRunPrefetcher, False to place each batch
+        on the device synchronously before running it
     """
 
     def __init__(
@@ -890,6 +1234,7 @@ class ModuleTrainer(ModuleRunner):
         log_steps: int = 100,
         log_summary: bool = True,
         device_context: ModuleDeviceContext = ModuleDeviceContext.default_context(),
+        prefetch: bool = False,
     ):
         super().__init__(
             module,
@@ -900,6 +1245,7 @@ class ModuleTrainer(ModuleRunner):
             log_steps,
             log_summary,
             device_context,
+            prefetch,
         )
         self._optimizer = optimizer
         self._num_accumulated_batches = num_accumulated_batches
@@ -958,7 +1304,10 @@ class ModuleTrainer(ModuleRunner):
     ):
         # setup
         self._accumulated += 1
-        data = self._run_funcs.to_device(data, self._device)
+
+        if not self._prefetch:
+            data = self._run_funcs.to_device(data, self._device)
+
         self._run_hooks.invoke_batch_start(counter, batch, batch_size, data)
 
         # optimizer / gradients reset
@@ -1046,6 +1395,9 @@ class ModuleTester(ModuleRunner):
         using torch.cuda.amp or adjust losses when using DistributedDataParallel.
         Default settings do not use mixed precision or account for DDP.
         Will raise an exception if torch version does not support amp.
+    :param prefetch: True to place the next batch on the device while the current
+        batch is run using a ModuleRunPrefetcher, False to place each batch
+        on the device synchronously before running it
     """
 
     def __init__(
@@ -1058,6 +1410,7 @@ class ModuleTester(ModuleRunner):
         log_steps: int = 100,
         log_summary: bool = True,
         device_context: ModuleDeviceContext = ModuleDeviceContext.default_context(),
+        prefetch: bool = False,
     ):
         super().__init__(
             module,
@@ -1068,6 +1421,7 @@ class ModuleTester(ModuleRunner):
             log_steps,
             log_summary,
             device_context,
+            prefetch,
         )
 
         if self.device_context.use_mixed_precision:
@@ -1091,7 +1445,9 @@ class ModuleTester(ModuleRunner):
     ):
         with torch.no_grad():
             # setup
-            data = self._run_funcs.to_device(data, self._device)
+            if not self._prefetch:
+                data = self._run_funcs.to_device(data, self._device)
+
             self._run_hooks.invoke_batch_start(counter, batch, batch_size, data)
 
             forward_context = (
@@ -23,7 +23,10 @@ import numpy
 from pydantic import BaseModel, Field
 from tqdm.auto import tqdm
 
-from sparseml.optim import default_pruning_sparsities_loss
+from sparseml.optim import (
+    default_pruning_sparsities_loss,
+    magnitude_pruning_averages_iter,
+)
 from sparseml.sparsification.model_info import (
     ModelInfo,
     ModelResult,
@@ -167,6 +170,10 @@ class PruningLossSensitivityMagnitudeAnalyzer(Analyzer, ABC):
     pruning_loss_analysis_sparsity_levels is an optional run argument to set the
     sparsities that this analysis will run at. if not set, the value defaults to
     sparsml.optim.default_pruning_sparsities_loss(extended=True)
+
+    pruning_loss_analysis_num_threads is an optional run argument to set the number
+    of threads to analyze the params with in parallel. if not set, the value
+    defaults to 1
     """
 
     @classmethod
@@ -231,29 +238,16 @@ class PruningLossSensitivityMagnitudeAnalyzer(Analyzer, ABC):
             else default_pruning_sparsities_loss(True)
         )
 
-        for idx, (name, param) in enumerate(named_params.items()):
-            yield AnalyzerProgress(step=idx, total_steps=num_params), self.result
+        averages_iter = magnitude_pruning_averages_iter(
+            named_params.values(),
+            sparsity_levels,
+            kwargs.get("pruning_loss_analysis_num_threads", 1),
+        )
 
-            sorted_param_vals = numpy.sort(numpy.abs(param.flatten()))
-            prev_sparsity_idx = 0
-
-            for sparsity in sparsity_levels:
-                sparsity_idx = round(sparsity * sorted_param_vals.size)
-                if sparsity_idx >= len(sorted_param_vals):
-                    sparsity_idx = len(sorted_param_vals) - 1
-
-                if sparsity <= 1e-9:
-                    sparsity = 0.0
-                    sparse_avg = 0.0
-                else:
-                    if sparsity_idx > prev_sparsity_idx:
-                        sparse_avg = (
-                            sorted_param_vals[prev_sparsity_idx:sparsity_idx]
-                            .mean()
-                            .item()
-                        )
-                        prev_sparsity_idx = sparsity_idx + 1
+        for idx, name in enumerate(named_params):
+            yield AnalyzerProgress(step=idx, total_steps=num_params), self.result
 
+            for sparsity, sparse_avg, _ in next(averages_iter):
                 self.result.add_layer_sparsity_result(name, sparsity, sparse_avg)
 
         yield AnalyzerProgress(step=num_params, total_steps=num_params), self.result
@@ -20,8 +20,11 @@ import inspect
 import logging
 import math
 import os
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import ExitStack
 from dataclasses import asdict
-from typing import Any, Dict, List, Optional, Tuple, Union
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import datasets
 import numpy
@@ -36,6 +39,10 @@ from transformers.trainer_callback import TrainerState
 from transformers.trainer_utils import get_last_checkpoint
 
 from sparseml.pytorch.optim import ScheduledModifierManager, ScheduledOptimizer
+from sparseml.pytorch.sparsification.distillation import (
+    TEACHER_CACHE_KEY_BY_HASH,
+    TeacherOutputsCache,
+)
 from sparseml.pytorch.utils import (
     GradSampler,
     LoggerManager,
@@ -89,7 +96,13 @@ class RecipeManagerTrainerInterface:
     :param metadata_args A list of arguments to be extracted from training_args
         and passed as metadata for the final, saved recipe.
     :param teacher: teacher model for distillation. Set to 'self' to distill
-        from the loaded model or 'disable' to turn of distillation
+        from the loaded model or 'disable' to turn of distillation. May also be a
+        TeacherOutputsCache to distill from precomputed teacher outputs. The
+        dataset indices of the samples are not available to the trainer, so
+        the cache must be keyed by the hash of the inputs
+    :param concurrent_teacher: True to run the teacher forward pass in a
+        background thread, and a separate CUDA stream on GPU, while the student
+        forward pass runs. Default is False
     :param kwargs: key word arguments passed to the parent class
     """
 
@@ -101,15 +114,27 @@ class RecipeManagerTrainerInterface:
         recipe_args: Optional[Union[Dict[str, Any], str]] = None,
         metadata_args: Optional[List[str]] = None,
         data_args: Optional["DataTrainingArguments"] = None,  # noqa: F821
-        teacher: Optional[Union[Module, str]] = None,
+        teacher: Optional[Union[Module, str, TeacherOutputsCache]] = None,
+        concurrent_teacher: bool = False,
         **kwargs,
     ):
+        if (
+            isinstance(teacher, TeacherOutputsCache)
+            and teacher.key_by != TEACHER_CACHE_KEY_BY_HASH
+        ):
+            raise ValueError(
+                "Trainer only supports teacher outputs caches keyed by "
+                f"{TEACHER_CACHE_KEY_BY_HASH}, given a cache keyed by "
+                f"{teacher.key_by}"
+            )
+
         # instantiate necessary state, like managers, so we can override args
         self.model = model
         self.model_state_path = str(model_state_path)
         self.recipe = recipe
         self.recipe_args = recipe_args
         self.teacher = teacher
+        self.concurrent_teacher = concurrent_teacher
 
         training_args = kwargs.get("args")
         self.metadata = (
@@ -163,11 +188,22 @@ class RecipeManagerTrainerInterface:
         self._model_signature_columns = list(model_signature.parameters.keys())
 
         if self.teacher is not None and teacher not in ("disable", "self"):
-            teacher_signature = inspect.signature(self.teacher.forward)
-            self._teacher_signature_columns = list(teacher_signature.parameters.keys())
+            self._teacher_signature_columns = _get_teacher_signature_columns(
+                self.teacher
+            )
         else:
             self._teacher_signature_columns = None
 
+        # input column names -> (student columns, teacher column name mapping)
+        self._input_columns_cache = {}
+        self._teacher_executor = None
+        self._teacher_device = None
+        self._teacher_stream = None
+
+    def __del__(self):
+        if getattr(self, "_teacher_executor", None) is not None:
+            self._teacher_executor.shutdown(wait=False)
+
     def apply_manager(self, epoch: float, checkpoint: Optional[str]) -> bool:
         """
         Apply the recipe(s) to the model and training/validation process.
@@ -230,6 +266,7 @@ class RecipeManagerTrainerInterface:
         ):
             return False
 
+        self._shutdown_teacher_executor()
         self.manager.finalize(self.model)
         self.manager_finalized = True
         _LOGGER.info("Finalized SparseML recipe argument applied to the model")
@@ -350,42 +387,54 @@ class RecipeManagerTrainerInterface:
         """
         self._check_super_defined("compute_loss")
 
+        student_columns, teacher_columns = self._get_input_columns(inputs)
+        student_inputs = {column: inputs[column] for column in student_columns}
+
         if (
             self.manager is None
             or not self.manager.initialized
             or not self.manager.enabled
             or not self.manager.distillation_modifiers
         ):
-            inputs = {
-                k: inputs[k] for k in inputs if k in self._model_signature_columns
+            return super().compute_loss(
+                model, student_inputs, return_outputs=return_outputs
+            )
+
+        # teacher inputs share the batch tensors, only the dict is rebuilt
+        teacher_inputs = (
+            {
+                teacher_column: inputs[column]
+                for column, teacher_column in teacher_columns
             }
-            return super().compute_loss(model, inputs, return_outputs=return_outputs)
+            if teacher_columns is not None
+            else None  # pass all inputs
+        )
 
-        student_inputs = {
-            k: inputs[k] for k in inputs if k in self._model_signature_columns
-        }
+        teacher_future = (
+            self._start_teacher_forward(model, student_inputs, teacher_inputs)
+            if self.concurrent_teacher
+            else None
+        )
         student_outputs = model(**student_inputs)
-        if any(_get_teacher_base_column_name(column) for column in inputs):
-            # inputs from teacher tokenizer available
-            teacher_inputs = {}
-            for column_name, column_data in inputs.items():
-                teacher_column_name = _get_teacher_base_column_name(column_name)
-                if not teacher_column_name or (
-                    self._teacher_signature_columns
-                    and teacher_column_name not in self._teacher_signature_columns
-                ):
-                    continue  # not valid teacher column name or no forward match
-                teacher_inputs[teacher_column_name] = column_data
-        elif self._teacher_signature_columns is not None:
-            # select from main student inputs
-            teacher_inputs = {
-                k: inputs[k] for k in inputs if k in self._teacher_signature_columns
-            }
-        else:
-            # pass all inputs
-            teacher_inputs = None
+        teacher_outputs = (
+            self._finish_teacher_forward(teacher_future)
+            if teacher_future is not None
+            else None
+        )
 
         loss = student_outputs["loss"]
+        if (
+            isinstance(self.teacher, TeacherOutputsCache)
+            and model.training
+            and self._ready_distillation_modifiers()
+        ):
+            # read the precomputed teacher outputs rather than running the teacher,
+            # eval batches and steps outside of distillation skip the lookup
+            teacher_outputs = self.teacher.lookup(
+                inputs=teacher_inputs if teacher_inputs is not None else student_inputs,
+                device=loss.device,
+            )
+
         loss = self.manager.loss_update(
             loss,
             model,
@@ -395,10 +444,118 @@ class RecipeManagerTrainerInterface:
             student_outputs=student_outputs,
             student_inputs=student_inputs,
             teacher_inputs=teacher_inputs,
+            teacher_outputs=teacher_outputs,
         )
 
         return (loss, student_outputs) if return_outputs else loss
 
+    def _get_input_columns(
+        self, inputs: Dict[str, Any]
+    ) -> Tuple[List[str], Optional[List[Tuple[str, str]]]]:
+        # column selection only depends on the input names, so match them once
+        # per set of names rather than on every step
+        column_names = tuple(inputs.keys())
+
+        if column_names in self._input_columns_cache:
+            return self._input_columns_cache[column_names]
+
+        model_columns = set(self._model_signature_columns)
+        student_columns = [name for name in column_names if name in model_columns]
+
+        if any(_get_teacher_base_column_name(column) for column in column_names):
+            # inputs from teacher tokenizer available
+            teacher_columns = []
+            for column_name in column_names:
+                teacher_column_name = _get_teacher_base_column_name(column_name)
+                if not teacher_column_name or (
+                    self._teacher_signature_columns
+                    and teacher_column_name not in self._teacher_signature_columns
+                ):
+                    continue  # not valid teacher column name or no forward match
+                teacher_columns.append((column_name, teacher_column_name))
+        elif self._teacher_signature_columns is not None:
+            # select from main student inputs
+            teacher_columns = [
+                (name, name)
+                for name in column_names
+                if name in self._teacher_signature_columns
+            ]
+        else:
+            teacher_columns = None
+
+        self._input_columns_cache[column_names] = (student_columns, teacher_columns)
+
+        return student_columns, teacher_columns
+
+    def _start_teacher_forward(
+        self,
+        model: Module,
+        student_inputs: Dict[str, Any],
+        teacher_inputs: Optional[Dict[str, Any]],
+    ) -> Optional[Future]:
+        if isinstance(self.teacher, TeacherOutputsCache):
+            return None
+
+        modifiers = self._ready_distillation_modifiers()
+
+        if len(modifiers) != 1:
+            # nothing to run or ambiguous teacher, let loss_update handle it
+            return None
+
+        if self._teacher_executor is None:
+            # inputs are placed on args.device, resolve the device and stream once
+            self._teacher_executor = ThreadPoolExecutor(max_workers=1)
+            self._teacher_device = torch.device(self.args.device)
+
+            if self._teacher_device.type == "cuda":
+                self._teacher_stream = torch.cuda.Stream(self._teacher_device)
+
+        # copy the model for self distillation before the student forward runs
+        modifiers[0].prepare_teacher(model, self._teacher_device)
+        stream = self._teacher_stream
+        # autocast state is thread local, carry it over to the teacher thread
+        autocast = _current_autocast(self._teacher_device)
+
+        if stream is not None:
+            # the teacher must see the inputs written by the current stream
+            stream.wait_stream(torch.cuda.current_stream(self._teacher_device))
+
+        def _forward():
+            with ExitStack() as stack:
+                if stream is not None:
+                    stack.enter_context(torch.cuda.stream(stream))
+
+                if autocast is not None:
+                    stack.enter_context(autocast())
+
+                return modifiers[0].teacher_forward(
+                    model, student_inputs, teacher_inputs
+                )
+
+        return self._teacher_executor.submit(_forward)
+
+    def _ready_distillation_modifiers(self) -> List[Any]:
+        return [
+            mod
+            for mod in self.manager.distillation_modifiers
+            if mod.update_ready(self.state.epoch, self.manager_steps_per_epoch)
+        ]
+
+    def _finish_teacher_forward(self, teacher_future: Future) -> Any:
+        teacher_outputs = teacher_future.result()
+
+        if self._teacher_stream is not None:
+            current_stream = torch.cuda.current_stream(self._teacher_device)
+            current_stream.wait_stream(self._teacher_stream)
+            _record_stream(teacher_outputs, current_stream)
+
+        return teacher_outputs
+
+    def _shutdown_teacher_executor(self):
+        if self._teacher_executor is not None:
+            self._teacher_executor.shutdown(wait=True)
+            self._teacher_executor = None
+
     def prediction_step(
         self,
         model: Module,
@@ -717,7 +874,9 @@ class TrainerInterface(RecipeManagerTrainerInterface):
     :param metadata_args A list of arguments to be extracted from training_args
         and passed as metadata for the final, saved recipe.
     :param teacher: teacher model for distillation. Set to 'self' to distill
-        from the loaded model or 'disable' to turn of distillation
+        from the loaded model or 'disable' to turn of distillation. May also be a
+        TeacherOutputsCache, keyed by the hash of the inputs, to distill from
+        precomputed teacher outputs
     :param kwargs: key word arguments passed to the parent class
     """
 
@@ -728,7 +887,7 @@ class TrainerInterface(RecipeManagerTrainerInterface):
         recipe: Optional[str],
         recipe_args: Optional[Union[Dict[str, Any], str]] = None,
         metadata_args: Optional[List[str]] = None,
-        teacher: Optional[Union[Module, str]] = None,
+        teacher: Optional[Union[Module, str, TeacherOutputsCache]] = None,
         **kwargs,
     ):
 
@@ -837,7 +996,9 @@ class Trainer(TrainerInterface, TransformersTrainer):
         arguments to override the root arguments within the recipe such as
         learning rate or num epochs
     :param teacher: teacher model for distillation. Set to 'self' to distill
-        from the loaded model or 'disable' to turn of distillation
+        from the loaded model or 'disable' to turn of distillation. May also be a
+        TeacherOutputsCache, keyed by the hash of the inputs, to distill from
+        precomputed teacher outputs
     :param kwargs: key word arguments passed to the parent class
     """
 
@@ -847,7 +1008,7 @@ class Trainer(TrainerInterface, TransformersTrainer):
         model_state_path: str,
         recipe: Optional[str],
         recipe_args: Optional[Union[Dict[str, Any], str]] = None,
-        teacher: Optional[Union[Module, str]] = None,
+        teacher: Optional[Union[Module, str, TeacherOutputsCache]] = None,
         **kwargs,
     ):
         super().__init__(
@@ -872,8 +1033,9 @@ class Trainer(TrainerInterface, TransformersTrainer):
             model_signature = inspect.signature(self.model.forward)
             model_signature_columns = set(model_signature.parameters.keys())
 
-            teacher_signature = inspect.signature(self.teacher.forward)
-            teacher_signature_columns = set(teacher_signature.parameters.keys())
+            teacher_signature_columns = set(
+                _get_teacher_signature_columns(self.teacher)
+            )
 
             self._signature_columns = list(
                 model_signature_columns | teacher_signature_columns
@@ -956,6 +1118,51 @@ class DisableHalfPrecisionCallback(TrainerCallback):
             _LOGGER.info(self.trainer.model)
 
 
+def _current_autocast(device: torch.device) -> Optional[Callable[[], Any]]:
+    # returns a constructor for the autocast context active on this thread
+    if device.type == "cuda":
+        if not torch.is_autocast_enabled():
+            return None
+
+        dtype = (
+            torch.get_autocast_gpu_dtype()
+            if hasattr(torch, "get_autocast_gpu_dtype")
+            else torch.float16
+        )
+    elif hasattr(torch, "is_autocast_cpu_enabled") and torch.is_autocast_cpu_enabled():
+        dtype = torch.get_autocast_cpu_dtype()
+    else:
+        return None
+
+    if hasattr(torch, "autocast"):
+        return partial(torch.autocast, device.type, dtype=dtype)
+
+    return torch.cuda.amp.autocast
+
+
+def _record_stream(outputs: Any, stream: "torch.cuda.Stream"):
+    # mark tensors created on the teacher stream as used by the given stream
+    # so their memory is not reused before the student side is done with them
+    if isinstance(outputs, torch.Tensor):
+        outputs.record_stream(stream)
+    elif isinstance(outputs, dict):
+        for value in outputs.values():
+            _record_stream(value, stream)
+    elif isinstance(outputs, (list, tuple)):
+        for value in outputs:
+            _record_stream(value, stream)
+
+
+def _get_teacher_signature_columns(
+    teacher: Union[Module, TeacherOutputsCache]
+) -> List[str]:
+    if isinstance(teacher, TeacherOutputsCache):
+        return list(teacher.input_keys or [])
+
+    teacher_signature = inspect.signature(teacher.forward)
+    return list(teacher_signature.parameters.keys())
+
+
 def _get_teacher_base_column_name(column_name: str) -> Optional[str]:
     # if column was created by teacher tokenizer, return the base name
     if not column_name.startswith("distill_teacher:"):
@@ -19,12 +19,18 @@ Common functions for interfacing with python primitives and directories/files.
 
 import errno
 import fnmatch
+import glob
+import io
 import json
 import logging
 import os
 import sys
+import tarfile
+import threading
+import weakref
 from collections import OrderedDict
-from typing import Any, Callable, Dict, Iterable, List, Tuple, Union
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, Tuple, Union
 from urllib.parse import urlparse
 
 import numpy
@@ -57,6 +63,7 @@ __all__ = [
     "load_numpy",
     "save_numpy",
     "load_labeled_data",
+    "LazyLabeledData",
     "NumpyArrayBatcher",
     "tensor_export",
     "tensors_export",
@@ -486,11 +493,17 @@ def load_labeled_data(
         None, str, Iterable[Union[str, numpy.ndarray, Dict[str, numpy.ndarray]]]
     ],
     raise_on_error: bool = True,
-) -> List[
-    Tuple[
-        Union[numpy.ndarray, Dict[str, numpy.ndarray]],
-        Union[None, numpy.ndarray, Dict[str, numpy.ndarray]],
-    ]
+    lazy: bool = False,
+    cache_size: int = 128,
+    read_ahead: int = 0,
+) -> Union[
+    List[
+        Tuple[
+            Union[numpy.ndarray, Dict[str, numpy.ndarray]],
+            Union[None, numpy.ndarray, Dict[str, numpy.ndarray]],
+        ]
+    ],
+    "LazyLabeledData",
 ]:
     """
     Load labels and data from disk or from memory and group them together.
@@ -502,10 +515,21 @@ def load_labeled_data(
     :param labels: the file glob, file path to numpy data tar ball, or list of arrays
         to use for labels, if any
     :param raise_on_error: True to raise on any error that occurs;
-        False to log a warning, ignore, and continue
+        False to log a warning, ignore, and continue.
+        Not used if lazy, errors are raised when the item is accessed instead
+    :param lazy: True to only index the files and read each item from disk when
+        it is accessed through a LazyLabeledData instance, False to load everything
+        into memory up front. Default is False
+    :param cache_size: if lazy, the number of items to keep in memory
+    :param read_ahead: if lazy, the number of items after an accessed item to
+        read ahead of time in background threads
     :return: a list containing tuples of the data, labels. If labels was passed in
-        as None, will now contain a None for the second index in each tuple
+        as None, will now contain a None for the second index in each tuple.
+        A LazyLabeledData that reads the tuples on access if lazy
     """
+    if lazy:
+        return LazyLabeledData(data, labels, cache_size, read_ahead)
+
     if isinstance(data, str):
         data = load_numpy_list(data)
 
@@ -542,6 +566,200 @@ def load_labeled_data(
     return labeled_data
 
 
+_TarMember = NamedTuple("_TarMember", [("path", str), ("offset", int), ("size", int)])
+
+
+def _index_numpy_sources(
+    data: Union[str, Iterable[Union[str, numpy.ndarray, Dict[str, numpy.ndarray]]]]
+) -> List[Union[str, _TarMember, numpy.ndarray, Dict[str, numpy.ndarray]]]:
+    # mirrors the loading logic of load_numpy_list without reading the files
+    if not isinstance(data, str):
+        return list(data)
+
+    if os.path.isfile(data) and tarfile.is_tarfile(data):
+        try:
+            # only uncompressed tar balls can be read from at random
+            with tarfile.open(data, "r:") as tar:
+                members = sorted(tar.getmembers(), key=lambda member: member.name)
+        except tarfile.ReadError:
+            _LOGGER.warning(
+                "compressed tar ball {} can not be read lazily, loading it".format(data)
+            )
+            return load_numpy_list(data)
+
+        return [
+            _TarMember(data, member.offset_data, member.size)
+            for member in members
+            if member.isfile()
+        ]
+
+    if os.path.isfile(data) and ".np" in data:
+        return [data]
+
+    glob_path = os.path.join(data, "*") if os.path.isdir(data) else data
+
+    return sorted(glob.glob(glob_path))
+
+
+def _load_numpy_source(
+    source: Union[None, str, _TarMember, numpy.ndarray, Dict[str, numpy.ndarray]]
+) -> Union[None, numpy.ndarray, Dict[str, numpy.ndarray]]:
+    if isinstance(source, str):
+        return load_numpy(source)
+
+    if isinstance(source, _TarMember):
+        with open(source.path, "rb") as file:
+            file.seek(source.offset)
+            array = numpy.load(io.BytesIO(file.read(source.size)))
+
+        if not isinstance(array, numpy.ndarray):
+            array = OrderedDict([(key, val) for key, val in array.items()])
+
+        return array
+
+    return source
+
+
+class LazyLabeledData(object):
+    """
+    Sequence of (data, label) tuples, as returned from load_labeled_data,
+    that indexes the numpy files for the data and labels up front and only reads
+    an item from disk when it is accessed so memory use does not grow with the
+    size of the dataset.
+    Recently accessed items are kept in an LRU cache and the items following an
+    accessed index can be read ahead of time in background threads.
+
+    :param data: the file glob, file path to numpy data tar ball, or list of arrays to
+        use for data
+    :param labels: the file glob, file path to numpy data tar ball, or list of arrays
+        to use for labels, if any
+    :param cache_size: the number of (data, label) items to keep in memory
+    :param read_ahead: the number of items after an accessed index to read ahead
+        of time in background threads, wrapping around to the start of the data.
+        Default is 0 to only read items when they are accessed
+    """
+
+    def __init__(
+        self,
+        data: Union[str, Iterable[Union[str, numpy.ndarray, Dict[str, numpy.ndarray]]]],
+        labels: Union[
+            None, str, Iterable[Union[str, numpy.ndarray, Dict[str, numpy.ndarray]]]
+        ],
+        cache_size: int = 128,
+        read_ahead: int = 0,
+    ):
+        self._data = _index_numpy_sources(data)
+        self._labels = (
+            _index_numpy_sources(labels)
+            if labels is not None
+            else [None for _ in range(len(self._data))]
+        )
+
+        if len(self._data) != len(self._labels):
+            raise ValueError(
+                "len(data) given of {} does not match len(labels) given of {}".format(
+                    len(self._data), len(self._labels)
+                )
+            )
+
+        self._read_ahead = read_ahead
+        # the cache must be able to hold everything read ahead to be useful
+        self._cache_size = max(cache_size, read_ahead + 1)
+        self._cache = OrderedDict()  # type: Dict[int, Tuple[Any, Any]]
+        self._pending = {}  # type: Dict[int, Future]
+        self._lock = threading.Lock()
+        self._executor = None
+
+        if read_ahead > 0:
+            self._executor = ThreadPoolExecutor(
+                max_workers=min(read_ahead, os.cpu_count() or 1)
+            )
+            weakref.finalize(self, self._executor.shutdown, wait=False)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __getitem__(
+        self, index: int
+    ) -> Tuple[
+        Union[numpy.ndarray, Dict[str, numpy.ndarray]],
+        Union[None, numpy.ndarray, Dict[str, numpy.ndarray]],
+    ]:
+        if index < 0:
+            index += len(self)
+
+        if index < 0 or index >= len(self):
+            raise IndexError(
+                "index {} out of range for {} items".format(index, len(self))
+            )
+
+        with self._lock:
+            item = self._cache.get(index)
+
+            if item is not None:
+                self._cache.move_to_end(index)
+
+            future = self._pending.pop(index, None) if item is None else None
+
+        if item is None:
+            item = future.result() if future is not None else self._load(index)
+
+            with self._lock:
+                self._cache_item(index, item)
+
+        self._schedule_read_ahead(index)
+
+        return item
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+    @property
+    def cache_size(self) -> int:
+        """
+        :return: the number of (data, label) items to keep in memory
+        """
+        return self._cache_size
+
+    @property
+    def read_ahead(self) -> int:
+        """
+        :return: the number of items after an accessed index to read ahead
+            of time in background threads
+        """
+        return self._read_ahead
+
+    def _load(self, index: int) -> Tuple[Any, Any]:
+        return (
+            _load_numpy_source(self._data[index]),
+            _load_numpy_source(self._labels[index]),
+        )
+
+    def _cache_item(self, index: int, item: Tuple[Any, Any]):
+        self._cache[index] = item
+        self._cache.move_to_end(index)
+
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+
+    def _schedule_read_ahead(self, index: int):
+        if self._executor is None:
+            return
+
+        window = [
+            (index + offset) % len(self) for offset in range(1, self._read_ahead + 1)
+        ]
+
+        with self._lock:
+            for stale in [idx for idx in self._pending if idx not in window]:
+                self._pending.pop(stale).cancel()
+
+            for idx in window:
+                if idx not in self._cache and idx not in self._pending:
+                    self._pending[idx] = self._executor.submit(self._load, idx)
+
+
 class NumpyArrayBatcher(object):
     """
     Batcher instance to handle taking in dictionaries of numpy arrays,
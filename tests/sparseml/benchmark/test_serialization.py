@@ -14,6 +14,7 @@
 
 from typing import Any, Dict
 
+import numpy
 import pytest
 
 from sparseml.benchmark.serialization import (
@@ -21,6 +22,8 @@ from sparseml.benchmark.serialization import (
     BenchmarkConfig,
     BenchmarkInfo,
     BenchmarkResult,
+    BenchmarkResultTracker,
+    LatencyHistogram,
 )
 
 
@@ -501,6 +504,19 @@ def test_benchmark_result_schema(data: Dict[str, Any], expect_error: bool):
                 ms_per_item=2000,
                 num_items=1,
                 num_batches=1,
+                batch_times_percentiles={
+                    "p50": 2.0,
+                    "p90": 2.0,
+                    "p95": 2.0,
+                    "p99": 2.0,
+                    "p99.9": 2.0,
+                },
+                batch_times_trimmed_mean=2.0,
+                num_outliers=0,
+                num_warmup_batches=0,
+                num_streams=1,
+                concurrent_items_per_second=None,
+                concurrent_batches_per_second=None,
             ),
         ),
         (
@@ -559,6 +575,16 @@ def test_benchmark_result_schema(data: Dict[str, Any], expect_error: bool):
                 ms_per_item=14 * 1e3 / (96),
                 num_items=96,
                 num_batches=3,
+                batch_times_percentiles=pytest.approx(
+                    {"p50": 4.0, "p90": 7.2, "p95": 7.6, "p99": 7.92, "p99.9": 7.992},
+                    rel=0.01,
+                ),
+                batch_times_trimmed_mean=14 / 3,
+                num_outliers=0,
+                num_warmup_batches=0,
+                num_streams=1,
+                concurrent_items_per_second=None,
+                concurrent_batches_per_second=None,
             ),
         ),
     ],
@@ -567,7 +593,8 @@ def test_benchmark_result_from_results(
     results: Dict[str, Any], expected_output: Dict[str, Any]
 ):
     schema = BenchmarkResult.from_results(**results)
-    assert schema.dict() == expected_output
+    assert schema.dict(exclude={"batch_times_histogram"}) == expected_output
+    assert schema.batch_times_histogram.count == expected_output["num_batches"]
 
 
 # Test serialization of BenchmarkConfig
@@ -780,3 +807,80 @@ def test_benchmark_config(data: Dict[str, Any], expect_error: bool):
 )
 def test_benchmark_info(data: Dict[str, Any], expect_error: bool):
     _test_serialization(BenchmarkInfo, data, expect_error)
+
+
+@pytest.mark.parametrize("relative_accuracy", [0.01, 0.05])
+def test_latency_histogram(relative_accuracy: float):
+    values = numpy.random.lognormal(mean=-4.0, sigma=1.0, size=5000)
+    histogram = LatencyHistogram(relative_accuracy=relative_accuracy)
+    other = LatencyHistogram(relative_accuracy=relative_accuracy)
+
+    for val in values[:2500]:
+        histogram.add(val)
+    for val in values[2500:]:
+        other.add(val)
+    histogram.merge(other)
+
+    assert histogram.count == len(values)
+    assert histogram.mean == pytest.approx(numpy.mean(values))
+    assert histogram.minimum == values.min()
+    assert histogram.maximum == values.max()
+    # bucket count depends on the range of the values, not how many were added
+    assert len(histogram.counts) < 500
+
+    for percentile in [0.0, 25.0, 50.0, 90.0, 99.0, 99.9, 100.0]:
+        expected = numpy.percentile(values, percentile)
+        assert histogram.percentile(percentile) == pytest.approx(
+            expected, rel=relative_accuracy
+        )
+
+    assert set(histogram.percentiles().keys()) == {"p50", "p90", "p95", "p99", "p99.9"}
+
+    trimmed_mean, num_outliers = histogram.trimmed_mean()
+    assert num_outliers > 0
+    assert trimmed_mean < histogram.mean
+
+    loaded = LatencyHistogram.parse_raw(histogram.json())
+    assert loaded.percentile(99.0) == histogram.percentile(99.0)
+
+    with pytest.raises(ValueError):
+        histogram.merge(LatencyHistogram(relative_accuracy=0.1))
+
+
+def test_benchmark_result_tracker():
+    # slow warm up batches followed by steady batches with rare spikes
+    batch_times = [1.0 - 0.09 * index for index in range(10)]
+    batch_times += [0.1 if index % 50 else 0.5 for index in range(1, 501)]
+    kept = BenchmarkResultTracker(batch_size=4, detect_warmup=True)
+    streamed = BenchmarkResultTracker(
+        batch_size=4, keep_results=False, detect_warmup=True
+    )
+
+    for batch_time in batch_times:
+        kept.add(batch_time)
+        streamed.add(batch_time)
+
+    kept_result = kept.to_result()
+    streamed_result = streamed.to_result()
+
+    for result in [kept_result, streamed_result]:
+        assert 10 <= result.num_warmup_batches < 30
+        assert result.num_batches == len(batch_times) - result.num_warmup_batches
+        assert result.num_items == 4 * result.num_batches
+        assert result.num_outliers == 10
+        assert result.batch_times_trimmed_mean == pytest.approx(0.1, rel=0.01)
+        assert result.batch_times_percentiles["p50"] == pytest.approx(0.1, rel=0.01)
+        assert result.batch_times_percentiles["p99.9"] == pytest.approx(0.5, rel=0.01)
+
+    assert len(kept_result.results) == kept_result.num_batches
+    assert streamed_result.results == []
+    assert streamed_result.batch_times_mean == pytest.approx(
+        kept_result.batch_times_mean
+    )
+    assert streamed_result.batch_times_std == pytest.approx(kept_result.batch_times_std)
+    assert streamed_result.items_per_second == pytest.approx(
+        kept_result.items_per_second
+    )
+
+    loaded = BenchmarkResult.parse_raw(streamed_result.json())
+    assert loaded.batch_times_histogram == streamed_result.batch_times_histogram
@@ -339,3 +339,60 @@ class TestOrtBenchmarkRunner:
         assert config.framework_args == cpu_runner_fixture.framework_args
         assert config.device == cpu_runner_fixture.device
         assert config.inference_provider == cpu_runner_fixture.inference_provider
+
+
+def _matmul_model() -> onnx.ModelProto:
+    graph = onnx.helper.make_graph(
+        [onnx.helper.make_node("MatMul", ["X", "weight"], ["Y"], name="matmul")],
+        "test-model",
+        [onnx.helper.make_tensor_value_info("X", onnx.TensorProto.FLOAT, [1, 16])],
+        [onnx.helper.make_tensor_value_info("Y", onnx.TensorProto.FLOAT, [1, 8])],
+        initializer=[
+            onnx.numpy_helper.from_array(
+                numpy.random.randn(16, 8).astype(numpy.float32), name="weight"
+            )
+        ],
+    )
+
+    return onnx.helper.make_model(graph)
+
+
+def test_ort_benchmark_runner_num_streams():
+    runner = ORTBenchmarkRunner(
+        _matmul_model(),
+        batch_size=1,
+        iterations=8,
+        warmup_iterations=2,
+        framework_args={"num_streams": 2},
+    )
+    assert runner._model_runner.num_streams == 2
+
+    results = runner.run(None)
+    assert isinstance(results, BenchmarkResult)
+    assert results.num_batches == 8
+    assert results.num_items == 8
+    assert results.num_streams == 2
+    assert results.concurrent_items_per_second > 0.0
+    assert results.concurrent_batches_per_second > 0.0
+    # the per batch stats are all derived from the batch latencies
+    assert results.batches_per_second == pytest.approx(1e3 / results.ms_per_batch)
+    assert results.items_per_second == pytest.approx(1e3 / results.ms_per_item)
+
+
+@pytest.mark.parametrize("num_streams", [1, 2])
+def test_ort_benchmark_runner_short_data(num_streams):
+    model = _matmul_model()
+    runner = ORTBenchmarkRunner(
+        model,
+        batch_size=1,
+        iterations=8,
+        warmup_iterations=2,
+        framework_args={"num_streams": num_streams},
+    )
+
+    # all of the data is used up by the warmup iterations
+    with pytest.raises(ValueError):
+        runner.run(DataLoader.from_model_random(model, 1, iter_steps=1))
+
+    results = runner.run(DataLoader.from_model_random(model, 1, iter_steps=3))
+    assert results.num_batches == 1
@@ -17,7 +17,11 @@ import os
 import numpy as np
 import pytest
 
-from sparseml.onnx.optim.quantization.calibration import CalibrationSession
+from sparseml.onnx.optim.quantization.calibration import (
+    CALIBRATION_MODES,
+    CalibrationSession,
+    CalibrationStatistics,
+)
 from tests.sparseml.onnx.optim.quantization.helpers import (
     make_tmp_onnx_file,
     onnx_conv_net,
@@ -83,15 +87,19 @@ def test_augmented_graph(model_lambda, static):
         (onnx_linear_net, [(20, 20)], np.float32, ["input"], False),
     ],
 )
+@pytest.mark.parametrize("calibration_mode", CALIBRATION_MODES)
 def test_full_calibration_session(
-    model_lambda, inputs_shape, inputs_dtype, input_names, static
+    model_lambda, inputs_shape, inputs_dtype, input_names, static, calibration_mode
 ):
     model = model_lambda()
     model_path = make_tmp_onnx_file(model)
 
     calibrate_op_types = ["Conv", "MatMul"]
     calibrator = CalibrationSession(
-        model_path, calibrate_op_types=calibrate_op_types, static=static
+        model_path,
+        calibrate_op_types=calibrate_op_types,
+        static=static,
+        calibration_mode=calibration_mode,
     )
 
     # Run calibration
@@ -124,4 +132,83 @@ def test_full_calibration_session(
         assert isinstance(zero_pt, np.uint8)
         assert isinstance(scale, np.float32)
 
+    # check that the selected ranges are within the ranges seen
+    thresholds = calibrator.get_quantization_thresholds()
+    for name, (range_min, range_max) in thresholds.items():
+        stats = calibrator.calibration_stats[name]
+        assert stats.num_batches == 5
+        assert stats.min <= range_min <= range_max <= stats.max
+
     os.remove(model_path)
+
+
+def test_calibration_statistics():
+    stats = CalibrationStatistics(num_bins=256, averaging_constant=0.5)
+    batches = [
+        np.random.randn(8, 32).astype(np.float32) * scale
+        for scale in [1.0, 0.1, 4.0, 2.0, 20.0]
+    ]
+    batches[1][:] = 0.0  # all zero batch before the histogram range is set
+
+    for batch in batches:
+        stats.update(batch.min(), batch.max(), batch)
+
+    values = np.concatenate(batches)
+    moving_average_min = batches[0].min()
+    moving_average_max = batches[0].max()
+    for batch in batches[1:]:
+        moving_average_min += 0.5 * (batch.min() - moving_average_min)
+        moving_average_max += 0.5 * (batch.max() - moving_average_max)
+
+    assert stats.num_batches == len(batches)
+    assert stats.range("minmax") == (values.min(), values.max())
+    assert stats.range("moving_average") == pytest.approx(
+        (moving_average_min, moving_average_max)
+    )
+
+    # histogram holds every value and covers the largest one
+    assert stats.histogram.sum() == values.size
+    assert stats.histogram.size == 256
+    assert np.abs(values).max() <= stats.histogram_max
+
+    # percentile threshold is within one bin of the exact percentile
+    bin_width = stats.histogram_max / stats.num_bins
+    expected = np.percentile(np.abs(values), 90.0)
+    range_min, range_max = stats.percentile_range(90.0)
+    assert expected - bin_width <= range_max <= expected + bin_width
+    assert range_min == pytest.approx(max(values.min(), -range_max))
+    assert stats.percentile_range(100.0) == pytest.approx((values.min(), values.max()))
+
+    range_min, range_max = stats.entropy_range()
+    assert values.min() <= range_min < 0 < range_max <= values.max()
+
+
+def test_calibration_statistics_entropy_clips_outliers():
+    stats = CalibrationStatistics()
+    for _ in range(4):
+        batch = np.random.randn(64, 64).astype(np.float32)
+        stats.update(batch.min(), batch.max(), batch)
+    outlier = np.array([30.0], dtype=np.float32)
+    stats.update(0.0, outlier.max(), outlier)
+
+    _, range_max = stats.entropy_range()
+    assert range_max < 10.0
+    assert stats.range("minmax")[1] == 30.0
+
+
+def test_calibration_statistics_errors():
+    with pytest.raises(ValueError):
+        CalibrationStatistics(num_bins=255)
+
+    stats = CalibrationStatistics()
+    with pytest.raises(ValueError):
+        stats.range("minmax")
+
+    stats.update(-1.0, 1.0)
+    with pytest.raises(ValueError):
+        stats.range("percentile")
+    with pytest.raises(ValueError):
+        stats.range("unknown")
+
+    with pytest.raises(ValueError):
+        CalibrationSession("model.onnx", calibration_mode="unknown")
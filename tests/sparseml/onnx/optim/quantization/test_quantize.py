@@ -0,0 +1,117 @@
+# Copyright (c) 2021 - present / Neuralmagic, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import numpy as np
+import onnx
+import pytest
+from onnx import TensorProto
+
+from sparseml.onnx.optim.quantization.quantize import quantize, quantize_data
+from tests.sparseml.onnx.optim.quantization.helpers import (
+    onnx_conv_net,
+    onnx_linear_net,
+)
+
+
+def _get_init(model, name):
+    return next(init for init in model.graph.initializer if init.name == name)
+
+
+def _reference_quantize(data, quantize_range, qType):
+    # element by element list implementation the vectorized version must match
+    rmin = min(min(data), 0)
+    rmax = max(max(data), 0)
+    max_range = max(abs(rmin), abs(rmax))
+    scale = (float(max_range) * 2) / quantize_range
+    zero_point = 0 if qType == TensorProto.INT8 else 128
+    quantized = (np.asarray(data) / scale).round() + zero_point
+
+    return (
+        rmin,
+        rmax,
+        zero_point,
+        scale,
+        quantized.astype("b" if qType == TensorProto.INT8 else "B"),
+    )
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_QUANTIZATION_TESTS", False),
+    reason="Skipping quantization tests",
+)
+@pytest.mark.parametrize(
+    "qType,quantize_range", [(TensorProto.INT8, 254), (TensorProto.UINT8, 255)]
+)
+def test_quantize_data(qType, quantize_range):
+    data = np.random.randn(1000).astype(np.float32).tolist()
+    expected = _reference_quantize(data, quantize_range, qType)
+    rmin, rmax, zero_point, scale, quantized = quantize_data(
+        data, quantize_range, qType
+    )
+
+    assert (rmin, rmax, zero_point, scale) == expected[:4]
+    assert quantized.dtype == expected[4].dtype
+    assert np.array_equal(quantized, expected[4])
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_QUANTIZATION_TESTS", False),
+    reason="Skipping quantization tests",
+)
+@pytest.mark.parametrize(
+    "model_lambda,weight_name,per_channel",
+    [
+        (onnx_linear_net, "matmul1.weight", False),
+        (onnx_conv_net, "conv1.weight", False),
+        (onnx_conv_net, "conv1.weight", True),
+    ],
+)
+@pytest.mark.parametrize("symmetric_weight", [False, True])
+@pytest.mark.parametrize("num_threads", [1, 4])
+def test_quantize_weights(
+    model_lambda, weight_name, per_channel, symmetric_weight, num_threads
+):
+    model = model_lambda()
+    weights = onnx.numpy_helper.to_array(_get_init(model, weight_name))
+    quantized_model = quantize(
+        model,
+        per_channel=per_channel,
+        symmetric_weight=symmetric_weight,
+        num_threads=num_threads,
+    )
+    assert weight_name not in [init.name for init in quantized_model.graph.initializer]
+
+    qType = TensorProto.INT8 if symmetric_weight else TensorProto.UINT8
+    quantize_range = 254 if symmetric_weight else 255
+    rows = weights.reshape(weights.shape[0] if per_channel else 1, -1)
+    expected = [
+        _reference_quantize(row.tolist(), quantize_range, qType) for row in rows
+    ]
+    quantized = onnx.numpy_helper.to_array(
+        _get_init(quantized_model, weight_name + "_quantized")
+    )
+    scales = onnx.numpy_helper.to_array(
+        _get_init(quantized_model, weight_name + "_scale")
+    )
+    zero_points = onnx.numpy_helper.to_array(
+        _get_init(quantized_model, weight_name + "_zero_point")
+    )
+
+    assert np.array_equal(
+        quantized, np.stack([exp[4] for exp in expected]).reshape(weights.shape)
+    )
+    assert np.allclose(scales.flatten(), [exp[3] for exp in expected])
+    assert np.array_equal(zero_points.flatten(), [exp[2] for exp in expected])
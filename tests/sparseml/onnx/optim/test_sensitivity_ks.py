@@ -15,17 +15,26 @@
 import os
 from typing import Any, Dict, List, NamedTuple, Union
 
+import numpy
+import onnx
 import pytest
+import torch
+from onnx import TensorProto, numpy_helper
+from onnx.helper import make_graph, make_model, make_node, make_tensor_value_info
 
 from flaky import flaky
 from sparseml.onnx.optim.sensitivity_pruning import (
     PruningLossSensitivityAnalysis,
+    _ActivationCache,
     pruning_loss_sens_magnitude,
     pruning_loss_sens_one_shot,
+    pruning_loss_sens_one_shot_iter,
     pruning_perf_sens_one_shot,
 )
 from sparseml.onnx.utils.data import DataLoader
+from sparseml.pytorch.utils import ModuleExporter
 from tests.sparseml.onnx.helpers import GENERATE_TEST_FILES, OnnxRepoModelFixture
+from tests.sparseml.pytorch.helpers import ConvNet, MLPNet
 
 
 from tests.sparseml.onnx.helpers import onnx_repo_models  # noqa isort: skip
@@ -277,3 +286,134 @@ def test_one_shot_ks_perf_sensitivity(
     )
 
     _test_analysis_comparison(expected_layers, actual_layers, True)
+
+
+@pytest.mark.parametrize(
+    "model_function,sample_batch",
+    [(MLPNet, torch.randn(1, 8)), (ConvNet, torch.randn(1, 3, 3, 3))],
+)
+@pytest.mark.parametrize("use_cache_dir", [False, True])
+def test_one_shot_ks_loss_sensitivity_cache_activations(
+    model_function, sample_batch, use_cache_dir, tmp_path
+):
+    ModuleExporter(model_function(), str(tmp_path)).export_onnx(
+        sample_batch=sample_batch
+    )
+    model_path = os.path.join(str(tmp_path), "model.onnx")
+    dataloader = DataLoader.from_model_random(model_path, 1, iter_steps=-1)
+    cache_dir = os.path.join(str(tmp_path), "cache")
+    os.makedirs(cache_dir)
+    sparsity_levels = [0.0, 0.5, 0.9]
+
+    expected = pruning_loss_sens_one_shot(
+        model_path, dataloader, 1, 2, sparsity_levels, show_progress=False
+    )
+    cached = pruning_loss_sens_one_shot(
+        model_path,
+        dataloader,
+        1,
+        2,
+        sparsity_levels,
+        show_progress=False,
+        cache_activations=True,
+        activation_cache_dir=cache_dir if use_cache_dir else None,
+    )
+
+    assert [res.id_ for res in cached.results] == [res.id_ for res in expected.results]
+
+    for res, expected_res in zip(cached.results, expected.results):
+        for sparsity in sparsity_levels:
+            assert res.averages[sparsity] == pytest.approx(
+                expected_res.averages[sparsity], abs=1e-5
+            )
+
+    assert not os.listdir(cache_dir)
+
+
+def test_one_shot_ks_loss_sensitivity_cache_activations_closed(tmp_path):
+    ModuleExporter(MLPNet(), str(tmp_path)).export_onnx(sample_batch=torch.randn(1, 8))
+    model_path = os.path.join(str(tmp_path), "model.onnx")
+    dataloader = DataLoader.from_model_random(model_path, 1, iter_steps=-1)
+    cache_dir = os.path.join(str(tmp_path), "cache")
+    os.makedirs(cache_dir)
+    analysis_iter = pruning_loss_sens_one_shot_iter(
+        model_path,
+        dataloader,
+        1,
+        2,
+        [0.0, 0.5, 0.9],
+        cache_activations=True,
+        activation_cache_dir=cache_dir,
+    )
+
+    for step, _ in enumerate(analysis_iter):
+        if step == 2:
+            break
+
+    assert os.listdir(cache_dir)
+    analysis_iter.close()
+    assert not os.listdir(cache_dir)
+
+
+def test_activation_cache_inputs_by_name():
+    weight = numpy.random.randn(4, 2).astype(numpy.float32)
+    graph = make_graph(
+        [
+            make_node("Sub", ["a", "b"], ["diff"], name="sub"),
+            make_node("MatMul", ["diff", "weight"], ["out"], name="matmul"),
+        ],
+        "sub_matmul",
+        [
+            make_tensor_value_info("a", TensorProto.FLOAT, [1, 4]),
+            make_tensor_value_info("b", TensorProto.FLOAT, [1, 4]),
+        ],
+        [make_tensor_value_info("out", TensorProto.FLOAT, [1, 2])],
+        initializer=[numpy_helper.from_array(weight, "weight")],
+    )
+    model = make_model(graph)
+    batch = {
+        "b": numpy.random.randn(1, 4).astype(numpy.float32),
+        "a": numpy.random.randn(1, 4).astype(numpy.float32),
+    }
+    expected = numpy.matmul(batch["a"] - batch["b"], weight)
+    cache = _ActivationCache.create(model, [graph.node[1]])
+    outputs = cache.record([(batch, None)], 1)
+
+    assert numpy.allclose(outputs[0]["out"], expected, atol=1e-5)
+    assert numpy.allclose(cache.run(0)[0]["out"], expected, atol=1e-5)
+
+
+def test_ks_loss_sensitivity_external_data(tmp_path):
+    ModuleExporter(MLPNet(), str(tmp_path)).export_onnx(sample_batch=torch.randn(1, 8))
+    model_path = os.path.join(str(tmp_path), "model.onnx")
+    external_path = os.path.join(str(tmp_path), "external", "model.onnx")
+    os.makedirs(os.path.dirname(external_path))
+    onnx.save_model(
+        onnx.load(model_path),
+        external_path,
+        save_as_external_data=True,
+        all_tensors_to_one_file=True,
+        location="model.data",
+        size_threshold=0,
+    )
+    dataloader = DataLoader.from_model_random(model_path, 1, iter_steps=-1)
+    sparsity_levels = [0.0, 0.5, 0.9]
+
+    for analysis_func in [pruning_loss_sens_magnitude, pruning_loss_sens_one_shot]:
+        args = (
+            (dataloader, 1, 2, sparsity_levels)
+            if analysis_func is pruning_loss_sens_one_shot
+            else (sparsity_levels,)
+        )
+        expected = analysis_func(model_path, *args, show_progress=False)
+        external = analysis_func(external_path, *args, show_progress=False)
+
+        assert [res.id_ for res in external.results] == [
+            res.id_ for res in expected.results
+        ]
+
+        for res, expected_res in zip(external.results, expected.results):
+            for sparsity in sparsity_levels:
+                assert res.averages[sparsity] == pytest.approx(
+                    expected_res.averages[sparsity], abs=1e-5
+                )
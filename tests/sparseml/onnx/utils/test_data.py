@@ -240,12 +240,15 @@ def test_dataloader_from_model(
         ),
     ],
 )
+@pytest.mark.parametrize("lazy_load,read_ahead", [(False, 0), (True, 0), (True, 4)])
 def test_dataloader(
     data_shape: Dict[str, Tuple[int, ...]],
     label_shape: Union[None, Dict[str, Tuple[int, ...]]],
     samples: int,
     batch_size: int,
     iter_steps: int,
+    lazy_load: bool,
+    read_ahead: int,
 ):
     with tempfile.TemporaryDirectory() as tempdir:
         data_glob = os.path.join(tempdir, "inp_*.npz")
@@ -268,7 +271,67 @@ def test_dataloader(
 
                 numpy.savez(label_path, **label)
 
-        dataloader = DataLoader(data_glob, label_glob, batch_size, iter_steps)
+        dataloader = DataLoader(
+            data_glob,
+            label_glob,
+            batch_size,
+            iter_steps,
+            lazy_load=lazy_load,
+            read_ahead=read_ahead,
+        )
         _test_dataloader(
             dataloader, data_shape, label_shape, batch_size, iter_steps, samples
         )
+
+
+@pytest.mark.parametrize("prefetch_batches", [0, 2])
+@pytest.mark.parametrize("use_cache_dir", [False, True])
+@pytest.mark.parametrize("contiguous", [True, False])
+def test_dataloader_batches(
+    prefetch_batches: int, use_cache_dir: bool, contiguous: bool, tmp_path
+):
+    samples = 10
+    batch_size = 4
+    iter_steps = 6
+    data = [
+        {
+            "0000": numpy.random.randn(3, 2).astype(numpy.float32),
+            "0001": numpy.random.randn(5),
+        }
+        for _ in range(samples)
+    ]
+
+    if not contiguous:
+        # differing key order can still be batched, but not stored contiguously
+        data[0] = {"0001": data[0]["0001"], "0000": data[0]["0000"]}
+
+    labels = [numpy.random.randn(2) for _ in range(samples)]
+    dataloader = DataLoader(
+        data,
+        labels,
+        batch_size,
+        iter_steps,
+        prefetch_batches=prefetch_batches,
+        data_cache_dir=str(tmp_path) if use_cache_dir else None,
+    )
+    assert dataloader.prefetch_batches == prefetch_batches
+
+    for _ in range(2):
+        steps = 0
+
+        for step, (batch_data, batch_label) in enumerate(dataloader):
+            indices = [(step * batch_size + idx) % samples for idx in range(4)]
+
+            for key in ["0000", "0001"]:
+                expected = numpy.stack([data[index][key] for index in indices])
+                assert numpy.array_equal(batch_data[key], expected)
+
+            expected = numpy.stack([labels[index] for index in indices])
+            assert numpy.array_equal(batch_label["ndarray"], expected)
+            steps += 1
+
+        assert steps == iter_steps
+
+    assert bool(os.listdir(str(tmp_path))) == (use_cache_dir and contiguous)
+    del dataloader
+    assert not os.listdir(str(tmp_path))
@@ -12,7 +12,11 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import threading
+
 import numpy
+import onnx
 import pytest
 from onnx import TensorProto, load_model, numpy_helper
 from onnx.helper import make_graph, make_model, make_node, make_tensor_value_info
@@ -23,12 +27,18 @@ from sparseml.onnx.utils import (
     calculate_flops,
     check_load_model,
     conv_node_params,
+    create_ort_session,
     extract_node_id,
     extract_node_shapes,
+    extract_nodes_shapes_ort,
+    extract_nodes_shapes_shape_inference,
     extract_shape,
     gemm_node_params,
+    get_indexed_graph,
+    get_init_array,
     get_init_by_name,
     get_kernel_shape,
+    get_model_structure_hash,
     get_node_attributes,
     get_node_by_id,
     get_node_input_nodes,
@@ -41,12 +51,15 @@ from sparseml.onnx.utils import (
     get_numpy_dtype,
     get_prunable_node_from_foldable,
     get_prunable_nodes,
+    helpers,
+    indexed_graph_lookups,
     is_foldable_node,
     is_prunable_node,
     matmul_node_params,
     model_inputs,
     model_outputs,
     onnx_nodes_sparsities,
+    update_model_param,
 )
 from sparsezoo import Zoo
 
@@ -156,6 +169,68 @@ def test_check_load_model(onnx_repo_models):  # noqa: F811
     assert loaded_model == check_load_model(loaded_model)
 
 
+@pytest.fixture
+def matmul_onnx_model():
+    graph = make_graph(
+        [
+            make_node("MatMul", ["X", "weight"], ["Y"], name="matmul"),
+            make_node("Add", ["Y", "bias"], ["Z"], name="add"),
+        ],
+        "test-model",
+        [make_tensor_value_info("X", TensorProto.FLOAT, [1, 16])],
+        [make_tensor_value_info("Z", TensorProto.FLOAT, [1, 8])],
+        initializer=[
+            numpy_helper.from_array(
+                numpy.random.randn(16, 8).astype(numpy.float32), name="weight"
+            ),
+            numpy_helper.from_array(
+                numpy.random.randn(8).astype(numpy.float32), name="bias"
+            ),
+        ],
+    )
+
+    return make_model(graph)
+
+
+def test_check_load_model_external_data(matmul_onnx_model, tmp_path):
+    weight = numpy_helper.to_array(get_init_by_name(matmul_onnx_model, "weight"))
+    bias = numpy_helper.to_array(get_init_by_name(matmul_onnx_model, "bias"))
+    path = os.path.join(str(tmp_path), "model.onnx")
+    onnx.save_model(
+        matmul_onnx_model,
+        path,
+        save_as_external_data=True,
+        all_tensors_to_one_file=True,
+        location="model.data",
+        size_threshold=0,
+    )
+
+    loaded = check_load_model(path)
+    lazy = check_load_model(path, load_external_data=False)
+    assert not any(init.HasField("raw_data") for init in lazy.graph.initializer)
+
+    weight_init = get_init_by_name(lazy, "weight")
+    assert isinstance(get_init_array(weight_init), numpy.memmap)
+    assert numpy.array_equal(get_init_array(weight_init), weight)
+    assert numpy.array_equal(get_init_array(get_init_by_name(lazy, "bias")), bias)
+    assert numpy.array_equal(
+        get_node_params(lazy, lazy.graph.node[0])[0].val,
+        get_node_params(loaded, loaded.graph.node[0])[0].val,
+    )
+
+    assert extract_nodes_shapes_ort(lazy) == extract_nodes_shapes_ort(loaded)
+    assert len(lazy.graph.output) == 1
+
+    batch = {"X": numpy.random.randn(1, 16).astype(numpy.float32)}
+    expected = create_ort_session(loaded).run(None, batch)[0]
+    assert numpy.allclose(create_ort_session(lazy).run(None, batch)[0], expected)
+
+    update_model_param(lazy, "weight", numpy.zeros_like(weight))
+    assert numpy.all(get_init_array(get_init_by_name(lazy, "weight")) == 0)
+    update_model_param(lazy, "weight", weight_init)
+    assert numpy.allclose(create_ort_session(lazy).run(None, batch)[0], expected)
+
+
 @pytest.mark.parametrize(
     "op_type,inputs,outputs", [("Conv", ["X"], ["Y"]), ("Gemm", ["X"], ["Y", "Z"])]
 )
@@ -306,6 +381,91 @@ def test_get_node_output_nodes(simple_onnx_model):
     )
 
 
+def test_indexed_graph_lookups(simple_onnx_model, prunable_onnx_model):
+    for model in [simple_onnx_model, prunable_onnx_model]:
+        ids = [extract_node_id(node) for node in model.graph.node]
+        ids += [init.name for init in model.graph.initializer] + ["NONE"]
+        expected = [
+            (
+                get_node_by_id(model, id_),
+                get_nodes_by_input_id(model, id_),
+                get_nodes_by_output_id(model, id_),
+                get_init_by_name(model, id_),
+            )
+            for id_ in ids
+        ]
+        expected_io = [
+            (get_node_input_nodes(model, node), get_node_output_nodes(model, node))
+            for node in model.graph.node
+        ]
+
+        with indexed_graph_lookups(model) as graph:
+            with indexed_graph_lookups(model) as nested_graph:
+                assert nested_graph is graph
+
+            assert expected == [
+                (
+                    get_node_by_id(model, id_),
+                    get_nodes_by_input_id(model, id_),
+                    get_nodes_by_output_id(model, id_),
+                    get_init_by_name(model, id_),
+                )
+                for id_ in ids
+            ]
+            assert expected_io == [
+                (get_node_input_nodes(model, node), get_node_output_nodes(model, node))
+                for node in model.graph.node
+            ]
+
+    with indexed_graph_lookups(prunable_onnx_model):
+        weight = get_init_by_name(prunable_onnx_model, "node1.weight")
+        new_val = numpy.zeros(weight.dims, dtype=numpy.float32)
+        update_model_param(prunable_onnx_model, "node1.weight", new_val)
+        updated = get_init_by_name(prunable_onnx_model, "node1.weight")
+        assert numpy.all(numpy_helper.to_array(updated) == 0)
+
+
+def test_indexed_graph_lookups_threads(prunable_onnx_model):
+    model = prunable_onnx_model
+    entered = threading.Barrier(2)
+    first_exited = threading.Event()
+    graphs = {}
+    errors = []
+
+    def _index(name: str):
+        try:
+            with indexed_graph_lookups(model) as graph:
+                entered.wait(timeout=10)
+                graphs[name] = (graph, get_indexed_graph(model))
+
+                if name == "second":
+                    first_exited.wait(timeout=10)
+
+            # the other thread leaving its context must not remove this index
+            assert get_indexed_graph(model) is None
+        except Exception as err:
+            errors.append(err)
+        finally:
+            if name == "first":
+                first_exited.set()
+
+    threads = [
+        threading.Thread(target=_index, args=(name,)) for name in ["first", "second"]
+    ]
+
+    for thread in threads:
+        thread.start()
+
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert graphs["first"][0] is graphs["first"][1]
+    assert graphs["second"][0] is graphs["second"][1]
+    assert graphs["first"][0] is not graphs["second"][0]
+    assert get_indexed_graph(model) is None
+
+
 def test_conv_node_params(prunable_onnx_model):
     conv_node = [
         node for node in prunable_onnx_model.graph.node if node.op_type == "Conv"
@@ -445,6 +605,84 @@ def test_extract_node_shape(extract_node_models):  # noqa: F811
     assert any(correct_output_shapes)
 
 
+def test_extract_node_shapes_cache(matmul_onnx_model, monkeypatch, tmp_path):
+    model = matmul_onnx_model
+    model_hash = get_model_structure_hash(model)
+    weight = get_init_by_name(model, "weight")
+    update_model_param(model, "weight", numpy_helper.to_array(weight) * 0.0)
+    assert get_model_structure_hash(model) == model_hash
+
+    expected = extract_node_shapes(model, use_cache=False)
+    assert extract_node_shapes(model, cache_dir=str(tmp_path)) == expected
+    cache_files = os.listdir(str(tmp_path))
+    assert cache_files == ["node_shapes_{}.json".format(model_hash)]
+
+    def _raise(*args, **kwargs):
+        raise RuntimeError("node shapes should be cached")
+
+    monkeypatch.setattr(helpers, "extract_nodes_shapes_ort", _raise)
+    monkeypatch.setattr(helpers, "extract_nodes_shapes_shape_inference", _raise)
+    assert extract_node_shapes(model) == expected
+
+    helpers._NODE_SHAPES_CACHE.clear()
+    assert extract_node_shapes(model) == {}
+    assert extract_node_shapes(model, cache_dir=str(tmp_path)) == expected
+
+    model.graph.node[-1].op_type = "Sub"
+    assert get_model_structure_hash(model) != model_hash
+
+
+def _reshape_model(shape):
+    inp = make_tensor_value_info("X", TensorProto.FLOAT, [1, 12])
+    out = make_tensor_value_info("Y", TensorProto.FLOAT, None)
+    graph = make_graph(
+        [make_node("Reshape", ["X", "shape"], ["Y"], name="reshape")],
+        "reshape_graph",
+        [inp],
+        [out],
+        initializer=[
+            numpy_helper.from_array(numpy.array(shape, dtype=numpy.int64), "shape")
+        ],
+    )
+
+    return make_model(graph)
+
+
+def test_extract_node_shapes_cache_shape_initializers():
+    model_a = _reshape_model([1, 3, 4])
+    model_b = _reshape_model([1, 6, 2])
+    assert get_model_structure_hash(model_a) != get_model_structure_hash(model_b)
+
+    assert extract_node_shapes(model_a)["Y"].output_shapes == [[1, 3, 4]]
+    assert extract_node_shapes(model_b)["Y"].output_shapes == [[1, 6, 2]]
+    assert extract_node_shapes(model_b) == extract_node_shapes(model_b, False)
+
+
+def test_extract_node_shapes_cache_copies():
+    model = _reshape_model([1, 3, 4])
+    node_shapes = extract_node_shapes(model)
+    node_shapes["Y"].output_shapes[0][1] = 12
+    node_shapes["Y"].input_shapes.clear()
+    del node_shapes["Y"]
+
+    assert extract_node_shapes(model) == extract_node_shapes(model, False)
+    assert extract_node_shapes(model)["Y"].output_shapes == [[1, 3, 4]]
+
+
+@pytest.mark.parametrize(
+    "extract_func",
+    [extract_nodes_shapes_ort, extract_nodes_shapes_shape_inference],
+)
+def test_extract_nodes_shapes_leaves_model(extract_func):
+    model = _reshape_model([1, 3, 4])
+    serialized = model.SerializeToString()
+    output_shapes = extract_func(model)
+
+    assert output_shapes["Y"] == [1, 3, 4]
+    assert model.SerializeToString() == serialized
+    assert [out.name for out in model.graph.output] == ["Y"]
+
+
 @pytest.mark.parametrize(
     "attributes,output",
     [
@@ -14,9 +14,11 @@
 
 from typing import Any, Callable, Dict, List, NamedTuple
 
+import numpy
 import psutil
 import pytest
-from onnx import load_model
+from onnx import TensorProto, load_model, numpy_helper
+from onnx.helper import make_graph, make_model, make_node, make_tensor_value_info
 
 from sparseml.onnx.utils.data import DataLoader
 from sparseml.onnx.utils.model import (
@@ -170,3 +172,109 @@ def test_nm_analyze_model_runner(
         for layer_info in out["layer_info"]:
             for field in layer_fields:
                 assert field in layer_info
+
+
+@pytest.fixture
+def matmul_onnx_model():
+    graph = make_graph(
+        [
+            make_node("MatMul", ["X", "weight"], ["Y"], name="matmul"),
+            make_node("Add", ["Y", "bias"], ["Z"], name="add"),
+        ],
+        "test-model",
+        [make_tensor_value_info("X", TensorProto.FLOAT, [1, 16])],
+        [make_tensor_value_info("Z", TensorProto.FLOAT, [1, 8])],
+        initializer=[
+            numpy_helper.from_array(
+                numpy.random.randn(16, 8).astype(numpy.float32), name="weight"
+            ),
+            numpy_helper.from_array(
+                numpy.random.randn(8).astype(numpy.float32), name="bias"
+            ),
+        ],
+    )
+
+    return make_model(graph)
+
+
+def _sum_loss(pred, label):
+    return sum(float(val.sum()) for val in pred.values())
+
+
+@pytest.mark.parametrize("pipeline_depth", [1, 4])
+@pytest.mark.parametrize("max_steps", [-1, 3])
+def test_ort_model_runner_pipelined(matmul_onnx_model, pipeline_depth, max_steps):
+    dataloader = DataLoader.from_model_random(matmul_onnx_model, 1, num_samples=10)
+    serial_runner = ORTModelRunner(matmul_onnx_model, loss=_sum_loss)
+    pipelined_runner = ORTModelRunner(
+        matmul_onnx_model, loss=_sum_loss, pipeline_depth=pipeline_depth
+    )
+    assert pipelined_runner.pipeline_depth == pipeline_depth
+
+    expected, _ = serial_runner.run(dataloader, max_steps=max_steps)
+    outputs, times = pipelined_runner.run(dataloader, max_steps=max_steps)
+    assert len(outputs) == (10 if max_steps < 0 else max_steps)
+    assert outputs == pytest.approx(expected, rel=1e-5)
+
+    for runner in [serial_runner, pipelined_runner]:
+        for stage in ["data", "pred", "post"]:
+            assert len(runner.stage_times[stage]) == len(outputs)
+    assert pipelined_runner.stage_times["pred"] == times
+
+    # exiting the iterator early stops the pipeline threads
+    for _ in pipelined_runner.run_iter(dataloader, show_progress=False):
+        break
+
+
+def test_ort_model_runner_pipelined_loss_error(matmul_onnx_model):
+    def _failing_loss(pred, label):
+        raise ValueError("loss failed")
+
+    dataloader = DataLoader.from_model_random(matmul_onnx_model, 1, num_samples=10)
+    runner = ORTModelRunner(matmul_onnx_model, loss=_failing_loss, pipeline_depth=2)
+
+    with pytest.raises(ValueError):
+        runner.run(dataloader)
+
+
+@pytest.mark.parametrize("num_streams", [2, 3])
+def test_ort_model_runner_concurrent(matmul_onnx_model, num_streams):
+    dataloader = DataLoader.from_model_random(matmul_onnx_model, 1, num_samples=10)
+    serial_runner = ORTModelRunner(matmul_onnx_model, loss=_sum_loss)
+    concurrent_runner = ORTModelRunner(
+        matmul_onnx_model, loss=_sum_loss, nthreads=4, num_streams=num_streams
+    )
+    assert concurrent_runner.num_streams == num_streams
+
+    expected, _ = serial_runner.run(dataloader)
+    results = concurrent_runner.run_concurrent(dataloader, show_progress=False)
+    assert results.outputs == pytest.approx(expected, rel=1e-5)
+    assert results.num_items == 10
+    assert results.items_per_second > 0.0
+    assert sorted(set(results.batch_streams)) == list(
+        range(max(results.batch_streams) + 1)
+    )
+    assert sum(
+        len(results.stream_times(stream)) for stream in range(num_streams)
+    ) == len(results.batch_times)
+
+    percentiles = results.stream_latency_percentiles((50.0, 99.0))
+    assert len(percentiles) == num_streams
+    for stream, stream_percentiles in enumerate(percentiles):
+        if results.stream_times(stream):
+            assert stream_percentiles[50.0] <= stream_percentiles[99.0]
+
+    outputs, times = concurrent_runner.run(dataloader, max_steps=4)
+    assert outputs == pytest.approx(expected[:4], rel=1e-5)
+    assert len(times) == 4
+
+
+def test_ort_model_runner_concurrent_loss_error(matmul_onnx_model):
+    def _failing_loss(pred, label):
+        raise ValueError("loss failed")
+
+    dataloader = DataLoader.from_model_random(matmul_onnx_model, 1, num_samples=10)
+    runner = ORTModelRunner(matmul_onnx_model, loss=_failing_loss, num_streams=2)
+
+    with pytest.raises(ValueError):
+        runner.run(dataloader)
@@ -15,7 +15,15 @@
 import os
 import tempfile
 
-from sparseml.optim import PruningLossSensitivityAnalysis
+import numpy
+import pytest
+
+from sparseml.optim import (
+    PruningLossSensitivityAnalysis,
+    default_pruning_sparsities_loss,
+    magnitude_pruning_averages,
+    magnitude_pruning_averages_iter,
+)
 
 
 def test_ks_loss_sensitivity_analysis():
@@ -183,3 +191,63 @@ def test_ks_loss_sensitivity_analysis():
     path = os.path.join(tempfile.gettempdir(), "ks-sens-analysis-avg.png")
     analysis.plot(path, plot_integral=False, normalize=False)
     assert os.path.exists(path)
+
+
+@pytest.mark.parametrize("num_values", [5, 100, 4321])
+@pytest.mark.parametrize("num_threads", [1, 2])
+def test_magnitude_pruning_averages(num_values, num_threads):
+    sparsity_levels = default_pruning_sparsities_loss(True)
+    params = [numpy.random.randn(num_values) for _ in range(3)]
+
+    for values, averages in zip(
+        params,
+        magnitude_pruning_averages_iter(params, sparsity_levels, num_threads),
+    ):
+        assert averages == magnitude_pruning_averages(values, sparsity_levels)
+        sorted_values = numpy.sort(numpy.abs(values))
+        prev_index = 0
+
+        for sparsity, (avg_sparsity, avg, baseline) in zip(sparsity_levels, averages):
+            val_index = min(round(sparsity * num_values), num_values - 1)
+
+            if sparsity <= 1e-9:
+                assert baseline
+                assert avg == 0.0
+                continue
+
+            assert not baseline
+            assert avg_sparsity == sparsity
+
+            if val_index > prev_index:
+                expected = sorted_values[prev_index:val_index].mean()
+                prev_index = val_index
+            else:
+                expected = sorted_values[val_index]
+                prev_index = val_index + 1
+
+            assert avg == pytest.approx(expected)
+
+
+@pytest.mark.parametrize("num_threads", [2, 4])
+def test_magnitude_pruning_averages_iter_read_ahead(num_threads):
+    sparsity_levels = default_pruning_sparsities_loss(False)
+    num_params = 20
+    num_read = 0
+
+    def _params():
+        nonlocal num_read
+
+        for _ in range(num_params):
+            num_read += 1
+            yield numpy.random.randn(100)
+
+    averages_iter = magnitude_pruning_averages_iter(
+        _params(), sparsity_levels, num_threads
+    )
+
+    for index in range(num_params):
+        next(averages_iter)
+        assert num_read <= min(index + 1 + 2 * num_threads, num_params)
+
+    with pytest.raises(StopIteration):
+        next(averages_iter)
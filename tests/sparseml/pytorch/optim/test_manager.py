@@ -26,7 +26,7 @@ from torch.optim.optimizer import Optimizer
 from sparseml import version as sparseml_version
 from sparseml.optim import BaseModifier
 from sparseml.pytorch.optim import ScheduledModifierManager
-from sparseml.pytorch.sparsification import Modifier
+from sparseml.pytorch.sparsification import Modifier, SetLearningRateModifier
 from tests.sparseml.pytorch.helpers import (
     SAMPLE_STAGED_RECIPE,
     LinearNet,
@@ -821,3 +821,114 @@ def test_manager_staged_recipe_serialization(staged_recipe):
         assert [type(mod) for mod in stage_modifiers] == (
             [type(mod) for mod in reloaded_stage_modifiers]
         )
+
+
+TIMELINE_RECIPE = """
+modifiers:
+    - !EpochRangeModifier
+        start_epoch: 0.0
+        end_epoch: 6.0
+
+    - !SetLearningRateModifier
+        start_epoch: 0.5
+        learning_rate: 0.05
+
+    - !LearningRateFunctionModifier
+        start_epoch: 1.0
+        end_epoch: 3.3
+        lr_func: linear
+        init_lr: 0.05
+        final_lr: 0.001
+        update_frequency: 0.3
+
+    - !SetWeightDecayModifier
+        start_epoch: 2.1
+        weight_decay: 0.001
+
+    - !GMPruningModifier
+        init_sparsity: 0.05
+        final_sparsity: 0.8
+        start_epoch: 1.0
+        end_epoch: 4.0
+        update_frequency: 0.5
+        params: ["re:.*weight"]
+
+    - !LearningRateModifier
+        start_epoch: 4.0
+        end_epoch: 5.0
+        lr_class: ExponentialLR
+        lr_kwargs: {"gamma": 0.9}
+        init_lr: 0.01
+        update_frequency: -1.0
+"""
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("epoch", [0.0, 0.37])
+@pytest.mark.parametrize("steps_per_epoch", [7, 10])
+def test_manager_step_wrapper_timeline(epoch, steps_per_epoch):
+    def _run_trace(use_timeline: bool):
+        torch.manual_seed(0)
+        model = LinearNet()
+        optimizer = create_optim_sgd(model)
+        manager = ScheduledModifierManager.from_yaml(TIMELINE_RECIPE)
+        manager.initialize(model, epoch=epoch)
+        wrapped = manager.modify(model, optimizer, steps_per_epoch, epoch=epoch)
+        set_lr = manager.modifiers[1]
+
+        if not use_timeline:
+            wrapped._wrapped_timeline = None
+        else:
+            assert wrapped._wrapped_timeline is not None
+
+        trace = []
+
+        for step in range(7 * steps_per_epoch):
+            # disabling a modifier over its start must delay it the same way
+            set_lr.enabled = not (2 <= step < steps_per_epoch)
+            wrapped.step()
+            group = optimizer.param_groups[0]
+            trace.append(
+                (
+                    group["lr"],
+                    group["weight_decay"],
+                    [(param == 0).sum().item() for param in model.parameters()],
+                )
+            )
+
+        manager.finalize(model)
+
+        return trace
+
+    assert _run_trace(True) == _run_trace(False)
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+def test_manager_step_wrapper_timeline_modifiers_changed():
+    model = LinearNet()
+    optimizer = create_optim_sgd(model)
+    manager = ScheduledModifierManager.from_yaml(TIMELINE_RECIPE)
+    wrapped = manager.modify(model, optimizer, 10)
+    wrapped.step()
+
+    # modifiers added after the wrapper was created are still stepped
+    added = SetLearningRateModifier(learning_rate=0.123, start_epoch=0.2)
+    added.initialize(model)
+    manager.modifiers = manager.modifiers + [added]
+
+    for _ in range(3):
+        wrapped.step()
+
+    assert added.started
+    assert optimizer.param_groups[0]["lr"] == pytest.approx(0.123)
+
+    # the manager checks still run, stepping a finalized manager fails
+    manager.finalize(model)
+    with pytest.raises(RuntimeError):
+        wrapped.step()
@@ -19,6 +19,7 @@ import torch
 import torch.nn.functional as TF
 from torch.utils.data import DataLoader
 
+from sparseml.optim import PruningLossSensitivityAnalysis
 from sparseml.pytorch.optim import (
     pruning_loss_sens_magnitude,
     pruning_loss_sens_one_shot,
@@ -33,7 +34,7 @@ from tests.sparseml.pytorch.helpers import ConvDataset, ConvNet, MLPDataset, MLP
 )
 @pytest.mark.parametrize(
     "model",
-    [MLPNet(), ConvNet()],
+    [MLPNet(), ConvNet(), MLPNet().to(torch.bfloat16)],
 )
 def test_module_ks_sensitivity_analysis_one_shot(model):
     analysis = pruning_loss_sens_magnitude(model)
@@ -112,3 +113,92 @@ def test_module_ks_sensitivity_analysis_one_shot_cuda(
         "cuda",
         steps_per_measurement,
     )
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+def test_model_ks_sensitivity_analysis_one_shot_workers_resume(tmp_path):
+    model = MLPNet()
+    data = DataLoader(MLPDataset(length=64), 16)
+    loss = LossWrapper(TF.mse_loss)
+    sparsity_levels = [0.0, 0.5, 0.9]
+    checkpoint_path = str(tmp_path / "sensitivity.json")
+
+    expected = pruning_loss_sens_one_shot(
+        model, data, loss, "cpu", 4, sparsity_levels=sparsity_levels
+    )
+    parallel = pruning_loss_sens_one_shot(
+        model,
+        data,
+        loss,
+        "cpu",
+        4,
+        sparsity_levels=sparsity_levels,
+        num_workers=2,
+        checkpoint_path=checkpoint_path,
+    )
+    assert os.path.exists(checkpoint_path)
+
+    # drop the last layer's results to simulate an interrupted run
+    partial = PruningLossSensitivityAnalysis.load_json(checkpoint_path)
+    partial._results = partial.results[:-1]
+    partial.save_json(checkpoint_path)
+    resumed = pruning_loss_sens_one_shot(
+        model,
+        data,
+        loss,
+        "cpu",
+        4,
+        sparsity_levels=sparsity_levels,
+        checkpoint_path=checkpoint_path,
+    )
+
+    for analysis in [parallel, resumed]:
+        assert [res.name for res in analysis.results] == [
+            res.name for res in expected.results
+        ]
+
+        for res, expected_res in zip(analysis.results, expected.results):
+            assert res.index == expected_res.index
+            assert list(res.sparse_measurements) == sparsity_levels
+            assert res.averages == pytest.approx(expected_res.averages)
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("use_cache_dir", [False, True])
+def test_model_ks_sensitivity_analysis_one_shot_cache_activations(
+    use_cache_dir, tmp_path
+):
+    model = MLPNet()
+    data = DataLoader(MLPDataset(length=64), 16)
+    loss = LossWrapper(TF.mse_loss)
+    sparsity_levels = [0.0, 0.5, 0.9]
+
+    expected = pruning_loss_sens_one_shot(
+        model, data, loss, "cpu", 4, sparsity_levels=sparsity_levels
+    )
+    cached = pruning_loss_sens_one_shot(
+        model,
+        data,
+        loss,
+        "cpu",
+        4,
+        sparsity_levels=sparsity_levels,
+        cache_activations=True,
+        activation_cache_dir=str(tmp_path) if use_cache_dir else None,
+    )
+
+    assert [res.name for res in cached.results] == [
+        res.name for res in expected.results
+    ]
+
+    for res, expected_res in zip(cached.results, expected.results):
+        assert res.averages == pytest.approx(expected_res.averages)
+
+    # the spilled activations are removed once the analysis completes
+    assert not os.listdir(str(tmp_path))
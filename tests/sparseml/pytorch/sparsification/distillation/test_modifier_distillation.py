@@ -152,6 +152,72 @@ class TestDistillationModifierImpl(ScheduledModifierTest):
         assert fake_loss.item() != updated_loss.item()
 
 
+class _RecordInputsNet(LinearNet):
+    def __init__(self):
+        super().__init__()
+        self.inputs = []
+
+    def forward(self, inp):
+        self.inputs.append(inp)
+        return super().forward(inp)
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("distillation_teacher", ["self", "module"])
+def test_distillation_modifier_teacher_forward(distillation_teacher):
+    model = LinearNet()
+    teacher = _RecordInputsNet() if distillation_teacher == "module" else "self"
+    modifier = DistillationModifier(start_epoch=0.0)
+    modifier.initialize(model, distillation_teacher=teacher)
+    optimizer = create_optim_sgd(model)
+
+    student_inputs = _get_fake_batch(LinearNet)
+    student_outputs = model(student_inputs)
+    teacher_outputs = modifier.teacher_forward(model, student_inputs)
+
+    if distillation_teacher == "module":
+        # teacher inputs are shared with the student rather than copied
+        assert teacher.inputs[-1] is student_inputs
+        assert not teacher.training
+    else:
+        assert torch.allclose(teacher_outputs, student_outputs)
+
+    assert not teacher_outputs.requires_grad
+
+    # precomputed teacher outputs give the same loss as running the teacher
+    fake_loss = student_outputs.mean()
+    losses = [
+        modifier.loss_update(
+            fake_loss,
+            model,
+            optimizer,
+            0.0,
+            1,
+            student_outputs=student_outputs,
+            student_inputs=student_inputs,
+            teacher_outputs=precomputed,
+        )
+        for precomputed in [teacher_outputs, None]
+    ]
+    assert losses[0].item() == pytest.approx(losses[1].item())
+
+    # precomputed outputs are checked against the student outputs the same way
+    with pytest.raises(ValueError):
+        modifier.loss_update(
+            fake_loss,
+            model,
+            optimizer,
+            0.0,
+            1,
+            student_outputs=student_outputs,
+            student_inputs=student_inputs,
+            teacher_outputs={"logits": teacher_outputs},
+        )
+
+
 @pytest.mark.skipif(
     os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
     reason="Skipping pytorch tests",
@@ -0,0 +1,226 @@
+# Copyright (c) 2021 - present / Neuralmagic, Inc. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing,
+# software distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+
+import pytest
+import torch
+from torch.nn import Linear, Module
+
+from sparseml.pytorch.sparsification import DistillationModifier
+from sparseml.pytorch.sparsification.distillation import (
+    TEACHER_CACHE_KEY_BY_HASH,
+    TEACHER_CACHE_KEY_BY_INDEX,
+    TeacherOutputsCache,
+)
+from tests.sparseml.pytorch.helpers import LinearNet, create_optim_sgd
+
+
+class _DictOutputNet(Module):
+    def __init__(self):
+        super().__init__()
+        self.fc = Linear(8, 16)
+
+    def forward(self, input_ids, token_type_ids):
+        logits = self.fc(input_ids + token_type_ids)
+        return {"loss": logits.mean(), "logits": logits, "hidden": logits * 2.0}
+
+
+def _dict_batches(num_batches=4, batch_size=3):
+    return [
+        {
+            "input_ids": torch.randn(batch_size, 8),
+            "token_type_ids": torch.randn(batch_size, 8),
+            "labels": torch.randint(0, 16, (batch_size,)),
+        }
+        for _ in range(num_batches)
+    ]
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("half_precision", [True, False])
+def test_teacher_outputs_cache_tensor(tmp_path, half_precision):
+    teacher = LinearNet()
+    batches = [torch.randn(5, 8) for _ in range(3)]
+    cache = TeacherOutputsCache.create(
+        str(tmp_path), teacher, batches, half_precision=half_precision
+    )
+
+    assert cache.num_samples == 15
+    assert cache.key_by == TEACHER_CACHE_KEY_BY_HASH
+    assert cache.input_keys is None
+
+    # reloading from disk and looking up shuffled samples by their inputs
+    cache = TeacherOutputsCache(str(tmp_path))
+    inputs = torch.cat(batches)[[14, 0, 7]]
+    with torch.no_grad():
+        expected = teacher(inputs)
+    outputs = cache.lookup(inputs=inputs)
+
+    assert isinstance(outputs, torch.Tensor)
+    assert outputs.dtype == torch.float32
+    if half_precision:
+        assert torch.allclose(outputs, expected, atol=1e-2, rtol=1e-2)
+    else:
+        assert torch.equal(outputs, expected)
+
+    with pytest.raises(KeyError):
+        cache.lookup(inputs=torch.randn(2, 8))
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+def test_teacher_outputs_cache_dict_top_k(tmp_path):
+    teacher = _DictOutputNet()
+    batches = _dict_batches()
+    cache = TeacherOutputsCache.create(
+        str(tmp_path),
+        teacher,
+        batches,
+        output_keys=["logits"],
+        input_keys=["token_type_ids", "input_ids"],
+        key_by=TEACHER_CACHE_KEY_BY_INDEX,
+        top_k=4,
+        half_precision=False,
+    )
+
+    assert cache.num_samples == 12
+    assert cache.input_keys == ["input_ids", "token_type_ids"]
+    assert cache.output_keys == ["logits"]
+
+    indices = torch.tensor([11, 3, 4])
+    outputs = cache.lookup(indices=indices)
+    with torch.no_grad():
+        logits = torch.cat(
+            [
+                teacher(batch["input_ids"], batch["token_type_ids"])["logits"]
+                for batch in batches
+            ]
+        )[indices]
+
+    assert list(outputs.keys()) == ["logits"]
+    cached = outputs["logits"]
+    assert cached.shape == logits.shape
+
+    # top k values are kept exactly, everything else is filled with the row min
+    top_values, top_indices = torch.topk(logits, 4, dim=-1)
+    assert torch.equal(cached.gather(-1, top_indices), top_values)
+    expected = logits.min(dim=-1, keepdim=True).values.expand_as(logits).clone()
+    expected.scatter_(-1, top_indices, top_values)
+    assert torch.equal(cached, expected)
+
+    with pytest.raises(ValueError):
+        cache.lookup(inputs=batches[0])
+    with pytest.raises(IndexError):
+        cache.lookup(indices=[12])
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+def test_teacher_outputs_cache_shape_change(tmp_path):
+    with pytest.raises(ValueError):
+        TeacherOutputsCache.create(
+            str(tmp_path),
+            Linear(4, 2),
+            [torch.randn(2, 3, 4), torch.randn(2, 5, 4)],
+        )
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+def test_distillation_modifier_teacher_cache(tmp_path):
+    student = _DictOutputNet()
+    teacher = _DictOutputNet()
+    batches = _dict_batches()
+    cache = TeacherOutputsCache.create(
+        str(tmp_path),
+        teacher,
+        batches,
+        input_keys=["input_ids", "token_type_ids"],
+        half_precision=False,
+    )
+    assert cache.output_keys == ["logits", "hidden"]
+
+    losses = []
+    for distillation_teacher in [teacher, cache]:
+        modifier = DistillationModifier(
+            start_epoch=0.0, distill_output_keys=["logits", "hidden"]
+        )
+        modifier.initialize(student, distillation_teacher=distillation_teacher)
+        batch = batches[2]
+        student_inputs = {key: batch[key] for key in ["input_ids", "token_type_ids"]}
+        student_outputs = student(**student_inputs)
+        losses.append(
+            modifier.loss_update(
+                student_outputs["loss"],
+                student,
+                create_optim_sgd(student),
+                0.0,
+                1,
+                student_outputs=student_outputs,
+                student_inputs=student_inputs,
+            )
+        )
+
+    assert losses[0].item() == pytest.approx(losses[1].item())
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+def test_distillation_modifier_teacher_cache_eval(tmp_path):
+    student = _DictOutputNet()
+    cache = TeacherOutputsCache.create(
+        str(tmp_path),
+        _DictOutputNet(),
+        _dict_batches(),
+        input_keys=["input_ids", "token_type_ids"],
+    )
+    modifier = DistillationModifier(start_epoch=0.0, distill_output_keys=["logits"])
+    modifier.initialize(student, distillation_teacher=cache)
+    # eval inputs are not part of the cache
+    batch = _dict_batches(num_batches=1)[0]
+    student_inputs = {key: batch[key] for key in ["input_ids", "token_type_ids"]}
+
+    def _loss_update():
+        student_outputs = student(**student_inputs)
+        loss = student_outputs["loss"]
+
+        return loss, modifier.loss_update(
+            loss,
+            student,
+            create_optim_sgd(student),
+            0.0,
+            1,
+            student_outputs=student_outputs,
+            student_inputs=student_inputs,
+        )
+
+    student.eval()
+    loss, updated_loss = _loss_update()
+    assert updated_loss is loss
+
+    student.train()
+    with pytest.raises(KeyError):
+        _loss_update()
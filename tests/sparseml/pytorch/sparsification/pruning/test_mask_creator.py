@@ -105,6 +105,30 @@ def test_global_sparsity_mask_creator(tensors, mask_creator, sparsity_val):
         grouped_masks_test(masks, mask_creator)
 
 
+@pytest.mark.parametrize("sparsity_val", [0.0, 0.4, 0.9, 1.0])
+def test_global_sparsity_mask_creator_stacked_views(sparsity_val):
+    shapes = [(128, 128, 3, 3), (64, 512), (32,)]
+    buffer = torch.randn(sum(torch.Size(shape).numel() for shape in shapes))
+    views = []
+    offset = 0
+    for shape in shapes:
+        numel = torch.Size(shape).numel()
+        views.append(buffer[offset : offset + numel].view(shape))
+        offset += numel
+    mask_creator = UnstructuredPruningMaskCreator()
+
+    view_masks = mask_creator.create_sparsity_masks(
+        views, sparsity_val, global_sparsity=True
+    )
+    copy_masks = mask_creator.create_sparsity_masks(
+        [view.clone() for view in views], sparsity_val, global_sparsity=True
+    )
+
+    for view, view_mask, copy_mask in zip(views, view_masks, copy_masks):
+        assert view_mask.shape == view.shape
+        assert torch.all(view_mask == copy_mask)
+
+
 @pytest.mark.parametrize(
     ("tensor_shapes,mask_creator,sparsity_val"),
     [
@@ -164,6 +188,53 @@ def test_four_block_mask_creator_matches_block(tensors, sparsity_val):
         assert torch.all(mask_1 == mask_2)
 
 
+@pytest.mark.parametrize(
+    ("tensors"),
+    [
+        [torch.randn(128, 128), torch.randn(128, 512, 3, 3)],
+        [torch.randint(-3, 3, (64, 64, 3, 3)).float()],
+    ],
+)
+@pytest.mark.parametrize("sparsity_val", [0.0, 0.4, 0.6, 0.9, 0.99, 1.0])
+@pytest.mark.parametrize("global_sparsity", [False, True])
+def test_kthvalue_threshold_matches_sort(tensors, sparsity_val, global_sparsity):
+    mask_creator_1 = UnstructuredPruningMaskCreator(threshold_method="kthvalue")
+    mask_creator_2 = UnstructuredPruningMaskCreator(threshold_method="sort")
+
+    masks_1 = mask_creator_1.create_sparsity_masks(
+        tensors, sparsity_val, global_sparsity
+    )
+    masks_2 = mask_creator_2.create_sparsity_masks(
+        tensors, sparsity_val, global_sparsity
+    )
+
+    for mask_1, mask_2 in zip(masks_1, masks_2):
+        assert mask_1.shape == mask_2.shape
+        assert torch.all(mask_1 == mask_2)
+
+
+@pytest.mark.parametrize("sparsity_val", [0.4, 0.6, 0.9, 0.99])
+@pytest.mark.parametrize("global_sparsity", [False, True])
+def test_sampled_threshold_mask_creator(sparsity_val, global_sparsity):
+    tensors = [torch.randn(256, 256, 3, 3), 3 * torch.randn(512, 512)]
+    mask_creator = UnstructuredPruningMaskCreator(
+        threshold_method="sampled", threshold_num_samples=2 ** 16
+    )
+    masks = mask_creator.create_sparsity_masks(tensors, sparsity_val, global_sparsity)
+
+    if global_sparsity:
+        masks = [torch.cat([mask.reshape(-1) for mask in masks])]
+
+    for mask in masks:
+        # sample size of 2 ** 16 bounds the error to ~0.008 w/ probability 0.999
+        assert abs(tensor_sparsity(mask) - sparsity_val) < 1e-2
+
+
+def test_invalid_threshold_method():
+    with pytest.raises(ValueError):
+        UnstructuredPruningMaskCreator(threshold_method="median")
+
+
 @pytest.mark.parametrize(
     "N, M",
     [(2, 4), (3, 4), (1, 8), (7, 8)],
@@ -18,6 +18,7 @@ import sys
 import pytest
 import torch
 from torch.nn import Conv2d, Linear
+from torch.optim import SGD, RMSprop
 
 from sparseml.pytorch.sparsification.pruning import (
     FourBlockMaskCreator,
@@ -453,3 +454,119 @@ def test_set_param_mask_from_sparsity_cuda(
     layer = layer.to("cuda")
     param = param.to("cuda")
     _test_set_param_mask_from_sparsity(layer, param_name, param, sparsity, mask_creator)
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("sparsity", [0.5, 0.9])
+def test_global_sparsity_score_buffer(sparsity):
+    layers = [
+        Conv2d(in_channels=16, out_channels=32, kernel_size=3),
+        Linear(in_features=64, out_features=128),
+        Linear(in_features=128, out_features=64),
+    ]
+    params = [layer.weight for layer in layers]
+    mask = ModuleParamPruningMask(
+        layers,
+        mask_creator=UnstructuredPruningMaskCreator(),
+        scorer=MagnitudePruningParamsScorer(params),
+        global_sparsity=True,
+    )
+    mask.enabled = True
+
+    mask.update_param_masks(sparsity / 2)
+    score_buffer_ptr = mask._global_scores.data_ptr()
+    mask.update_param_masks(sparsity)
+
+    # score buffer is reused across updates and masks are views of one global mask
+    assert mask._global_scores.data_ptr() == score_buffer_ptr
+    mask_ptrs = {param_mask.storage().data_ptr() for param_mask in mask.param_masks}
+    assert len(mask_ptrs) == 1
+
+    for param, param_mask in zip(params, mask.param_masks):
+        assert param_mask.shape == param.shape
+    global_mask = torch.cat([param_mask.view(-1) for param_mask in mask.param_masks])
+    assert _tensor_val_eq_err(tensor_sparsity(global_mask), sparsity)
+
+    mask.pruning_end(leave_enabled=False)
+    assert mask._global_scores is None
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize(
+    "layer,param_name",
+    [
+        (Conv2d(in_channels=3, out_channels=7, kernel_size=3), "weight"),
+        (Linear(in_features=13, out_features=5), "weight"),
+    ],
+)
+def test_packed_param_masks(layer, param_name):
+    param = getattr(layer, param_name)
+    mask = ModuleParamPruningMask(
+        [layer],
+        param_names=[param_name],
+        mask_creator=UnstructuredPruningMaskCreator(),
+        scorer=MagnitudePruningParamsScorer([param]),
+        pack_masks=True,
+    )
+    mask.enabled = True
+    assert mask.pack_masks
+
+    mask.update_param_masks(0.5)
+    packed_mask = mask.packed_param_masks[0]
+    assert packed_mask.dtype == torch.uint8
+    assert packed_mask.numel() == (param.numel() + 7) // 8
+
+    dense_mask = mask.param_masks[0]
+    assert dense_mask.shape == param.shape
+    assert _tensor_val_eq_err(tensor_sparsity(dense_mask), 0.5, max_err=1e-2)
+    assert torch.sum((param.data == 0.0) != (dense_mask == 0.0)) == 0
+
+    # packed masks are detected and accepted when set directly
+    mask.set_param_masks([torch.ones_like(param.data)])
+    assert torch.all(mask.param_masks[0] == 1.0)
+    mask.set_param_masks([packed_mask])
+    assert torch.equal(mask.param_masks[0], dense_mask)
+    assert torch.equal(mask.packed_param_masks[0], packed_mask)
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("pack_masks", [False, True])
+def test_apply_and_mask_optimizer_state(pack_masks):
+    layers = [
+        Conv2d(in_channels=3, out_channels=8, kernel_size=3),
+        Linear(in_features=16, out_features=8),
+    ]
+    params = [layer.weight for layer in layers]
+    mask = ModuleParamPruningMask(
+        layers,
+        mask_creator=UnstructuredPruningMaskCreator(),
+        scorer=MagnitudePruningParamsScorer(params),
+        pack_masks=pack_masks,
+    )
+    mask.enabled = True
+    mask.update_param_masks(0.5)
+
+    # fused apply masks every param
+    for param in params:
+        param.data.add_(1.0)
+    mask.apply()
+    for param, param_mask in zip(params, mask.param_masks):
+        assert torch.equal(param.data == 0.0, param_mask == 0.0)
+
+    optimizer = SGD(params, lr=0.1, momentum=0.9)
+    for param in params:
+        optimizer.state[param]["momentum_buffer"] = torch.ones_like(param.data)
+    assert mask.mask_optimizer_state(optimizer)
+    for param, param_mask in zip(params, mask.param_masks):
+        assert torch.equal(optimizer.state[param]["momentum_buffer"], param_mask)
+
+    assert not mask.mask_optimizer_state(RMSprop(params, lr=0.1))
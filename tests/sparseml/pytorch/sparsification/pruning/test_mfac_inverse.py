@@ -96,3 +96,56 @@ def test_blocked_fisher_inverse(fisher_algorithm, devices):
         )
         == small_blocks_mul_out
     )
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize(
+    "fisher_algorithm",
+    [
+        FisherInverseFastSmallBlocks,
+        FisherInverseFastBlock,
+    ],
+)
+@flaky(max_runs=3, min_passes=2)
+def test_blocked_fisher_inverse_sparse_mul(fisher_algorithm):
+    total_params = 1050
+    num_grads = 16
+    block_size = 100
+    damp = 0.0000001
+
+    grads = torch.rand(num_grads, total_params)
+    blocked_hinv = fisher_algorithm(
+        grads=grads.clone(),
+        block_size=block_size,
+        damp=damp,
+    )
+
+    # only a few blocks hold nonzero values, as for OBS weight updates
+    tensor_to_mul = torch.zeros(total_params)
+    tensor_to_mul[120:125] = torch.rand(5)
+    tensor_to_mul[1010:1020] = torch.rand(10)
+    blocked_mul_out = blocked_hinv.mul(tensor_to_mul)
+
+    expected_mul_out = torch.cat(
+        [
+            FisherInverseFast(
+                grads[:, block_start : block_start + block_size].clone(), damp=damp
+            ).mul(tensor_to_mul[block_start : block_start + block_size])
+            for block_start in range(0, total_params, block_size)
+        ]
+    )
+
+    assert blocked_mul_out.shape == expected_mul_out.shape
+    assert torch.all(blocked_mul_out[:100] == 0.0)
+    assert torch.all(blocked_mul_out[200:1000] == 0.0)
+    assert (
+        pytest.approx(
+            expected_mul_out,
+            torch.sqrt(torch.mean(torch.square(expected_mul_out))).item() * PRECISION,
+        )
+        == blocked_mul_out
+    )
+    assert torch.all(blocked_hinv.mul(torch.zeros(total_params)) == 0.0)
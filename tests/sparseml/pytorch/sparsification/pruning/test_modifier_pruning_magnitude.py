@@ -16,6 +16,7 @@ import os
 
 import pytest
 import torch
+from torch.optim import SGD, Adam, AdamW
 
 from flaky import flaky
 from sparseml.pytorch.sparsification.pruning import (
@@ -342,6 +343,7 @@ def test_global_magnitude_pruning_yaml():
     params = "__ALL_PRUNABLE__"
     inter_func = "cubic"
     mask_type = "filter"
+    threshold_method = "sampled"
     yaml_str = f"""
     !GlobalMagnitudePruningModifier
         init_sparsity: {init_sparsity}
@@ -352,6 +354,7 @@ def test_global_magnitude_pruning_yaml():
         params: {params}
         inter_func: {inter_func}
         mask_type: {mask_type}
+        threshold_method: {threshold_method}
     """
     yaml_modifier = GlobalMagnitudePruningModifier.load_obj(yaml_str)
     serialized_modifier = GlobalMagnitudePruningModifier.load_obj(
@@ -366,9 +369,79 @@ def test_global_magnitude_pruning_yaml():
         params=params,
         inter_func=inter_func,
         mask_type=mask_type,
+        threshold_method=threshold_method,
     )
 
     assert isinstance(yaml_modifier, GlobalMagnitudePruningModifier)
     pruning_modifier_serialization_vals_test(
         yaml_modifier, serialized_modifier, obj_modifier
     )
+    assert (
+        yaml_modifier.threshold_method
+        == serialized_modifier.threshold_method
+        == obj_modifier.threshold_method
+        == threshold_method
+    )
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize(
+    "optim_lambda",
+    [
+        lambda model: SGD(model.parameters(), lr=0.01, momentum=0.9, weight_decay=1e-4),
+        lambda model: SGD(model.parameters(), lr=0.01, momentum=0.9, nesterov=True),
+        lambda model: Adam(model.parameters(), lr=0.1, weight_decay=1e-4),
+        lambda model: AdamW(model.parameters(), lr=0.1),
+    ],
+)
+def test_magnitude_pruning_fold_mask_into_optimizer(optim_lambda):
+    model = LinearNet()
+    optimizer = optim_lambda(model)
+    steps_per_epoch = 4
+    modifier = MagnitudePruningModifier(
+        init_sparsity=0.2,
+        final_sparsity=0.8,
+        start_epoch=0.0,
+        end_epoch=2.0,
+        update_frequency=0.5,
+        params="__ALL_PRUNABLE__",
+        fold_mask_into_optimizer=True,
+    )
+    modifier.initialize(model)
+    module_masks = modifier.module_masks
+    test_batch = torch.randn(8, *LinearNet.layer_descs()[0].input_size)
+
+    # track full mask applications made outside of the forward hooks
+    full_applies = []
+    apply = module_masks.apply
+
+    def _tracked_apply(param_idx=None):
+        if param_idx is None:
+            full_applies.append(param_idx)
+        apply(param_idx)
+
+    module_masks.apply = _tracked_apply
+
+    for step in range(4 * steps_per_epoch):
+        epoch = step / steps_per_epoch
+        optimizer.zero_grad()
+        model(test_batch).abs().mean().backward()
+        mask_updated = modifier.update_ready(epoch, steps_per_epoch)
+        if mask_updated:
+            modifier.scheduled_update(model, optimizer, epoch, steps_per_epoch)
+        modifier.optimizer_pre_step(model, optimizer, epoch, steps_per_epoch)
+        num_applies = len(full_applies)
+        optimizer.step()
+        modifier.optimizer_post_step(model, optimizer, epoch, steps_per_epoch)
+
+        # the mask is only reapplied after steps that change it
+        assert modifier._optimizer_state_masked
+        assert len(full_applies) - num_applies == int(mask_updated)
+        for param, mask in zip(module_masks.params_data, module_masks.param_masks):
+            assert torch.sum(param[mask == 0.0].abs()) == 0.0
+
+    assert modifier.fold_mask_into_optimizer
+    assert "fold_mask_into_optimizer: True" in str(modifier)
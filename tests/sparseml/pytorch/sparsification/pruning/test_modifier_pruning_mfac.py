@@ -107,6 +107,20 @@ def _build_gradient_sampler(
             num_grads=8,
             global_sparsity=True,
         ),
+        lambda: MFACPruningModifier(
+            init_sparsity=0.5,
+            final_sparsity=0.95,
+            start_epoch=2.0,
+            end_epoch=5.0,
+            update_frequency=1.0,
+            params=["re:.*weight"],
+            inter_func="linear",
+            fisher_block_size=None,
+            num_grads=8,
+            num_pages=2,
+            grads_device="mmap",
+            available_devices=["cpu"],
+        ),
     ],
     scope="function",
 )
@@ -373,3 +387,21 @@ def test_mfac_pruning_yaml(params, init_sparsity, final_sparsity):
         == str(serialized_modifier.mask_type)
         == str(obj_modifier.mask_type)
     )
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+def test_mfac_mmap_grads_device_requires_unblocked():
+    with pytest.raises(ValueError):
+        MFACPruningModifier(
+            init_sparsity=0.05,
+            final_sparsity=0.8,
+            start_epoch=0.0,
+            end_epoch=5.0,
+            update_frequency=1.0,
+            params=["re:.*weight"],
+            grads_device="mmap",
+            fisher_block_size=2000,
+        )
@@ -12,6 +12,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import math
 import os
 import sys
 
@@ -33,6 +34,11 @@ def test_results_const():
     assert results.batch_size == batch_size
     assert len(results.model_batch_timings) < 1
     assert len(results.e2e_batch_timings) < 1
+    assert math.isnan(results.model_batches_per_second)
+    assert math.isnan(results.model_items_per_second)
+    assert math.isnan(results.e2e_batches_per_second)
+    assert math.isnan(results.e2e_items_per_second)
+    assert str(results)
 
 
 @pytest.mark.skipif(
@@ -51,6 +57,34 @@ def test_results_add():
         results.add(1.0, 1.0, 8)
 
 
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("keep_timings", [True, False])
+def test_results_percentiles(keep_timings):
+    timings = [0.01 * (index + 1) for index in range(100)]
+    results = BatchBenchmarkResults(4, keep_timings=keep_timings)
+
+    for val in timings:
+        results.add(val, 2 * val, 4)
+
+    assert len(results.model_batch_timings) == (len(timings) if keep_timings else 0)
+    assert results.model_batch_seconds == pytest.approx(numpy.mean(timings))
+    assert results.e2e_batch_seconds == pytest.approx(2 * numpy.mean(timings))
+    assert results.model_batch_histogram.count == len(timings)
+
+    model_percentiles = results.model_batch_percentiles()
+    e2e_percentiles = results.e2e_batch_percentiles((50.0, 99.0))
+    assert set(model_percentiles.keys()) == {"p50", "p90", "p95", "p99", "p99.9"}
+    assert model_percentiles["p90"] == pytest.approx(
+        numpy.percentile(timings, 90.0), rel=0.01
+    )
+    assert e2e_percentiles["p99"] == pytest.approx(
+        2 * numpy.percentile(timings, 99.0), rel=0.01
+    )
+
+
 @pytest.mark.skipif(
     os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
     reason="Skipping pytorch tests",
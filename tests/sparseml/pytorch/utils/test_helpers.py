@@ -33,6 +33,7 @@ from sparseml.pytorch.utils import (
     get_optim_learning_rate,
     infinite_data_loader,
     mask_difference,
+    pack_mask,
     set_optim_learning_rate,
     tensor_density,
     tensor_export,
@@ -44,6 +45,7 @@ from sparseml.pytorch.utils import (
     tensors_to_device,
     tensors_to_precision,
     thin_model_from_checkpoint,
+    unpack_mask,
 )
 from tests.sparseml.pytorch.helpers import LinearNet
 
@@ -840,6 +842,29 @@ def test_mask_difference(old_mask, new_mask, expected_diff):
     assert torch.sum((diff - expected_diff).abs()) < sys.float_info.epsilon
 
 
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize(
+    "mask",
+    [
+        torch.tensor([1.0, 0.0, 1.0, 1.0, 0.0, 0.0, 0.0, 1.0]),
+        (torch.rand(7, 3, 3, 3) > 0.5).float(),
+        (torch.rand(13, 5) > 0.9).float(),
+        torch.ones(3),
+    ],
+)
+def test_pack_unpack_mask(mask):
+    packed = pack_mask(mask)
+    assert packed.dtype == torch.uint8
+    assert packed.numel() == (mask.numel() + 7) // 8
+
+    unpacked = unpack_mask(packed, mask.shape)
+    assert unpacked.shape == mask.shape
+    assert torch.equal(unpacked, mask)
+
+
 @pytest.mark.skipif(
     os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
     reason="Skipping pytorch tests",
@@ -12,12 +12,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import gc
 import logging
 import os
+import threading
 import time
+import weakref
 from abc import ABC
 
 import pytest
+import torch
 
 from sparseml.pytorch.utils import (
     LambdaLogger,
@@ -61,6 +65,7 @@ from sparseml.pytorch.utils import (
                 WANDBLogger() if WANDBLogger.available() else PythonLogger(),
             ]
         ),
+        LoggerManager(async_logging=True),
     ],
 )
 class TestModifierLogger(ABC):
@@ -90,3 +95,131 @@ class TestModifierLogger(ABC):
             time.time() - 1,
             level=10,
         )
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+def test_logger_manager_async():
+    logged = []
+    manager = LoggerManager(
+        [
+            LambdaLogger(
+                lambda_func=lambda tag, value, values, step, wall_time, level: (
+                    logged.append((tag, value, values, step))
+                )
+                or True
+            )
+        ],
+        log_python=False,
+        async_logging=True,
+    )
+    assert manager.async_logging
+    value = torch.tensor(1.0)
+
+    for step in range(3):
+        manager.log_scalar("scalar", value, step)
+        manager.log_scalar("count", torch.tensor([step]), step)
+        manager.log_scalars("scalars", {"a": value * 2, "b": 0.5}, step)
+        value.add_(1.0)  # in place updates after logging are not picked up
+
+    manager.flush()
+    assert logged == [
+        log
+        for step in range(3)
+        for log in [
+            ("scalar", step + 1.0, None, step),
+            ("count", step, None, step),
+            ("scalars", None, {"a": 2.0 * (step + 1), "b": 0.5}, step),
+        ]
+    ]
+    assert all(
+        not isinstance(val, torch.Tensor)
+        for log in logged
+        for val in [log[1], *(log[2] or {}).values()]
+    )
+    assert manager.num_blocked_logs == 0
+    assert manager.num_dropped_logs == 0
+
+    manager.close()
+    assert not manager.async_logging
+    manager.log_scalar("scalar", 1.0, 4)
+    assert logged[-1] == ("scalar", 1.0, None, 4)
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("drop_when_full", [True, False])
+def test_logger_manager_async_full_queue(drop_when_full):
+    logged = []
+    release = threading.Event()
+
+    def _slow_log(tag, value, values, step, wall_time, level):
+        release.wait()
+        logged.append(step)
+
+        return True
+
+    manager = LoggerManager(
+        [LambdaLogger(lambda_func=_slow_log)],
+        log_python=False,
+        async_logging=True,
+        async_queue_size=1,
+        async_drop_when_full=drop_when_full,
+    )
+
+    if not drop_when_full:
+        threading.Timer(0.5, release.set).start()
+
+    for step in range(5):
+        manager.log_scalar("scalar", float(step), step)
+
+    release.set()
+    manager.close()
+
+    if drop_when_full:
+        assert manager.num_dropped_logs > 0
+        assert len(logged) + manager.num_dropped_logs == 5
+        assert logged[-1] == 4  # flushed on close even when the queue is full
+    else:
+        assert manager.num_blocked_logs > 0
+        assert logged == list(range(5))
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+def test_logger_manager_async_unstepped_logs():
+    logged = []
+    written = threading.Event()
+
+    def _log(tag, value, values, step, wall_time, level):
+        logged.append((tag, wall_time))
+        written.set()
+
+        return True
+
+    manager = LoggerManager(
+        [LambdaLogger(lambda_func=_log)], log_python=False, async_logging=True
+    )
+    log_time = time.time()
+    manager.log_scalar("scalar", 1.0)
+
+    # logs without a step are sent without waiting for a flush
+    assert written.wait(timeout=10.0)
+    assert logged[0][0] == "scalar"
+    # the wall time is taken when logging, not when written
+    assert log_time <= logged[0][1] <= time.time()
+
+    # the manager is not kept alive by its worker thread or exit hook
+    manager_ref = weakref.ref(manager)
+    thread = manager._async_thread
+    del manager
+    gc.collect()
+    assert manager_ref() is None
+    thread.join(timeout=10.0)
+    assert not thread.is_alive()
@@ -14,6 +14,7 @@
 
 import math
 import os
+import threading
 
 import pytest
 import torch
@@ -24,9 +25,11 @@ from torch.utils.data import DataLoader, Dataset
 
 from sparseml.pytorch.utils import (
     DEFAULT_LOSS_KEY,
+    BaseLogger,
     LossWrapper,
     ModuleRunFuncs,
     ModuleRunHooks,
+    ModuleRunPrefetcher,
     ModuleRunResults,
     ModuleTester,
     ModuleTrainer,
@@ -261,8 +264,11 @@ def test_run_funcs_copy():
         ),
     ],
 )
-def test_run_results(name, loss_tensors, batch_size, expected_mean, expected_std):
-    results = ModuleRunResults()
+@pytest.mark.parametrize("keep_results", [True, False])
+def test_run_results(
+    name, loss_tensors, batch_size, expected_mean, expected_std, keep_results
+):
+    results = ModuleRunResults(keep_results=keep_results)
 
     for loss in loss_tensors:
         results.append({name: loss}, batch_size)
@@ -270,9 +276,67 @@ def test_run_results(name, loss_tensors, batch_size, expected_mean, expected_std
     mean = results.result_mean(name)
     std = results.result_std(name)
 
-    assert len(results.result(name)) == len(loss_tensors)
+    assert results.result_keys == [name]
+    assert results.result_count(name) == len(loss_tensors) * batch_size
     assert (mean - expected_mean).abs() < 0.0001
     assert (std - expected_std).abs() < 0.0001
+    assert mean.dtype == loss_tensors[0].dtype
+
+    if keep_results:
+        assert len(results.result(name)) == len(loss_tensors)
+    else:
+        with pytest.raises(ValueError):
+            results.result(name)
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("fold_size", [1, 3, 128])
+def test_run_results_matches_stored(fold_size):
+    results = ModuleRunResults(keep_results=True, fold_size=fold_size)
+    batches = [
+        (torch.randn(()), 7),
+        (torch.randn(3), 2),
+        (torch.tensor([]), 5),
+        (torch.randn(()) * 10.0, 1),
+        (torch.randn(()), 64),
+    ]
+
+    for loss, batch_size in batches:
+        results.append({"loss": loss, "acc": loss.abs()}, batch_size)
+
+    for key in ["loss", "acc"]:
+        stored = results.result_list_tensor(key).double()
+        assert results.result_count(key) == stored.numel()
+        assert torch.allclose(results.result_mean(key).double(), stored.mean())
+        assert torch.allclose(results.result_std(key).double(), stored.std())
+        assert results.result_min(key).item() == pytest.approx(stored.min().item())
+        assert results.result_max(key).item() == pytest.approx(stored.max().item())
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("keep_results", [True, False])
+def test_run_results_empty(keep_results):
+    results = ModuleRunResults(keep_results=keep_results)
+    results.append({"acc": torch.tensor([])}, 4)
+    results.append({"acc": torch.tensor([])}, 4)
+
+    assert results.result_keys == ["acc"]
+    assert results.result_count("acc") == 0
+    assert torch.isnan(results.result_mean("acc"))
+    assert torch.isnan(results.result_std("acc"))
+    assert torch.isnan(results.result_min("acc"))
+    assert torch.isnan(results.result_max("acc"))
+
+    results.append({"acc": torch.tensor(2.0)}, 4)
+    assert results.result_count("acc") == 4
+    assert results.result_mean("acc").item() == pytest.approx(2.0)
+    assert results.result_min("acc").item() == pytest.approx(2.0)
 
 
 TEST_MODULE = Sequential(
@@ -342,7 +406,12 @@ def _train_helper(model, dataset, loss, optimizer, batch_size, device):
 
     trainer = ModuleTrainer(model, device, loss, optimizer)
     result = trainer.run_epoch(
-        data_loader, epoch=0, max_epochs=0, show_progress=False, track_results=True
+        data_loader,
+        epoch=0,
+        max_epochs=0,
+        show_progress=False,
+        track_results=True,
+        keep_results=True,
     )
     assert isinstance(result, ModuleRunResults)
 
@@ -461,7 +530,12 @@ def _test_helper(model, dataset, loss, batch_size, device):
 
     tester = ModuleTester(model, device, loss)
     result = tester.run_epoch(
-        data_loader, epoch=0, max_epochs=0, show_progress=False, track_results=True
+        data_loader,
+        epoch=0,
+        max_epochs=0,
+        show_progress=False,
+        track_results=True,
+        keep_results=True,
     )
     assert isinstance(result, ModuleRunResults)
 
@@ -501,3 +575,117 @@ def test_module_tester(model, dataset, loss, batch_size):
 @pytest.mark.skipif(not torch.cuda.is_available(), reason="requires cuda availability")
 def test_module_tester_cuda(model, dataset, loss, batch_size):
     _test_helper(model.to("cuda"), dataset, loss, batch_size, "cuda")
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("num_prefetch", [1, 3])
+def test_module_run_prefetcher(num_prefetch):
+    batches = [(torch.randn(4, 8), torch.randn(4, 1)) for _ in range(7)]
+    placed = []
+
+    def _to_device(data, device):
+        placed.append(threading.current_thread())
+        return tensors_to_device(data, device)
+
+    prefetcher = ModuleRunPrefetcher(batches, "cpu", _to_device, num_prefetch)
+    assert not prefetcher.uses_stream
+    prefetched = list(prefetcher)
+
+    assert len(prefetched) == len(batches)
+    for (x_feat, y_lab), (pre_x_feat, pre_y_lab) in zip(batches, prefetched):
+        assert torch.equal(x_feat, pre_x_feat)
+        assert torch.equal(y_lab, pre_y_lab)
+
+    # batches are placed on a background thread
+    assert all(thread is not threading.current_thread() for thread in placed)
+
+    # stopping early shuts down the background thread
+    num_threads = threading.active_count()
+    data_iter = iter(prefetcher)
+    next(data_iter)
+    assert threading.active_count() == num_threads + 1
+    data_iter.close()
+    assert threading.active_count() == num_threads
+
+    def _failing_data():
+        yield batches[0]
+        raise RuntimeError("failed loading")
+
+    data_iter = iter(ModuleRunPrefetcher(_failing_data(), "cpu"))
+    next(data_iter)
+    with pytest.raises(RuntimeError):
+        next(data_iter)
+
+    with pytest.raises(ValueError):
+        ModuleRunPrefetcher(batches, "cpu", num_prefetch=0)
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.skipif(not torch.cuda.is_available(), reason="requires cuda availability")
+def test_module_run_prefetcher_cuda():
+    batches = [{"inp": torch.randn(4, 8), "lab": torch.randn(4, 1)} for _ in range(5)]
+    prefetcher = ModuleRunPrefetcher(batches, "cuda")
+    assert prefetcher.uses_stream
+
+    for batch, prefetched in zip(batches, prefetcher):
+        for key, val in batch.items():
+            assert prefetched[key].is_cuda
+            assert torch.equal(prefetched[key].cpu(), val)
+
+
+class _ScalarsLogger(BaseLogger):
+    def __init__(self):
+        super().__init__("scalars")
+        self.scalars = {}
+
+    def log_scalar(self, tag, value, step=None, wall_time=None):
+        self.scalars.setdefault(tag, []).append(value)
+
+        return True
+
+
+@pytest.mark.skipif(
+    os.getenv("NM_ML_SKIP_PYTORCH_TESTS", False),
+    reason="Skipping pytorch tests",
+)
+@pytest.mark.parametrize("prefetch", [True, False])
+def test_module_runner_prefetch(prefetch):
+    dataset = DatasetImpl(50)
+    data_loader = DataLoader(dataset, 8)
+    loss = LossWrapper(TF.mse_loss)
+    model = Sequential(Linear(8, 16), ReLU(), Linear(16, 1))
+    expected = ModuleTester(model, "cpu", loss, log_summary=False).run(
+        data_loader, desc="", show_progress=False
+    )
+
+    logger = _ScalarsLogger()
+    tester = ModuleTester(
+        model, "cpu", loss, loggers=[logger], log_steps=1, prefetch=prefetch
+    )
+    assert tester.prefetch == prefetch
+    results = tester.run(data_loader, desc="", show_progress=False)
+
+    assert results.result_count(DEFAULT_LOSS_KEY) == len(dataset)
+    assert torch.allclose(
+        results.result_mean(DEFAULT_LOSS_KEY), expected.result_mean(DEFAULT_LOSS_KEY)
+    )
+    data_waits = logger.scalars["Test/Data wait seconds per step"]
+    assert len(data_waits) == len(data_loader)
+    assert all(wait >= 0.0 for wait in data_waits)
+
+    trainer = ModuleTrainer(
+        model,
+        "cpu",
+        loss,
+        SGD(model.parameters(), 0.001),
+        log_summary=False,
+        prefetch=prefetch,
+    )
+    results = trainer.run(data_loader, desc="", show_progress=False, max_steps=3)
+    assert results.result_count(DEFAULT_LOSS_KEY) == 4 * 8
@@ -21,9 +21,14 @@ from collections import Counter, OrderedDict
 import onnx
 import onnxruntime as ort
 import pytest
-from transformers import AutoConfig
+import torch
+from transformers import AutoConfig, TrainingArguments
 
 from sparseml.pytorch.optim import ScheduledModifierManager
+from sparseml.pytorch.sparsification.distillation import (
+    TEACHER_CACHE_KEY_BY_INDEX,
+    TeacherOutputsCache,
+)
 from sparseml.transformers.sparsification import Trainer
 from sparsezoo import Zoo
 from sparsezoo.utils import load_numpy_list
@@ -193,3 +198,72 @@ class TestModelFromZoo:
         out2 = _run_inference_onnx(path_retrieved_onnx, input_data)
         for o1, o2 in zip(out1, out2):
             pytest.approx(o1, abs=1e-5) == o2
+
+
+def test_trainer_teacher_cache_key_by(tmp_path):
+    teacher = torch.nn.Linear(4, 2)
+    cache = TeacherOutputsCache.create(
+        str(tmp_path),
+        teacher,
+        [torch.randn(3, 4)],
+        key_by=TEACHER_CACHE_KEY_BY_INDEX,
+    )
+
+    # the trainer has no access to the dataset indices of the samples
+    with pytest.raises(ValueError):
+        Trainer(
+            model=teacher,
+            model_state_path=str(tmp_path),
+            recipe=None,
+            teacher=cache,
+        )
+
+
+class _DictOutputModel(torch.nn.Module):
+    def __init__(self):
+        super().__init__()
+        self.fc = torch.nn.Linear(4, 2)
+
+    def forward(self, input_ids, labels=None):
+        logits = self.fc(input_ids)
+        return {"loss": logits.mean(), "logits": logits}
+
+
+def test_trainer_teacher_cache_eval(tmp_path):
+    cache = TeacherOutputsCache.create(
+        str(tmp_path / "cache"),
+        _DictOutputModel(),
+        [{"input_ids": torch.randn(3, 4)}],
+        input_keys=["input_ids"],
+    )
+    recipe = """
+    modifiers:
+        - !EpochRangeModifier
+            start_epoch: 0.0
+            end_epoch: 1.0
+
+        - !DistillationModifier
+            start_epoch: 0.0
+            distill_output_keys: ["logits"]
+    """
+    model = _DictOutputModel()
+    trainer = Trainer(
+        model=model,
+        model_state_path=str(tmp_path),
+        recipe=recipe,
+        teacher=cache,
+        args=TrainingArguments(output_dir=str(tmp_path / "output")),
+    )
+    trainer.manager.initialize(model, distillation_teacher=cache)
+    trainer.manager_steps_per_epoch = 1
+    trainer.state.epoch = 0.0
+    # eval inputs are not part of the cache built from the training data
+    inputs = {"input_ids": torch.randn(2, 4)}
+
+    model.eval()
+    loss = trainer.compute_loss(model, inputs)
+    assert loss.item() == pytest.approx(model(**inputs)["loss"].item())
+
+    model.train()
+    with pytest.raises(KeyError):
+        trainer.compute_loss(model, inputs)
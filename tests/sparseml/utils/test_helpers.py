@@ -12,13 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import os
+import tarfile
+
+import numpy
 import pytest
 
 from sparseml.utils import (
     ALL_TOKEN,
+    LazyLabeledData,
     convert_to_bool,
     flatten_iterable,
     interpolate,
+    load_labeled_data,
     validate_str_iterable,
 )
 
@@ -98,3 +104,57 @@ def test_validate_str_iterable_negative():
 def test_interpolate(x_cur, x0, x1, y0, y1, inter_func, out):
     interpolated = interpolate(x_cur, x0, x1, y0, y1, inter_func)
     assert abs(out - interpolated) < 0.01
+
+
+@pytest.mark.parametrize("source", ["glob", "dir", "tar", "tar.gz"])
+@pytest.mark.parametrize("read_ahead", [0, 3])
+def test_load_labeled_data_lazy(source, read_ahead, tmp_path):
+    data_dir = os.path.join(str(tmp_path), "data")
+    label_dir = os.path.join(str(tmp_path), "labels")
+    os.makedirs(data_dir)
+    os.makedirs(label_dir)
+
+    for index in range(10):
+        numpy.savez(
+            os.path.join(data_dir, "inp_{:04}.npz".format(index)),
+            input=numpy.random.randn(3, 4),
+        )
+        numpy.save(
+            os.path.join(label_dir, "out_{:04}.npy".format(index)),
+            numpy.random.randn(2),
+        )
+
+    if source == "glob":
+        data = os.path.join(data_dir, "inp_*.npz")
+        labels = os.path.join(label_dir, "out_*.npy")
+    elif source == "dir":
+        data = data_dir
+        labels = label_dir
+    else:
+        data = os.path.join(str(tmp_path), "data.{}".format(source))
+        labels = os.path.join(str(tmp_path), "labels.{}".format(source))
+
+        for path, dir_ in [(data, data_dir), (labels, label_dir)]:
+            with tarfile.open(path, "w:gz" if source == "tar.gz" else "w") as tar:
+                for name in os.listdir(dir_):
+                    tar.add(os.path.join(dir_, name), arcname=name)
+
+    expected = load_labeled_data(data, labels)
+    lazy = load_labeled_data(
+        data, labels, lazy=True, cache_size=4, read_ahead=read_ahead
+    )
+    assert isinstance(lazy, LazyLabeledData)
+    assert len(lazy) == len(expected) == 10
+    assert lazy.cache_size == max(4, read_ahead + 1)
+
+    for _ in range(2):
+        for index in [0, 1, 2, 9, 5, -1]:
+            (dat, lab), (exp_dat, exp_lab) = lazy[index], expected[index]
+            assert list(dat.keys()) == list(exp_dat.keys())
+            assert numpy.array_equal(dat["input"], exp_dat["input"])
+            assert numpy.array_equal(lab, exp_lab)
+
+    assert len(list(lazy)) == 10
+
+    with pytest.raises(IndexError):
+        lazy[10]